@@ -33,6 +33,10 @@ def create_app(config_name='default'):
     # 初始化扩展
     CORS(app)
 
+    # 请求计数和延迟指标（/metrics 导出）
+    from .utils import metrics
+    metrics.init_app(app)
+
     # 注册蓝图
     try:
         from .api import api_bp
@@ -47,6 +51,22 @@ def create_app(config_name='default'):
     except ImportError as e:
         app.logger.warning(f"主蓝图导入失败: {e}")
 
+    # 启动模型预热（预热完成前 /health/ready 返回未就绪）
+    from .services.warmup import start_warmup
+    start_warmup(app)
+
+    # 启动视频生成任务轮询（从任务库恢复重启前未完成的任务）
+    from .services.video_jobs import video_job_manager
+    video_job_manager.init_app(app)
+
+    # 启动存储清理（按目录配额和TTL淘汰上传和生成的文件）
+    from .services.storage_manager import storage_manager
+    storage_manager.init_app(app)
+
+    # 后台预先改写配置的模板提示词
+    from .services.prompt_cache import start_prompt_precompute
+    start_prompt_precompute(app)
+
     # 配置日志
     if not app.debug and not app.testing:
         if not os.path.exists('logs'):
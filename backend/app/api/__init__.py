@@ -5,10 +5,14 @@ API蓝图模块
 """
 
 from flask import Blueprint
+from ..utils.aio import AsyncRouter
 
 # 创建API蓝图
 api_bp = Blueprint('api', __name__)
 
+# 异步视图（ASGI模式下网络密集型接口直接在事件循环中处理，见 app/asgi.py）
+async_api = AsyncRouter(url_prefix='/api')
+
 # 导入所有API路由
 try:
     from . import image_qa
@@ -17,6 +21,8 @@ try:
     from . import object_detection
     from . import image_segmentation
     from . import video_generation
+    from . import jobs
+    from . import artifacts
     from . import utils
 except ImportError as e:
     # 如果某些模块导入失败，记录错误但不中断应用启动
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+结果图像API模块
+按需渲染并返回检测/分割接口未立即生成的结果图像
+"""
+
+from flask import jsonify, current_app, send_file
+from . import api_bp
+
+
+@api_bp.route('/results/<result_id>/artifacts/<name>', methods=['GET'])
+def get_artifact(result_id, name):
+    """
+    获取结果图像，首次请求时渲染并缓存
+
+    - name: summary（汇总图）或对象序号（从0开始）
+    """
+    try:
+        from ..services.artifact_store import get_artifact_store
+
+        path = get_artifact_store().render(result_id, name)
+        if not path:
+            return jsonify({
+                'success': False,
+                'error': '结果图像不存在'
+            }), 404
+        return send_file(path)
+
+    except Exception as e:
+        current_app.logger.error(f"获取结果图像错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取结果图像失败: {str(e)}'
+        }), 500
@@ -5,7 +5,7 @@
 """
 
 from flask import request, jsonify, current_app
-from . import api_bp
+from . import api_bp, async_api
 from ..services.image_generation_service import ImageGenerationService
 from ..utils.helpers import init_gemini_client
 
@@ -21,6 +21,25 @@ def get_image_generation_service():
         return None
 
 
+def _read_generation_params():
+    """
+    读取图像生成请求参数（支持JSON和form数据）
+
+    Returns:
+        tuple: (generate_image 的参数, 错误结果)
+    """
+    source = request.get_json() if request.is_json else request.form
+    prompt = source.get('prompt', '')
+    if not prompt.strip():
+        return None, {'success': False, 'error': '请输入图像描述'}
+    return {
+        'prompt': prompt,
+        'model_type': source.get('model', 'imagen-3.0-generate-002'),
+        'aspect_ratio': source.get('aspect_ratio', '1:1'),
+        'style': source.get('style', 'realistic')
+    }, None
+
+
 @api_bp.route('/image-generation', methods=['POST'])
 def image_generation():
     """
@@ -41,28 +60,37 @@ def image_generation():
                 'error': '服务初始化失败'
             }), 500
 
-        # 支持JSON和form数据
-        if request.is_json:
-            data = request.get_json()
-            prompt = data.get('prompt', '')
-            model_type = data.get('model', 'imagen-3.0-generate-002')
-            aspect_ratio = data.get('aspect_ratio', '1:1')
-            style = data.get('style', 'realistic')
-        else:
-            prompt = request.form.get('prompt', '')
-            model_type = request.form.get('model', 'imagen-3.0-generate-002')
-            aspect_ratio = request.form.get('aspect_ratio', '1:1')
-            style = request.form.get('style', 'realistic')
-
-        if not prompt.strip():
+        params, error = _read_generation_params()
+        if error:
+            return jsonify(error), 400
+
+        result, status_code = service.generate_image(**params)
+        return jsonify(result), status_code
+
+    except Exception as e:
+        current_app.logger.error(f"图像生成API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'图像生成失败: {str(e)}'
+        }), 500
+
+
+@async_api.route('/image-generation', methods=['POST'])
+async def image_generation_async():
+    """图像生成API（ASGI模式，参数和返回与同步版本相同）"""
+    try:
+        service = get_image_generation_service()
+        if not service:
             return jsonify({
                 'success': False,
-                'error': '请输入图像描述'
-            }), 400
+                'error': '服务初始化失败'
+            }), 500
 
-        result, status_code = service.generate_image(
-            prompt, model_type, aspect_ratio, style
-        )
+        params, error = _read_generation_params()
+        if error:
+            return jsonify(error), 400
+
+        result, status_code = await service.agenerate_image(**params)
         return jsonify(result), status_code
 
     except Exception as e:
@@ -5,9 +5,10 @@
 """
 
 from flask import request, jsonify, current_app
-from . import api_bp
+from . import api_bp, async_api
 from ..services.image_qa_service import ImageQAService
 from ..utils.helpers import init_gemini_client
+from ..utils.sse import sse_response, async_sse_response
 
 
 # 延迟初始化服务
@@ -21,6 +22,35 @@ def get_image_qa_service():
         return None
 
 
+def _read_qa_params():
+    """
+    读取问答请求参数（支持JSON和form数据）
+
+    Returns:
+        tuple: (process_image_qa 的参数, 错误结果)
+    """
+    if request.is_json:
+        data = request.get_json()
+        return {
+            'file': None,
+            'question': data.get('question', ''),
+            'model': data.get('model', 'gemini-2.0-flash'),
+            'image_data': data.get('image_data')
+        }, None
+
+    file = request.files.get('image')
+    question = request.form.get('question', '')
+    if not file:
+        return None, {'success': False, 'error': '请上传图像文件'}
+    if not question.strip():
+        return None, {'success': False, 'error': '请输入问题'}
+    return {
+        'file': file,
+        'question': question,
+        'model': request.form.get('model', 'gemini-2.0-flash')
+    }, None
+
+
 @api_bp.route('/image-qa', methods=['POST'])
 def image_qa():
     """
@@ -40,42 +70,74 @@ def image_qa():
                 'error': '服务初始化失败'
             }), 500
 
-        # 支持JSON和form数据
-        if request.is_json:
-            data = request.get_json()
-            question = data.get('question', '')
-            model = data.get('model', 'gemini-2.0-flash')
-            image_data = data.get('image_data')
-
-            result, status_code = service.process_image_qa(
-                file=None,
-                question=question,
-                model=model,
-                image_data=image_data
-            )
-        else:
-            file = request.files.get('image')
-            question = request.form.get('question', '')
-            model = request.form.get('model', 'gemini-2.0-flash')
-
-            if not file:
-                return jsonify({
-                    'success': False,
-                    'error': '请上传图像文件'
-                }), 400
-
-            if not question.strip():
-                return jsonify({
-                    'success': False,
-                    'error': '请输入问题'
-                }), 400
-
-            result, status_code = service.process_image_qa(
-                file=file,
-                question=question,
-                model=model
-            )
+        params, error = _read_qa_params()
+        if error:
+            return jsonify(error), 400
+
+        result, status_code = service.process_image_qa(**params)
+        return jsonify(result), status_code
+
+    except Exception as e:
+        current_app.logger.error(f"图像问答API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'处理失败: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/image-qa/stream', methods=['POST'])
+def image_qa_stream():
+    """
+    流式图像问答API（Server-Sent Events）
+
+    参数与 /image-qa 相同，响应为 text/event-stream：
+    - start: 开始生成
+    - token: 一段回答文本 {"text": ...}
+    - done: 完整结果（与 /image-qa 的返回相同，附带 first_token_ms、duration_ms）
+    - error: 生成失败
+    客户端断开连接时停止生成
+    """
+    try:
+        service = get_image_qa_service()
+        if not service:
+            return jsonify({
+                'success': False,
+                'error': '服务初始化失败'
+            }), 500
+
+        params, error = _read_qa_params()
+        if error:
+            return jsonify(error), 400
+
+        events, status_code = service.stream_image_qa(**params)
+        if status_code != 200:
+            return jsonify(events), status_code
+        return sse_response(events)
+
+    except Exception as e:
+        current_app.logger.error(f"流式图像问答API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'处理失败: {str(e)}'
+        }), 500
+
+
+@async_api.route('/image-qa', methods=['POST'])
+async def image_qa_async():
+    """图像问答API（ASGI模式，参数和返回与同步版本相同）"""
+    try:
+        service = get_image_qa_service()
+        if not service:
+            return jsonify({
+                'success': False,
+                'error': '服务初始化失败'
+            }), 500
+
+        params, error = _read_qa_params()
+        if error:
+            return jsonify(error), 400
 
+        result, status_code = await service.aprocess_image_qa(**params)
         return jsonify(result), status_code
 
     except Exception as e:
@@ -86,6 +148,34 @@ def image_qa():
         }), 500
 
 
+@async_api.route('/image-qa/stream', methods=['POST'])
+async def image_qa_stream_async():
+    """流式图像问答API（ASGI模式，事件与同步版本相同）"""
+    try:
+        service = get_image_qa_service()
+        if not service:
+            return jsonify({
+                'success': False,
+                'error': '服务初始化失败'
+            }), 500
+
+        params, error = _read_qa_params()
+        if error:
+            return jsonify(error), 400
+
+        events, status_code = service.astream_image_qa(**params)
+        if status_code != 200:
+            return jsonify(events), status_code
+        return async_sse_response(events)
+
+    except Exception as e:
+        current_app.logger.error(f"流式图像问答API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'处理失败: {str(e)}'
+        }), 500
+
+
 @api_bp.route('/image-qa/models', methods=['GET'])
 def get_image_qa_models():
     """获取可用的图像问答模型列表"""
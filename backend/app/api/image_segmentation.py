@@ -5,45 +5,78 @@
 """
 
 from flask import request, jsonify, current_app
-from . import api_bp
-import tempfile
-import base64
-import os
+from . import api_bp, async_api
+from ..utils.fanout import Leg, run_legs, failed_leg_result, LEG_TIMEOUT, LEG_ERROR, LEG_BUSY
+from ..utils.image_input import load_image_input, ImageInputError
+from ..services.artifact_store import parse_artifacts_mode
+from ..utils.mask_encoding import parse_mask_format
+import threading
+import time
+
+
+# 本地分割服务不依赖请求状态，进程内共享同一实例，避免每次请求重建模型缓存
+_local_services = {}
+_local_services_lock = threading.Lock()
+
+
+def _get_local_services():
+    """获取进程内共享的OpenCV和YOLO分割服务"""
+    with _local_services_lock:
+        if not _local_services:
+            from ..services.opencv_service import OpenCVService
+            from ..services.yolo_segmentation_service import YOLOSegmentationService
+            _local_services['opencv'] = OpenCVService()
+            _local_services['yolo'] = YOLOSegmentationService()
+        return _local_services
 
 
 def get_segmentation_services():
     """获取图像分割服务实例"""
     try:
         from ..services.image_segmentation_service import ImageSegmentationService
-        from ..services.opencv_service import OpenCVService
-        from ..services.yolo_segmentation_service import YOLOSegmentationService
         from ..utils.helpers import init_gemini_client
 
         client = init_gemini_client()
+        local_services = _get_local_services()
         return {
             'gemini': ImageSegmentationService(client),
-            'opencv': OpenCVService(),
-            'yolo': YOLOSegmentationService()
+            'opencv': local_services['opencv'],
+            'yolo': local_services['yolo']
         }
     except Exception as e:
         current_app.logger.error(f"初始化图像分割服务失败: {e}")
         return None
 
 
-# 通用的共享文件对象类
-class SharedFileObject:
-    def __init__(self, filepath):
-        self.filepath = filepath
-        self.filename = os.path.basename(filepath)
+def _read_segmentation_params():
+    """
+    读取Gemini分割请求参数（支持JSON和form数据）
+
+    Returns:
+        tuple: (segment_image 的参数, 错误结果)
+    """
+    if request.is_json:
+        data = request.get_json()
+        return {
+            'file': None,
+            'object_name': data.get('object_name', ''),
+            'image_data': data.get('image_data')
+        }, None
+
+    file = request.files.get('image')
+    if not file:
+        return None, {'success': False, 'error': '请上传图像文件'}
+    return {
+        'file': file,
+        'object_name': request.form.get('object_name', '')
+    }, None
 
-    def save(self, path):
-        # 检查源文件和目标文件是否相同
-        if os.path.abspath(self.filepath) == os.path.abspath(path):
-            return path
-        # 复制文件而不是移动
-        import shutil
-        shutil.copy2(self.filepath, path)
-        return path
+
+def _segmentation_response(result, status_code):
+    # 对于内容不匹配的情况，返回200状态码让前端正确处理
+    if not result.get('success') and (result.get('message') or result.get('suggestion') or result.get('detected_objects') or result.get('explanation') or result.get('content_mismatch')):
+        return jsonify(result), 200
+    return jsonify(result), status_code
 
 
 @api_bp.route('/image-segmentation', methods=['POST'])
@@ -64,36 +97,36 @@ def image_segmentation():
                 'error': '服务初始化失败'
             }), 500
 
-        # 支持JSON和form数据
-        if request.is_json:
-            data = request.get_json()
-            object_name = data.get('object_name', '')
-            image_data = data.get('image_data')
-            result, status_code = services['gemini'].segment_image(
-                file=None,
-                object_name=object_name,
-                image_data=image_data
-            )
-        else:
-            file = request.files.get('image')
-            object_name = request.form.get('object_name', '')
+        params, error = _read_segmentation_params()
+        if error:
+            return jsonify(error), 400
 
-            if not file:
-                return jsonify({
-                    'success': False,
-                    'error': '请上传图像文件'
-                }), 400
+        return _segmentation_response(*services['gemini'].segment_image(**params))
 
-            result, status_code = services['gemini'].segment_image(
-                file=file,
-                object_name=object_name
-            )
+    except Exception as e:
+        current_app.logger.error(f"图像分割API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'图像分割失败: {str(e)}'
+        }), 500
 
-        # 对于内容不匹配的情况，返回200状态码让前端正确处理
-        if not result.get('success') and (result.get('message') or result.get('suggestion') or result.get('detected_objects') or result.get('explanation') or result.get('content_mismatch')):
-            return jsonify(result), 200
 
-        return jsonify(result), status_code
+@async_api.route('/image-segmentation', methods=['POST'])
+async def image_segmentation_async():
+    """图像分割API - Gemini方法（ASGI模式，参数和返回与同步版本相同）"""
+    try:
+        services = get_segmentation_services()
+        if not services:
+            return jsonify({
+                'success': False,
+                'error': '服务初始化失败'
+            }), 500
+
+        params, error = _read_segmentation_params()
+        if error:
+            return jsonify(error), 400
+
+        return _segmentation_response(*await services['gemini'].asegment_image(**params))
 
     except Exception as e:
         current_app.logger.error(f"图像分割API错误: {str(e)}")
@@ -105,7 +138,13 @@ def image_segmentation():
 
 @api_bp.route('/image-segmentation/opencv', methods=['POST'])
 def opencv_segmentation():
-    """OpenCV 图像分割"""
+    """
+    OpenCV 图像分割
+
+    artifacts 参数（all / summary / none）目前只对 contour_mask 方法生效：
+    为 summary 或 none 时不立即生成分割图像，返回按需渲染地址；
+    mask_format 参数（rle / polygon）对 contour_mask 和 grabcut 方法生效，在结果中内联返回掩码
+    """
     try:
         # 获取服务实例
         services = get_segmentation_services()
@@ -125,7 +164,9 @@ def opencv_segmentation():
                 file=None,
                 image_data=image_data,
                 method=method,
-                object_name=object_name
+                object_name=object_name,
+                artifacts=parse_artifacts_mode(data.get('artifacts')),
+                mask_format=parse_mask_format(data.get('mask_format'))
             )
         else:
             file = request.files.get('image')
@@ -134,7 +175,9 @@ def opencv_segmentation():
             result, status_code = services['opencv'].segment_image_opencv(
                 file=file,
                 method=method,
-                object_name=object_name
+                object_name=object_name,
+                artifacts=parse_artifacts_mode(request.form.get('artifacts')),
+                mask_format=parse_mask_format(request.form.get('mask_format'))
             )
 
         # 对于内容不匹配的情况，返回200状态码让前端正确处理
@@ -153,7 +196,14 @@ def opencv_segmentation():
 
 @api_bp.route('/image-segmentation/yolo', methods=['POST'])
 def yolo_segmentation():
-    """YOLO 图像分割"""
+    """
+    YOLO 图像分割
+
+    支持的参数:
+    - model_name / confidence / user_query: 模型、置信度阈值和要分割的对象
+    - mask_format: 内联返回的掩码格式 rle（COCO游程编码）/ polygon（简化多边形）/ none（默认）
+    - artifacts: 立即生成的分割图像 all / summary / none，只需要掩码时可设为 none
+    """
     try:
         # 获取服务实例
         services = get_segmentation_services()
@@ -175,7 +225,9 @@ def yolo_segmentation():
                 image_data=image_data,
                 model_name=model_name,
                 confidence=confidence,
-                user_query=user_query
+                user_query=user_query,
+                artifacts=parse_artifacts_mode(data.get('artifacts')),
+                mask_format=parse_mask_format(data.get('mask_format'))
             )
         else:
             file = request.files.get('image')
@@ -186,7 +238,9 @@ def yolo_segmentation():
                 file=file,
                 model_name=model_name,
                 confidence=confidence,
-                user_query=user_query
+                user_query=user_query,
+                artifacts=parse_artifacts_mode(request.form.get('artifacts')),
+                mask_format=parse_mask_format(request.form.get('mask_format'))
             )
 
         # 对于内容不匹配的情况，返回200状态码让前端正确处理
@@ -205,7 +259,13 @@ def yolo_segmentation():
 
 @api_bp.route('/image-segmentation/compare', methods=['POST'])
 def compare_segmentation():
-    """对比 Gemini、OpenCV 和 YOLO 的图像分割结果"""
+    """
+    对比 Gemini、OpenCV 和 YOLO 的图像分割结果
+
+    图像只解码一次，三路共享同一个内存中的 ImageInput，在共享线程池中并行执行，
+    各自独立超时（从开始执行时计时）；某一路超时时仍返回其余各路的结果。
+    线程池没有足够名额时整体排队，排队超时的各路不执行，列在 busy_methods 中
+    """
     try:
         # 获取服务实例
         services = get_segmentation_services()
@@ -222,86 +282,46 @@ def compare_segmentation():
             opencv_method = data.get('opencv_method', 'grabcut')
             yolo_model = data.get('yolo_model', 'yolo11n-seg')
             image_data = data.get('image_data')
-
-            # 为JSON数据创建共享的临时文件
-            image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-            image_bytes = base64.b64decode(image_data_clean)
-
-            # 创建共享的临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                tmp_file.write(image_bytes)
-                shared_filepath = tmp_file.name
-
-            # 创建共享文件对象
-            shared_file = SharedFileObject(shared_filepath)
-
-            try:
-                # Gemini 分割
-                gemini_result, _ = services['gemini'].segment_image(
-                    file=shared_file,
-                    object_name=object_name
-                )
-
-                # OpenCV 分割
-                opencv_result, _ = services['opencv'].segment_image_opencv(
-                    file=shared_file,
-                    method=opencv_method
-                )
-
-                # YOLO 分割
-                yolo_result, _ = services['yolo'].segment_image_yolo(
-                    file=None,
-                    image_data=image_data,
-                    model_name=yolo_model,
-                    confidence=0.5,
-                    user_query=object_name
-                )
-
-            finally:
-                # 清理共享的临时文件
-                try:
-                    os.unlink(shared_filepath)
-                except:
-                    pass
+            file = None
         else:
             file = request.files.get('image')
             object_name = request.form.get('object_name', '主要对象')
             opencv_method = request.form.get('opencv_method', 'grabcut')
             yolo_model = request.form.get('yolo_model', 'yolo11n-seg')
+            image_data = None
 
-            if not file or file.filename == '':
-                return jsonify({'success': False, 'error': '未选择文件'}), 400
-
-            from ..utils.helpers import save_uploaded_file, allowed_file
-            if not allowed_file(file.filename):
-                return jsonify({'success': False, 'error': '无效的文件类型'}), 400
-
-            # 保存上传的文件到共享位置
-            shared_filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
-
-            # 创建共享文件对象
-            shared_file = SharedFileObject(shared_filepath)
+        try:
+            image = load_image_input(file, image_data)
+        except ImageInputError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
+        config = current_app.config
+        started_at = time.perf_counter()
+        values, legs = run_legs([
             # Gemini 分割
-            gemini_result, _ = services['gemini'].segment_image(
-                file=shared_file,
-                object_name=object_name
-            )
-
+            Leg('gemini', lambda: services['gemini'].segment_image(
+                object_name=object_name,
+                image=image
+            )[0], config['COMPARE_GEMINI_TIMEOUT']),
             # OpenCV 分割
-            opencv_result, _ = services['opencv'].segment_image_opencv(
-                file=shared_file,
+            Leg('opencv', lambda: services['opencv'].segment_image_opencv(
                 method=opencv_method,
-                object_name=object_name
-            )
-
+                object_name=object_name,
+                image=image
+            )[0], config['COMPARE_OPENCV_TIMEOUT']),
             # YOLO 分割
-            yolo_result, _ = services['yolo'].segment_image_yolo(
-                file=shared_file,
+            Leg('yolo', lambda: services['yolo'].segment_image_yolo(
                 model_name=yolo_model,
                 confidence=0.5,
-                user_query=object_name
-            )
+                user_query=object_name,
+                image=image
+            )[0], config['COMPARE_YOLO_TIMEOUT'])
+        ])
+        total_time = time.perf_counter() - started_at
+
+        gemini_result = values['gemini'] or failed_leg_result('Gemini', legs['gemini'])
+        opencv_result = values['opencv'] or failed_leg_result('OpenCV', legs['opencv'])
+        yolo_result = values['yolo'] or failed_leg_result('YOLO', legs['yolo'])
 
         # 计算分割统计
         gemini_count = len(gemini_result.get('segmented_objects', [])) if gemini_result.get('success') else 0
@@ -322,8 +342,13 @@ def compare_segmentation():
                 'yolo_count': yolo_count,
                 'total_methods': 3,
                 'successful_methods': sum([1 for result in [gemini_result, opencv_result, yolo_result] if result.get('success')]),
-                'has_segmentations': has_successful_segmentation
+                'has_segmentations': has_successful_segmentation,
+                'timed_out_methods': [name for name, leg in legs.items() if leg['status'] == LEG_TIMEOUT],
+                'failed_methods': [name for name, leg in legs.items() if leg['status'] == LEG_ERROR],
+                'busy_methods': [name for name, leg in legs.items() if leg['status'] == LEG_BUSY]
             },
+            'legs': legs,
+            'total_time_ms': round(total_time * 1000, 2),
             'object_name': object_name,
             'segmentation_method': 'comparison'
         }), 200
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+任务API模块
+查询异步任务（如视频生成）的状态和结果
+"""
+
+from flask import request, jsonify, current_app
+from . import api_bp
+
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """获取任务状态，任务结束后包含完整结果"""
+    try:
+        from ..services.video_jobs import video_job_manager
+        from ..services.job_store import job_to_response
+
+        job = video_job_manager.get(job_id)
+        if not job:
+            return jsonify({
+                'success': False,
+                'error': '任务不存在'
+            }), 404
+
+        response = job_to_response(job)
+        response['success'] = True
+        return jsonify(response)
+
+    except Exception as e:
+        current_app.logger.error(f"获取任务状态错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取任务状态失败: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """
+    列出最近的任务
+
+    支持的参数:
+    - kind: 任务类型 (text_to_video / image_to_video)
+    - status: 任务状态 (running / succeeded / failed)
+    - limit: 返回数量 (默认: 20，范围: 1~100)
+    """
+    try:
+        from ..services.video_jobs import video_job_manager
+        from ..services.job_store import job_to_response
+
+        try:
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit 必须是整数'}), 400
+        # SQLite 中负数 LIMIT 表示不限制，必须限定在 1~100
+        limit = max(1, min(limit, 100))
+
+        if not video_job_manager.store:
+            return jsonify({'success': True, 'jobs': []})
+
+        jobs = video_job_manager.store.list(
+            kind=request.args.get('kind'),
+            status=request.args.get('status'),
+            limit=limit
+        )
+        return jsonify({
+            'success': True,
+            'jobs': [job_to_response(job) for job in jobs]
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"获取任务列表错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取任务列表失败: {str(e)}'
+        }), 500
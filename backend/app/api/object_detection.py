@@ -5,14 +5,15 @@
 """
 
 from flask import request, jsonify, current_app
-from . import api_bp
+from . import api_bp, async_api
 from ..services.object_detection_service import ObjectDetectionService
 from ..services.opencv_service import OpenCVService
 from ..services.yolo_detection_service import YOLODetectionService
-from ..utils.helpers import init_gemini_client, save_uploaded_file, allowed_file
-import tempfile
-import base64
-import os
+from ..utils.helpers import init_gemini_client
+from ..utils.fanout import Leg, run_legs, failed_leg_result, LEG_TIMEOUT, LEG_ERROR, LEG_BUSY
+from ..utils.image_input import load_image_input, ImageInputError
+from ..services.artifact_store import parse_artifacts_mode
+import time
 
 
 
@@ -30,21 +31,37 @@ opencv_service = OpenCVService()
 yolo_detection_service = YOLODetectionService()
 
 
-# 通用的共享文件对象类
-class SharedFileObject:
-    def __init__(self, filepath):
-        self.filepath = filepath
-        self.filename = os.path.basename(filepath)
+def _read_detection_params():
+    """
+    读取Gemini检测请求参数（支持JSON和form数据）
 
-    def save(self, path):
-        # 检查源文件和目标文件是否相同
-        if os.path.abspath(self.filepath) == os.path.abspath(path):
-            # 如果是同一个文件，直接返回路径，不需要复制
-            return path
-        # 复制文件而不是移动
-        import shutil
-        shutil.copy2(self.filepath, path)
-        return path
+    Returns:
+        tuple: (detect_objects 的参数, 错误结果)
+    """
+    if request.is_json:
+        data = request.get_json()
+        return {
+            'file': None,
+            'object_name': data.get('object_name', '对象'),
+            'image_data': data.get('image_data'),
+            'artifacts': parse_artifacts_mode(data.get('artifacts'))
+        }, None
+
+    file = request.files.get('image')
+    if not file:
+        return None, {'success': False, 'error': '请上传图像文件'}
+    return {
+        'file': file,
+        'object_name': request.form.get('object_name', '对象'),
+        'artifacts': parse_artifacts_mode(request.form.get('artifacts'))
+    }, None
+
+
+def _detection_response(result, status_code):
+    # 对于内容不匹配的情况，返回200状态码让前端正确处理
+    if not result.get('success') and (result.get('message') or result.get('suggestion') or result.get('detected_objects') or result.get('explanation')):
+        return jsonify(result), 200
+    return jsonify(result), status_code
 
 
 @api_bp.route('/object-detection', methods=['POST'])
@@ -55,6 +72,7 @@ def object_detection():
     支持的参数:
     - image: 图像文件
     - object_name: 要检测的对象名称
+    - artifacts: 立即生成的结果图像 all / summary / none（默认: all）
     """
     try:
         # 获取服务实例
@@ -65,36 +83,36 @@ def object_detection():
                 'error': '服务初始化失败'
             }), 500
 
-        # 支持JSON和form数据
-        if request.is_json:
-            data = request.get_json()
-            object_name = data.get('object_name', '对象')
-            image_data = data.get('image_data')
-            result, status_code = service.detect_objects(
-                file=None,
-                object_name=object_name,
-                image_data=image_data
-            )
-        else:
-            file = request.files.get('image')
-            object_name = request.form.get('object_name', '对象')
+        params, error = _read_detection_params()
+        if error:
+            return jsonify(error), 400
 
-            if not file:
-                return jsonify({
-                    'success': False,
-                    'error': '请上传图像文件'
-                }), 400
+        return _detection_response(*service.detect_objects(**params))
 
-            result, status_code = service.detect_objects(
-                file=file,
-                object_name=object_name
-            )
+    except Exception as e:
+        current_app.logger.error(f"目标检测API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'目标检测失败: {str(e)}'
+        }), 500
 
-        # 对于内容不匹配的情况，返回200状态码让前端正确处理
-        if not result.get('success') and (result.get('message') or result.get('suggestion') or result.get('detected_objects') or result.get('explanation')):
-            return jsonify(result), 200
 
-        return jsonify(result), status_code
+@async_api.route('/object-detection', methods=['POST'])
+async def object_detection_async():
+    """目标检测API - Gemini方法（ASGI模式，参数和返回与同步版本相同）"""
+    try:
+        service = get_object_detection_service()
+        if not service:
+            return jsonify({
+                'success': False,
+                'error': '服务初始化失败'
+            }), 500
+
+        params, error = _read_detection_params()
+        if error:
+            return jsonify(error), 400
+
+        return _detection_response(*await service.adetect_objects(**params))
 
     except Exception as e:
         current_app.logger.error(f"目标检测API错误: {str(e)}")
@@ -118,7 +136,8 @@ def opencv_detection():
                 file=None,
                 image_data=image_data,
                 method=method,
-                object_name=object_name
+                object_name=object_name,
+                artifacts=parse_artifacts_mode(data.get('artifacts'))
             )
         else:
             file = request.files.get('image')
@@ -127,7 +146,8 @@ def opencv_detection():
             result, status_code = opencv_service.detect_objects_opencv(
                 file=file,
                 method=method,
-                object_name=object_name
+                object_name=object_name,
+                artifacts=parse_artifacts_mode(request.form.get('artifacts'))
             )
 
         # 对于内容不匹配的情况，返回200状态码让前端正确处理
@@ -156,33 +176,31 @@ def yolo_detection():
             # 支持两种参数名：user_query 和 object_name
             user_query = data.get('user_query', '') or data.get('object_name', '')
             image_data = data.get('image_data')
+            artifacts = parse_artifacts_mode(data.get('artifacts'))
 
-            # 处理base64图像数据
-            if image_data:
-                image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(image_data_clean)
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                    tmp_file.write(image_bytes)
-                    image_path = tmp_file.name
-            else:
+            if not image_data:
                 return jsonify({'success': False, 'error': '未提供图像数据'}), 400
+            file = None
         else:
             file = request.files.get('image')
             model_name = request.form.get('model', 'yolo11n')
             confidence = float(request.form.get('confidence', 0.5))
             # 支持两种参数名：user_query 和 object_name
             user_query = request.form.get('user_query', '') or request.form.get('object_name', '')
+            artifacts = parse_artifacts_mode(request.form.get('artifacts'))
 
-            if not file:
-                return jsonify({'success': False, 'error': '未选择文件'}), 400
+            image_data = None
 
-            # 保存上传的文件
-            if not allowed_file(file.filename):
-                return jsonify({'success': False, 'error': '无效的文件类型'}), 400
-            image_path = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
+        # 图像只解码到内存，不写临时文件
+        try:
+            image = load_image_input(file, image_data)
+        except ImageInputError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
         # 使用YOLO进行检测
-        result = yolo_detection_service.detect_objects(image_path, model_name, confidence, user_query)
+        result = yolo_detection_service.detect_objects(
+            model_name=model_name, confidence=confidence, user_query=user_query, image=image,
+            artifacts=artifacts)
 
         # 对于内容不匹配的情况，返回200状态码让前端正确处理
         if not result.get('success') and (result.get('message') or result.get('suggestion') or result.get('detected_objects')):
@@ -198,9 +216,104 @@ def yolo_detection():
         }), 500
 
 
+@api_bp.route('/object-detection/yolo/batch', methods=['POST'])
+def yolo_batch_detection():
+    """
+    YOLO 批量目标检测
+
+    支持的参数:
+    - images: 多个图像文件（multipart），或JSON中的base64图像数据列表
+    - model / confidence / user_query: 与单张检测接口相同
+    - batch_size: 每次推理的图像数（可选，默认使用配置，超过 YOLO_BATCH_MAX_SIZE 时按上限处理）
+    - artifacts: 立即生成的结果图像 all / summary / none（默认: all）
+
+    每批图像只调用一次模型，results 按输入顺序返回每张图像的检测结果
+    """
+    try:
+        if request.is_json:
+            data = request.get_json()
+            model_name = data.get('model', 'yolo11n')
+            confidence = float(data.get('confidence', 0.5))
+            user_query = data.get('user_query', '') or data.get('object_name', '')
+            batch_size = data.get('batch_size')
+            artifacts = parse_artifacts_mode(data.get('artifacts'))
+            inputs = [{'image_data': image_data} for image_data in (data.get('images') or [])]
+        else:
+            model_name = request.form.get('model', 'yolo11n')
+            confidence = float(request.form.get('confidence', 0.5))
+            user_query = request.form.get('user_query', '') or request.form.get('object_name', '')
+            batch_size = request.form.get('batch_size')
+            artifacts = parse_artifacts_mode(request.form.get('artifacts'))
+            inputs = [{'file': file} for file in request.files.getlist('images')]
+
+        if batch_size in (None, ''):
+            batch_size = current_app.config['YOLO_BATCH_SIZE']
+        try:
+            batch_size = int(batch_size)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'batch_size 必须是正整数'}), 400
+        if batch_size < 1:
+            return jsonify({'success': False, 'error': 'batch_size 必须是正整数'}), 400
+        # 超过上限时按上限处理，返回结果中报告实际使用的值
+        batch_size = min(batch_size, current_app.config['YOLO_BATCH_MAX_SIZE'])
+
+        if not inputs:
+            return jsonify({'success': False, 'error': '未提供图像数据'}), 400
+        max_images = current_app.config['YOLO_BATCH_MAX_IMAGES']
+        if len(inputs) > max_images:
+            return jsonify({'success': False, 'error': f'单次最多处理 {max_images} 张图像'}), 400
+
+        # 逐张解码，无效的输入单独报告错误
+        images, indexes, results = [], [], [None] * len(inputs)
+        for index, item in enumerate(inputs):
+            try:
+                images.append(load_image_input(**item))
+                indexes.append(index)
+            except ValueError as e:  # 包括 ImageInputError 和 base64 解码错误
+                results[index] = {'index': index, 'success': False, 'error': str(e)}
+
+        started_at = time.perf_counter()
+        batch_results = yolo_detection_service.detect_objects_batch(
+            images,
+            model_name=model_name,
+            confidence=confidence,
+            user_query=user_query,
+            batch_size=batch_size,
+            artifacts=artifacts
+        )
+        total_time = time.perf_counter() - started_at
+
+        for index, result in zip(indexes, batch_results):
+            result['index'] = index
+            results[index] = result
+
+        return jsonify({
+            'success': True,
+            'results': results,
+            'total_images': len(results),
+            'successful_images': sum(1 for result in results if result.get('success')),
+            'total_objects': sum(result.get('total_objects', 0) for result in results if result.get('success')),
+            'model_name': yolo_detection_service.resolve_model_name(model_name),
+            'batch_size': batch_size,
+            'total_time_ms': round(total_time * 1000, 2)
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"YOLO批量检测API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'YOLO批量检测失败: {str(e)}'
+        }), 500
+
+
 @api_bp.route('/object-detection/compare', methods=['POST'])
 def compare_detection():
-    """对比 Gemini、OpenCV 和 YOLO 的目标检测结果"""
+    """
+    对比 Gemini、OpenCV 和 YOLO 的目标检测结果
+
+    三路检测在共享线程池中并行执行，各自独立超时，响应中的 legs 给出每一路的状态和耗时；
+    图像只解码一次，三路共享同一个内存中的 ImageInput
+    """
     try:
         # 支持JSON和form数据
         if request.is_json:
@@ -209,102 +322,60 @@ def compare_detection():
             opencv_method = data.get('opencv_method', 'contour')
             yolo_model = data.get('yolo_model', 'yolo11s')
             image_data = data.get('image_data')
-
-            # 为JSON数据创建共享的临时文件，避免每个服务独立创建导致文件冲突
-            # 处理base64图像数据
-            image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-            image_bytes = base64.b64decode(image_data_clean)
-
-            # 创建共享的临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                tmp_file.write(image_bytes)
-                shared_filepath = tmp_file.name
-
-            # 创建共享文件对象
-            shared_file = SharedFileObject(shared_filepath)
-
-            try:
-                # 获取服务实例
-                service = get_object_detection_service()
-                if not service:
-                    return jsonify({
-                        'success': False,
-                        'error': '服务初始化失败'
-                    }), 500
-
-                # Gemini 检测 - 使用共享文件路径
-                gemini_result, _ = service.detect_objects(
-                    file=shared_file,
-                    object_name=object_name
-                )
-
-                # OpenCV 检测 - 使用共享文件路径
-                opencv_result, _ = opencv_service.detect_objects_opencv(
-                    file=shared_file,
-                    method=opencv_method,
-                    object_name=object_name
-                )
-
-                # YOLO 检测 - 直接使用文件路径
-                yolo_result = yolo_detection_service.detect_objects(
-                    image_path=shared_filepath,
-                    model_name=yolo_model,
-                    confidence=0.5,
-                    user_query=object_name
-                )
-
-            finally:
-                # 清理共享的临时文件
-                try:
-                    os.unlink(shared_filepath)
-                except:
-                    pass
+            artifacts = parse_artifacts_mode(data.get('artifacts'))
+            file = None
         else:
             file = request.files.get('image')
             object_name = request.form.get('object_name', '对象')
             opencv_method = request.form.get('opencv_method', 'contour')
             yolo_model = request.form.get('yolo_model', 'yolo11s')
+            artifacts = parse_artifacts_mode(request.form.get('artifacts'))
+            image_data = None
 
-            # 为表单数据也创建共享文件，避免Flask文件对象只能读取一次的问题
-            if not file or file.filename == '':
-                return jsonify({'success': False, 'error': '未选择文件'}), 400
-            if not allowed_file(file.filename):
-                return jsonify({'success': False, 'error': '无效的文件类型'}), 400
-
-            # 保存上传的文件到共享位置
-            shared_filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
-
-            # 创建共享文件对象
-            shared_file = SharedFileObject(shared_filepath)
-
-            # 获取服务实例
-            service = get_object_detection_service()
-            if not service:
-                return jsonify({
-                    'success': False,
-                    'error': '服务初始化失败'
-                }), 500
-
-            # Gemini 检测 - 使用共享文件
-            gemini_result, _ = service.detect_objects(
-                file=shared_file,
-                object_name=object_name
-            )
+        # 解码一次，各路共享（Flask文件对象只能读取一次）
+        try:
+            image = load_image_input(file, image_data)
+        except ImageInputError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
-            # OpenCV 检测 - 使用共享文件
-            opencv_result, _ = opencv_service.detect_objects_opencv(
-                file=shared_file,
-                method=opencv_method,
-                object_name=object_name
-            )
+        # 获取服务实例
+        service = get_object_detection_service()
+        if not service:
+            return jsonify({
+                'success': False,
+                'error': '服务初始化失败'
+            }), 500
 
-            # YOLO 检测 - 直接使用文件路径
-            yolo_result = yolo_detection_service.detect_objects(
-                image_path=shared_filepath,
+        config = current_app.config
+        started_at = time.perf_counter()
+        values, legs = run_legs([
+            # Gemini 检测
+            Leg('gemini', lambda: service.detect_objects(
+                object_name=object_name,
+                image=image,
+                artifacts=artifacts
+            )[0], config['COMPARE_GEMINI_TIMEOUT']),
+            # OpenCV 检测
+            Leg('opencv', lambda: opencv_service.detect_objects_opencv(
+                method=opencv_method,
+                object_name=object_name,
+                image=image,
+                artifacts=artifacts
+            )[0], config['COMPARE_OPENCV_TIMEOUT']),
+            # YOLO 检测
+            Leg('yolo', lambda: yolo_detection_service.detect_objects(
+                image=image,
                 model_name=yolo_model,
                 confidence=0.5,
-                user_query=object_name
-            )
+                user_query=object_name,
+                artifacts=artifacts
+            ), config['COMPARE_YOLO_TIMEOUT'])
+        ])
+        total_time = time.perf_counter() - started_at
+
+        gemini_result = values['gemini'] or failed_leg_result('Gemini', legs['gemini'])
+        opencv_result = values['opencv'] or failed_leg_result('OpenCV', legs['opencv'])
+        yolo_result = values['yolo'] or failed_leg_result('YOLO', legs['yolo'])
 
         # 计算检测统计
         gemini_count = len(gemini_result.get('detected_objects', [])) if gemini_result.get('success') else 0
@@ -325,8 +396,13 @@ def compare_detection():
                 'yolo_count': yolo_count,
                 'total_methods': 3,
                 'successful_methods': sum([1 for result in [gemini_result, opencv_result, yolo_result] if result.get('success')]),
-                'has_detections': has_successful_detection
+                'has_detections': has_successful_detection,
+                'timed_out_methods': [name for name, leg in legs.items() if leg['status'] == LEG_TIMEOUT],
+                'failed_methods': [name for name, leg in legs.items() if leg['status'] == LEG_ERROR],
+                'busy_methods': [name for name, leg in legs.items() if leg['status'] == LEG_BUSY]
             },
+            'legs': legs,
+            'total_time_ms': round(total_time * 1000, 2),
             'object_name': object_name,
             'detection_method': 'comparison'
         }), 200
@@ -352,14 +428,13 @@ def validate_content_match():
         if not user_query.strip():
             return jsonify({'success': False, 'error': '请输入查询内容'}), 400
 
-        # 保存上传的图像
-        if not allowed_file(file.filename):
-            return jsonify({'success': False, 'error': '无效的文件类型'}), 400
-
-        image_path = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
+        try:
+            image = load_image_input(file=file)
+        except ImageInputError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
 
         # 使用YOLO进行内容匹配验证
-        validation_result = yolo_detection_service._validate_content_match(image_path, user_query)
+        validation_result = yolo_detection_service._validate_content_match(image, user_query)
 
         return jsonify({
             'success': True,
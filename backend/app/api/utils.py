@@ -21,10 +21,10 @@ def test_api_key():
                 'error': 'API Key 不能为空'
             }), 400
 
-        # 创建临时客户端测试API Key
+        # 使用该Key在客户端池中的客户端测试，后续使用同一Key的请求复用其连接
         try:
-            import google.genai as genai
-            test_client = genai.Client(api_key=api_key)
+            from ..services.gemini_clients import get_gemini_client, get_gemini_client_pool
+            test_client = get_gemini_client(api_key)
 
             # 尝试调用一个简单的API来测试
             response = test_client.models.generate_content(
@@ -47,6 +47,7 @@ def test_api_key():
         except Exception as api_error:
             error_msg = str(api_error)
             if '401' in error_msg or 'UNAUTHENTICATED' in error_msg:
+                get_gemini_client_pool().discard(api_key)
                 return jsonify({
                     'success': False,
                     'error': 'API Key 无效或已过期'
@@ -70,6 +71,133 @@ def test_api_key():
         }), 500
 
 
+@api_bp.route('/models/registry', methods=['GET'])
+def get_model_registry_stats():
+    """获取进程内已加载的YOLO模型及其加载耗时、常驻内存，以及微批处理调度统计"""
+    try:
+        from ..services.model_registry import get_model_registry
+        from ..services.inference_scheduler import get_inference_scheduler
+        return jsonify({
+            'success': True,
+            'registry': get_model_registry().stats(),
+            'scheduler': get_inference_scheduler().stats()
+        })
+    except Exception as e:
+        current_app.logger.error(f"获取模型注册表状态错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取模型注册表状态失败: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/gemini/clients', methods=['GET'])
+def get_gemini_client_stats():
+    """获取Gemini客户端池状态（各Key以指纹显示）"""
+    try:
+        from ..services.gemini_clients import get_gemini_client_pool
+        return jsonify({
+            'success': True,
+            'pool': get_gemini_client_pool().stats()
+        })
+    except Exception as e:
+        current_app.logger.error(f"获取Gemini客户端池状态错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取Gemini客户端池状态失败: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/gemini/scheduler', methods=['GET'])
+def get_gemini_scheduler_stats():
+    """获取Gemini调用调度状态：各模型的令牌桶、排队深度、等待耗时和限流重试次数"""
+    try:
+        from ..services.gemini_scheduler import get_gemini_scheduler
+        return jsonify({
+            'success': True,
+            'scheduler': get_gemini_scheduler().stats()
+        })
+    except Exception as e:
+        current_app.logger.error(f"获取Gemini调度状态错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取Gemini调度状态失败: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/cache/stats', methods=['GET'])
+def get_result_cache_stats():
+    """获取Gemini结果缓存和提示词改写缓存的命中率和各层容量"""
+    try:
+        from ..services.result_cache import get_result_cache
+        from ..services.prompt_cache import get_prompt_cache
+        return jsonify({
+            'success': True,
+            'cache': get_result_cache().stats(),
+            'prompt_cache': get_prompt_cache().stats()
+        })
+    except Exception as e:
+        current_app.logger.error(f"获取结果缓存状态错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取结果缓存状态失败: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/cache/clear', methods=['POST'])
+def clear_result_cache():
+    """清空Gemini结果缓存和提示词改写缓存"""
+    try:
+        from ..services.result_cache import get_result_cache
+        from ..services.prompt_cache import get_prompt_cache
+        get_result_cache().clear()
+        get_prompt_cache().clear()
+        return jsonify({
+            'success': True,
+            'message': '结果缓存已清空'
+        })
+    except Exception as e:
+        current_app.logger.error(f"清空结果缓存错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'清空结果缓存失败: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/storage/stats', methods=['GET'])
+def get_storage_stats():
+    """获取各存储目录的用量、配额和清理统计"""
+    try:
+        from ..services.storage_manager import storage_manager
+        return jsonify({
+            'success': True,
+            'storage': storage_manager.stats()
+        })
+    except Exception as e:
+        current_app.logger.error(f"获取存储状态错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'获取存储状态失败: {str(e)}'
+        }), 500
+
+
+@api_bp.route('/storage/gc', methods=['POST'])
+def run_storage_gc():
+    """立即触发一次后台存储清理"""
+    try:
+        from ..services.storage_manager import storage_manager
+        storage_manager.request_gc()
+        return jsonify({
+            'success': True,
+            'message': '已触发存储清理'
+        })
+    except Exception as e:
+        current_app.logger.error(f"触发存储清理错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'触发存储清理失败: {str(e)}'
+        }), 500
+
+
 @api_bp.route('/features', methods=['GET'])
 def get_features():
     """API功能列表"""
@@ -85,6 +213,17 @@ def get_features():
                 'model': '使用的模型'
             }
         },
+        'image_qa_stream': {
+            'name': '流式图像问答',
+            'description': '以SSE事件逐段返回图像问答的回答',
+            'endpoint': '/api/image-qa/stream',
+            'methods': ['POST'],
+            'parameters': {
+                'image': '图像文件',
+                'question': '问题文本',
+                'model': '使用的模型'
+            }
+        },
         'image_generation': {
             'name': '图像生成',
             'description': '根据文本描述生成图像',
@@ -4,8 +4,8 @@
 处理视频生成相关的API请求
 """
 
-from flask import request, jsonify, current_app
-from . import api_bp
+from flask import request, jsonify, current_app, url_for
+from . import api_bp, async_api
 
 
 def get_video_generation_service():
@@ -20,6 +20,48 @@ def get_video_generation_service():
         return None
 
 
+def _validate_callback_url(callback_url):
+    """校验回调地址，仅允许http/https且不能指向内网或本机（见 validate_callback_url）"""
+    if not callback_url:
+        return None
+    from ..services.video_jobs import validate_callback_url
+    return validate_callback_url(callback_url, current_app.config.get('VIDEO_JOB_CALLBACK_ALLOWED_HOSTS', ()))
+
+
+def _job_accepted_response(job):
+    """任务提交后的响应：进行中返回202，已结束（如直接生成制作方案）返回200"""
+    from ..services.job_store import job_to_response
+    response = job_to_response(job)
+    response['success'] = True
+    response['status_url'] = url_for('api.get_job', job_id=job['id'])
+    return jsonify(response), 200 if response['done'] else 202
+
+
+def _read_video_params():
+    """
+    读取文本到视频请求参数（支持JSON和form数据）
+
+    Returns:
+        tuple: (任务参数, 回调地址, 错误结果)
+    """
+    source = request.get_json() if request.is_json else request.form
+    prompt = source.get('prompt', '')
+    if not prompt.strip():
+        return None, None, {'success': False, 'error': '请输入视频描述'}
+
+    try:
+        callback_url = _validate_callback_url(source.get('callback_url'))
+    except ValueError as e:
+        return None, None, {'success': False, 'error': str(e)}
+
+    return {
+        'prompt': prompt,
+        'duration': int(source.get('duration', 8)),
+        'style': source.get('style', 'realistic'),
+        'aspect_ratio': source.get('aspect_ratio', '16:9')
+    }, callback_url, None
+
+
 @api_bp.route('/video-generation', methods=['POST'])
 def video_generation():
     """
@@ -30,6 +72,9 @@ def video_generation():
     - duration: 视频时长 (默认: 8秒)
     - style: 视频风格 (默认: realistic)
     - aspect_ratio: 宽高比 (默认: 16:9)
+    - callback_url: 任务结束时POST通知的地址 (可选)
+
+    立即返回任务ID，通过 /api/jobs/<job_id> 查询进度和结果
     """
     try:
         # 获取服务实例
@@ -40,33 +85,43 @@ def video_generation():
                 'error': '服务初始化失败'
             }), 500
 
-        # 支持JSON和form数据
-        if request.is_json:
-            data = request.get_json()
-            prompt = data.get('prompt', '')
-            duration = int(data.get('duration', 8))
-            style = data.get('style', 'realistic')
-            aspect_ratio = data.get('aspect_ratio', '16:9')
-        else:
-            prompt = request.form.get('prompt', '')
-            duration = int(request.form.get('duration', 8))
-            style = request.form.get('style', 'realistic')
-            aspect_ratio = request.form.get('aspect_ratio', '16:9')
-
-        if not prompt.strip():
+        params, callback_url, error = _read_video_params()
+        if error:
+            return jsonify(error), 400
+
+        from ..services.video_jobs import video_job_manager
+        job = video_job_manager.submit(service, video_job_manager.KIND_TEXT_TO_VIDEO, params,
+                                       callback_url=callback_url)
+
+        return _job_accepted_response(job)
+
+    except Exception as e:
+        current_app.logger.error(f"视频生成API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'视频生成失败: {str(e)}'
+        }), 500
+
+
+@async_api.route('/video-generation', methods=['POST'])
+async def video_generation_async():
+    """视频生成API（ASGI模式，参数和返回与同步版本相同）"""
+    try:
+        service = get_video_generation_service()
+        if not service:
             return jsonify({
                 'success': False,
-                'error': '请输入视频描述'
-            }), 400
+                'error': '服务初始化失败'
+            }), 500
+
+        params, callback_url, error = _read_video_params()
+        if error:
+            return jsonify(error), 400
 
-        result, status_code = service.generate_video(
-            prompt=prompt,
-            duration=duration,
-            style=style,
-            aspect_ratio=aspect_ratio
-        )
+        from ..services.video_jobs import video_job_manager
+        job = await video_job_manager.asubmit(service, params, callback_url=callback_url)
 
-        return jsonify(result), status_code
+        return _job_accepted_response(job)
 
     except Exception as e:
         current_app.logger.error(f"视频生成API错误: {str(e)}")
@@ -78,7 +133,7 @@ def video_generation():
 
 @api_bp.route('/video-generation/from-image', methods=['POST'])
 def video_from_image():
-    """从图像生成视频 - 图像到视频功能"""
+    """从图像生成视频 - 图像到视频功能（异步任务，返回任务ID）"""
     try:
         # 获取服务实例
         service = get_video_generation_service()
@@ -93,6 +148,11 @@ def video_from_image():
         duration = int(request.form.get('duration', 8))
         aspect_ratio = request.form.get('aspect_ratio', '16:9')
 
+        try:
+            callback_url = _validate_callback_url(request.form.get('callback_url'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
         if not file:
             return jsonify({'success': False, 'error': '请上传图像文件'}), 400
 
@@ -103,13 +163,15 @@ def video_from_image():
 
         image_path = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
 
-        result, status_code = service.generate_video_from_image(
-            image_path=image_path,
-            prompt=prompt,
-            duration=duration,
-            aspect_ratio=aspect_ratio
-        )
-        return jsonify(result), status_code
+        from ..services.video_jobs import video_job_manager
+        job = video_job_manager.submit(service, video_job_manager.KIND_IMAGE_TO_VIDEO, {
+            'prompt': prompt,
+            'duration': duration,
+            'aspect_ratio': aspect_ratio,
+            'source_image': image_path
+        }, callback_url=callback_url)
+
+        return _job_accepted_response(job)
 
     except Exception as e:
         current_app.logger.error(f"图像到视频生成API错误: {str(e)}")
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI入口
+uvicorn 以一个事件循环承载所有连接：
+- 注册在 async_api 中的网络密集型接口（图像问答、Gemini检测/分割、图像生成、视频生成）
+  直接在事件循环中处理，等待Gemini响应期间不占用线程，单进程可同时保持数千个请求
+- 其余接口交给Flask应用，在线程池中按WSGI方式执行
+
+启动方式：设置 SERVER_MODE=asgi 后运行 run.py，或 uvicorn --factory app.asgi:create_asgi_app
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge
+from werkzeug.wrappers import Response
+
+from . import create_app
+
+
+class AsgiApp:
+    """异步视图优先，未匹配的请求转发给Flask应用"""
+
+    def __init__(self, flask_app, router, wsgi_workers=32):
+        self.flask_app = flask_app
+        self.router = router
+        self.wsgi = WSGIMiddleware(flask_app, workers=wsgi_workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            view, values = self.router.match(scope['path'], scope['method'])
+            if view is not None:
+                return await self._dispatch(view, values, scope, receive, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _dispatch(self, view, values, scope, receive, send):
+        """按Flask的请求处理流程执行异步视图（请求钩子、错误处理、CORS等响应处理照常生效）"""
+        app = self.flask_app
+        error = None
+        try:
+            body = await self._read_body(scope, receive)
+        except HTTPException as e:
+            # 请求体过大或请求头无效：与Flask一样交给错误处理返回413/400
+            body, error = b'', e
+        if body is None:
+            return  # 客户端在上传过程中断开
+
+        with app.request_context(build_environ(scope, body)):
+            try:
+                try:
+                    if error is not None:
+                        raise error
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**values)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+            # 流式响应的生成器可能使用 current_app，在请求上下文中发送
+            await self._send_response(response, receive, send)
+
+    async def _read_body(self, scope, receive):
+        """读取完整请求体，超过 MAX_CONTENT_LENGTH 时抛出413，Content-Length 无效时抛出400，客户端断开时返回None"""
+        max_length = self.flask_app.config.get('MAX_CONTENT_LENGTH')
+        for name, value in scope['headers']:
+            if name == b'content-length':
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    content_length = -1
+                if content_length < 0:
+                    raise _invalid_content_length()
+                if max_length and content_length > max_length:
+                    raise RequestEntityTooLarge()
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body.extend(message.get('body', b''))
+            if max_length and len(body) > max_length:
+                raise RequestEntityTooLarge()
+            if not message.get('more_body'):
+                return bytes(body)
+
+    async def _send_response(self, response, receive, send):
+        async_body = getattr(response, 'async_body', None)
+        if async_body is not None:
+            response.headers.pop('Content-Length', None)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()]
+        })
+        if async_body is None:
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+            return
+
+        # 流式响应：同时监听断开事件，客户端断开时取消发送，生成器在 finally 中关闭上游调用
+        sender = asyncio.ensure_future(_send_chunks(async_body, send))
+        watcher = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            watcher.cancel()
+            for result in await asyncio.gather(sender, watcher, return_exceptions=True):
+                if isinstance(result, Exception):
+                    print(f"流式响应发送失败: {str(result)}")
+
+
+def _invalid_content_length():
+    """Content-Length 无效时的400错误，响应体与各接口的错误格式一致"""
+    message = '无效的 Content-Length 请求头'
+    return BadRequest(message, response=Response(
+        json.dumps({'success': False, 'error': message}, ensure_ascii=False),
+        status=400, mimetype='application/json'))
+
+
+async def _send_chunks(body, send):
+    try:
+        async for chunk in body:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await body.aclose()
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def build_environ(scope, body):
+    """由ASGI请求构建WSGI环境，供Flask解析表单、文件和JSON"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def create_asgi_app(config_name=None, flask_app=None):
+    """
+    ASGI应用工厂
+
+    Args:
+        config_name (str): 配置名称，默认读取 FLASK_ENV
+        flask_app (Flask): 已创建的Flask应用，为None时按配置创建
+    """
+    if flask_app is None:
+        flask_app = create_app(config_name or os.getenv('FLASK_ENV', 'development'))
+    from .api import async_api
+    return AsgiApp(flask_app, async_api, flask_app.config.get('ASGI_WSGI_WORKERS', 32))
@@ -26,6 +26,9 @@ class Config:
     GENERATED_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'storage', 'generated')
     MODELS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'storage', 'models')
 
+    # 请求图像只在内存中解码使用；开启后按内容哈希保存到上传目录，供响应中的 original_image 引用
+    PERSIST_UPLOADS = os.environ.get('PERSIST_UPLOADS', 'false').lower() == 'true'
+
     # 文件大小限制 (16MB)
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
 
@@ -46,6 +49,118 @@ class Config:
         'gemini-2.0-flash': 'gemini-2.0-flash-exp-image-generation'
     }
 
+    # YOLO模型缓存配置（0表示不限制）
+    YOLO_MODEL_CACHE_MAX_MODELS = int(os.environ.get('YOLO_MODEL_CACHE_MAX_MODELS', 0))
+    YOLO_MODEL_CACHE_MAX_BYTES = int(os.environ.get('YOLO_MODEL_CACHE_MAX_MB', 0)) * 1024 * 1024
+
+    # 启动预热配置
+    MODEL_WARMUP_ENABLED = os.environ.get('MODEL_WARMUP_ENABLED', 'true').lower() == 'true'
+    MODEL_WARMUP_BLOCKING = os.environ.get('MODEL_WARMUP_BLOCKING', 'false').lower() == 'true'
+    MODEL_WARMUP_DETECTION_MODELS = [m.strip() for m in os.environ.get('MODEL_WARMUP_DETECTION_MODELS', 'yolo11n').split(',') if m.strip()]
+    MODEL_WARMUP_SEGMENTATION_MODELS = [m.strip() for m in os.environ.get('MODEL_WARMUP_SEGMENTATION_MODELS', 'yolo11n-seg').split(',') if m.strip()]
+    MODEL_WARMUP_IMAGE_SIZE = int(os.environ.get('MODEL_WARMUP_IMAGE_SIZE', 640))
+
+    # Gemini结果缓存配置（按图像哈希、模型和查询缓存视觉调用的响应）
+    GEMINI_CACHE_ENABLED = os.environ.get('GEMINI_CACHE_ENABLED', 'true').lower() == 'true'
+    GEMINI_CACHE_TTL = int(os.environ.get('GEMINI_CACHE_TTL', 86400))
+    GEMINI_CACHE_MAX_ENTRIES = int(os.environ.get('GEMINI_CACHE_MAX_ENTRIES', 512))
+    GEMINI_CACHE_DISK_ENABLED = os.environ.get('GEMINI_CACHE_DISK_ENABLED', 'true').lower() == 'true'
+    GEMINI_CACHE_DISK_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'storage', 'cache', 'gemini_results.db')
+    GEMINI_CACHE_DISK_MAX_BYTES = int(os.environ.get('GEMINI_CACHE_DISK_MAX_MB', 256)) * 1024 * 1024
+
+    # 提示词改写缓存配置（生成前的提示词优化和中译英翻译，按调用类型、模型、风格和归一化提示词缓存）
+    PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+    PROMPT_CACHE_TTL = int(os.environ.get('PROMPT_CACHE_TTL', 30 * 86400))
+    PROMPT_CACHE_MAX_ENTRIES = int(os.environ.get('PROMPT_CACHE_MAX_ENTRIES', 1024))
+    PROMPT_CACHE_DISK_ENABLED = os.environ.get('PROMPT_CACHE_DISK_ENABLED', 'true').lower() == 'true'
+    PROMPT_CACHE_DISK_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'storage', 'cache', 'prompt_rewrites.db')
+    PROMPT_CACHE_DISK_MAX_BYTES = int(os.environ.get('PROMPT_CACHE_DISK_MAX_MB', 64)) * 1024 * 1024
+    PROMPT_CACHE_PRECOMPUTE_FILE = os.environ.get('PROMPT_CACHE_PRECOMPUTE_FILE', '')
+
+    # Gemini客户端池配置（按API Key复用客户端并保持HTTP长连接，超时单位：秒，0表示使用SDK默认值）
+    GEMINI_CLIENT_POOL_MAX_KEYS = int(os.environ.get('GEMINI_CLIENT_POOL_MAX_KEYS', 32))
+    GEMINI_HTTP_MAX_CONNECTIONS = int(os.environ.get('GEMINI_HTTP_MAX_CONNECTIONS', 20))
+    GEMINI_ASYNC_MAX_CONNECTIONS = int(os.environ.get('GEMINI_ASYNC_MAX_CONNECTIONS', 1000))
+    GEMINI_HTTP_KEEPALIVE = float(os.environ.get('GEMINI_HTTP_KEEPALIVE', 120))
+    GEMINI_HTTP_TIMEOUT = float(os.environ.get('GEMINI_HTTP_TIMEOUT', 0))
+    GEMINI_CLIENT_WARMUP = os.environ.get('GEMINI_CLIENT_WARMUP', 'false').lower() == 'true'
+    # API地址（为空时使用Google官方地址；压测时指向本地替身服务，见 python -m gemini_standin）
+    GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL', '')
+
+    # Gemini调用调度配置（按API Key和模型的令牌桶限速，GEMINI_RATE_LIMITS 格式为 模型=每分钟请求数,...；
+    # 未单独配置的模型使用 GEMINI_DEFAULT_RPM，0表示不限速；限流后按带抖动的指数退避重试，延迟单位：秒）
+    GEMINI_SCHEDULER_ENABLED = os.environ.get('GEMINI_SCHEDULER_ENABLED', 'true').lower() == 'true'
+    GEMINI_RATE_LIMITS = {model.strip(): float(rpm) for model, rpm in (
+        item.split('=', 1) for item in os.environ.get('GEMINI_RATE_LIMITS', '').split(',') if '=' in item)}
+    GEMINI_DEFAULT_RPM = float(os.environ.get('GEMINI_DEFAULT_RPM', 0))
+    GEMINI_RATE_BURST = int(os.environ.get('GEMINI_RATE_BURST', 0))
+    GEMINI_RETRY_MAX = int(os.environ.get('GEMINI_RETRY_MAX', 3))
+    GEMINI_RETRY_BASE_DELAY = float(os.environ.get('GEMINI_RETRY_BASE_DELAY', 1.0))
+    GEMINI_RETRY_MAX_DELAY = float(os.environ.get('GEMINI_RETRY_MAX_DELAY', 30))
+    GEMINI_QUEUE_TIMEOUT = float(os.environ.get('GEMINI_QUEUE_TIMEOUT', 60))
+
+    # ASGI服务模式配置（SERVER_MODE=asgi 时网络密集型接口在事件循环中异步处理；
+    # CPU密集型的渲染和推理交给线程池，其余接口在WSGI线程池中执行；
+    # ASGI_LIMIT_CONCURRENCY 为同时处理的连接数上限，0表示不限制）
+    SERVER_MODE = os.environ.get('SERVER_MODE', 'threaded').lower()
+    ASGI_EXECUTOR_WORKERS = int(os.environ.get('ASGI_EXECUTOR_WORKERS', 8))
+    ASGI_WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', 32))
+    ASGI_LIMIT_CONCURRENCY = int(os.environ.get('ASGI_LIMIT_CONCURRENCY', 0))
+
+    # YOLO批量检测配置（每次推理的图像数及其上限、单个请求的图像数上限）
+    YOLO_BATCH_SIZE = int(os.environ.get('YOLO_BATCH_SIZE', 8))
+    YOLO_BATCH_MAX_SIZE = int(os.environ.get('YOLO_BATCH_MAX_SIZE', 32))
+    YOLO_BATCH_MAX_IMAGES = int(os.environ.get('YOLO_BATCH_MAX_IMAGES', 64))
+
+    # YOLO微批处理配置（并发请求在窗口内合并为一次推理）
+    YOLO_MICROBATCH_ENABLED = os.environ.get('YOLO_MICROBATCH_ENABLED', 'true').lower() == 'true'
+    YOLO_MICROBATCH_MAX_SIZE = int(os.environ.get('YOLO_MICROBATCH_MAX_SIZE', 8))
+    YOLO_MICROBATCH_MAX_WAIT_MS = float(os.environ.get('YOLO_MICROBATCH_MAX_WAIT_MS', 5))
+    YOLO_MICROBATCH_RESULT_TIMEOUT = float(os.environ.get('YOLO_MICROBATCH_RESULT_TIMEOUT', 120))
+
+    # 对比接口并行扇出配置（排队超时和各路超时单位：秒）
+    FANOUT_MAX_WORKERS = int(os.environ.get('FANOUT_MAX_WORKERS', 8))
+    FANOUT_QUEUE_TIMEOUT = float(os.environ.get('FANOUT_QUEUE_TIMEOUT', 30))
+    COMPARE_GEMINI_TIMEOUT = float(os.environ.get('COMPARE_GEMINI_TIMEOUT', 60))
+    COMPARE_OPENCV_TIMEOUT = float(os.environ.get('COMPARE_OPENCV_TIMEOUT', 30))
+    COMPARE_YOLO_TIMEOUT = float(os.environ.get('COMPARE_YOLO_TIMEOUT', 30))
+
+    # 结果图像按需渲染配置（artifacts 参数默认值：all / summary / none）
+    DEFAULT_ARTIFACTS = os.environ.get('DEFAULT_ARTIFACTS', 'all').lower()
+    ARTIFACT_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'storage', 'artifacts.db')
+    ARTIFACT_FOLDER = os.path.join(GENERATED_FOLDER, 'artifacts')
+
+    # 存储生命周期配置（各目录的容量上限、文件数上限和TTL秒数，0表示不限制）
+    STORAGE_GC_ENABLED = os.environ.get('STORAGE_GC_ENABLED', 'true').lower() == 'true'
+    STORAGE_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'storage', 'storage_index.db')
+    STORAGE_GC_INTERVAL = int(os.environ.get('STORAGE_GC_INTERVAL', 60))
+    STORAGE_GC_BATCH = int(os.environ.get('STORAGE_GC_BATCH', 200))
+    STORAGE_RESCAN_INTERVAL = int(os.environ.get('STORAGE_RESCAN_INTERVAL', 3600))
+    STORAGE_MIN_AGE = int(os.environ.get('STORAGE_MIN_AGE', 300))
+    STORAGE_UPLOADS_MAX_BYTES = int(os.environ.get('STORAGE_UPLOADS_MAX_MB', 2048)) * 1024 * 1024
+    STORAGE_UPLOADS_MAX_FILES = int(os.environ.get('STORAGE_UPLOADS_MAX_FILES', 20000))
+    STORAGE_UPLOADS_TTL = int(os.environ.get('STORAGE_UPLOADS_TTL', 7 * 86400))
+    STORAGE_GENERATED_MAX_BYTES = int(os.environ.get('STORAGE_GENERATED_MAX_MB', 4096)) * 1024 * 1024
+    STORAGE_GENERATED_MAX_FILES = int(os.environ.get('STORAGE_GENERATED_MAX_FILES', 50000))
+    STORAGE_GENERATED_TTL = int(os.environ.get('STORAGE_GENERATED_TTL', 7 * 86400))
+    STORAGE_ARTIFACTS_MAX_BYTES = int(os.environ.get('STORAGE_ARTIFACTS_MAX_MB', 1024)) * 1024 * 1024
+    STORAGE_ARTIFACTS_MAX_FILES = int(os.environ.get('STORAGE_ARTIFACTS_MAX_FILES', 20000))
+    STORAGE_ARTIFACTS_TTL = int(os.environ.get('STORAGE_ARTIFACTS_TTL', 86400))
+
+    # 异步任务配置（视频生成）
+    JOB_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'storage', 'jobs.db')
+    VIDEO_JOB_POLLER_ENABLED = os.environ.get('VIDEO_JOB_POLLER_ENABLED', 'true').lower() == 'true'
+    VIDEO_JOB_POLL_INTERVAL = int(os.environ.get('VIDEO_JOB_POLL_INTERVAL', 20))
+    VIDEO_JOB_MAX_WAIT = int(os.environ.get('VIDEO_JOB_MAX_WAIT', 600))
+    VIDEO_JOB_CALLBACK_TIMEOUT = int(os.environ.get('VIDEO_JOB_CALLBACK_TIMEOUT', 10))
+    VIDEO_JOB_CALLBACK_WORKERS = int(os.environ.get('VIDEO_JOB_CALLBACK_WORKERS', 4))
+    VIDEO_JOB_FINISH_WORKERS = int(os.environ.get('VIDEO_JOB_FINISH_WORKERS', 2))
+    # 回调地址不能解析到内网、本机、链路本地（含云元数据）地址；列出的主机名不受此限制（逗号分隔）
+    VIDEO_JOB_CALLBACK_ALLOWED_HOSTS = [h.strip().lower() for h in os.environ.get('VIDEO_JOB_CALLBACK_ALLOWED_HOSTS', '').split(',') if h.strip()]
+
+    # 指标导出配置（/metrics，Prometheus 文本格式）
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
     # 应用设置
     JSON_AS_ASCII = False  # 支持中文JSON响应
 
@@ -75,6 +190,10 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     WTF_CSRF_ENABLED = False
+    MODEL_WARMUP_ENABLED = False
+    VIDEO_JOB_POLLER_ENABLED = False
+    GEMINI_CACHE_DISK_ENABLED = False
+    PROMPT_CACHE_DISK_ENABLED = False
 
 
 # 配置字典
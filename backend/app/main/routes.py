@@ -4,7 +4,7 @@
 处理页面渲染和基本路由
 """
 
-from flask import send_from_directory, current_app
+from flask import send_from_directory, current_app, Response, abort
 from . import main_bp
 import os
 
@@ -36,14 +36,38 @@ def serve_vue_app(path):
 @main_bp.route('/storage/<path:filename>')
 def serve_storage_files(filename):
     """服务存储目录中的文件"""
+    from ..services.storage_manager import storage_manager
+
     storage_dir = os.path.join(current_app.root_path, '../../storage')
-    return send_from_directory(storage_dir, filename)
+    response = send_from_directory(storage_dir, filename)
+    storage_manager.touch(os.path.join(storage_dir, filename))
+    return response
 
 
 @main_bp.route('/health')
 def health_check():
     """健康检查接口"""
+    from ..services.warmup import warmup_state
     return {
         'status': 'healthy',
-        'message': 'Gemini Image App is running'
+        'message': 'Gemini Image App is running',
+        'ready': warmup_state.ready,
+        'warmup': warmup_state.to_dict()
     }
+
+
+@main_bp.route('/metrics')
+def metrics_export():
+    """Prometheus 指标导出（请求、后端各阶段耗时、模型加载、缓存命中率、队列深度）"""
+    from ..utils.metrics import render_metrics, CONTENT_TYPE
+    if not current_app.config.get('METRICS_ENABLED', True):
+        abort(404)
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
+@main_bp.route('/health/ready')
+def readiness_check():
+    """就绪检查接口 - 模型预热完成前返回503，供负载均衡判断是否转发流量"""
+    from ..services.warmup import warmup_state
+    state = warmup_state.to_dict()
+    return state, 200 if state['ready'] else 503
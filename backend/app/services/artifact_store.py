@@ -0,0 +1,253 @@
+"""
+结果图像按需渲染
+检测/分割接口通过 artifacts 参数控制生成哪些结果图像：
+- all: 立即生成每个对象的图像和汇总图（默认，与原行为一致）
+- summary: 只立即生成汇总图
+- none: 不生成任何图像
+未立即生成的图像只保存渲染参数，首次通过 GET /api/results/<id>/artifacts/<name> 请求时才渲染并缓存
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import cv2
+from flask import current_app
+from ..utils.image_input import ImageInput
+from ..utils.rendering import DetectionRenderer, RenderItem, MODE_HIGHLIGHT, contour_cutout
+from .storage_manager import storage_manager
+from ..utils.metrics import time_stage
+
+
+ARTIFACTS_NONE = 'none'
+ARTIFACTS_SUMMARY = 'summary'
+ARTIFACTS_ALL = 'all'
+ARTIFACT_MODES = (ARTIFACTS_NONE, ARTIFACTS_SUMMARY, ARTIFACTS_ALL)
+
+# 延迟渲染的结果类型
+KIND_BOXES = 'boxes'              # 边界框高亮图/裁剪图 + 汇总图
+KIND_CONTOUR_CUTOUT = 'contour'   # 按轮廓抠图的分割图像
+
+SUMMARY = 'summary'
+
+
+def parse_artifacts_mode(value):
+    """解析请求中的 artifacts 参数，未提供或无效时使用配置的默认值"""
+    value = (value or '').strip().lower()
+    if value in ARTIFACT_MODES:
+        return value
+    return current_app.config.get('DEFAULT_ARTIFACTS', ARTIFACTS_ALL)
+
+
+def artifact_url(result_id, name):
+    """结果图像的按需渲染地址"""
+    return f'/api/results/{result_id}/artifacts/{name}'
+
+
+class ArtifactStore:
+    """保存延迟渲染所需的参数，按需渲染并缓存结果图像"""
+
+    def __init__(self, db_path, output_folder):
+        self.db_path = db_path
+        self.output_folder = output_folder
+        self._lock = threading.Lock()
+        self._render_locks = {}
+        for folder in (os.path.dirname(db_path), output_folder):
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS artifact_results (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    source_path TEXT NOT NULL,
+                    spec TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_artifact_source ON artifact_results (source_path)')
+            self._conn.commit()
+
+    def save(self, kind, source_path, spec):
+        """保存渲染参数，返回结果ID"""
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO artifact_results (id, kind, source_path, spec, created_at) VALUES (?, ?, ?, ?, ?)',
+                (result_id, kind, source_path, json.dumps(spec, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+        return result_id
+
+    def get(self, result_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM artifact_results WHERE id = ?', (result_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record['spec'] = json.loads(record['spec'])
+        return record
+
+    def render(self, result_id, name):
+        """
+        获取结果图像路径，尚未渲染时立即渲染并缓存
+
+        Args:
+            result_id (str): 结果ID
+            name (str): summary 或对象序号
+
+        Returns:
+            str | None: 图像路径，结果或图像不存在时返回None
+        """
+        record = self.get(result_id)
+        if record is None:
+            return None
+        spec = record['spec']
+        index = None
+        if name != SUMMARY:
+            if not name.isdigit() or int(name) >= len(spec.get('items', [])):
+                return None
+            index = int(name)
+        elif not spec.get('summary', True):
+            return None
+
+        output_path = os.path.join(self.output_folder, f"{result_id}_{name}.{spec.get('extension', 'png')}")
+        if os.path.exists(output_path):
+            storage_manager.touch(output_path)
+            return output_path
+
+        # 同一图像只渲染一次，并发请求等待首个请求完成后直接复用
+        with self._lock:
+            render_lock = self._render_locks.setdefault(output_path, threading.Lock())
+        try:
+            with render_lock:
+                if not os.path.exists(output_path):
+                    if not os.path.exists(record['source_path']):
+                        return None
+                    tmp_path = f'{output_path}.{uuid.uuid4().hex[:8]}.tmp{os.path.splitext(output_path)[1]}'
+                    try:
+                        self._render_to(record, index, tmp_path)
+                        os.replace(tmp_path, output_path)
+                    except Exception:
+                        # 渲染失败时不在结果目录中留下临时文件
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                        raise
+                    storage_manager.track(output_path)
+                    storage_manager.touch(record['source_path'])
+        finally:
+            with self._lock:
+                self._render_locks.pop(output_path, None)
+        return output_path
+
+    def forget_sources(self, area, paths):
+        """源图像被存储清理删除后，移除依赖它的结果记录（存储管理的清理回调）"""
+        if area != 'uploads' or not paths:
+            return
+        with self._lock:
+            self._conn.executemany('DELETE FROM artifact_results WHERE source_path = ?', [(path,) for path in paths])
+            self._conn.commit()
+
+    def _render_to(self, record, index, output_path):
+        spec = record['spec']
+        source = ImageInput.from_path(record['source_path'])
+        if record['kind'] == KIND_CONTOUR_CUTOUT:
+            item = spec['items'][index]
+            cutout = contour_cutout(source.bgr, item['contour'], tuple(item['crop_box']), item.get('feather', True))
+            with time_stage('disk_write', 'artifact'):
+                cv2.imwrite(output_path, cutout)
+            return
+
+        renderer = DetectionRenderer(source)
+        if index is None:
+            renderer.render([RenderItem.from_dict(item) for item in spec['items']], summary_path=output_path)
+        else:
+            renderer.render(
+                [RenderItem.from_dict(spec['items'][index], output_path)],
+                mode=spec.get('mode', MODE_HIGHLIGHT),
+                expand_ratio=spec.get('expand_ratio', 0.0),
+                min_crop_size=spec.get('min_crop_size', 0)
+            )
+
+
+# 进程级单例，首次使用时按应用配置创建
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """获取进程级共享的结果图像存储"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = current_app.config
+            _store = ArtifactStore(config['ARTIFACT_STORE_PATH'], config['ARTIFACT_FOLDER'])
+            storage_manager.add_eviction_listener(_store.forget_sources)
+        return _store
+
+
+def render_detection_artifacts(source, items, summary_path, artifacts=ARTIFACTS_ALL,
+                               mode=MODE_HIGHLIGHT, expand_ratio=0.0, min_crop_size=0):
+    """
+    按 artifacts 模式渲染检测结果图像
+
+    Args:
+        source (ImageInput): 源图像
+        items (list[RenderItem]): 待渲染的对象（output_path 为立即渲染时的保存路径）
+        summary_path (str): 立即渲染时汇总图的保存路径
+        artifacts (str): none / summary / all
+        mode, expand_ratio, min_crop_size: 逐对象图像的渲染方式，见 DetectionRenderer.render
+
+    Returns:
+        dict: 合并到接口返回结果中的字段（bbox_images、summary_image，延迟渲染时附带 result_id 和 artifact_urls）
+    """
+    if artifacts == ARTIFACTS_ALL:
+        bbox_images, summary_image = DetectionRenderer(source).render(
+            items, summary_path=summary_path, mode=mode, expand_ratio=expand_ratio, min_crop_size=min_crop_size)
+        return {'bbox_images': bbox_images, 'summary_image': summary_image, 'artifacts': artifacts}
+
+    summary_image = None
+    if artifacts == ARTIFACTS_SUMMARY:
+        summary_items = [RenderItem.from_dict(item.to_dict()) for item in items]
+        _, summary_image = DetectionRenderer(source).render(summary_items, summary_path=summary_path)
+
+    extension = os.path.splitext(summary_path)[1].lstrip('.').lower() or 'png'
+    result_id = get_artifact_store().save(KIND_BOXES, source.ensure_saved(), {
+        'items': [item.to_dict() for item in items],
+        'mode': mode,
+        'expand_ratio': expand_ratio,
+        'min_crop_size': min_crop_size,
+        'extension': extension,
+        # summary 模式下汇总图已立即写入，不再按需重复渲染
+        'summary': artifacts != ARTIFACTS_SUMMARY
+    })
+    artifact_urls = {'objects': [artifact_url(result_id, index) for index in range(len(items))]}
+    if artifacts != ARTIFACTS_SUMMARY:
+        artifact_urls['summary'] = artifact_url(result_id, SUMMARY)
+    return {
+        'bbox_images': [],
+        'summary_image': summary_image,
+        'artifacts': artifacts,
+        'result_id': result_id,
+        'artifact_urls': artifact_urls
+    }
+
+
+def defer_contour_cutouts(source, cutouts):
+    """
+    保存按轮廓抠图的渲染参数，返回 (结果ID, 各对象的按需渲染地址)
+
+    Args:
+        source (ImageInput): 源图像
+        cutouts (list[dict]): 每个对象的 contour（轮廓点列表）、crop_box 和可选的 feather（柔和边缘，默认开启）
+    """
+    result_id = get_artifact_store().save(KIND_CONTOUR_CUTOUT, source.ensure_saved(), {
+        'items': cutouts,
+        'summary': False,
+        'extension': 'png'
+    })
+    return result_id, [artifact_url(result_id, index) for index in range(len(cutouts))]
@@ -0,0 +1,192 @@
+"""
+Gemini客户端池
+每个API Key在进程内只创建一个 genai.Client，各请求复用其底层HTTP连接池（保持长连接），
+避免每次调用都重新建立TLS连接；用户提交测试的API Key按最近使用淘汰，服务端配置的Key常驻。
+配置了调度器时，客户端包装为 ScheduledClient，生成类调用经过调度器限速和重试
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import httpx
+from google import genai
+from google.genai import types
+from flask import current_app
+from .gemini_scheduler import ScheduledClient, get_gemini_scheduler
+
+
+def key_fingerprint(api_key):
+    """API Key的指纹（统计信息中代替明文Key）"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+
+class GeminiClientPool:
+    """按API Key复用的Gemini客户端池（线程安全）"""
+
+    def __init__(self, max_keys=32, max_connections=20, keepalive_expiry=120.0, timeout_ms=None, scheduler=None,
+                 async_max_connections=1000, base_url=None):
+        """
+        Args:
+            max_keys (int): 最多保留的非常驻Key数量，超出时淘汰最久未使用的
+            max_connections (int): 每个Key的最大并发连接数（也是保持的空闲长连接数）
+            async_max_connections (int): 每个Key的异步客户端（client.aio）最大并发连接数
+            keepalive_expiry (float): 空闲连接保持时间（秒）
+            timeout_ms (int): 单次请求超时（毫秒），为None时使用SDK默认值
+            scheduler (GeminiScheduler): 调用调度器，为None时客户端不经过调度
+            base_url (str): API地址，为None时使用SDK默认的Google地址
+        """
+        self.max_keys = max_keys
+        self.max_connections = max_connections
+        self.async_max_connections = async_max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout_ms = timeout_ms
+        self.scheduler = scheduler
+        self.base_url = base_url
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()  # 指纹 -> 客户端条目
+        self._pinned = set()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def get(self, api_key, pinned=False):
+        """
+        获取API Key对应的客户端，不存在时创建
+
+        Args:
+            api_key (str): API Key
+            pinned (bool): 是否常驻（服务端配置的Key不会被淘汰）
+        """
+        if not api_key:
+            raise ValueError('未配置 Gemini API Key')
+        fingerprint = key_fingerprint(api_key)
+        with self._lock:
+            entry = self._clients.get(fingerprint)
+            if entry is not None:
+                self._clients.move_to_end(fingerprint)
+                entry['last_used'] = time.time()
+                entry['requests'] += 1
+                self.reused += 1
+                if pinned:
+                    self._pinned.add(fingerprint)
+                return entry['client']
+
+            client = self._create(api_key, fingerprint)
+            self._clients[fingerprint] = {
+                'client': client,
+                'created_at': time.time(),
+                'last_used': time.time(),
+                'requests': 1,
+                'warmed': False
+            }
+            self.created += 1
+            if pinned:
+                self._pinned.add(fingerprint)
+            self._evict_locked()
+            return client
+
+    def warm(self, api_key, model, pinned=True):
+        """预热：创建客户端并发起一次轻量请求（查询模型信息），提前建立TLS连接"""
+        client = self.get(api_key, pinned=pinned)
+        client.models.get(model=model)
+        with self._lock:
+            entry = self._clients.get(key_fingerprint(api_key))
+            if entry is not None:
+                entry['warmed'] = True
+        return client
+
+    def discard(self, api_key):
+        """移除API Key对应的客户端（如Key已失效）"""
+        with self._lock:
+            fingerprint = key_fingerprint(api_key)
+            self._pinned.discard(fingerprint)
+            return self._clients.pop(fingerprint, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'pinned': len(self._pinned),
+                'max_keys': self.max_keys,
+                'max_connections': self.max_connections,
+                'async_max_connections': self.async_max_connections,
+                'keepalive_expiry': self.keepalive_expiry,
+                'base_url': self.base_url,
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'keys': [{
+                    'fingerprint': fingerprint,
+                    'pinned': fingerprint in self._pinned,
+                    'requests': entry['requests'],
+                    'warmed': entry['warmed'],
+                    'idle_seconds': round(time.time() - entry['last_used'], 1)
+                } for fingerprint, entry in self._clients.items()]
+            }
+
+    def _create(self, api_key, fingerprint):
+        # 连接上限与空闲长连接数相同，突发请求结束后连接仍保留供后续复用
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        # 异步客户端由一个事件循环承载大量并发请求，连接上限单独配置
+        async_limits = httpx.Limits(
+            max_connections=self.async_max_connections,
+            max_keepalive_connections=self.async_max_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        http_options = types.HttpOptions(
+            client_args={'limits': limits},
+            async_client_args={'limits': async_limits},
+            timeout=self.timeout_ms,
+            base_url=self.base_url
+        )
+        client = genai.Client(api_key=api_key, http_options=http_options)
+        if self.scheduler is not None:
+            return ScheduledClient(client, self.scheduler, fingerprint)
+        return client
+
+    def _evict_locked(self):
+        """淘汰最久未使用的非常驻客户端，直到数量不超过上限"""
+        unpinned = [fp for fp in self._clients if fp not in self._pinned]
+        while len(unpinned) > self.max_keys:
+            self._clients.pop(unpinned.pop(0), None)
+            self.evicted += 1
+
+
+# 进程级单例，首次使用时按应用配置创建
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_gemini_client_pool():
+    """获取进程级共享的Gemini客户端池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = current_app.config
+            timeout = config.get('GEMINI_HTTP_TIMEOUT', 0)
+            _pool = GeminiClientPool(
+                max_keys=config.get('GEMINI_CLIENT_POOL_MAX_KEYS', 32),
+                max_connections=config.get('GEMINI_HTTP_MAX_CONNECTIONS', 20),
+                async_max_connections=config.get('GEMINI_ASYNC_MAX_CONNECTIONS', 1000),
+                keepalive_expiry=config.get('GEMINI_HTTP_KEEPALIVE', 120),
+                timeout_ms=int(timeout * 1000) if timeout else None,
+                base_url=config.get('GEMINI_BASE_URL') or None,
+                scheduler=get_gemini_scheduler() if config.get('GEMINI_SCHEDULER_ENABLED', True) else None
+            )
+        return _pool
+
+
+def get_gemini_client(api_key=None):
+    """
+    获取共享的Gemini客户端
+
+    Args:
+        api_key (str): 用户提供的API Key，为None时使用服务端配置的Key（常驻）
+    """
+    if api_key is None:
+        return get_gemini_client_pool().get(current_app.config['GEMINI_API_KEY'], pinned=True)
+    return get_gemini_client_pool().get(api_key)
@@ -0,0 +1,502 @@
+"""
+Gemini调用调度
+所有生成类调用（generate_content / generate_images / generate_videos 等）都经过进程级调度器：
+- 按 (API Key, 模型) 的令牌桶限制请求速率，速率和突发容量来自配置
+- 等待配额的调用按优先级排队（交互式问答优先于普通请求，普通请求优先于后台任务）
+- 遇到 429 / RESOURCE_EXHAUSTED 时暂停该模型的令牌发放，并按带抖动的指数退避重试，
+  重试用尽后抛出 GeminiQuotaError，调用方不应再发起依赖Gemini的备选调用
+客户端池创建的客户端会包装为 ScheduledClient，服务代码无需修改调用方式；
+异步客户端（client.aio）的调用同样经过调度，与同步调用共用令牌桶和等待队列
+"""
+import asyncio
+import functools
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from collections import deque
+from flask import current_app
+from ..utils.metrics import GEMINI_QUEUE_WAIT
+
+
+PRIORITY_INTERACTIVE = 0  # 交互式问答
+PRIORITY_NORMAL = 1       # 普通请求
+PRIORITY_BATCH = 2        # 后台任务（视频任务轮询、模板预先改写等）
+
+# 经过调度的模型调用方法
+SCHEDULED_METHODS = ('generate_content', 'generate_images', 'generate_videos', 'edit_image', 'upscale_image')
+
+# 异步调用排队时重新检查队首的最长间隔（秒），同步调用释放配额时无法唤醒协程
+ASYNC_POLL_INTERVAL = 0.05
+
+_RETRY_DELAY_PATTERN = re.compile(r"retryDelay['\"]?\s*:\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+class GeminiQuotaError(Exception):
+    """调用配额不足：重试用尽仍被限流，或排队等待超时"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(error):
+    """
+    是否为配额/限流错误（429 RESOURCE_EXHAUSTED）
+
+    按SDK错误的状态码和状态判断；错误文本中只匹配状态名称，不匹配数字 429（请求ID、字节数、像素尺寸中都可能出现）
+    """
+    if getattr(error, 'code', None) == 429 or getattr(error, 'status', None) == 'RESOURCE_EXHAUSTED':
+        return True
+    return 'RESOURCE_EXHAUSTED' in str(error)
+
+
+def is_retryable_error(error):
+    """是否为可重试的错误（限流，或服务端暂时不可用）"""
+    if is_rate_limit_error(error):
+        return True
+    return getattr(error, 'code', None) == 503 or 'UNAVAILABLE' in str(error)
+
+
+def quota_exhausted_result(error):
+    """配额不足时的接口返回结果"""
+    result = {
+        'success': False,
+        'error': f'Gemini 调用配额不足，请稍后重试: {str(error)}',
+        'quota_exhausted': True
+    }
+    if getattr(error, 'retry_after', None):
+        result['retry_after'] = round(error.retry_after, 1)
+    return result, 429
+
+
+class TokenBucket:
+    """令牌桶（调用方需持有调度器的锁）"""
+
+    def __init__(self, rpm, burst=0):
+        """
+        Args:
+            rpm (float): 每分钟请求数，0表示不限速
+            burst (int): 桶容量（允许的突发请求数），0表示按10秒的配额计算
+        """
+        self.rate = rpm / 60.0
+        self.capacity = float(burst or max(1, int(rpm / 6))) if rpm else 0.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def take(self, now):
+        """取一个令牌，成功返回0，否则返回还需等待的秒数"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, until):
+        """被限流后暂停发放令牌，恢复后从空桶开始"""
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = 0.0
+        self.updated = max(self.updated, until)
+
+
+class _ModelQueue:
+    """单个 (API Key, 模型) 的令牌桶、等待队列和统计"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.waiting = []  # (优先级, 序号) 的最小堆
+        self.max_depth = 0
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.waits = deque(maxlen=1000)
+
+
+class GeminiScheduler:
+    """进程级Gemini调用调度器（线程安全）"""
+
+    def __init__(self, limits=None, default_rpm=0, burst=0, max_retries=3,
+                 base_delay=1.0, max_delay=30.0, queue_timeout=60.0):
+        """
+        Args:
+            limits (dict): 各模型的每分钟请求数 {模型: rpm}
+            default_rpm (float): 未单独配置的模型的每分钟请求数，0表示不限速
+            burst (int): 令牌桶容量，0表示按10秒的配额计算
+            max_retries (int): 限流或服务暂时不可用时的最大重试次数
+            base_delay (float): 退避的初始延迟（秒）
+            max_delay (float): 退避的最大延迟（秒）
+            queue_timeout (float): 排队等待配额的最长时间（秒），0表示不限
+        """
+        self.limits = dict(limits or {})
+        self.default_rpm = default_rpm
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._seq = itertools.count()
+
+    def call(self, key, model, func, priority=PRIORITY_NORMAL):
+        """
+        排队取得配额后执行调用，可重试的错误按带抖动的指数退避重试
+
+        Args:
+            key (str): API Key指纹（不同Key的配额相互独立）
+            model (str): 模型名称
+            func: 实际的SDK调用（无参数，每次重试重新调用）
+            priority (int): 排队优先级，数值越小越优先
+        """
+        attempt = 0
+        while True:
+            self._acquire(key, model, priority)
+            try:
+                return func()
+            except Exception as e:
+                attempt, delay = self._handle_error(key, model, e, attempt)
+                time.sleep(delay)
+
+    async def acall(self, key, model, func, priority=PRIORITY_NORMAL):
+        """call 的协程版本，func 返回可等待对象，排队和退避期间不占用线程"""
+        attempt = 0
+        while True:
+            await self._aacquire(key, model, priority)
+            try:
+                return await func()
+            except Exception as e:
+                attempt, delay = self._handle_error(key, model, e, attempt)
+                await asyncio.sleep(delay)
+
+    def stream(self, key, model, func, priority=PRIORITY_NORMAL):
+        """
+        流式调用：在收到第一段响应前遇到可重试的错误时重试，之后的错误直接抛出
+
+        Returns:
+            generator: 响应片段，关闭生成器时同时关闭上游的流
+        """
+        attempt = 0
+        while True:
+            self._acquire(key, model, priority)
+            stream = func()
+            try:
+                first = next(stream)
+                break
+            except StopIteration:
+                return
+            except Exception as e:
+                stream.close()
+                attempt, delay = self._handle_error(key, model, e, attempt)
+                time.sleep(delay)
+
+        try:
+            yield first
+            yield from stream
+        finally:
+            stream.close()
+
+    async def astream(self, key, model, func, priority=PRIORITY_NORMAL):
+        """stream 的协程版本，func 返回可等待对象，其结果为异步迭代器"""
+        attempt = 0
+        while True:
+            await self._aacquire(key, model, priority)
+            stream = None
+            try:
+                stream = await func()
+                first = await stream.__anext__()
+                break
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                await _aclose(stream)
+                attempt, delay = self._handle_error(key, model, e, attempt)
+                await asyncio.sleep(delay)
+
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await _aclose(stream)
+
+    def stats(self):
+        with self._cond:
+            models = []
+            for (key, model), queue in self._queues.items():
+                waits = sorted(queue.waits)
+                models.append({
+                    'key': key,
+                    'model': model,
+                    'rpm': round(queue.bucket.rate * 60, 2),
+                    'burst': queue.bucket.capacity,
+                    'tokens': round(queue.bucket.tokens, 2),
+                    'blocked_for': round(max(0.0, queue.bucket.blocked_until - time.monotonic()), 2),
+                    'queue_depth': len(queue.waiting),
+                    'max_queue_depth': queue.max_depth,
+                    'calls': queue.calls,
+                    'retries': queue.retries,
+                    'rate_limited': queue.rate_limited,
+                    'timeouts': queue.timeouts,
+                    'failures': queue.failures,
+                    'wait_ms': {
+                        'avg': round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                        'p95': round(waits[int(len(waits) * 0.95)] * 1000, 2) if waits else 0.0,
+                        'max': round(waits[-1] * 1000, 2) if waits else 0.0
+                    }
+                })
+        return {
+            'default_rpm': self.default_rpm,
+            'max_retries': self.max_retries,
+            'queue_timeout': self.queue_timeout,
+            'queue_depth': sum(m['queue_depth'] for m in models),
+            'models': models
+        }
+
+    def _queue(self, key, model):
+        queue = self._queues.get((key, model))
+        if queue is None:
+            queue = _ModelQueue(TokenBucket(self.limits.get(model, self.default_rpm), self.burst))
+            self._queues[(key, model)] = queue
+        return queue
+
+    def _acquire(self, key, model, priority):
+        """按优先级排队，轮到队首且取得令牌后返回"""
+        started = time.monotonic()
+        with self._cond:
+            queue, ticket = self._enqueue(key, model, priority)
+            try:
+                while True:
+                    wait = self._poll(queue, ticket, model, started)
+                    if wait == 0:
+                        break
+                    self._cond.wait(wait)
+            finally:
+                self._dequeue(queue, ticket)
+            self._record_wait(queue, model, started)
+
+    async def _aacquire(self, key, model, priority):
+        """_acquire 的协程版本：等待期间不持有锁，定期重新检查是否轮到自己"""
+        started = time.monotonic()
+        with self._cond:
+            queue, ticket = self._enqueue(key, model, priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._poll(queue, ticket, model, started)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait or ASYNC_POLL_INTERVAL, ASYNC_POLL_INTERVAL))
+        finally:
+            with self._cond:
+                self._dequeue(queue, ticket)
+        with self._cond:
+            self._record_wait(queue, model, started)
+
+    def _enqueue(self, key, model, priority):
+        queue = self._queue(key, model)
+        ticket = (priority, next(self._seq))
+        heapq.heappush(queue.waiting, ticket)
+        queue.max_depth = max(queue.max_depth, len(queue.waiting))
+        return queue, ticket
+
+    def _poll(self, queue, ticket, model, started):
+        """
+        轮到队首时尝试取令牌，排队超时时抛出异常
+
+        Returns:
+            float: 取得令牌时为0，否则为应等待的秒数（None表示等待其他调用释放队首）
+        """
+        now = time.monotonic()
+        wait = None
+        if queue.waiting[0] == ticket:
+            wait = queue.bucket.take(now)
+            if wait <= 0:
+                return 0
+        if self.queue_timeout:
+            remaining = started + self.queue_timeout - now
+            if remaining <= 0:
+                queue.timeouts += 1
+                raise GeminiQuotaError(f'等待 {model} 调用配额超时（{self.queue_timeout} 秒）', wait)
+            wait = remaining if wait is None else min(wait, remaining)
+        return wait
+
+    def _dequeue(self, queue, ticket):
+        queue.waiting.remove(ticket)
+        heapq.heapify(queue.waiting)
+        # 队首变化或令牌已取走，唤醒其他等待者重新检查
+        self._cond.notify_all()
+
+    @staticmethod
+    def _record_wait(queue, model, started):
+        wait = time.monotonic() - started
+        queue.calls += 1
+        queue.waits.append(wait)
+        GEMINI_QUEUE_WAIT.labels(model).observe(wait)
+
+    def _handle_error(self, key, model, error, attempt):
+        """
+        可重试时暂停该模型的令牌发放，否则抛出异常
+
+        Returns:
+            tuple: (下一次的重试序号, 重试前调用方需等待的秒数)
+        """
+        rate_limited = is_rate_limit_error(error)
+        with self._cond:
+            queue = self._queue(key, model)
+            if rate_limited:
+                queue.rate_limited += 1
+            if not is_retryable_error(error) or attempt >= self.max_retries:
+                queue.failures += 1
+                if rate_limited:
+                    raise GeminiQuotaError(f'{model} 调用被限流，已重试 {attempt} 次: {error}',
+                                           self._backoff(attempt, error)) from error
+                raise error
+
+            delay = self._backoff(attempt, error)
+            queue.retries += 1
+            # 限流时同一模型的其他调用一起等待，避免继续消耗配额
+            queue.bucket.block(time.monotonic() + delay)
+            self._cond.notify_all()
+        print(f"Gemini调用失败，{delay:.1f} 秒后重试（{model}，第 {attempt + 1} 次）: {str(error)[:200]}")
+        # 限流时令牌桶已暂停，重新排队即可；服务暂时不可用时由调用方等待
+        return attempt + 1, 0.0 if rate_limited else delay
+
+    def _backoff(self, attempt, error):
+        """带抖动的指数退避延迟，响应中给出 retryDelay 时不少于该值"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        match = _RETRY_DELAY_PATTERN.search(str(error))
+        if match:
+            delay = max(delay, min(self.max_delay, float(match.group(1))))
+        return delay
+
+
+async def _aclose(stream):
+    """关闭异步的上游流（释放连接）"""
+    close = getattr(stream, 'aclose', None)
+    if close is not None:
+        await close()
+
+
+class _ScheduledModels:
+    """client.models 的代理：生成类调用经过调度器，其余方法直接转发"""
+
+    def __init__(self, models, scheduler, key, priority):
+        self._models = models
+        self._scheduler = scheduler
+        self._key = key
+        self._priority = priority
+
+    def __getattr__(self, name):
+        attr = getattr(self._models, name)
+        if name not in SCHEDULED_METHODS:
+            return attr
+
+        def scheduled(*args, **kwargs):
+            model = kwargs.get('model', args[0] if args else '')
+            return self._scheduler.call(self._key, model, functools.partial(attr, *args, **kwargs), self._priority)
+        return scheduled
+
+    def generate_content_stream(self, *args, **kwargs):
+        model = kwargs.get('model', args[0] if args else '')
+        return self._scheduler.stream(
+            self._key, model, functools.partial(self._models.generate_content_stream, *args, **kwargs), self._priority)
+
+
+class _ScheduledAsyncModels:
+    """client.aio.models 的代理：生成类调用经过调度器（协程），其余方法直接转发"""
+
+    def __init__(self, models, scheduler, key, priority):
+        self._models = models
+        self._scheduler = scheduler
+        self._key = key
+        self._priority = priority
+
+    def __getattr__(self, name):
+        attr = getattr(self._models, name)
+        if name not in SCHEDULED_METHODS:
+            return attr
+
+        async def scheduled(*args, **kwargs):
+            model = kwargs.get('model', args[0] if args else '')
+            return await self._scheduler.acall(
+                self._key, model, functools.partial(attr, *args, **kwargs), self._priority)
+        return scheduled
+
+    async def generate_content_stream(self, *args, **kwargs):
+        model = kwargs.get('model', args[0] if args else '')
+        return self._scheduler.astream(
+            self._key, model, functools.partial(self._models.generate_content_stream, *args, **kwargs), self._priority)
+
+
+class _ScheduledAsyncClient:
+    """client.aio 的代理"""
+
+    def __init__(self, aio, scheduler, key, priority):
+        self._aio = aio
+        self.models = _ScheduledAsyncModels(aio.models, scheduler, key, priority)
+
+    def __getattr__(self, name):
+        return getattr(self._aio, name)
+
+
+class ScheduledClient:
+    """genai.Client 的代理，models 和 aio.models 上的生成类调用经过调度器"""
+
+    def __init__(self, client, scheduler, key, priority=PRIORITY_NORMAL):
+        self._client = client
+        self._scheduler = scheduler
+        self._key = key
+        self.priority = priority
+        self.models = _ScheduledModels(client.models, scheduler, key, priority)
+
+    @property
+    def aio(self):
+        return _ScheduledAsyncClient(self._client.aio, self._scheduler, self._key, self.priority)
+
+    def with_priority(self, priority):
+        """同一底层客户端的指定优先级视图"""
+        return ScheduledClient(self._client, self._scheduler, self._key, priority)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def prioritized(client, priority):
+    """返回指定优先级的客户端（未经过调度的客户端原样返回）"""
+    if isinstance(client, ScheduledClient):
+        return client.with_priority(priority)
+    return client
+
+
+# 进程级单例，首次使用时按应用配置创建
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_gemini_scheduler():
+    """获取进程级共享的Gemini调用调度器"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            config = current_app.config
+            _scheduler = GeminiScheduler(
+                limits=config.get('GEMINI_RATE_LIMITS', {}),
+                default_rpm=config.get('GEMINI_DEFAULT_RPM', 0),
+                burst=config.get('GEMINI_RATE_BURST', 0),
+                max_retries=config.get('GEMINI_RETRY_MAX', 3),
+                base_delay=config.get('GEMINI_RETRY_BASE_DELAY', 1.0),
+                max_delay=config.get('GEMINI_RETRY_MAX_DELAY', 30.0),
+                queue_timeout=config.get('GEMINI_QUEUE_TIMEOUT', 60.0)
+            )
+        return _scheduler
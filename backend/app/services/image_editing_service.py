@@ -5,10 +5,9 @@ import os
 import cv2
 import numpy as np
 from PIL import Image, ImageFilter, ImageEnhance, ImageOps
-import tempfile
-import base64
 from flask import current_app
-from ..utils.helpers import save_uploaded_file, allowed_file
+from ..utils.image_input import load_image_input, ImageInputError
+from .storage_manager import storage_manager
 from google import genai
 from google.genai import types
 
@@ -17,33 +16,25 @@ class ImageEditingService:
     def __init__(self, client):
         self.client = client
 
-    def edit_image(self, file=None, image_data=None, edit_type='gemini', edit_params=None):
-        """图像编辑主函数"""
+    def edit_image(self, file=None, image_data=None, edit_type='gemini', edit_params=None, image=None):
+        """图像编辑主函数（image 为已解码的 ImageInput 时直接使用）"""
         try:
-            # 处理文件输入
-            if image_data:
-                image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(image_data_clean)
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                    tmp_file.write(image_bytes)
-                    filepath = tmp_file.name
-            else:
-                if not file or file.filename == '':
-                    return {'success': False, 'error': '未选择文件'}, 400
-                if not allowed_file(file.filename):
-                    return {'success': False, 'error': '无效的文件类型'}, 400
-                filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
+            # 解析图像输入（只解码一次，不落盘）
+            try:
+                image = load_image_input(file, image_data, image)
+            except ImageInputError as e:
+                return {'success': False, 'error': str(e)}, 400
 
             if edit_type == 'gemini':
-                return self._edit_with_gemini(filepath, edit_params)
+                return self._edit_with_gemini(image, edit_params)
             elif edit_type == 'filter':
-                return self._apply_filter(filepath, edit_params)
+                return self._apply_filter(image, edit_params)
             elif edit_type == 'enhance':
-                return self._enhance_image(filepath, edit_params)
+                return self._enhance_image(image, edit_params)
             elif edit_type == 'transform':
-                return self._transform_image(filepath, edit_params)
+                return self._transform_image(image, edit_params)
             elif edit_type == 'repair':
-                return self._repair_image(filepath, edit_params)
+                return self._repair_image(image, edit_params)
             else:
                 return {'success': False, 'error': '不支持的编辑类型'}, 400
 
@@ -52,22 +43,20 @@ class ImageEditingService:
             print(f"图像编辑错误: {e}")
             return {'success': False, 'error': error_msg}, 500
 
-    def _edit_with_gemini(self, filepath, edit_params):
+    def _edit_with_gemini(self, source, edit_params):
         """使用 Gemini 进行 AI 图像编辑"""
         try:
             instruction = edit_params.get('instruction', '请编辑这张图像')
             gemini_model = edit_params.get('gemini_model', current_app.config['GEMINI_IMAGE_GEN_MODEL'])
 
-            # 读取图像
-            with open(filepath, 'rb') as f:
-                image_bytes = f.read()
+            image_bytes = source.data
 
             # 使用指定的 Gemini 模型进行图像编辑
             response = self.client.models.generate_content(
                 model=gemini_model,
                 contents=[
                     instruction,
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
+                    types.Part.from_bytes(data=image_bytes, mime_type=source.mime_type)
                 ],
                 config=types.GenerateContentConfig(response_modalities=["Text", "Image"])
             )
@@ -76,18 +65,19 @@ class ImageEditingService:
             edited_images = []
             for part in response.candidates[0].content.parts:
                 if hasattr(part, 'inline_data') and part.inline_data is not None:
-                    filename = f"gemini_edited_{hash(instruction) % 10000}_{os.path.basename(filepath)}"
+                    filename = f"gemini_edited_{hash(instruction) % 10000}_{source.name}"
                     output_path = os.path.join(current_app.config['GENERATED_FOLDER'], filename)
 
                     with open(output_path, 'wb') as f:
                         f.write(part.inline_data.data)
+                    storage_manager.track(output_path)
 
                     edited_images.append(output_path)
 
             if edited_images:
                 return {
                     'success': True,
-                    'original_image': filepath,
+                    'original_image': source.reference_path(),
                     'edited_images': edited_images,
                     'edit_type': f'Gemini AI 编辑 ({gemini_model})',
                     'instruction': instruction
@@ -98,13 +88,13 @@ class ImageEditingService:
         except Exception as e:
             return {'success': False, 'error': f'Gemini 编辑失败: {str(e)}'}, 500
 
-    def _apply_filter(self, filepath, edit_params):
+    def _apply_filter(self, source, edit_params):
         """应用图像滤镜"""
         filter_type = edit_params.get('filter_type', 'blur')
         intensity = edit_params.get('intensity', 1.0)
 
-        # 使用 PIL 打开图像
-        image = Image.open(filepath)
+        # 使用共享的 PIL 图像（滤镜操作均返回新图像）
+        image = source.pil
 
         edited_images = []
 
@@ -144,25 +134,26 @@ class ImageEditingService:
             return {'success': False, 'error': f'不支持的滤镜类型: {filter_type}'}, 400
 
         # 保存滤镜后的图像
-        filename = f"filter_{filter_type}_{os.path.basename(filepath)}"
+        filename = f"filter_{filter_type}_{source.name}"
         output_path = os.path.join(current_app.config['GENERATED_FOLDER'], filename)
         filtered_image.save(output_path)
+        storage_manager.track(output_path)
         edited_images.append(output_path)
 
         return {
             'success': True,
-            'original_image': filepath,
+            'original_image': source.reference_path(),
             'edited_images': edited_images,
             'edit_type': f'{filter_type} 滤镜',
             'parameters': edit_params
         }, 200
 
-    def _enhance_image(self, filepath, edit_params):
+    def _enhance_image(self, source, edit_params):
         """图像增强"""
         enhance_type = edit_params.get('enhance_type', 'brightness')
         factor = edit_params.get('factor', 1.2)
 
-        image = Image.open(filepath)
+        image = source.pil
         edited_images = []
 
         if enhance_type == 'brightness':
@@ -194,24 +185,25 @@ class ImageEditingService:
             return {'success': False, 'error': f'不支持的增强类型: {enhance_type}'}, 400
 
         # 保存增强后的图像
-        filename = f"enhance_{enhance_type}_{os.path.basename(filepath)}"
+        filename = f"enhance_{enhance_type}_{source.name}"
         output_path = os.path.join(current_app.config['GENERATED_FOLDER'], filename)
         enhanced_image.save(output_path)
+        storage_manager.track(output_path)
         edited_images.append(output_path)
 
         return {
             'success': True,
-            'original_image': filepath,
+            'original_image': source.reference_path(),
             'edited_images': edited_images,
             'edit_type': f'{enhance_type} 增强',
             'parameters': edit_params
         }, 200
 
-    def _transform_image(self, filepath, edit_params):
+    def _transform_image(self, source, edit_params):
         """图像变换"""
         transform_type = edit_params.get('transform_type', 'resize')
 
-        image = Image.open(filepath)
+        image = source.pil
         edited_images = []
 
         if transform_type == 'resize':
@@ -249,25 +241,26 @@ class ImageEditingService:
             return {'success': False, 'error': f'不支持的变换类型: {transform_type}'}, 400
 
         # 保存变换后的图像
-        filename = f"transform_{transform_type}_{os.path.basename(filepath)}"
+        filename = f"transform_{transform_type}_{source.name}"
         output_path = os.path.join(current_app.config['GENERATED_FOLDER'], filename)
         transformed_image.save(output_path)
+        storage_manager.track(output_path)
         edited_images.append(output_path)
 
         return {
             'success': True,
-            'original_image': filepath,
+            'original_image': source.reference_path(),
             'edited_images': edited_images,
             'edit_type': f'{transform_type} 变换',
             'parameters': edit_params
         }, 200
 
-    def _repair_image(self, filepath, edit_params):
+    def _repair_image(self, source, edit_params):
         """图像修复"""
         repair_type = edit_params.get('repair_type', 'denoise')
 
-        # 使用 OpenCV 读取图像
-        image = cv2.imread(filepath)
+        # 使用共享的 BGR 数组（修复操作均返回新数组）
+        image = source.bgr
 
         if repair_type == 'denoise':
             # 去噪
@@ -295,13 +288,14 @@ class ImageEditingService:
             return {'success': False, 'error': f'不支持的修复类型: {repair_type}'}, 400
 
         # 保存修复后的图像
-        filename = f"repair_{repair_type}_{os.path.basename(filepath)}"
+        filename = f"repair_{repair_type}_{source.name}"
         output_path = os.path.join(current_app.config['GENERATED_FOLDER'], filename)
         cv2.imwrite(output_path, repaired_image)
+        storage_manager.track(output_path)
 
         return {
             'success': True,
-            'original_image': filepath,
+            'original_image': source.reference_path(),
             'edited_images': [output_path],
             'edit_type': f'{repair_type} 修复',
             'parameters': edit_params
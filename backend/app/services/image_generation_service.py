@@ -4,9 +4,13 @@
 import os
 import time
 import base64
-from google import genai
 from google.genai import types
 from ..utils.helpers import save_generated_image
+from .storage_manager import storage_manager
+from .gemini_clients import get_gemini_client
+from .prompt_cache import get_prompt_cache, KIND_IMAGE_PROMPT
+from .gemini_scheduler import GeminiQuotaError, quota_exhausted_result
+from ..utils.aio import run_blocking
 from flask import current_app
 
 
@@ -14,8 +18,8 @@ class ImageGenerationService:
     def __init__(self, client=None):
         """初始化图像生成服务"""
         if client is None:
-            # 如果没有提供client，创建一个新的
-            self.client = genai.Client(api_key=current_app.config['GEMINI_API_KEY'])
+            # 如果没有提供client，使用进程内共享的客户端
+            self.client = get_gemini_client()
         else:
             self.client = client
 
@@ -24,7 +28,38 @@ class ImageGenerationService:
         使用 Gemini 优化用户的图像生成提示词
         """
         try:
-            optimization_prompt = f"""
+            # 相同的提示词（及风格）直接复用之前的改写结果
+            optimized_prompt, cached = get_prompt_cache().rewrite(
+                self.client, KIND_IMAGE_PROMPT, "gemini-2.0-flash", user_prompt,
+                self.optimization_prompt(user_prompt, style), style)
+            return self._optimization_result(user_prompt, optimized_prompt, cached)
+
+        except Exception as e:
+            print(f"提示词优化失败: {str(e)}")
+            # 如果优化失败，返回原始提示词
+            return {
+                'original_prompt': user_prompt,
+                'optimized_prompt': user_prompt
+            }
+
+    async def aoptimize_prompt(self, user_prompt, style="realistic"):
+        """optimize_prompt 的协程版本（ASGI模式）"""
+        try:
+            optimized_prompt, cached = await get_prompt_cache().arewrite(
+                self.client, KIND_IMAGE_PROMPT, "gemini-2.0-flash", user_prompt,
+                self.optimization_prompt(user_prompt, style), style)
+            return self._optimization_result(user_prompt, optimized_prompt, cached)
+
+        except Exception as e:
+            print(f"提示词优化失败: {str(e)}")
+            return {
+                'original_prompt': user_prompt,
+                'optimized_prompt': user_prompt
+            }
+
+    @staticmethod
+    def optimization_prompt(user_prompt, style):
+        return f"""
 请优化以下图像生成提示词，使其更适合Imagen 3.0图像生成模型。
 优化要求：
 1. 添加具体的视觉细节描述
@@ -41,58 +76,27 @@ class ImageGenerationService:
 请返回优化后的英文提示词：
 """
 
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=optimization_prompt
-            )
+    @staticmethod
+    def _optimization_result(user_prompt, optimized_prompt, cached):
+        if not optimized_prompt:
+            raise ValueError('优化结果为空')
 
-            optimized_prompt = response.text.strip()
+        # 如果返回的内容包含引号或其他格式，清理一下
+        if optimized_prompt.startswith('"') and optimized_prompt.endswith('"'):
+            optimized_prompt = optimized_prompt[1:-1]
 
-            # 如果返回的内容包含引号或其他格式，清理一下
-            if optimized_prompt.startswith('"') and optimized_prompt.endswith('"'):
-                optimized_prompt = optimized_prompt[1:-1]
-
-            return {
-                'original_prompt': user_prompt,
-                'optimized_prompt': optimized_prompt
-            }
-
-        except Exception as e:
-            print(f"提示词优化失败: {str(e)}")
-            # 如果优化失败，返回原始提示词
-            return {
-                'original_prompt': user_prompt,
-                'optimized_prompt': user_prompt
-            }
+        return {
+            'original_prompt': user_prompt,
+            'optimized_prompt': optimized_prompt,
+            'cached': cached
+        }
 
     def generate_image(self, prompt, model_type='imagen-3.0-generate-002', aspect_ratio='1:1', style='realistic', num_images=1):
         """
         生成图像 - 支持多种模型动态选择
         """
         try:
-            # 获取模型信息
-            model_options = self.get_model_options()
-
-            # 处理旧的模型类型兼容性
-            if model_type == 'imagen-3':
-                model_type = 'imagen-3.0-generate-002'  # 默认使用最新版本
-
-            # 验证模型是否存在
-            if model_type not in model_options:
-                model_type = 'imagen-3.0-generate-002'  # 回退到默认模型
-
-            model_info = model_options[model_type]
-            actual_model_id = model_info['model_id']
-            model_name = model_info['name']
-
-            print(f"正在调用 {model_name} 图像生成API...")
-            print(f"模型ID: {actual_model_id}")
-
-            # 验证宽高比是否支持
-            validated_aspect_ratio = self._validate_aspect_ratio(aspect_ratio, model_info['type'])
-            if validated_aspect_ratio != aspect_ratio:
-                print(f"宽高比 {aspect_ratio} 不支持，已调整为 {validated_aspect_ratio}")
-                aspect_ratio = validated_aspect_ratio
+            model_info, aspect_ratio = self._resolve_model(model_type, aspect_ratio)
 
             # 首先优化提示词
             prompt_optimization = self.optimize_prompt(prompt, style)
@@ -102,10 +106,10 @@ class ImageGenerationService:
             # 根据模型类型选择不同的API调用方式
             if model_info['type'] == 'gemini':
                 # 使用 Gemini 2.0 Flash 图像生成
-                return self._generate_with_gemini(actual_model_id, optimized_prompt, aspect_ratio, style, num_images, model_name, prompt)
+                return self._generate_with_gemini(model_info['model_id'], optimized_prompt, aspect_ratio, style, num_images, model_info['name'], prompt)
             else:
                 # 使用 Imagen 系列模型
-                return self._generate_with_imagen(actual_model_id, optimized_prompt, aspect_ratio, style, num_images, model_name, prompt)
+                return self._generate_with_imagen(model_info['model_id'], optimized_prompt, aspect_ratio, style, num_images, model_info['name'], prompt)
 
         except Exception as e:
             error_msg = f"图像生成失败: {str(e)}"
@@ -115,63 +119,133 @@ class ImageGenerationService:
                 'error': error_msg
             }, 500
 
-    def _generate_with_imagen(self, model_id, optimized_prompt, aspect_ratio, style, num_images, model_name, original_prompt):
-        """使用 Imagen 系列模型生成图像"""
+    async def agenerate_image(self, prompt, model_type='imagen-3.0-generate-002', aspect_ratio='1:1', style='realistic', num_images=1):
+        """generate_image 的协程版本（ASGI模式）：Gemini/Imagen调用使用异步客户端，图像在线程池中保存"""
         try:
-            response = self.client.models.generate_images(
-                model=model_id,
-                prompt=optimized_prompt,
-                config=types.GenerateImagesConfig(
-                    number_of_images=num_images,
-                    aspect_ratio=aspect_ratio,
-                    safety_filter_level="BLOCK_LOW_AND_ABOVE",
-                    person_generation="allow_adult",
-                ),
-            )
+            model_info, aspect_ratio = self._resolve_model(model_type, aspect_ratio)
 
-            if response.generated_images and len(response.generated_images) > 0:
-                generated_images = []
+            prompt_optimization = await self.aoptimize_prompt(prompt, style)
+            optimized_prompt = prompt_optimization['optimized_prompt']
+            print(f"优化后的提示词: {optimized_prompt}")
 
-                for i, generated_image in enumerate(response.generated_images):
-                    # 保存图像
-                    timestamp = int(time.time())
-                    image_filename = f"imagen_generated_{timestamp}_{i}.png"
+            model_id, model_name = model_info['model_id'], model_info['name']
+            try:
+                if model_info['type'] == 'gemini':
+                    response = await self.client.aio.models.generate_content(
+                        model=model_id, contents=optimized_prompt, config=self._gemini_image_config())
+                    return await run_blocking(self._gemini_image_result, response, model_id, optimized_prompt,
+                                              aspect_ratio, style, model_name, prompt)
+                response = await self.client.aio.models.generate_images(
+                    model=model_id, prompt=optimized_prompt, config=self._imagen_config(num_images, aspect_ratio))
+                return await run_blocking(self._imagen_result, response, model_id, optimized_prompt,
+                                          aspect_ratio, style, model_name, prompt)
+            except Exception as api_error:
+                print(f"{model_name} API调用失败: {str(api_error)}")
+                if isinstance(api_error, GeminiQuotaError):
+                    return quota_exhausted_result(api_error)
+                return await self._agenerate_image_creation_plan(optimized_prompt, aspect_ratio, style)
 
-                    image_path = save_generated_image(
-                        generated_image.image.image_bytes,
-                        image_filename,
-                        current_app.config['GENERATED_FOLDER']
-                    )
+        except Exception as e:
+            error_msg = f"图像生成失败: {str(e)}"
+            print(error_msg)
+            return {
+                'success': False,
+                'error': error_msg
+            }, 500
 
-                    generated_images.append({
-                        'path': image_path,
-                        'filename': image_filename
-                    })
+    def _resolve_model(self, model_type, aspect_ratio):
+        """
+        解析请求的模型和宽高比
 
-                return {
-                    'success': True,
-                    'status': 'image_generated',
-                    'message': '图像生成成功！',
-                    'images': generated_images,
-                    'image_path': generated_images[0]['path'] if generated_images else None,
-                    'original_prompt': original_prompt,
-                    'optimized_prompt': optimized_prompt,
-                    'model': model_name,
-                    'model_id': model_id,
-                    'aspect_ratio': aspect_ratio,
-                    'style': style,
-                    'num_images': len(generated_images),
-                    'note': f'{model_name} 图像生成完成'
-                }, 200
+        Returns:
+            tuple: (模型信息, 模型支持的宽高比)
+        """
+        # 获取模型信息
+        model_options = self.get_model_options()
 
-            else:
-                raise Exception("未生成任何图像")
+        # 处理旧的模型类型兼容性
+        if model_type == 'imagen-3':
+            model_type = 'imagen-3.0-generate-002'  # 默认使用最新版本
+
+        # 验证模型是否存在
+        if model_type not in model_options:
+            model_type = 'imagen-3.0-generate-002'  # 回退到默认模型
+
+        model_info = model_options[model_type]
+        print(f"正在调用 {model_info['name']} 图像生成API...")
+        print(f"模型ID: {model_info['model_id']}")
+
+        # 验证宽高比是否支持
+        validated_aspect_ratio = self._validate_aspect_ratio(aspect_ratio, model_info['type'])
+        if validated_aspect_ratio != aspect_ratio:
+            print(f"宽高比 {aspect_ratio} 不支持，已调整为 {validated_aspect_ratio}")
+        return model_info, validated_aspect_ratio
+
+    def _generate_with_imagen(self, model_id, optimized_prompt, aspect_ratio, style, num_images, model_name, original_prompt):
+        """使用 Imagen 系列模型生成图像"""
+        try:
+            response = self.client.models.generate_images(
+                model=model_id,
+                prompt=optimized_prompt,
+                config=self._imagen_config(num_images, aspect_ratio),
+            )
+            return self._imagen_result(response, model_id, optimized_prompt, aspect_ratio, style, model_name, original_prompt)
 
         except Exception as imagen_api_error:
             print(f"{model_name} API调用失败: {str(imagen_api_error)}")
+            # 配额不足时直接返回，创作方案同样需要调用Gemini
+            if isinstance(imagen_api_error, GeminiQuotaError):
+                return quota_exhausted_result(imagen_api_error)
             # 如果API不可用，生成详细的创作方案
             return self._generate_image_creation_plan(optimized_prompt, aspect_ratio, style)
 
+    @staticmethod
+    def _imagen_config(num_images, aspect_ratio):
+        return types.GenerateImagesConfig(
+            number_of_images=num_images,
+            aspect_ratio=aspect_ratio,
+            safety_filter_level="BLOCK_LOW_AND_ABOVE",
+            person_generation="allow_adult",
+        )
+
+    def _imagen_result(self, response, model_id, optimized_prompt, aspect_ratio, style, model_name, original_prompt):
+        """保存 Imagen 生成的图像并构建返回结果，未生成图像时抛出异常"""
+        if not response.generated_images:
+            raise Exception("未生成任何图像")
+
+        generated_images = []
+        for i, generated_image in enumerate(response.generated_images):
+            # 保存图像
+            timestamp = int(time.time())
+            image_filename = f"imagen_generated_{timestamp}_{i}.png"
+
+            image_path = save_generated_image(
+                generated_image.image.image_bytes,
+                image_filename,
+                current_app.config['GENERATED_FOLDER']
+            )
+
+            generated_images.append({
+                'path': image_path,
+                'filename': image_filename
+            })
+
+        return {
+            'success': True,
+            'status': 'image_generated',
+            'message': '图像生成成功！',
+            'images': generated_images,
+            'image_path': generated_images[0]['path'] if generated_images else None,
+            'original_prompt': original_prompt,
+            'optimized_prompt': optimized_prompt,
+            'model': model_name,
+            'model_id': model_id,
+            'aspect_ratio': aspect_ratio,
+            'style': style,
+            'num_images': len(generated_images),
+            'note': f'{model_name} 图像生成完成'
+        }, 200
+
     def _generate_with_gemini(self, model_id, optimized_prompt, aspect_ratio, style, num_images, model_name, original_prompt):
         """使用 Gemini 2.0 Flash 图像生成"""
         try:
@@ -179,71 +253,79 @@ class ImageGenerationService:
             response = self.client.models.generate_content(
                 model=model_id,
                 contents=optimized_prompt,
-                config=types.GenerateContentConfig(
-                    response_modalities=["Text", "Image"],
-                    # Gemini 2.0 Flash 的特定配置
-                )
+                config=self._gemini_image_config()
             )
-
-            # 处理 Gemini 2.0 Flash 的响应
-            if hasattr(response, 'candidates') and response.candidates:
-                generated_images = []
-
-                for candidate in response.candidates:
-                    if hasattr(candidate, 'content') and candidate.content:
-                        for part in candidate.content.parts:
-                            if hasattr(part, 'inline_data') and part.inline_data:
-                                # 保存图像
-                                timestamp = int(time.time())
-                                image_filename = f"gemini_generated_{timestamp}.png"
-
-                                # 处理 Gemini 的图像数据
-                                image_data = part.inline_data.data
-                                if isinstance(image_data, str):
-                                    # 如果是base64编码的字符串
-                                    import base64
-                                    image_bytes = base64.b64decode(image_data)
-                                else:
-                                    image_bytes = image_data
-
-                                image_path = save_generated_image(
-                                    image_bytes,
-                                    image_filename,
-                                    current_app.config['GENERATED_FOLDER']
-                                )
-
-                                generated_images.append({
-                                    'path': image_path,
-                                    'filename': image_filename
-                                })
-
-                if generated_images:
-                    return {
-                        'success': True,
-                        'status': 'image_generated',
-                        'message': '图像生成成功！',
-                        'images': generated_images,
-                        'image_path': generated_images[0]['path'] if generated_images else None,
-                        'original_prompt': original_prompt,
-                        'optimized_prompt': optimized_prompt,
-                        'model': model_name,
-                        'model_id': model_id,
-                        'aspect_ratio': aspect_ratio,
-                        'style': style,
-                        'num_images': len(generated_images),
-                        'note': f'{model_name} 对话式图像生成完成',
-                        'response_text': response.text if hasattr(response, 'text') else None
-                    }, 200
-                else:
-                    raise Exception("未生成任何图像")
-            else:
-                raise Exception("Gemini响应格式异常")
+            return self._gemini_image_result(response, model_id, optimized_prompt, aspect_ratio, style, model_name, original_prompt)
 
         except Exception as gemini_api_error:
             print(f"{model_name} API调用失败: {str(gemini_api_error)}")
+            # 配额不足时直接返回，创作方案同样需要调用Gemini
+            if isinstance(gemini_api_error, GeminiQuotaError):
+                return quota_exhausted_result(gemini_api_error)
             # 如果Gemini不可用，生成详细的创作方案
             return self._generate_image_creation_plan(optimized_prompt, aspect_ratio, style)
 
+    @staticmethod
+    def _gemini_image_config():
+        return types.GenerateContentConfig(
+            response_modalities=["Text", "Image"],
+            # Gemini 2.0 Flash 的特定配置
+        )
+
+    def _gemini_image_result(self, response, model_id, optimized_prompt, aspect_ratio, style, model_name, original_prompt):
+        """保存 Gemini 响应中的图像并构建返回结果，未生成图像时抛出异常"""
+        # 处理 Gemini 2.0 Flash 的响应
+        if not (hasattr(response, 'candidates') and response.candidates):
+            raise Exception("Gemini响应格式异常")
+
+        generated_images = []
+        for candidate in response.candidates:
+            if hasattr(candidate, 'content') and candidate.content:
+                for part in candidate.content.parts:
+                    if hasattr(part, 'inline_data') and part.inline_data:
+                        # 保存图像
+                        timestamp = int(time.time())
+                        image_filename = f"gemini_generated_{timestamp}.png"
+
+                        # 处理 Gemini 的图像数据
+                        image_data = part.inline_data.data
+                        if isinstance(image_data, str):
+                            # 如果是base64编码的字符串
+                            image_bytes = base64.b64decode(image_data)
+                        else:
+                            image_bytes = image_data
+
+                        image_path = save_generated_image(
+                            image_bytes,
+                            image_filename,
+                            current_app.config['GENERATED_FOLDER']
+                        )
+
+                        generated_images.append({
+                            'path': image_path,
+                            'filename': image_filename
+                        })
+
+        if not generated_images:
+            raise Exception("未生成任何图像")
+
+        return {
+            'success': True,
+            'status': 'image_generated',
+            'message': '图像生成成功！',
+            'images': generated_images,
+            'image_path': generated_images[0]['path'] if generated_images else None,
+            'original_prompt': original_prompt,
+            'optimized_prompt': optimized_prompt,
+            'model': model_name,
+            'model_id': model_id,
+            'aspect_ratio': aspect_ratio,
+            'style': style,
+            'num_images': len(generated_images),
+            'note': f'{model_name} 对话式图像生成完成',
+            'response_text': response.text if hasattr(response, 'text') else None
+        }, 200
+
     def edit_image(self, image_path, edit_prompt, mask_path=None, model_type='imagen-3.0-generate-002'):
         """
         编辑图像 - 支持多种 Imagen 模型的图像编辑功能
@@ -484,7 +566,38 @@ class ImageGenerationService:
         生成图像创作方案（当API不可用时的备选方案）
         """
         try:
-            plan_prompt = f"""
+            response = self.client.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=self._creation_plan_prompt(prompt, aspect_ratio, style)
+            )
+            return self._creation_plan_result(response.text, prompt, aspect_ratio, style)
+
+        except Exception as e:
+            print(f"生成创作方案失败: {str(e)}")
+            return {
+                'success': False,
+                'error': f'无法生成图像创作方案: {str(e)}'
+            }, 500
+
+    async def _agenerate_image_creation_plan(self, prompt, aspect_ratio, style):
+        """_generate_image_creation_plan 的协程版本"""
+        try:
+            response = await self.client.aio.models.generate_content(
+                model="gemini-2.0-flash",
+                contents=self._creation_plan_prompt(prompt, aspect_ratio, style)
+            )
+            return self._creation_plan_result(response.text, prompt, aspect_ratio, style)
+
+        except Exception as e:
+            print(f"生成创作方案失败: {str(e)}")
+            return {
+                'success': False,
+                'error': f'无法生成图像创作方案: {str(e)}'
+            }, 500
+
+    @staticmethod
+    def _creation_plan_prompt(prompt, aspect_ratio, style):
+        return f"""
 作为专业的图像设计师，请为以下图像需求制定详细的创作方案：
 
 图像描述：{prompt}
@@ -504,30 +617,18 @@ class ImageGenerationService:
 请以专业且实用的方式组织这些信息。
 """
 
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=plan_prompt
-            )
-
-            plan_content = response.text
-
-            return {
-                'success': True,
-                'status': 'plan_generated',
-                'message': 'Imagen 3.0暂时不可用，已生成详细的图像创作方案',
-                'creation_plan': plan_content,
-                'original_prompt': prompt,
-                'aspect_ratio': aspect_ratio,
-                'style': style,
-                'note': '这是一个详细的创作方案，您可以使用专业图像设计软件来实现'
-            }, 200
-
-        except Exception as e:
-            print(f"生成创作方案失败: {str(e)}")
-            return {
-                'success': False,
-                'error': f'无法生成图像创作方案: {str(e)}'
-            }, 500
+    @staticmethod
+    def _creation_plan_result(plan_content, prompt, aspect_ratio, style):
+        return {
+            'success': True,
+            'status': 'plan_generated',
+            'message': 'Imagen 3.0暂时不可用，已生成详细的图像创作方案',
+            'creation_plan': plan_content,
+            'original_prompt': prompt,
+            'aspect_ratio': aspect_ratio,
+            'style': style,
+            'note': '这是一个详细的创作方案，您可以使用专业图像设计软件来实现'
+        }, 200
 
     def upscale_image(self, image_path, scale_factor=2):
         """
@@ -553,6 +654,7 @@ class ImageGenerationService:
             upscaled_path = os.path.join(current_app.config['GENERATED_FOLDER'], upscaled_filename)
 
             upscaled_image.save(upscaled_path)
+            storage_manager.track(upscaled_path)
 
             return {
                 'success': True,
@@ -1,81 +1,213 @@
 """
 图像问答服务模块
 """
+import asyncio
 import os
-from flask import jsonify, current_app
+import time
+from flask import jsonify
 from google import genai
 from google.genai import types
+from .result_cache import get_result_cache, make_cache_key
+from .gemini_scheduler import prioritized, PRIORITY_INTERACTIVE
+from ..utils.image_input import load_image_input, ImageInputError
 
 
 class ImageQAService:
     def __init__(self, client):
-        self.client = client
+        # 交互式问答优先于其他Gemini调用
+        self.client = prioritized(client, PRIORITY_INTERACTIVE)
 
-    def process_image_qa(self, file=None, question='', model='gemini-2.0-flash', image_data=None):
-        """处理图像问答请求"""
+    def process_image_qa(self, file=None, question='', model='gemini-2.0-flash', image_data=None, image=None):
+        """处理图像问答请求（image 为已解码的 ImageInput 时直接使用）"""
         try:
-            from ..utils.helpers import save_uploaded_file, image_to_bytes, allowed_file
-
-            # 处理图像数据
-            if image_data:
-                # 处理base64图像数据
-                import base64
-                import tempfile
-                if "base64," in image_data:
-                    image_data = image_data.split("base64,")[1]
-                image_bytes = base64.b64decode(image_data)
-
-                # 创建临时文件
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                    tmp_file.write(image_bytes)
-                    filepath = tmp_file.name
-
-                # 重新读取图像字节
-                image_bytes = image_to_bytes(filepath)
-            else:
-                # 验证文件
-                if not file or file.filename == '':
-                    return {'success': False, 'error': '未选择文件'}, 400
-
-                if not allowed_file(file.filename):
-                    return {'success': False, 'error': '无效的文件类型'}, 400
-
-                # 保存上传的文件
-                upload_folder = current_app.config['UPLOAD_FOLDER']
-                filepath = save_uploaded_file(file, upload_folder)
-
-                # 读取图像
-                image_bytes = image_to_bytes(filepath)
-
-            if not question or not question.strip():
-                return {'success': False, 'error': '请输入问题'}, 400
-
-            # 构建中文提示词
-            chinese_prompt = f"请用中文回答以下关于图像的问题：{question.strip()}"
-
-            # 使用指定的 Gemini 模型生成回答
-            response = self.client.models.generate_content(
-                model=model,
-                contents=[
-                    types.Part.from_text(text=chinese_prompt),
-                    types.Part.from_bytes(
-                        data=image_bytes,
-                        mime_type=f"image/{file.filename.split('.')[-1].lower()}"
-                    )
-                ]
+            image, error = self._load_input(file, image_data, image, question)
+            if error:
+                return error, 400
+
+            # 使用指定的 Gemini 模型生成回答（相同图像和问题直接复用缓存结果）
+            answer, cache_hit = get_result_cache().generate_text(
+                self.client,
+                model,
+                'qa.answer',
+                question,
+                image.data,
+                self._build_contents(image, question),
+                image_hash=image.sha256
             )
+            return self._answer_result(image, question, model, answer, cache_hit), 200
+
+        except Exception as e:
+            error_msg = f'处理失败: {str(e)}'
+            print(f"图像问答错误: {e}")
+            return {'success': False, 'error': error_msg}, 500
 
-            answer = response.text.strip()
+    async def aprocess_image_qa(self, file=None, question='', model='gemini-2.0-flash', image_data=None, image=None):
+        """process_image_qa 的协程版本（ASGI模式），等待Gemini响应期间不占用线程"""
+        try:
+            image, error = self._load_input(file, image_data, image, question)
+            if error:
+                return error, 400
 
-            return {
-                'success': True,
-                'answer': answer,
-                'image_path': filepath,
-                'question': question,
-                'model_used': model
-            }, 200
+            answer, cache_hit = await get_result_cache().agenerate_text(
+                self.client,
+                model,
+                'qa.answer',
+                question,
+                image.data,
+                self._build_contents(image, question),
+                image_hash=image.sha256
+            )
+            return self._answer_result(image, question, model, answer, cache_hit), 200
 
         except Exception as e:
             error_msg = f'处理失败: {str(e)}'
             print(f"图像问答错误: {e}")
             return {'success': False, 'error': error_msg}, 500
+
+    def stream_image_qa(self, file=None, question='', model='gemini-2.0-flash', image_data=None, image=None):
+        """
+        流式图像问答：回答按生成进度逐段推送
+
+        输入在返回前校验完毕；返回的事件生成器依次产生 (事件名, 数据)：
+        - start: 开始生成（立即发送，尽快送达首字节）
+        - token: 一段回答文本 {'text': ...}
+        - done: 与 process_image_qa 相同的完整结果，附带首段文本耗时和总耗时
+        - error: 生成失败 {'success': False, 'error': ...}
+        生成器被关闭（客户端断开连接）时取消上游的流式请求，未完成的回答不写入缓存
+
+        Returns:
+            tuple: (事件生成器, 200)，输入无效时为 (错误结果, 400)
+        """
+        image, error = self._load_input(file, image_data, image, question)
+        if error:
+            return error, 400
+        return self._stream_answer(image, question, model), 200
+
+    def astream_image_qa(self, file=None, question='', model='gemini-2.0-flash', image_data=None, image=None):
+        """stream_image_qa 的异步版本（ASGI模式），返回 (异步事件生成器, 200)"""
+        image, error = self._load_input(file, image_data, image, question)
+        if error:
+            return error, 400
+        return self._astream_answer(image, question, model), 200
+
+    def _stream_answer(self, image, question, model):
+        started = time.perf_counter()
+        cache = get_result_cache()
+        key = make_cache_key(image.sha256, model, 'qa.answer', question)
+        yield 'start', {'question': question, 'model_used': model}
+
+        stream = None
+        first_token_ms = None
+        try:
+            answer = cache.get(key)
+            cache_hit = answer is not None
+            if cache_hit:
+                first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+                yield 'token', {'text': answer}
+            else:
+                chunks = []
+                stream = self.client.models.generate_content_stream(
+                    model=model, contents=self._build_contents(image, question))
+                for chunk in stream:
+                    text = chunk.text
+                    if not text:
+                        continue
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+                    chunks.append(text)
+                    yield 'token', {'text': text}
+                answer = ''.join(chunks)
+                if answer:
+                    cache.set(key, answer)
+
+            result = self._answer_result(image, question, model, answer, cache_hit)
+            result['first_token_ms'] = first_token_ms
+            result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            yield 'done', result
+        except Exception as e:
+            print(f"流式图像问答错误: {e}")
+            yield 'error', {'success': False, 'error': f'处理失败: {str(e)}'}
+        finally:
+            # 客户端断开时关闭上游流，释放连接并停止生成
+            if stream is not None:
+                stream.close()
+
+    async def _astream_answer(self, image, question, model):
+        started = time.perf_counter()
+        cache = get_result_cache()
+        key = make_cache_key(image.sha256, model, 'qa.answer', question)
+        yield 'start', {'question': question, 'model_used': model}
+
+        stream = None
+        first_token_ms = None
+        try:
+            answer = await asyncio.to_thread(cache.get, key)
+            cache_hit = answer is not None
+            if cache_hit:
+                first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+                yield 'token', {'text': answer}
+            else:
+                chunks = []
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=model, contents=self._build_contents(image, question))
+                async for chunk in stream:
+                    text = chunk.text
+                    if not text:
+                        continue
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+                    chunks.append(text)
+                    yield 'token', {'text': text}
+                answer = ''.join(chunks)
+                if answer:
+                    await asyncio.to_thread(cache.set, key, answer)
+
+            result = self._answer_result(image, question, model, answer, cache_hit)
+            result['first_token_ms'] = first_token_ms
+            result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            yield 'done', result
+        except Exception as e:
+            print(f"流式图像问答错误: {e}")
+            yield 'error', {'success': False, 'error': f'处理失败: {str(e)}'}
+        finally:
+            # 客户端断开时关闭上游流，释放连接并停止生成
+            if stream is not None:
+                await stream.aclose()
+
+    @staticmethod
+    def _load_input(file, image_data, image, question):
+        """
+        解析图像输入（只解码一次，不落盘）并检查问题
+
+        Returns:
+            tuple: (ImageInput, 错误结果)
+        """
+        try:
+            image = load_image_input(file, image_data, image)
+        except ImageInputError as e:
+            return None, {'success': False, 'error': str(e)}
+        if not question or not question.strip():
+            return None, {'success': False, 'error': '请输入问题'}
+        return image, None
+
+    @staticmethod
+    def _answer_result(image, question, model, answer, cache_hit):
+        return {
+            'success': True,
+            'answer': answer.strip(),
+            'image_path': image.reference_path(),
+            'question': question,
+            'model_used': model,
+            'cache_hit': cache_hit
+        }
+
+    def _build_contents(self, image, question):
+        """构建中文提示词和图像内容"""
+        chinese_prompt = f"请用中文回答以下关于图像的问题：{question.strip()}"
+        return [
+            types.Part.from_text(text=chinese_prompt),
+            types.Part.from_bytes(
+                data=image.data,
+                mime_type=image.mime_type
+            )
+        ]
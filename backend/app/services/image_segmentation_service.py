@@ -3,11 +3,13 @@
 """
 import os
 import json
-import tempfile
-import base64
+import time
 from flask import jsonify
 from flask import current_app
-from ..utils.helpers import save_uploaded_file, image_to_bytes, allowed_file, create_segment_image
+from ..utils.rendering import DetectionRenderer, save_image
+from ..utils.image_input import load_image_input, ImageInputError
+from .result_cache import get_result_cache
+from ..utils.aio import run_blocking
 from google import genai
 from google.genai import types
 
@@ -16,37 +18,101 @@ class ImageSegmentationService:
     def __init__(self, client):
         self.client = client
 
-    def segment_image(self, file=None, object_name='主要对象', image_data=None):
-        """分割图像中的对象"""
+    def segment_image(self, file=None, object_name='主要对象', image_data=None, image=None):
+        """分割图像中的对象（image 为已解码的 ImageInput 时直接使用）"""
         try:
-            # 处理文件输入
-            if image_data:
-                # 处理base64图像数据
-                image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(image_data_clean)
-
-                # 创建临时文件
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                    tmp_file.write(image_bytes)
-                    filepath = tmp_file.name
-            else:
-                # 处理文件上传
-                if not file or file.filename == '':
-                    return {'success': False, 'error': '未选择文件'}, 400
+            image, error = self._load_input(file, image_data, image, object_name)
+            if error:
+                return error, 400
 
-                if not allowed_file(file.filename):
-                    return {'success': False, 'error': '无效的文件类型'}, 400
+            # 首先验证图像内容是否包含用户查询的对象
+            result_cache = get_result_cache()
+            validation_text, _ = result_cache.generate_text(
+                self.client,
+                current_app.config['GEMINI_SEGMENTATION_MODEL'],
+                'segmentation.validate',
+                object_name,
+                image.data,
+                self._validation_contents(image, object_name),
+                image_hash=image.sha256
+            )
+            mismatch = self._mismatch_result(validation_text, object_name)
+            if mismatch:
+                return mismatch, 200  # 改为200状态码，让前端正确处理内容不匹配
 
-                filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
+            # 使用 Gemini 进行图像分割
+            response_text, cache_hit = result_cache.generate_text(
+                self.client,
+                current_app.config['GEMINI_SEGMENTATION_MODEL'],
+                'segmentation.segment',
+                object_name,
+                image.data,
+                self._segmentation_contents(image, object_name),
+                image_hash=image.sha256
+            )
+            return self._segmentation_result(image, object_name, response_text, cache_hit)
+
+        except Exception as e:
+            error_msg = f'分割失败: {str(e)}'
+            print(f"图像分割错误: {e}")
+            return {'success': False, 'error': error_msg}, 500
 
-            if not object_name or not object_name.strip():
-                return {'success': False, 'error': '请输入要分割的对象名称'}, 400
+    async def asegment_image(self, file=None, object_name='主要对象', image_data=None, image=None):
+        """segment_image 的协程版本（ASGI模式）：Gemini调用使用异步客户端，裁剪图像在线程池中生成"""
+        try:
+            image, error = self._load_input(file, image_data, image, object_name)
+            if error:
+                return error, 400
+
+            result_cache = get_result_cache()
+            validation_text, _ = await result_cache.agenerate_text(
+                self.client,
+                current_app.config['GEMINI_SEGMENTATION_MODEL'],
+                'segmentation.validate',
+                object_name,
+                image.data,
+                self._validation_contents(image, object_name),
+                image_hash=image.sha256
+            )
+            mismatch = self._mismatch_result(validation_text, object_name)
+            if mismatch:
+                return mismatch, 200
+
+            response_text, cache_hit = await result_cache.agenerate_text(
+                self.client,
+                current_app.config['GEMINI_SEGMENTATION_MODEL'],
+                'segmentation.segment',
+                object_name,
+                image.data,
+                self._segmentation_contents(image, object_name),
+                image_hash=image.sha256
+            )
+            return await run_blocking(self._segmentation_result, image, object_name, response_text, cache_hit)
 
-            # 读取图像
-            image_bytes = image_to_bytes(filepath)
+        except Exception as e:
+            error_msg = f'分割失败: {str(e)}'
+            print(f"图像分割错误: {e}")
+            return {'success': False, 'error': error_msg}, 500
 
-            # 首先验证图像内容是否包含用户查询的对象
-            content_validation_prompt = f"""
+    @staticmethod
+    def _load_input(file, image_data, image, object_name):
+        """
+        解析图像输入（只解码一次，不落盘）并检查对象名称
+
+        Returns:
+            tuple: (ImageInput, 错误结果)
+        """
+        try:
+            image = load_image_input(file, image_data, image)
+        except ImageInputError as e:
+            return None, {'success': False, 'error': str(e)}
+        if not object_name or not object_name.strip():
+            return None, {'success': False, 'error': '请输入要分割的对象名称'}
+        return image, None
+
+    def _validation_contents(self, image, object_name):
+        """内容验证请求：图像中是否包含用户查询的对象"""
+        content_validation_prompt = f"""
             请仔细分析这张图像，检查是否包含"{object_name.strip()}"。
 
             请以JSON格式返回结果：
@@ -58,38 +124,34 @@ class ImageSegmentationService:
 
             如果图像中没有"{object_name.strip()}"，请在detected_objects中列出实际检测到的主要对象。
             """
-
-            # 进行内容验证
-            validation_response = self.client.models.generate_content(
-                model=current_app.config['GEMINI_SEGMENTATION_MODEL'],
-                contents=[
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
-                    types.Part.from_text(text=content_validation_prompt)
-                ]
-            )
-
-            validation_text = validation_response.text.strip()
-            validation_data = self._parse_segmentation_response(validation_text)
-
-            # 检查内容匹配性
-            if not validation_data.get('contains_object', True):
-                detected_objects = validation_data.get('detected_objects', [])
-                explanation = validation_data.get('explanation', '图像内容与查询不匹配')
-
-                return {
-                    'success': False,
-                    'error': f'未检测到目标：{object_name.strip()}',
-                    'message': f'图像中检测到的对象与您查询的"{object_name.strip()}"不匹配。{explanation}',
-                    'explanation': explanation,
-                    'detected_objects': detected_objects,
-                    'suggestion': f'图像中包含: {", ".join(detected_objects[:5])}。请修改查询词汇或上传包含"{object_name.strip()}"的图像。' if detected_objects else '请上传包含明确对象的图像，或检查图像质量。',
-                    'content_mismatch': True,
-                    'user_query': object_name.strip(),
-                    'alternative_queries': detected_objects[:3] if detected_objects else []
-                }, 200  # 改为200状态码，让前端正确处理内容不匹配
-
-            # 构建分割提示词
-            prompt = f"""
+        return [
+            types.Part.from_bytes(data=image.data, mime_type=image.mime_type),
+            types.Part.from_text(text=content_validation_prompt)
+        ]
+
+    def _mismatch_result(self, validation_text, object_name):
+        """解析内容验证结果，图像内容与查询不匹配时返回提示结果，否则返回None"""
+        validation_data = self._parse_segmentation_response(validation_text.strip())
+        if validation_data.get('contains_object', True):
+            return None
+
+        detected_objects = validation_data.get('detected_objects', [])
+        explanation = validation_data.get('explanation', '图像内容与查询不匹配')
+        return {
+            'success': False,
+            'error': f'未检测到目标：{object_name.strip()}',
+            'message': f'图像中检测到的对象与您查询的"{object_name.strip()}"不匹配。{explanation}',
+            'explanation': explanation,
+            'detected_objects': detected_objects,
+            'suggestion': f'图像中包含: {", ".join(detected_objects[:5])}。请修改查询词汇或上传包含"{object_name.strip()}"的图像。' if detected_objects else '请上传包含明确对象的图像，或检查图像质量。',
+            'content_mismatch': True,
+            'user_query': object_name.strip(),
+            'alternative_queries': detected_objects[:3] if detected_objects else []
+        }
+
+    def _segmentation_contents(self, image, object_name):
+        """构建分割提示词和图像内容"""
+        prompt = f"""
             请对图像中的{object_name.strip()}进行分割。
             请识别图像中所有的{object_name.strip()}实例，并为每个实例提供详细的分割信息。
 
@@ -109,74 +171,65 @@ class ImageSegmentationService:
             请为每个检测到的{object_name.strip()}实例创建一个分割条目。
             如果没有检测到{object_name.strip()}，请返回空的segments数组。
             """
-
-            # 使用 Gemini 进行图像分割
-            response = self.client.models.generate_content(
-                model=current_app.config['GEMINI_SEGMENTATION_MODEL'],
-                contents=[
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
-                    types.Part.from_text(text=prompt)
-                ]
-            )
-
-            response_text = response.text.strip()
-
-            # 解析分割结果
-            segment_data = self._parse_segmentation_response(response_text)
-
-            # 处理分割结果
-            segmented_objects = []
-            segment_images = []
-
-            segments = segment_data.get('segments', [])
-            if not segments and isinstance(segment_data, list):
-                segments = segment_data
-
-            for i, segment_info in enumerate(segments):
-                label = segment_info.get('label', f'{object_name}_{i+1}')
-                description = segment_info.get('description', '')
-                bbox = segment_info.get('bbox', [])
-                confidence = segment_info.get('confidence', 0.9)
-
-                if len(bbox) == 4:
-                    # 创建分割图像（使用边界框裁剪）
-                    import time
-                    timestamp = int(time.time() * 1000)  # 使用毫秒级时间戳避免重复
-                    safe_label = label.replace('/', '_').replace('\\', '_').replace(' ', '_')
-                    seg_filename = f"gemini_segment_{safe_label}_{i}_{timestamp}.png"
-                    seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
-
-                    # 使用边界框创建分割图像
-                    create_segment_image(filepath, bbox, seg_filepath, label)
-
-                    segmented_objects.append({
-                        'label': label,
-                        'description': description,
-                        'confidence': confidence,
-                        'bbox': bbox,
-                        'segment_image': seg_filepath
-                    })
-                    segment_images.append(seg_filepath)
-
-            if segmented_objects:
-                return {
-                    'success': True,
-                    'original_image': filepath,
-                    'segmented_objects': segmented_objects,
-                    'segment_images': segment_images,
-                    'response_text': response_text
-                }, 200
-            else:
-                return {
-                    'success': False,
-                    'error': f'未能分割出{object_name}',
-                    'response_text': response_text
-                }, 200
-
-        except Exception as e:
-            error_msg = f'分割失败: {str(e)}'
-            print(f"图像分割错误: {e}")
-            return {'success': False, 'error': error_msg}, 500
+        return [
+            types.Part.from_bytes(data=image.data, mime_type=image.mime_type),
+            types.Part.from_text(text=prompt)
+        ]
+
+    def _segmentation_result(self, image, object_name, response_text, cache_hit):
+        """解析分割结果并裁剪保存各实例图像（CPU密集，ASGI模式下在线程池中执行）"""
+        response_text = response_text.strip()
+        segment_data = self._parse_segmentation_response(response_text)
+
+        # 处理分割结果
+        segmented_objects = []
+        segment_images = []
+
+        segments = segment_data.get('segments', [])
+        if not segments and isinstance(segment_data, list):
+            segments = segment_data
+
+        renderer = DetectionRenderer(image) if segments else None
+        for i, segment_info in enumerate(segments):
+            label = segment_info.get('label', f'{object_name}_{i+1}')
+            description = segment_info.get('description', '')
+            bbox = segment_info.get('bbox', [])
+            confidence = segment_info.get('confidence', 0.9)
+
+            if len(bbox) == 4:
+                # 创建分割图像（使用边界框裁剪）
+                timestamp = int(time.time() * 1000)  # 使用毫秒级时间戳避免重复
+                safe_label = label.replace('/', '_').replace('\\', '_').replace(' ', '_')
+                seg_filename = f"gemini_segment_{safe_label}_{i}_{timestamp}.png"
+                seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
+
+                # 使用边界框裁剪分割图像（扩展10%以完整显示对象）
+                save_image(renderer.crop(renderer.to_pixels(bbox), expand_ratio=0.1, min_size=100), seg_filepath)
+
+                segmented_objects.append({
+                    'label': label,
+                    'description': description,
+                    'confidence': confidence,
+                    'bbox': bbox,
+                    'segment_image': seg_filepath
+                })
+                segment_images.append(seg_filepath)
+
+        if not segmented_objects:
+            return {
+                'success': False,
+                'error': f'未能分割出{object_name}',
+                'response_text': response_text
+            }, 200
+
+        return {
+            'success': True,
+            'original_image': image.reference_path(),
+            'segmented_objects': segmented_objects,
+            'segment_images': segment_images,
+            'response_text': response_text,
+            'cache_hit': cache_hit
+        }, 200
 
     def _parse_segmentation_response(self, response_text):
         """解析分割响应"""
@@ -0,0 +1,191 @@
+"""
+YOLO 推理调度器
+每个模型一个推理队列和一个工作线程：在短时间窗口内（最长等待毫秒数、最大批次）收集并发请求，
+合并为一次 model(...) 批量推理，再把每张图像的结果分发回等待的调用方
+"""
+import queue
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from .model_registry import get_model_registry
+from ..utils.metrics import time_stage, YOLO_QUEUE_WAIT, YOLO_BATCH_SIZE
+
+
+class _InferenceRequest:
+    """队列中的单张图像推理请求"""
+
+    __slots__ = ('model', 'image', 'conf', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, model, image, conf):
+        self.model = model
+        self.image = image
+        self.conf = conf
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ModelBatchQueue:
+    """单个模型的微批处理队列"""
+
+    def __init__(self, model_name, max_batch_size=8, max_wait=0.005, result_timeout=120):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.result_timeout = result_timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'batches': 0, 'model_calls': 0, 'errors': 0,
+                       'max_batch': 0, 'total_queue_wait': 0.0}
+        self._thread = threading.Thread(target=self._run, name=f'yolo-batch-{model_name}', daemon=True)
+        self._thread.start()
+
+    def submit(self, model, image, conf):
+        """提交一张图像并等待结果，返回与 model(image) 相同格式的结果列表"""
+        request = _InferenceRequest(model, image, conf)
+        self._queue.put(request)
+        if not request.done.wait(self.result_timeout):
+            self._count('errors')
+            raise TimeoutError(f'YOLO推理等待超时 ({self.model_name}, {self.result_timeout:g}秒)')
+        if request.error is not None:
+            raise request.error
+        return [request.result]
+
+    def _run(self):
+        """收集一个窗口内的请求：取到第一个请求后最多再等待 max_wait 秒或凑满一批"""
+        while True:
+            batch = [self._queue.get()]
+            try:
+                deadline = time.perf_counter() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    try:
+                        batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._execute(batch)
+            except Exception as e:
+                # 推理以外的异常（如指标、统计）不能结束工作线程，尚未返回结果的请求按失败返回
+                print(f"YOLO批处理队列异常 ({self.model_name}): {str(e)}")
+                for request in batch:
+                    if not request.done.is_set():
+                        request.error = e
+                        request.done.set()
+
+    def _execute(self, batch):
+        """执行一批请求：同一模型句柄、同一置信度的请求合并为一次推理"""
+        started_at = time.perf_counter()
+        groups = OrderedDict()
+        for request in batch:
+            groups.setdefault((id(request.model), request.conf), []).append(request)
+
+        for group in groups.values():
+            try:
+                with get_model_registry().inference_lock(self.model_name), time_stage('yolo', self.model_name):
+                    results = group[0].model([request.image for request in group], conf=group[0].conf)
+                for request, result in zip(group, results):
+                    request.result = result
+            except Exception as e:
+                print(f"YOLO批量推理失败 ({self.model_name}): {str(e)}")
+                for request in group:
+                    request.error = e
+                self._count('errors')
+            finally:
+                for request in group:
+                    request.done.set()
+
+        queue_wait = YOLO_QUEUE_WAIT.labels(self.model_name)
+        for request in batch:
+            queue_wait.observe(started_at - request.enqueued_at)
+        YOLO_BATCH_SIZE.labels(self.model_name).observe(len(batch))
+
+        with self._lock:
+            self._stats['requests'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['model_calls'] += len(groups)
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+            self._stats['total_queue_wait'] += sum(started_at - request.enqueued_at for request in batch)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        total_queue_wait = stats.pop('total_queue_wait')
+        stats['avg_batch_size'] = round(stats['requests'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['avg_queue_wait_ms'] = round(total_queue_wait / stats['requests'] * 1000, 2) if stats['requests'] else 0.0
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+
+class InferenceScheduler:
+    """按模型名称分发推理请求到各自的微批处理队列"""
+
+    def __init__(self, max_batch_size=8, max_wait_ms=5, enabled=True, result_timeout=120):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.enabled = enabled
+        self.result_timeout = result_timeout
+        self._lock = threading.Lock()
+        self._queues = {}
+
+    def predict(self, model_name, model, image, conf):
+        """
+        对单张图像执行推理
+
+        Args:
+            model_name (str): 模型名称（决定使用的队列和推理锁）
+            model: 从注册表获取的模型句柄
+            image (numpy.ndarray): BGR图像（推理期间不能被修改）
+            conf (float): 置信度阈值
+
+        Returns:
+            list: 与 model(image, conf=conf) 相同格式的结果列表
+        """
+        if not self.enabled:
+            with get_model_registry().inference_lock(model_name), time_stage('yolo', model_name):
+                return model(image, conf=conf)
+        return self._queue_for(model_name).submit(model, image, conf)
+
+    def _queue_for(self, model_name):
+        with self._lock:
+            batch_queue = self._queues.get(model_name)
+            if batch_queue is None:
+                batch_queue = ModelBatchQueue(model_name, self.max_batch_size, self.max_wait_ms / 1000.0,
+                                              self.result_timeout)
+                self._queues[model_name] = batch_queue
+            return batch_queue
+
+    def stats(self):
+        with self._lock:
+            queues = dict(self._queues)
+        return {
+            'enabled': self.enabled,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'models': {name: batch_queue.stats() for name, batch_queue in queues.items()}
+        }
+
+
+# 进程级单例，首次使用时按应用配置创建
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_inference_scheduler():
+    """获取进程级共享的YOLO推理调度器"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            config = current_app.config
+            _scheduler = InferenceScheduler(
+                max_batch_size=config.get('YOLO_MICROBATCH_MAX_SIZE', 8),
+                max_wait_ms=config.get('YOLO_MICROBATCH_MAX_WAIT_MS', 5),
+                enabled=config.get('YOLO_MICROBATCH_ENABLED', True),
+                result_timeout=config.get('YOLO_MICROBATCH_RESULT_TIMEOUT', 120)
+            )
+        return _scheduler
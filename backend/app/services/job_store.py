@@ -0,0 +1,169 @@
+"""
+任务存储
+基于SQLite的本地持久化任务表，长时间运行的任务（如Veo视频生成）在进程重启后仍可继续轮询
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# 任务状态
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+ACTIVE_STATUSES = (JOB_PENDING, JOB_RUNNING)
+
+
+class JobStore:
+    """线程安全的SQLite任务存储"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    operation_name TEXT,
+                    params TEXT,
+                    result TEXT,
+                    error TEXT,
+                    callback_url TEXT,
+                    callback_status TEXT,
+                    poll_count INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    next_poll_at REAL,
+                    deadline REAL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, next_poll_at)')
+            self._conn.commit()
+
+    def create(self, kind, params=None, operation_name=None, callback_url=None,
+               status=JOB_RUNNING, next_poll_at=None, deadline=None):
+        """创建任务并返回任务字典"""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, kind, status, operation_name, params, callback_url, '
+                'created_at, updated_at, next_poll_at, deadline) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, status, operation_name, json.dumps(params or {}, ensure_ascii=False),
+                 callback_url, now, now, next_poll_at, deadline)
+            )
+            self._conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """按ID获取任务，不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def update(self, job_id, **fields):
+        """更新任务字段，result/params会序列化为JSON"""
+        if not fields:
+            return
+        for key in ('result', 'params'):
+            if key in fields and fields[key] is not None:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False)
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f'{key} = ?' for key in fields)
+        with self._lock:
+            self._conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+            self._conn.commit()
+
+    def due_jobs(self, now=None, limit=50):
+        """获取到达下次轮询时间的进行中任务"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM jobs WHERE status IN (?, ?) AND (next_poll_at IS NULL OR next_poll_at <= ?) '
+                'ORDER BY next_poll_at LIMIT ?',
+                (*ACTIVE_STATUSES, now, limit)
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def claim(self, job_id, expected_next_poll_at, next_poll_at):
+        """
+        认领一次轮询：仅当next_poll_at未被其他进程修改时推进到下一次轮询时间
+
+        多个进程共用同一任务库时，保证同一轮询周期只有一个进程处理该任务
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET next_poll_at = ?, poll_count = poll_count + 1, updated_at = ? '
+                'WHERE id = ? AND next_poll_at IS ?',
+                (next_poll_at, time.time(), job_id, expected_next_poll_at)
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def next_poll_time(self):
+        """返回最近一次需要轮询的时间，没有进行中任务时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT MIN(COALESCE(next_poll_at, 0)) AS next_at FROM jobs WHERE status IN (?, ?)',
+                ACTIVE_STATUSES
+            ).fetchone()
+        return row['next_at'] if row else None
+
+    def list(self, kind=None, status=None, limit=50):
+        """按创建时间倒序列出任务"""
+        query = 'SELECT * FROM jobs'
+        conditions, args = [], []
+        if kind:
+            conditions.append('kind = ?')
+            args.append(kind)
+        if status:
+            conditions.append('status = ?')
+            args.append(status)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row):
+        job = dict(row)
+        for key in ('params', 'result'):
+            job[key] = json.loads(job[key]) if job.get(key) else None
+        return job
+
+
+def job_to_response(job):
+    """转换为API响应格式（隐藏内部调度字段）"""
+    response = {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'done': job['status'] not in ACTIVE_STATUSES,
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+        'poll_count': job['poll_count']
+    }
+    if job.get('result') is not None:
+        response['result'] = job['result']
+    if job.get('error'):
+        response['error'] = job['error']
+    if job.get('callback_url'):
+        response['callback_url'] = job['callback_url']
+        response['callback_status'] = job.get('callback_status')
+    return response
@@ -0,0 +1,275 @@
+"""
+YOLO 模型注册表
+进程级共享的模型缓存：每个权重文件在进程内只加载一次，
+检测、分割和 OpenCV 内容验证共用同一份模型句柄
+"""
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from ..utils.metrics import MODEL_LOADS, MODEL_LOAD_LATENCY
+
+
+class ModelRecord:
+    """已加载模型的记录"""
+
+    def __init__(self, name, model, path, load_time, resident_bytes):
+        self.name = name
+        self.model = model
+        self.path = path
+        self.load_time = load_time
+        self.resident_bytes = resident_bytes
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'load_time_ms': round(self.load_time * 1000, 2),
+            'resident_bytes': self.resident_bytes,
+            'resident_mb': round(self.resident_bytes / (1024 * 1024), 2),
+            'loaded_at': self.loaded_at,
+            'last_used': self.last_used,
+            'hits': self.hits
+        }
+
+
+class YOLOModelRegistry:
+    """线程安全的YOLO模型注册表，支持按数量/内存上限进行LRU淘汰"""
+
+    def __init__(self, max_models=None, max_bytes=None):
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self._inference_locks = {}
+        self._records = OrderedDict()
+        self._cascades = {}
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'loads': 0,
+            'load_failures': 0,
+            'evictions': 0,
+            'total_load_time': 0.0
+        }
+
+    def get(self, model_name, allow_download=True):
+        """
+        获取共享的模型句柄，必要时加载
+
+        Args:
+            model_name (str): 模型名称，如 yolo11n、yolo11n-seg
+            allow_download (bool): 本地不存在权重时是否允许下载
+
+        Returns:
+            YOLO | None: 模型句柄，加载失败时返回None
+        """
+        with self._lock:
+            record = self._touch(model_name)
+            if record is not None:
+                return record.model
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        # 同一模型只允许一个线程加载，其他线程等待后直接复用
+        with load_lock:
+            with self._lock:
+                record = self._touch(model_name)
+                if record is not None:
+                    return record.model
+
+            start = time.perf_counter()
+            try:
+                model, model_path = self._load(model_name, allow_download)
+            except Exception as e:
+                print(f"加载YOLO模型失败: {str(e)}")
+                model, model_path = None, None
+
+            if model is None:
+                MODEL_LOADS.labels(model_name, 'failure').inc()
+                with self._lock:
+                    self._stats['load_failures'] += 1
+                return None
+
+            load_time = time.perf_counter() - start
+            MODEL_LOADS.labels(model_name, 'success').inc()
+            MODEL_LOAD_LATENCY.labels(model_name).observe(load_time)
+            record = ModelRecord(model_name, model, model_path, load_time,
+                                 self._estimate_resident_bytes(model, model_path))
+            print(f"{model_name} 模型加载完成，耗时 {load_time:.2f}s，"
+                  f"常驻内存约 {record.resident_bytes / (1024 * 1024):.1f}MB")
+
+            with self._lock:
+                self._records[model_name] = record
+                self._stats['misses'] += 1
+                self._stats['loads'] += 1
+                self._stats['total_load_time'] += load_time
+                self._evict_if_needed(keep=model_name)
+            return model
+
+    def inference_lock(self, model_name):
+        """
+        获取模型的推理锁
+
+        同一模型句柄被多个线程共享，ultralytics的predictor不是线程安全的，
+        对同一模型的推理需串行执行；不同模型之间可以并行
+        """
+        with self._lock:
+            return self._inference_locks.setdefault(model_name, threading.Lock())
+
+    def get_cascade(self, cascade_file):
+        """获取共享的Haar级联分类器，首次使用时加载"""
+        with self._lock:
+            cascade = self._cascades.get(cascade_file)
+            if cascade is None:
+                import cv2
+                cascade = cv2.CascadeClassifier(cv2.data.haarcascades + cascade_file)
+                self._cascades[cascade_file] = cascade
+            return cascade
+
+    def is_loaded(self, model_name):
+        """检查模型是否已常驻内存"""
+        with self._lock:
+            return model_name in self._records
+
+    def evict(self, model_name):
+        """手动淘汰指定模型"""
+        with self._lock:
+            record = self._records.pop(model_name, None)
+            if record is not None:
+                self._stats['evictions'] += 1
+                print(f"已从注册表淘汰模型: {model_name}")
+            return record is not None
+
+    def resolve_model_path(self, model_name):
+        """解析模型权重路径：优先使用配置的模型目录"""
+        models_folder = self._config('MODELS_FOLDER')
+        if models_folder:
+            return os.path.join(models_folder, f'{model_name}.pt')
+        # 回退到当前目录
+        return f'{model_name}.pt'
+
+    def find_local_weights(self, model_name):
+        """查找本地已存在的权重文件，找不到时返回None"""
+        candidates = [self.resolve_model_path(model_name), f'{model_name}.pt']
+        for path in candidates:
+            if os.path.exists(path):
+                return path
+        return None
+
+    def stats(self):
+        """返回注册表统计信息"""
+        with self._lock:
+            max_models, max_bytes = self._limits()
+            records = [record.to_dict() for record in self._records.values()]
+            return {
+                'loaded_models': records,
+                'loaded_count': len(records),
+                'cascades': list(self._cascades.keys()),
+                'resident_bytes': sum(r['resident_bytes'] for r in records),
+                'max_models': max_models,
+                'max_bytes': max_bytes,
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'loads': self._stats['loads'],
+                'load_failures': self._stats['load_failures'],
+                'evictions': self._stats['evictions'],
+                'total_load_time_ms': round(self._stats['total_load_time'] * 1000, 2)
+            }
+
+    def _touch(self, model_name):
+        """命中时更新LRU顺序（调用方需持有锁）"""
+        record = self._records.get(model_name)
+        if record is not None:
+            self._records.move_to_end(model_name)
+            record.last_used = time.time()
+            record.hits += 1
+            self._stats['hits'] += 1
+        return record
+
+    def _load(self, model_name, allow_download):
+        """从本地加载或下载模型权重"""
+        from ultralytics import YOLO
+
+        local_path = self.find_local_weights(model_name)
+        if local_path:
+            print(f"找到本地模型文件: {local_path}")
+            print(f"正在加载 {model_name} 模型...")
+            return YOLO(local_path), local_path
+
+        if not allow_download:
+            return None, None
+
+        model_path = self.resolve_model_path(model_name)
+        models_folder = self._config('MODELS_FOLDER')
+        print(f"本地未找到模型文件: {model_path}")
+        print(f"正在下载并加载 {model_name} 模型...")
+
+        # 先下载到当前目录，再移动到模型目录
+        model = YOLO(f'{model_name}.pt')
+        downloaded_path = f'{model_name}.pt'
+        if models_folder and os.path.exists(models_folder) and \
+                os.path.exists(downloaded_path) and downloaded_path != model_path:
+            shutil.move(downloaded_path, model_path)
+            print(f"模型文件已移动到: {model_path}")
+            model = YOLO(model_path)
+            return model, model_path
+        return model, downloaded_path
+
+    def _estimate_resident_bytes(self, model, model_path):
+        """估算模型常驻内存：参数与缓冲区字节数，失败时回退到权重文件大小"""
+        try:
+            module = model.model
+            total = sum(p.numel() * p.element_size() for p in module.parameters())
+            total += sum(b.numel() * b.element_size() for b in module.buffers())
+            if total > 0:
+                return int(total)
+        except Exception:
+            pass
+        try:
+            return os.path.getsize(model_path) if model_path else 0
+        except OSError:
+            return 0
+
+    def _evict_if_needed(self, keep=None):
+        """超出数量或内存上限时按LRU顺序淘汰（调用方需持有锁）"""
+        max_models, max_bytes = self._limits()
+
+        def over_limit():
+            if max_models and len(self._records) > max_models:
+                return True
+            if max_bytes and sum(r.resident_bytes for r in self._records.values()) > max_bytes:
+                return True
+            return False
+
+        while over_limit():
+            victim = next((name for name in self._records if name != keep), None)
+            if victim is None:
+                break
+            self._records.pop(victim)
+            self._stats['evictions'] += 1
+            print(f"模型缓存超出上限，已淘汰: {victim}")
+
+    def _limits(self):
+        max_models = self.max_models if self.max_models is not None else self._config('YOLO_MODEL_CACHE_MAX_MODELS')
+        max_bytes = self.max_bytes if self.max_bytes is not None else self._config('YOLO_MODEL_CACHE_MAX_BYTES')
+        return max_models, max_bytes
+
+    @staticmethod
+    def _config(key):
+        if has_app_context():
+            return current_app.config.get(key)
+        return None
+
+
+# 进程级单例
+_registry = YOLOModelRegistry()
+
+
+def get_model_registry():
+    """获取进程级共享的模型注册表"""
+    return _registry
@@ -4,11 +4,13 @@
 import os
 import json
 import re
-import tempfile
-import base64
 from flask import jsonify
 from flask import current_app
-from ..utils.helpers import save_uploaded_file, image_to_bytes, allowed_file, draw_bounding_box, draw_all_bounding_boxes
+from ..utils.rendering import RenderItem, PALETTE, to_pixels
+from .artifact_store import render_detection_artifacts, ARTIFACTS_ALL
+from ..utils.image_input import load_image_input, ImageInputError
+from .result_cache import get_result_cache
+from ..utils.aio import run_blocking
 from google import genai
 from google.genai import types
 
@@ -17,37 +19,105 @@ class ObjectDetectionService:
     def __init__(self, client):
         self.client = client
 
-    def detect_objects(self, file=None, object_name='对象', image_data=None):
-        """检测图像中的对象"""
+    def detect_objects(self, file=None, object_name='对象', image_data=None, image=None, artifacts=ARTIFACTS_ALL):
+        """
+        检测图像中的对象（image 为已解码的 ImageInput 时直接使用）
+
+        artifacts 控制立即生成的结果图像：all（全部）、summary（仅汇总图）、none（不生成，按需渲染）
+        """
         try:
-            # 处理文件输入
-            if image_data:
-                # 处理base64图像数据
-                image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(image_data_clean)
-
-                # 创建临时文件
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                    tmp_file.write(image_bytes)
-                    filepath = tmp_file.name
-            else:
-                # 处理文件上传
-                if not file or file.filename == '':
-                    return {'success': False, 'error': '未选择文件'}, 400
+            image, error = self._load_input(file, image_data, image, object_name)
+            if error:
+                return error, 400
+
+            # 首先验证图像内容是否包含用户查询的对象
+            result_cache = get_result_cache()
+            validation_text, _ = result_cache.generate_text(
+                self.client,
+                current_app.config['GEMINI_VISION_MODEL'],
+                'detection.validate',
+                object_name,
+                image.data,
+                self._validation_contents(image, object_name),
+                image_hash=image.sha256
+            )
+            mismatch = self._mismatch_result(validation_text, object_name)
+            if mismatch:
+                return mismatch, 200  # 改为200状态码，让前端正确处理内容不匹配
 
-                if not allowed_file(file.filename):
-                    return {'success': False, 'error': '无效的文件类型'}, 400
+            # 使用 Gemini 进行目标检测
+            response_text, cache_hit = result_cache.generate_text(
+                self.client,
+                current_app.config['GEMINI_VISION_MODEL'],
+                'detection.detect',
+                object_name,
+                image.data,
+                self._detection_contents(image, object_name),
+                image_hash=image.sha256
+            )
+            return self._detection_result(image, object_name, response_text, cache_hit, artifacts)
+
+        except Exception as e:
+            error_msg = f'检测失败: {str(e)}'
+            print(f"目标检测错误: {e}")
+            return {'success': False, 'error': error_msg}, 500
 
-                filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
+    async def adetect_objects(self, file=None, object_name='对象', image_data=None, image=None, artifacts=ARTIFACTS_ALL):
+        """detect_objects 的协程版本（ASGI模式）：Gemini调用使用异步客户端，结果图像在线程池中渲染"""
+        try:
+            image, error = self._load_input(file, image_data, image, object_name)
+            if error:
+                return error, 400
 
-            if not object_name or not object_name.strip():
-                return {'success': False, 'error': '请输入要检测的对象名称'}, 400
+            result_cache = get_result_cache()
+            validation_text, _ = await result_cache.agenerate_text(
+                self.client,
+                current_app.config['GEMINI_VISION_MODEL'],
+                'detection.validate',
+                object_name,
+                image.data,
+                self._validation_contents(image, object_name),
+                image_hash=image.sha256
+            )
+            mismatch = self._mismatch_result(validation_text, object_name)
+            if mismatch:
+                return mismatch, 200
 
-            # 读取图像
-            image_bytes = image_to_bytes(filepath)
+            response_text, cache_hit = await result_cache.agenerate_text(
+                self.client,
+                current_app.config['GEMINI_VISION_MODEL'],
+                'detection.detect',
+                object_name,
+                image.data,
+                self._detection_contents(image, object_name),
+                image_hash=image.sha256
+            )
+            return await run_blocking(self._detection_result, image, object_name, response_text, cache_hit, artifacts)
 
-            # 首先验证图像内容是否包含用户查询的对象
-            content_validation_prompt = f"""
+        except Exception as e:
+            error_msg = f'检测失败: {str(e)}'
+            print(f"目标检测错误: {e}")
+            return {'success': False, 'error': error_msg}, 500
+
+    @staticmethod
+    def _load_input(file, image_data, image, object_name):
+        """
+        解析图像输入（只解码一次，不落盘）并检查对象名称
+
+        Returns:
+            tuple: (ImageInput, 错误结果)
+        """
+        try:
+            image = load_image_input(file, image_data, image)
+        except ImageInputError as e:
+            return None, {'success': False, 'error': str(e)}
+        if not object_name or not object_name.strip():
+            return None, {'success': False, 'error': '请输入要检测的对象名称'}
+        return image, None
+
+    def _validation_contents(self, image, object_name):
+        """内容验证请求：图像中是否包含用户查询的对象"""
+        content_validation_prompt = f"""
             请仔细分析这张图像，检查是否包含"{object_name.strip()}"。
 
             请以JSON格式返回结果：
@@ -59,38 +129,34 @@ class ObjectDetectionService:
 
             如果图像中没有"{object_name.strip()}"，请在detected_objects中列出实际检测到的主要对象。
             """
+        return [
+            types.Part.from_bytes(data=image.data, mime_type=image.mime_type),
+            types.Part.from_text(text=content_validation_prompt)
+        ]
 
-            # 进行内容验证
-            validation_response = self.client.models.generate_content(
-                model=current_app.config['GEMINI_VISION_MODEL'],
-                contents=[
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
-                    types.Part.from_text(text=content_validation_prompt)
-                ]
-            )
+    def _mismatch_result(self, validation_text, object_name):
+        """解析内容验证结果，图像内容与查询不匹配时返回提示结果，否则返回None"""
+        validation_data = self._parse_detection_response(validation_text.strip(), "validation")
+        if validation_data.get('contains_object', True):
+            return None
+
+        detected_objects = validation_data.get('detected_objects', [])
+        explanation = validation_data.get('explanation', '图像内容与查询不匹配')
+        return {
+            'success': False,
+            'error': f'未检测到目标：{object_name.strip()}',
+            'message': f'图像中检测到的对象与您查询的"{object_name.strip()}"不匹配。{explanation}',
+            'explanation': explanation,
+            'detected_objects': detected_objects,
+            'suggestion': f'图像中包含: {", ".join(detected_objects[:5])}。请修改查询词汇或上传包含"{object_name.strip()}"的图像。' if detected_objects else '请上传包含明确对象的图像，或检查图像质量。',
+            'content_mismatch': True,
+            'user_query': object_name.strip(),
+            'alternative_queries': detected_objects[:3] if detected_objects else []
+        }
 
-            validation_text = validation_response.text.strip()
-            validation_data = self._parse_detection_response(validation_text, "validation")
-
-            # 检查内容匹配性
-            if not validation_data.get('contains_object', True):
-                detected_objects = validation_data.get('detected_objects', [])
-                explanation = validation_data.get('explanation', '图像内容与查询不匹配')
-
-                return {
-                    'success': False,
-                    'error': f'未检测到目标：{object_name.strip()}',
-                    'message': f'图像中检测到的对象与您查询的"{object_name.strip()}"不匹配。{explanation}',
-                    'explanation': explanation,
-                    'detected_objects': detected_objects,
-                    'suggestion': f'图像中包含: {", ".join(detected_objects[:5])}。请修改查询词汇或上传包含"{object_name.strip()}"的图像。' if detected_objects else '请上传包含明确对象的图像，或检查图像质量。',
-                    'content_mismatch': True,
-                    'user_query': object_name.strip(),
-                    'alternative_queries': detected_objects[:3] if detected_objects else []
-                }, 200  # 改为200状态码，让前端正确处理内容不匹配
-
-            # 构建检测提示词
-            prompt = f"""
+    def _detection_contents(self, image, object_name):
+        """构建检测提示词和图像内容"""
+        prompt = f"""
             请检测图像中的{object_name.strip()}，并返回边界框坐标。
             请以JSON格式返回结果，包含以下信息：
             {{
@@ -105,68 +171,62 @@ class ObjectDetectionService:
             坐标应该是0到1之间的归一化值。
             如果没有检测到{object_name.strip()}，请返回空的objects数组。
             """
+        return [
+            types.Part.from_bytes(data=image.data, mime_type=image.mime_type),
+            types.Part.from_text(text=prompt)
+        ]
 
-            # 使用 Gemini 进行目标检测
-            response = self.client.models.generate_content(
-                model=current_app.config['GEMINI_VISION_MODEL'],
-                contents=[
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
-                    types.Part.from_text(text=prompt)
-                ]
-            )
+    def _detection_result(self, image, object_name, response_text, cache_hit, artifacts):
+        """解析检测结果并绘制结果图像（CPU密集，ASGI模式下在线程池中执行）"""
+        response_text = response_text.strip()
+        detection_data = self._parse_detection_response(response_text, object_name)
 
-            response_text = response.text.strip()
-
-            # 解析检测结果
-            detection_data = self._parse_detection_response(response_text, object_name)
-
-            # 处理检测到的对象
-            detected_objects = []
-            bbox_images = []
-
-            for i, obj in enumerate(detection_data.get('objects', [])):
-                bbox = obj.get('bbox', [])
-                label = obj.get('label', object_name)
-                confidence = obj.get('confidence', 0.9)
-
-                if len(bbox) == 4:
-                    # 在图像上绘制边界框
-                    bbox_filename = f"bbox_{label}_{i}_{os.path.basename(filepath)}"
-                    bbox_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], bbox_filename)
-                    draw_bounding_box(filepath, bbox, bbox_filepath, label=label)
-
-                    detected_objects.append({
-                        'label': label,
-                        'confidence': confidence,
-                        'bbox': bbox
-                    })
-                    bbox_images.append(bbox_filepath)
-
-            if detected_objects:
-                # 创建汇总图片，将所有检测到的对象绘制在一张图上
-                summary_filename = f"summary_all_objects_{os.path.basename(filepath)}"
-                summary_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], summary_filename)
-                draw_all_bounding_boxes(filepath, detected_objects, summary_filepath)
-
-                return {
-                    'success': True,
-                    'detected_objects': detected_objects,
-                    'original_image': filepath,
-                    'bbox_images': bbox_images,
-                    'summary_image': summary_filepath,  # 新增汇总图片
-                    'response_text': response_text
-                }, 200
-            else:
-                return {
-                    'success': False,
-                    'error': f'未检测到{object_name}',
-                    'response_text': response_text
-                }, 200
+        # 处理检测到的对象
+        detected_objects = []
+        render_items = []
 
-        except Exception as e:
-            error_msg = f'检测失败: {str(e)}'
-            print(f"目标检测错误: {e}")
-            return {'success': False, 'error': error_msg}, 500
+        for i, obj in enumerate(detection_data.get('objects', [])):
+            bbox = obj.get('bbox', [])
+            label = obj.get('label', object_name)
+            confidence = obj.get('confidence', 0.9)
+
+            if len(bbox) == 4:
+                bbox_filename = f"bbox_{label}_{i}_{image.name}"
+                render_items.append(RenderItem(
+                    to_pixels(bbox, image.dimensions),
+                    os.path.join(current_app.config['GENERATED_FOLDER'], bbox_filename),
+                    label=label,
+                    color='red',
+                    summary_label=f"{label} ({confidence:.2f})",
+                    summary_color=PALETTE[len(render_items) % len(PALETTE)]
+                ))
+
+                detected_objects.append({
+                    'label': label,
+                    'confidence': confidence,
+                    'bbox': bbox
+                })
+
+        if not detected_objects:
+            return {
+                'success': False,
+                'error': f'未检测到{object_name}',
+                'response_text': response_text
+            }, 200
+
+        # 一次遍历绘制每个对象的边界框图像和汇总图片（或保存参数按需渲染）
+        summary_filename = f"summary_all_objects_{image.name}"
+        summary_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], summary_filename)
+        rendered = render_detection_artifacts(image, render_items, summary_filepath, artifacts)
+
+        return {
+            'success': True,
+            'detected_objects': detected_objects,
+            'original_image': image.reference_path(),
+            **rendered,
+            'response_text': response_text,
+            'cache_hit': cache_hit
+        }, 200
 
     def _parse_detection_response(self, response_text, object_name):
         """解析检测响应"""
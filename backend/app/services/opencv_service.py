@@ -5,10 +5,16 @@ import os
 import cv2
 import numpy as np
 from PIL import Image
-import tempfile
-import base64
 from flask import current_app
-from ..utils.helpers import save_uploaded_file, allowed_file
+from ..utils.image_input import load_image_input, read_bgr_image, ImageInputError
+from ..utils.rendering import RenderItem, to_pixels, contour_cutout
+from .artifact_store import render_detection_artifacts, defer_contour_cutouts, ARTIFACTS_ALL
+from ..utils.mask_encoding import encode_mask, encode_contour, MASK_FORMAT_NONE
+from ..utils.label_index import label_index
+from .model_registry import get_model_registry
+from .inference_scheduler import get_inference_scheduler
+from .storage_manager import storage_manager
+from ..utils.metrics import time_stage, timed
 
 
 class OpenCVService:
@@ -19,9 +25,10 @@ class OpenCVService:
         self.yolo_output_layers = None
         self._load_yolo_model()
 
-        # 初始化 Haar Cascade 分类器
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+        # 初始化 Haar Cascade 分类器（进程内共享）
+        registry = get_model_registry()
+        self.face_cascade = registry.get_cascade('haarcascade_frontalface_default.xml')
+        self.eye_cascade = registry.get_cascade('haarcascade_eye.xml')
 
     def _load_yolo_model(self):
         """加载 YOLO 模型（如果可用）"""
@@ -32,118 +39,26 @@ class OpenCVService:
         except Exception as e:
             print(f"YOLO 模型加载失败: {e}")
 
-    def detect_objects_opencv(self, file=None, image_data=None, method='contour', object_name='对象'):
-        """使用 OpenCV 进行目标检测"""
-        try:
-            # 处理文件输入
-            if image_data:
-                image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(image_data_clean)
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                    tmp_file.write(image_bytes)
-                    filepath = tmp_file.name
-            else:
-                if not file or file.filename == '':
-                    return {'success': False, 'error': '未选择文件'}, 400
-                if not allowed_file(file.filename):
-                    return {'success': False, 'error': '无效的文件类型'}, 400
-                # 检查是否是已经存在的文件路径（用于测试）
-                if hasattr(file, 'filepath') and os.path.exists(file.filepath):
-                    filepath = file.filepath
-                else:
-                    # 标准的Flask文件上传对象
-                    filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
-
-            # 首先检查文件是否存在和有效
-            if not os.path.exists(filepath):
-                error_msg = f'图像文件不存在: {filepath}'
-                print(error_msg)
-                return {'success': False, 'error': error_msg}, 400
-
-            # 检查文件大小
-            file_size = os.path.getsize(filepath)
-            if file_size == 0:
-                error_msg = f'图像文件为空: {filepath}（文件大小: 0 字节）'
-                print(error_msg)
-                return {'success': False, 'error': error_msg}, 400
-
-            if file_size < 100:  # 小于100字节的图像文件通常是无效的
-                error_msg = f'图像文件过小，可能已损坏: {filepath}（文件大小: {file_size} 字节）'
-                print(error_msg)
-                return {'success': False, 'error': error_msg}, 400
+    def detect_objects_opencv(self, file=None, image_data=None, method='contour', object_name='对象', image=None,
+                              artifacts=ARTIFACTS_ALL):
+        """
+        使用 OpenCV 进行目标检测（image 为已解码的 ImageInput 时直接使用）
 
-            # 读取图像 - 使用多种方法确保能够读取
-            image = None
-
-            # 方法1: 直接使用cv2.imread
+        artifacts 控制立即生成的结果图像：all（全部）、summary（仅汇总图）、none（不生成，按需渲染）
+        """
+        try:
+            # 解析图像输入（只解码一次，不落盘）；检测过程会在图像上就地绘制，使用副本
             try:
-                image = cv2.imread(filepath)
-                if image is not None and image.size > 0:
-                    print("使用cv2.imread成功读取图像")
-                else:
-                    image = None
-            except Exception as e:
-                print(f"cv2.imread 失败: {e}")
-
-            # 方法2: 如果直接读取失败，使用PIL转换
-            if image is None:
-                try:
-                    from PIL import Image as PILImage
-                    pil_image = PILImage.open(filepath)
-
-                    # 检查图像是否有效
-                    if pil_image.size[0] == 0 or pil_image.size[1] == 0:
-                        raise ValueError("图像尺寸无效")
-
-                    # 转换为RGB（如果是RGBA）
-                    if pil_image.mode == 'RGBA':
-                        pil_image = pil_image.convert('RGB')
-                    elif pil_image.mode == 'P':
-                        pil_image = pil_image.convert('RGB')
-
-                    # 转换为numpy数组
-                    image_array = np.array(pil_image)
-                    # PIL使用RGB，OpenCV使用BGR，需要转换
-                    image = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-                    print("使用PIL成功读取图像")
-                except Exception as e:
-                    print(f"PIL读取失败: {e}")
-
-            # 方法3: 如果还是失败，尝试使用numpy直接读取
-            if image is None:
-                try:
-                    # 读取文件字节
-                    with open(filepath, 'rb') as f:
-                        file_bytes = f.read()
-
-                    if len(file_bytes) == 0:
-                        raise ValueError("文件内容为空")
-
-                    # 使用numpy和cv2解码
-                    nparr = np.frombuffer(file_bytes, np.uint8)
-                    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-                    if image is not None and image.size > 0:
-                        print("使用numpy成功读取图像")
-                    else:
-                        image = None
-                except Exception as e:
-                    print(f"numpy读取失败: {e}")
-
-            if image is None:
-                error_msg = f'无法读取图像文件: {filepath}。文件可能已损坏或格式不支持。文件大小: {file_size} 字节'
-                print(error_msg)
-                return {'success': False, 'error': error_msg}, 400
-
-            # 验证图像尺寸
-            if image.shape[0] == 0 or image.shape[1] == 0:
-                error_msg = f'图像尺寸无效: {filepath}。图像尺寸: {image.shape}'
+                source = load_image_input(file, image_data, image)
+                image = source.bgr.copy()
+            except ImageInputError as e:
+                error_msg = str(e)
                 print(error_msg)
                 return {'success': False, 'error': error_msg}, 400
 
             # 如果用户指定了特定对象名称，进行内容验证
             if object_name and object_name.strip() and object_name.strip() != '对象':
-                validation_result = self._validate_image_content(filepath, object_name.strip())
+                validation_result = self._validate_image_content(source, object_name.strip())
                 if not validation_result['is_match']:
                     return {
                         'success': False,
@@ -171,7 +86,7 @@ class OpenCVService:
                 # 使用轮廓检测（通用对象检测）
                 # 首先验证图像内容是否包含用户查询的对象
                 if object_name and object_name.strip():
-                    content_match = self._validate_image_content(filepath, object_name)
+                    content_match = self._validate_image_content(source, object_name)
                     if not content_match['is_match']:
                         return {
                             'success': False,
@@ -186,7 +101,7 @@ class OpenCVService:
                 # 使用颜色分割检测
                 # 验证图像内容
                 if object_name and object_name.strip():
-                    content_match = self._validate_image_content(filepath, object_name)
+                    content_match = self._validate_image_content(source, object_name)
                     if not content_match['is_match']:
                         return {
                             'success': False,
@@ -201,7 +116,7 @@ class OpenCVService:
                 # 使用边缘检测
                 # 验证图像内容
                 if object_name and object_name.strip():
-                    content_match = self._validate_image_content(filepath, object_name)
+                    content_match = self._validate_image_content(source, object_name)
                     if not content_match['is_match']:
                         return {
                             'success': False,
@@ -213,26 +128,17 @@ class OpenCVService:
                         }, 200  # 改为200状态码
                 detected_objects = self._detect_by_edges(image, object_name)
 
-            # 生成带边界框的图像
-            bbox_images = []
-            for i, obj in enumerate(detected_objects):
-                bbox_filename = f"opencv_bbox_{obj['label']}_{i}_{os.path.basename(filepath)}"
-                bbox_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], bbox_filename)
-                self._draw_opencv_bbox(filepath, obj['bbox'], bbox_filepath, obj['label'], obj['method'], i)
-                bbox_images.append(bbox_filepath)
-
             if detected_objects:
-                # 创建汇总图片
-                summary_filename = f"opencv_summary_{os.path.basename(filepath)}"
+                # 一次遍历生成每个对象的边界框图像和汇总图片
+                summary_filename = f"opencv_summary_{source.name}"
                 summary_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], summary_filename)
-                self._draw_all_opencv_bboxes(filepath, detected_objects, summary_filepath)
+                rendered = self._render_opencv_bboxes(source, detected_objects, summary_filepath, artifacts)
 
                 return {
                     'success': True,
                     'detected_objects': detected_objects,
-                    'original_image': filepath,
-                    'bbox_images': bbox_images,
-                    'summary_image': summary_filepath,
+                    'original_image': source.reference_path(),
+                    **rendered,
                     'method': f'OpenCV {method}'
                 }, 200
             else:
@@ -247,7 +153,7 @@ class OpenCVService:
             print(f"OpenCV 检测错误: {e}")
             return {'success': False, 'error': error_msg}, 500
 
-    def _validate_image_content(self, image_path, object_name):
+    def _validate_image_content(self, source, object_name):
         """改进的图像内容验证方法 - 更严格的验证策略"""
         try:
             print(f"OpenCV内容验证：开始验证图像是否包含 '{object_name}'")
@@ -265,7 +171,7 @@ class OpenCVService:
                 }
 
             # 方法1: 首先尝试使用YOLO进行快速验证（如果可用）
-            yolo_validation = self._validate_with_yolo(image_path, object_name)
+            yolo_validation = self._validate_with_yolo(source, object_name)
             if yolo_validation['is_available']:
                 if yolo_validation['is_match']:
                     print(f"YOLO验证成功：检测到 '{object_name}'")
@@ -289,7 +195,7 @@ class OpenCVService:
                     }
 
             # 方法2: 如果YOLO不可用，使用Gemini进行详细验证
-            gemini_validation = self._validate_with_gemini(image_path, object_name)
+            gemini_validation = self._validate_with_gemini(source, object_name)
             if gemini_validation.get('is_available', True):
                 if gemini_validation['is_match']:
                     print(f"Gemini验证成功：检测到 '{object_name}'")
@@ -313,7 +219,7 @@ class OpenCVService:
                     }
 
             # 方法3: 如果前两种方法都不可用，使用OpenCV基础特征验证（更严格）
-            opencv_validation = self._validate_with_opencv_features(image_path, object_name)
+            opencv_validation = self._validate_with_opencv_features(source, object_name)
             if opencv_validation['is_match']:
                 print(f"OpenCV特征验证成功：检测到相关特征")
                 return {
@@ -360,27 +266,20 @@ class OpenCVService:
                 'detected_objects': []
             }
 
-    def _validate_with_yolo(self, image_path, object_name):
+    def _validate_with_yolo(self, source, object_name):
         """使用YOLO进行内容验证"""
         try:
-            # 尝试导入YOLO相关模块
-            from ultralytics import YOLO
-            import cv2
-
-            # 检查是否有可用的YOLO模型
-            yolo_model_path = 'yolo11n.pt'  # 使用检测模型而不是分割模型
-            if not os.path.exists(yolo_model_path):
+            # 从共享注册表获取检测模型（仅使用本地已有权重，验证阶段不触发下载）
+            model = get_model_registry().get('yolo11n', allow_download=False)
+            if model is None:
                 return {
                     'is_available': False,
                     'is_match': False,
                     'message': 'YOLO模型不可用'
                 }
 
-            # 加载YOLO模型
-            model = YOLO(yolo_model_path)
-
             # 读取图像
-            image = cv2.imread(image_path)
+            image = read_bgr_image(source)
             if image is None:
                 return {
                     'is_available': True,
@@ -389,7 +288,7 @@ class OpenCVService:
                 }
 
             # 进行检测
-            results = model(image, conf=0.3)  # 使用较低的置信度
+            results = get_inference_scheduler().predict('yolo11n', model, image, 0.3)  # 使用较低的置信度
 
             detected_objects = []
             for result in results:
@@ -424,19 +323,17 @@ class OpenCVService:
                 'message': f'YOLO验证出错: {str(e)}'
             }
 
-    def _validate_with_gemini(self, image_path, object_name):
+    def _validate_with_gemini(self, source, object_name):
         """使用Gemini进行智能内容验证 - 充分利用AI的语义理解能力"""
         try:
-            from google import genai
             from google.genai import types
-            from flask import current_app
-            from ..utils.helpers import image_to_bytes
+            from .result_cache import get_result_cache
+            from .gemini_clients import get_gemini_client
 
-            # 初始化Gemini客户端
-            client = genai.Client(api_key=current_app.config['GEMINI_API_KEY'])
+            # 获取共享的Gemini客户端
+            client = get_gemini_client()
 
-            # 读取图像
-            image_bytes = image_to_bytes(image_path)
+            image_bytes = source.data
 
             # 构建智能验证提示词 - 利用Gemini的强大理解能力
             validation_prompt = f"""
@@ -477,19 +374,24 @@ class OpenCVService:
             """
 
             # 进行智能内容验证
-            response = client.models.generate_content(
-                model=current_app.config['GEMINI_VISION_MODEL'],
-                contents=[
-                    types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg"),
+            response_text, _ = get_result_cache().generate_text(
+                client,
+                current_app.config['GEMINI_VISION_MODEL'],
+                'opencv.validate',
+                object_name,
+                image_bytes,
+                [
+                    types.Part.from_bytes(data=image_bytes, mime_type=source.mime_type),
                     types.Part.from_text(text=validation_prompt)
-                ]
+                ],
+                image_hash=source.sha256
             )
 
             # 解析响应
             import json
             import re
 
-            response_text = response.text.strip()
+            response_text = response_text.strip()
             print(f"Gemini原始响应: {response_text[:200]}...")
 
             # 尝试提取JSON
@@ -618,10 +520,10 @@ class OpenCVService:
             }
         }
 
-    def _validate_with_opencv_features(self, image_path, object_name):
+    def _validate_with_opencv_features(self, source, object_name):
         """使用OpenCV特征进行基础验证 - 更严格的验证"""
         try:
-            image = cv2.imread(image_path)
+            image = read_bgr_image(source)
             if image is None:
                 return {
                     'is_match': False,
@@ -683,286 +585,10 @@ class OpenCVService:
             }
 
     def _check_object_match(self, query, detected_objects):
-        """检查查询对象是否与检测到的对象匹配 - 增强版匹配逻辑"""
+        """检查查询对象是否与检测到的对象匹配（与YOLO服务共用标签索引）"""
         if not detected_objects:
             return False
-
-        query_lower = query.lower().strip()
-        detected_lower = [obj.lower().strip() for obj in detected_objects]
-
-        # 1. 直接匹配
-        if query_lower in detected_lower:
-            return True
-
-        # 2. 部分匹配（更严格的条件）
-        for detected in detected_lower:
-            # 只有当查询词是检测到的对象的完整子串，或者检测到的对象是查询词的完整子串时才匹配
-            if (len(query_lower) >= 2 and query_lower in detected) or (len(detected) >= 2 and detected in query_lower):
-                return True
-
-        # 3. 扩展的同义词匹配（大幅扩展映射表）
-        synonym_map = {
-            # 人类相关
-            '人': ['person', 'people', 'human', 'man', 'woman', 'boy', 'girl', 'child'],
-            '人物': ['person', 'people', 'human', 'man', 'woman'],
-            '男人': ['man', 'person'],
-            '女人': ['woman', 'person'],
-            '小孩': ['child', 'boy', 'girl', 'person'],
-            '儿童': ['child', 'boy', 'girl', 'person'],
-
-            # 动物相关（大幅扩展）
-            '狗': ['dog', 'puppy'],
-            '小狗': ['dog', 'puppy'],
-            '犬': ['dog'],
-            '猫': ['cat', 'kitten'],
-            '小猫': ['cat', 'kitten'],
-            '猫咪': ['cat', 'kitten'],
-            '鸟': ['bird'],
-            '小鸟': ['bird'],
-            '马': ['horse'],
-            '牛': ['cow'],
-            '羊': ['sheep'],
-            '大象': ['elephant'],
-            '象': ['elephant'],
-            '斑马': ['zebra'],
-            '长颈鹿': ['giraffe'],
-            '鹿': ['giraffe'],
-            '狮子': ['lion'],
-            '老虎': ['tiger'],
-            '虎': ['tiger'],
-            '熊': ['bear'],
-            '猴子': ['monkey'],
-            '猴': ['monkey'],
-            '兔子': ['rabbit'],
-            '兔': ['rabbit'],
-            '老鼠': ['mouse'],
-            '鼠': ['mouse'],
-            '动物': ['animal', 'dog', 'cat', 'bird', 'horse', 'cow', 'sheep', 'elephant', 'bear', 'zebra', 'giraffe', 'lion', 'tiger', 'monkey', 'rabbit', 'mouse'],
-
-            # 交通工具相关
-            '汽车': ['car', 'vehicle', 'automobile'],
-            '车': ['car', 'vehicle', 'automobile', 'truck', 'bus'],
-            '轿车': ['car', 'automobile'],
-            '小车': ['car'],
-            '卡车': ['truck'],
-            '货车': ['truck'],
-            '大车': ['truck', 'bus'],
-            '公交车': ['bus'],
-            '巴士': ['bus'],
-            '自行车': ['bicycle', 'bike'],
-            '单车': ['bicycle', 'bike'],
-            '脚踏车': ['bicycle'],
-            '摩托车': ['motorcycle'],
-            '机车': ['motorcycle'],
-            '飞机': ['airplane', 'aircraft'],
-            '客机': ['airplane'],
-            '船': ['boat', 'ship'],
-            '小船': ['boat'],
-            '火车': ['train'],
-            '交通工具': ['car', 'truck', 'bus', 'motorcycle', 'bicycle', 'airplane', 'boat', 'train'],
-
-            # 物品相关（大幅扩展）
-            '瓶子': ['bottle'],
-            '水瓶': ['bottle'],
-            '椅子': ['chair'],
-            '座椅': ['chair'],
-            '桌子': ['table', 'desk'],
-            '餐桌': ['table'],
-            '书': ['book'],
-            '书本': ['book'],
-            '电脑': ['laptop', 'computer'],
-            '笔记本电脑': ['laptop'],
-            '手机': ['phone', 'cell phone'],
-            '电话': ['phone'],
-            '时钟': ['clock'],
-            '钟表': ['clock'],
-            '键盘': ['keyboard'],
-            '鼠标': ['mouse'],
-            '显示器': ['monitor'],
-            '屏幕': ['monitor', 'tv'],
-            '电视': ['tv'],
-            '剪刀': ['scissors'],
-            '剪子': ['scissors'],
-            '泰迪熊': ['teddy bear'],
-            '玩具熊': ['teddy bear'],
-            '熊娃娃': ['teddy bear'],
-            '吹风机': ['hair drier'],
-            '电吹风': ['hair drier'],
-            '牙刷': ['toothbrush'],
-            '电动牙刷': ['toothbrush'],
-            '雨伞': ['umbrella'],
-            '伞': ['umbrella'],
-            '手提包': ['handbag'],
-            '包': ['handbag', 'backpack'],
-            '背包': ['backpack'],
-            '行李箱': ['suitcase'],
-            '箱子': ['suitcase'],
-
-            # 自然物体相关
-            '花': ['flower'],
-            '花朵': ['flower'],
-            '树': ['tree'],
-            '树木': ['tree'],
-            '房子': ['house', 'building'],
-            '建筑': ['building', 'house'],
-            '楼房': ['building'],
-
-            # 食物相关（新增）
-            '苹果': ['apple'],
-            '香蕉': ['banana'],
-            '橙子': ['orange'],
-            '橘子': ['orange'],
-            '蛋糕': ['cake'],
-            '面包': ['bread'],
-            '三明治': ['sandwich'],
-            '热狗': ['hot dog'],
-            '披萨': ['pizza'],
-            '甜甜圈': ['donut'],
-            '胡萝卜': ['carrot'],
-            '萝卜': ['carrot'],
-
-            # 运动相关
-            '球': ['ball', 'sports ball'],
-            '足球': ['sports ball'],
-            '篮球': ['sports ball'],
-            '网球': ['sports ball', 'tennis racket'],
-            '网球拍': ['tennis racket'],
-            '棒球棒': ['baseball bat'],
-            '滑板': ['skateboard'],
-            '滑雪板': ['skis'],
-            '风筝': ['kite'],
-
-            # 英文到中文的反向映射（大幅扩展）
-            'person': ['人', '人物', '人类'],
-            'dog': ['狗', '小狗', '犬'],
-            'cat': ['猫', '小猫', '猫咪'],
-            'car': ['汽车', '车', '轿车', '小车'],
-            'truck': ['卡车', '货车', '大车'],
-            'bus': ['公交车', '巴士', '大车'],
-            'bird': ['鸟', '小鸟'],
-            'horse': ['马'],
-            'cow': ['牛'],
-            'sheep': ['羊'],
-            'elephant': ['大象', '象'],
-            'zebra': ['斑马'],
-            'giraffe': ['长颈鹿', '鹿'],
-            'lion': ['狮子'],
-            'tiger': ['老虎', '虎'],
-            'bear': ['熊'],
-            'monkey': ['猴子', '猴'],
-            'rabbit': ['兔子', '兔'],
-            'mouse': ['老鼠', '鼠'],
-            'bicycle': ['自行车', '单车', '脚踏车'],
-            'motorcycle': ['摩托车', '机车'],
-            'airplane': ['飞机', '客机'],
-            'boat': ['船', '小船'],
-            'train': ['火车'],
-            'bottle': ['瓶子', '水瓶'],
-            'chair': ['椅子', '座椅'],
-            'table': ['桌子', '餐桌'],
-            'book': ['书', '书本'],
-            'laptop': ['电脑', '笔记本电脑'],
-            'phone': ['手机', '电话'],
-            'clock': ['时钟', '钟表'],
-            'keyboard': ['键盘'],
-            'mouse': ['鼠标'],
-            'monitor': ['显示器', '屏幕'],
-            'tv': ['电视', '屏幕'],
-            'scissors': ['剪刀', '剪子'],
-            'teddy bear': ['泰迪熊', '玩具熊', '熊娃娃'],
-            'hair drier': ['吹风机', '电吹风'],
-            'toothbrush': ['牙刷', '电动牙刷'],
-            'umbrella': ['雨伞', '伞'],
-            'handbag': ['手提包', '包'],
-            'backpack': ['背包', '包'],
-            'suitcase': ['行李箱', '箱子'],
-            'flower': ['花', '花朵'],
-            'tree': ['树', '树木'],
-            'house': ['房子'],
-            'building': ['建筑', '楼房'],
-            'apple': ['苹果'],
-            'banana': ['香蕉'],
-            'orange': ['橙子', '橘子'],
-            'cake': ['蛋糕'],
-            'bread': ['面包'],
-            'sandwich': ['三明治'],
-            'hot dog': ['热狗'],
-            'pizza': ['披萨'],
-            'donut': ['甜甜圈'],
-            'carrot': ['胡萝卜', '萝卜'],
-            'ball': ['球'],
-            'sports ball': ['足球', '篮球', '球'],
-            'tennis racket': ['网球拍'],
-            'baseball bat': ['棒球棒'],
-            'skateboard': ['滑板'],
-            'skis': ['滑雪板'],
-            'kite': ['风筝']
-        }
-
-        # 4. 检查同义词匹配
-        for key, synonyms in synonym_map.items():
-            if key == query_lower:
-                # 查询词在同义词映射的键中
-                for synonym in synonyms:
-                    if synonym in detected_lower:
-                        return True
-            elif query_lower in synonyms:
-                # 查询词在同义词列表中
-                if key in detected_lower:
-                    return True
-                # 检查其他同义词
-                for synonym in synonyms:
-                    if synonym in detected_lower:
-                        return True
-
-        # 5. 模糊匹配（仅对长度大于3的词进行）
-        if len(query_lower) > 3:
-            for detected in detected_lower:
-                if len(detected) > 3:
-                    # 计算相似度（简单的字符重叠）
-                    common_chars = set(query_lower) & set(detected)
-                    similarity = len(common_chars) / max(len(query_lower), len(detected))
-                    if similarity > 0.6:  # 60%以上的字符重叠
-                        return True
-
-        # 6. 语义组匹配（新增）
-        semantic_groups = {
-            'animals': ['dog', 'cat', 'bird', 'horse', 'cow', 'sheep', 'elephant', 'zebra', 'giraffe', 'lion', 'tiger', 'bear', 'monkey', 'rabbit', 'mouse'],
-            'vehicles': ['car', 'truck', 'bus', 'motorcycle', 'bicycle', 'airplane', 'boat', 'train'],
-            'furniture': ['chair', 'table', 'sofa', 'bed'],
-            'electronics': ['laptop', 'phone', 'tv', 'keyboard', 'mouse', 'monitor'],
-            'food': ['apple', 'banana', 'orange', 'cake', 'bread', 'sandwich', 'hot dog', 'pizza', 'donut', 'carrot'],
-            'sports': ['ball', 'sports ball', 'tennis racket', 'baseball bat', 'skateboard', 'skis', 'kite']
-        }
-
-        # 检查是否属于同一语义组
-        query_group = None
-        detected_groups = set()
-
-        # 找到查询词所属的语义组
-        for group_name, items in semantic_groups.items():
-            if any(synonym in query_lower for synonym in items):
-                query_group = group_name
-                break
-            # 检查中文同义词
-            for item in items:
-                if item in synonym_map and query_lower in synonym_map[item]:
-                    query_group = group_name
-                    break
-
-        # 找到检测对象所属的语义组
-        for detected in detected_lower:
-            for group_name, items in semantic_groups.items():
-                if detected in items:
-                    detected_groups.add(group_name)
-
-        # 如果属于同一语义组，则认为可能匹配（降低匹配严格度）
-        if query_group and query_group in detected_groups:
-            # 对于语义组匹配，我们可以给出提示而不是直接匹配
-            # 这里暂时返回False，让上层逻辑处理
-            pass
-
-        return False
+        return bool(label_index.select(query, detected_objects))
 
     def _detect_color_features(self, image, object_name):
         """检测颜色特征"""
@@ -1122,6 +748,7 @@ class OpenCVService:
         # 这样可以避免误判，让YOLO或Gemini来处理复杂对象识别
         return False
 
+    @timed('opencv', 'haar')
     def _detect_faces_haar(self, image):
         """使用 Haar Cascade 检测人脸"""
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -1145,6 +772,7 @@ class OpenCVService:
 
         return detected_objects
 
+    @timed('opencv', 'contour')
     def _detect_contours(self, image, object_name='对象'):
         """使用轮廓检测对象"""
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -1197,6 +825,7 @@ class OpenCVService:
 
         return detected_objects
 
+    @timed('opencv', 'color')
     def _detect_by_color(self, image, object_name='对象'):
         """使用颜色分割检测对象"""
         hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
@@ -1252,6 +881,7 @@ class OpenCVService:
 
         return detected_objects[:3]  # 最多返回3个对象
 
+    @timed('opencv', 'edge')
     def _detect_by_edges(self, image, object_name='对象'):
         """使用边缘检测对象"""
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -1295,176 +925,67 @@ class OpenCVService:
 
         return detected_objects
 
-    def _draw_opencv_bbox(self, image_path, bbox_coords, output_path, label, method, color_index=0):
-        """绘制 OpenCV 检测的边界框 - 支持不同颜色"""
-        image = cv2.imread(image_path)
-        height, width = image.shape[:2]
-
-        ymin, xmin, ymax, xmax = bbox_coords
-        x1 = int(xmin * width)
-        y1 = int(ymin * height)
-        x2 = int(xmax * width)
-        y2 = int(ymax * height)
-
-        # 颜色调色板
-        colors = [
-            (255, 0, 0),    # 红色
-            (0, 255, 0),    # 绿色
-            (0, 0, 255),    # 蓝色
-            (255, 255, 0),  # 青色
-            (255, 0, 255),  # 洋红色
-            (0, 255, 255),  # 黄色
-            (128, 0, 255),  # 紫色
-            (255, 128, 0),  # 橙色
-        ]
-
-        color = colors[color_index % len(colors)]
-
-        # 绘制边界框
-        cv2.rectangle(image, (x1, y1), (x2, y2), color, 3)
-
-        # 添加标签背景和文本
-        label_text = f"{label} ({method})"
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.6
-        font_thickness = 2
-        (text_width, text_height), baseline = cv2.getTextSize(label_text, font, font_scale, font_thickness)
-
-        # 绘制标签背景
-        cv2.rectangle(image, (x1, y1 - text_height - 10), (x1 + text_width + 10, y1), color, -1)
-
-        # 绘制标签文本（白色）
-        cv2.putText(image, label_text, (x1 + 5, y1 - 5), font, font_scale, (255, 255, 255), font_thickness)
-
-        cv2.imwrite(output_path, image)
-        return output_path
-
-    def _draw_all_opencv_bboxes(self, image_path, detected_objects, output_path):
-        """绘制所有 OpenCV 检测的边界框 - 使用不同颜色区分对象"""
-        image = cv2.imread(image_path)
-        height, width = image.shape[:2]
-
-        # 扩展颜色调色板，使用更鲜明的颜色
-        colors = [
-            (255, 0, 0),    # 红色
-            (0, 255, 0),    # 绿色
-            (0, 0, 255),    # 蓝色
-            (255, 255, 0),  # 青色
-            (255, 0, 255),  # 洋红色
-            (0, 255, 255),  # 黄色
-            (128, 0, 255),  # 紫色
-            (255, 128, 0),  # 橙色
-            (0, 128, 255),  # 天蓝色
-            (128, 255, 0),  # 青绿色
-            (255, 0, 128),  # 粉红色
-            (0, 255, 128),  # 春绿色
-        ]
-
+    # 逐对象图像的边界框颜色（RGB）
+    BBOX_COLORS = [
+        (0, 0, 255),    # 蓝色
+        (0, 255, 0),    # 绿色
+        (255, 0, 0),    # 红色
+        (0, 255, 255),  # 青色
+        (255, 0, 255),  # 洋红色
+        (255, 255, 0),  # 黄色
+        (255, 0, 128),  # 玫红色
+        (0, 128, 255),  # 天蓝色
+    ]
+
+    # 汇总图的颜色调色板（RGB），使用更多鲜明的颜色区分对象
+    SUMMARY_COLORS = BBOX_COLORS + [
+        (255, 128, 0),  # 橙色
+        (0, 255, 128),  # 春绿色
+        (128, 0, 255),  # 紫色
+        (128, 255, 0),  # 黄绿色
+    ]
+
+    def _render_opencv_bboxes(self, source, detected_objects, summary_path, artifacts=ARTIFACTS_ALL):
+        """
+        绘制 OpenCV 检测的边界框：每个对象一张带边界框的图像，以及一张使用不同颜色区分对象的汇总图
+
+        Returns:
+            dict: 结果图像字段，见 render_detection_artifacts
+        """
+        items = []
         for i, obj in enumerate(detected_objects):
-            bbox = obj['bbox']
-            label = obj['label']
-            method = obj['method']
+            label, method = obj['label'], obj['method']
             confidence = obj.get('confidence', 0.0)
-
-            ymin, xmin, ymax, xmax = bbox
-            x1 = int(xmin * width)
-            y1 = int(ymin * height)
-            x2 = int(xmax * width)
-            y2 = int(ymax * height)
-
-            # 使用不同颜色
-            color = colors[i % len(colors)]
-
-            # 绘制边界框，线条粗细根据置信度调整
-            thickness = max(2, int(confidence * 4)) if confidence > 0 else 3
-            cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
-
-            # 添加标签背景
-            label_text = f"{label} ({confidence:.2f})" if confidence > 0 else f"{label} ({method})"
-
-            # 计算文本尺寸
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.6
-            font_thickness = 2
-            (text_width, text_height), baseline = cv2.getTextSize(label_text, font, font_scale, font_thickness)
-
-            # 绘制标签背景
-            cv2.rectangle(image, (x1, y1 - text_height - 10), (x1 + text_width + 10, y1), color, -1)
-
-            # 绘制标签文本（白色）
-            cv2.putText(image, label_text, (x1 + 5, y1 - 5), font, font_scale, (255, 255, 255), font_thickness)
-
-            # 在右上角添加对象编号
-            number_text = f"#{i+1}"
-            cv2.putText(image, number_text, (x2 - 30, y1 + 20), font, 0.5, color, 2)
-
-        cv2.imwrite(output_path, image)
-        return output_path
-
-    def segment_image_opencv(self, file=None, image_data=None, method='contour_mask', object_name = ""):
-        """使用 OpenCV 进行图像分割"""
+            bbox_filename = f"opencv_bbox_{label}_{i}_{source.name}"
+            items.append(RenderItem(
+                to_pixels(obj['bbox'], source.dimensions),
+                os.path.join(current_app.config['GENERATED_FOLDER'], bbox_filename),
+                label=f"{label} ({method})",
+                color=self.BBOX_COLORS[i % len(self.BBOX_COLORS)],
+                width=3,
+                summary_label=f"{label} ({confidence:.2f})" if confidence > 0 else f"{label} ({method})",
+                summary_color=self.SUMMARY_COLORS[i % len(self.SUMMARY_COLORS)],
+                # 汇总图线条粗细根据置信度调整
+                summary_width=max(2, int(confidence * 4)) if confidence > 0 else 3,
+                number=i + 1
+            ))
+        return render_detection_artifacts(source, items, summary_path, artifacts)
+
+    def segment_image_opencv(self, file=None, image_data=None, method='contour_mask', object_name = "", image=None,
+                             artifacts=ARTIFACTS_ALL, mask_format=MASK_FORMAT_NONE):
+        """
+        使用 OpenCV 进行图像分割（image 为已解码的 ImageInput 时直接使用）
+
+        artifacts 不为 all 时，轮廓掩码分割不立即生成分割图像（分割结果没有汇总图），返回按需渲染地址；
+        mask_format 为 rle / polygon 时，轮廓掩码和 GrabCut 分割的每个对象附带内联的掩码（mask 字段）
+        """
         try:
-            # 处理文件输入
-            if image_data:
-                image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(image_data_clean)
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                    tmp_file.write(image_bytes)
-                    filepath = tmp_file.name
-            else:
-                if not file or not hasattr(file, 'filename') or file.filename == '':
-                    return {'success': False, 'error': '未选择文件'}, 400
-                if not allowed_file(file.filename):
-                    return {'success': False, 'error': '无效的文件类型'}, 400
-
-                # 检查是否是已经存在的文件路径（用于测试）
-                if hasattr(file, 'filepath') and os.path.exists(file.filepath):
-                    filepath = file.filepath
-                else:
-                    # 标准的Flask文件上传对象
-                    filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
-
-            # 读取图像 - 使用多种方法确保能够读取
-            image = None
-
-            # 方法1: 直接使用cv2.imread
+            # 解析图像输入（只解码一次，不落盘）；分水岭等算法会就地修改图像，使用副本
             try:
-                image = cv2.imread(filepath)
-            except Exception as e:
-                print(f"cv2.imread 失败: {e}")
-
-            # 方法2: 如果直接读取失败，使用PIL转换
-            if image is None:
-                try:
-                    from PIL import Image as PILImage
-                    pil_image = PILImage.open(filepath)
-                    # 转换为RGB（如果是RGBA）
-                    if pil_image.mode == 'RGBA':
-                        pil_image = pil_image.convert('RGB')
-                    # 转换为numpy数组
-                    image_array = np.array(pil_image)
-                    # PIL使用RGB，OpenCV使用BGR，需要转换
-                    image = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
-                    print("使用PIL成功读取图像")
-                except Exception as e:
-                    print(f"PIL读取失败: {e}")
-
-            # 方法3: 如果还是失败，尝试使用numpy直接读取
-            if image is None:
-                try:
-                    # 读取文件字节
-                    with open(filepath, 'rb') as f:
-                        file_bytes = f.read()
-
-                    # 使用numpy和cv2解码
-                    nparr = np.frombuffer(file_bytes, np.uint8)
-                    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    print("使用numpy成功读取图像")
-                except Exception as e:
-                    print(f"numpy读取失败: {e}")
-
-            if image is None:
-                error_msg = f'无法读取图像文件: {filepath}。请检查文件格式是否正确。'
+                source = load_image_input(file, image_data, image)
+                image = source.bgr.copy()
+            except ImageInputError as e:
+                error_msg = str(e)
                 print(error_msg)
                 return {'success': False, 'error': error_msg}, 400
 
@@ -1474,7 +995,7 @@ class OpenCVService:
 
             # 进行内容验证，确保图像中包含指定对象
             print(f"OpenCV分割：开始验证图像内容是否包含 '{object_name.strip()}'")
-            validation_result = self._validate_image_content(filepath, object_name.strip())
+            validation_result = self._validate_image_content(source, object_name.strip())
             if not validation_result['is_match']:
                 print(f"OpenCV分割：内容验证失败，未检测到 '{object_name.strip()}'")
                 return {
@@ -1497,39 +1018,44 @@ class OpenCVService:
 
             if method == 'contour_mask':
                 # 使用轮廓掩码分割（推荐）
-                segments = self._contour_mask_segmentation(image, filepath, object_name)
+                segments = self._contour_mask_segmentation(image, source, object_name, artifacts, mask_format)
                 segmented_objects.extend(segments)
 
             elif method == 'grabcut':
                 # 使用 GrabCut 算法
-                segments = self._grabcut_segmentation(image, filepath)
+                segments = self._grabcut_segmentation(image, source, mask_format)
                 segmented_objects.extend(segments)
 
             elif method == 'watershed':
                 # 使用 Watershed 算法
-                segments = self._watershed_segmentation(image, filepath)
+                segments = self._watershed_segmentation(image, source)
                 segmented_objects.extend(segments)
 
             elif method == 'kmeans':
                 # 使用 K-means 聚类
-                segments = self._kmeans_segmentation(image, filepath)
+                segments = self._kmeans_segmentation(image, source)
                 segmented_objects.extend(segments)
 
             # 收集分割图像路径
             for i, segment in enumerate(segmented_objects):
-                if 'segment_image' in segment and os.path.exists(segment['segment_image']):
+                if segment.get('segment_image') and os.path.exists(segment['segment_image']):
                     segment_images.append(segment['segment_image'])
                     print(f"分割图像已保存: {segment['segment_image']}")
+                elif segment.get('segment_image_url'):
+                    print(f"分割图像将按需渲染: {segment['segment_image_url']}")
                 else:
                     print(f"分割图像不存在: {segment.get('segment_image', 'N/A')}")
 
             if segmented_objects:
                 return {
                     'success': True,
-                    'original_image': filepath,
+                    'original_image': source.reference_path(),
                     'segmented_objects': segmented_objects,
                     'segment_images': segment_images,
-                    'method': f'OpenCV {method}'
+                    'method': f'OpenCV {method}',
+                    # 目前只有轮廓掩码分割支持按需渲染，其他方法总是立即生成分割图像
+                    'artifacts': artifacts if method == 'contour_mask' else ARTIFACTS_ALL,
+                    'mask_format': mask_format if method in ('contour_mask', 'grabcut') else MASK_FORMAT_NONE
                 }, 200
             else:
                 return {
@@ -1543,7 +1069,9 @@ class OpenCVService:
             print(f"OpenCV 分割错误: {e}")
             return {'success': False, 'error': error_msg}, 500
 
-    def _contour_mask_segmentation(self, image, filepath, object_name='主要对象'):
+    @timed('opencv', 'contour_mask')
+    def _contour_mask_segmentation(self, image, source, object_name='主要对象', artifacts=ARTIFACTS_ALL,
+                                   mask_format=MASK_FORMAT_NONE):
         """基于轮廓的掩码分割 - 精确分割对象轮廓"""
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         height, width = image.shape[:2]
@@ -1618,73 +1146,47 @@ class OpenCVService:
         valid_contours.sort(key=lambda x: (x['quality'] * 0.6 + (x['area'] / (width * height)) * 0.4), reverse=True)
 
         segmented_objects = []
+        deferred_cutouts = []
 
         for i, contour_info in enumerate(valid_contours[:3]):  # 最多取3个最好的轮廓
             contour = contour_info['contour']
 
-            # 创建精确的轮廓掩码
-            mask = np.zeros(gray.shape, np.uint8)
-            cv2.fillPoly(mask, [contour], 255)
-
             # 轮廓平滑处理
             epsilon = 0.02 * cv2.arcLength(contour, True)
             smoothed_contour = cv2.approxPolyDP(contour, epsilon, True)
 
-            # 创建平滑后的掩码
-            smooth_mask = np.zeros(gray.shape, np.uint8)
-            cv2.fillPoly(smooth_mask, [smoothed_contour], 255)
-
-            # 应用掩码到原图像
-            result = image.copy()
-
-            # 创建渐变边缘效果
-            # 对掩码进行轻微的高斯模糊，创建柔和边缘
-            blurred_mask = cv2.GaussianBlur(smooth_mask, (3, 3), 0)
-            blurred_mask_3ch = cv2.cvtColor(blurred_mask, cv2.COLOR_GRAY2BGR) / 255.0
-
-            # 应用掩码
-            result = result * blurred_mask_3ch
-
-            # 将背景设为白色
-            background = np.ones_like(result) * 255
-            result = result + background * (1 - blurred_mask_3ch)
-            result = result.astype(np.uint8)
-
-            # 获取精确的边界框
+            # 智能裁剪：按平滑后轮廓的实际边界添加适当的边距，保持对象完整性
             x, y, w, h = cv2.boundingRect(smoothed_contour)
-
-            # 智能裁剪：保持对象完整性
-            # 计算对象的实际边界
-            mask_coords = np.where(smooth_mask > 0)
-            if len(mask_coords[0]) > 0:
-                y_min, y_max = np.min(mask_coords[0]), np.max(mask_coords[0])
-                x_min, x_max = np.min(mask_coords[1]), np.max(mask_coords[1])
-
-                # 添加适当的边距
-                padding_x = max(10, int((x_max - x_min) * 0.05))
-                padding_y = max(10, int((y_max - y_min) * 0.05))
-
-                x1 = max(0, x_min - padding_x)
-                y1 = max(0, y_min - padding_y)
-                x2 = min(width, x_max + padding_x)
-                y2 = min(height, y_max + padding_y)
+            x_min, y_min = max(0, x), max(0, y)
+            x_max, y_max = min(width - 1, x + w - 1), min(height - 1, y + h - 1)
+            padding_x = max(10, int((x_max - x_min) * 0.05))
+            padding_y = max(10, int((y_max - y_min) * 0.05))
+
+            x1 = max(0, x_min - padding_x)
+            y1 = max(0, y_min - padding_y)
+            x2 = min(width, x_max + padding_x)
+            y2 = min(height, y_max + padding_y)
+
+            if artifacts != ARTIFACTS_ALL:
+                # 只保存轮廓和裁剪区域，分割图像在首次请求时渲染
+                seg_filepath = None
+                deferred_cutouts.append({
+                    'contour': smoothed_contour.reshape(-1, 2).tolist(),
+                    'crop_box': [int(x1), int(y1), int(x2), int(y2)]
+                })
             else:
-                # 回退到边界框
-                padding = 10
-                x1 = max(0, x - padding)
-                y1 = max(0, y - padding)
-                x2 = min(width, x + w + padding)
-                y2 = min(height, y + h + padding)
-
-            cropped_result = result[y1:y2, x1:x2]
-
-            # 保存分割结果
-            import time
-            timestamp = int(time.time() * 1000)  # 使用毫秒级时间戳避免重复
-            safe_object_name = object_name.replace('/', '_').replace('\\', '_').replace(' ', '_')
-            seg_filename = f"opencv_contour_{safe_object_name}_{i}_{timestamp}.png"
-            seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
-            cv2.imwrite(seg_filepath, cropped_result)
+                # 只在裁剪区域内应用柔和边缘的掩码，背景设为白色
+                cropped_result = contour_cutout(image, smoothed_contour, (x1, y1, x2, y2))
+
+                # 保存分割结果
+                import time
+                timestamp = int(time.time() * 1000)  # 使用毫秒级时间戳避免重复
+                safe_object_name = object_name.replace('/', '_').replace('\\', '_').replace(' ', '_')
+                seg_filename = f"opencv_contour_{safe_object_name}_{i}_{timestamp}.png"
+                seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
+                with time_stage('disk_write', 'opencv'):
+                    cv2.imwrite(seg_filepath, cropped_result)
+                storage_manager.track(seg_filepath)
 
             # 计算置信度
             confidence = min(0.95, max(0.4, contour_info['quality']))
@@ -1695,7 +1197,7 @@ class OpenCVService:
             ymax = y2 / height
             xmax = x2 / width
 
-            segmented_objects.append({
+            segment = {
                 'label': f'{object_name}_精确轮廓_{i+1}',
                 'description': f'基于精确轮廓分割的{object_name}对象（质量评分: {contour_info["quality"]:.2f}）',
                 'confidence': confidence,
@@ -1708,11 +1210,21 @@ class OpenCVService:
                     'aspect_ratio': contour_info['aspect_ratio'],
                     'area_ratio': contour_info['area'] / (width * height)
                 }
-            })
+            }
+            if mask_format != MASK_FORMAT_NONE:
+                segment['mask'] = encode_contour(smoothed_contour, mask_format, (height, width))
+            segmented_objects.append(segment)
+
+        if deferred_cutouts:
+            result_id, urls = defer_contour_cutouts(source, deferred_cutouts)
+            for segment, url in zip(segmented_objects, urls):
+                segment['result_id'] = result_id
+                segment['segment_image_url'] = url
 
         return segmented_objects
 
-    def _grabcut_segmentation(self, image, filepath):
+    @timed('opencv', 'grabcut')
+    def _grabcut_segmentation(self, image, source, mask_format=MASK_FORMAT_NONE):
         """GrabCut 分割算法"""
         height, width = image.shape[:2]
 
@@ -1736,18 +1248,24 @@ class OpenCVService:
         timestamp = int(time.time() * 1000)
         seg_filename = f"opencv_grabcut_{timestamp}.png"
         seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
-        cv2.imwrite(seg_filepath, result)
+        with time_stage('disk_write', 'opencv'):
+            cv2.imwrite(seg_filepath, result)
+        storage_manager.track(seg_filepath)
 
-        return [{
+        segment = {
             'label': 'GrabCut 前景',
             'description': '使用 GrabCut 算法分割的前景对象',
             'confidence': 0.8,
             'bbox': [0.25, 0.25, 0.75, 0.75],  # 近似边界框
             'segment_image': seg_filepath,
             'method': 'GrabCut'
-        }]
+        }
+        if mask_format != MASK_FORMAT_NONE:
+            segment['mask'] = encode_mask(mask2, mask_format)
+        return [segment]
 
-    def _watershed_segmentation(self, image, filepath):
+    @timed('opencv', 'watershed')
+    def _watershed_segmentation(self, image, source):
         """Watershed 分割算法"""
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
@@ -1783,7 +1301,9 @@ class OpenCVService:
         timestamp = int(time.time() * 1000)
         seg_filename = f"opencv_watershed_{timestamp}.png"
         seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
-        cv2.imwrite(seg_filepath, image)
+        with time_stage('disk_write', 'opencv'):
+            cv2.imwrite(seg_filepath, image)
+        storage_manager.track(seg_filepath)
 
         return [{
             'label': 'Watershed 分割',
@@ -1794,7 +1314,8 @@ class OpenCVService:
             'method': 'Watershed'
         }]
 
-    def _kmeans_segmentation(self, image, filepath):
+    @timed('opencv', 'kmeans')
+    def _kmeans_segmentation(self, image, source):
         """K-means 聚类分割"""
         # 重塑图像数据
         data = image.reshape((-1, 3))
@@ -1815,7 +1336,9 @@ class OpenCVService:
         timestamp = int(time.time() * 1000)
         seg_filename = f"opencv_kmeans_{timestamp}.png"
         seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
-        cv2.imwrite(seg_filepath, segmented_image)
+        with time_stage('disk_write', 'opencv'):
+            cv2.imwrite(seg_filepath, segmented_image)
+        storage_manager.track(seg_filepath)
 
         return [{
             'label': 'K-means 聚类',
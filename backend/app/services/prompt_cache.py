@@ -0,0 +1,199 @@
+"""
+提示词改写缓存
+图像/视频生成前的提示词优化和中译英翻译都要先调用一次Gemini，
+按 (调用类型, 模型, 风格, 归一化提示词) 缓存改写结果，常用的预设风格和模板提示词只需改写一次。
+
+复用结果缓存的分层实现（进程内LRU + 本地SQLite），使用独立的数据库和更长的TTL；
+可配置模板提示词列表在启动时后台预先改写
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from flask import current_app
+from .result_cache import MemoryCacheBackend, SQLiteCacheBackend, ResultCache, normalize_query
+from .gemini_scheduler import prioritized, PRIORITY_BATCH
+from ..utils.metrics import time_stage
+
+
+# 调用类型，提示词模板变更时应同时修改版本
+KIND_IMAGE_PROMPT = 'image.optimize.v1'
+KIND_VIDEO_PROMPT = 'video.optimize.v1'
+KIND_TRANSLATE = 'translate.zh-en.v1'
+
+
+def make_prompt_key(kind, model, prompt, style=''):
+    """构建提示词改写的缓存键"""
+    raw = '\x1f'.join(['prompt', kind, model, normalize_query(style), normalize_query(prompt)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class PromptRewriteCache:
+    """带缓存的提示词改写"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.precompute = {'status': 'disabled', 'total': 0, 'completed': 0, 'failed': 0}
+
+    def rewrite(self, client, kind, model, prompt, contents, style=''):
+        """
+        带缓存的改写调用
+
+        Args:
+            client: Gemini客户端
+            kind (str): 调用类型
+            model (str): 模型名称
+            prompt (str): 用户提示词（决定缓存键）
+            contents: 传给 generate_content 的内容
+            style (str): 风格等影响改写结果的附加参数
+
+        Returns:
+            tuple: (去除首尾空白的响应文本, 是否命中缓存)
+        """
+        key = make_prompt_key(kind, model, prompt, style)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+
+        with time_stage('gemini', kind):
+            response = client.models.generate_content(model=model, contents=contents)
+        text = (response.text or '').strip()
+        if text:
+            self.cache.set(key, text)
+        return text, False
+
+    async def arewrite(self, client, kind, model, prompt, contents, style=''):
+        """rewrite 的协程版本，使用异步客户端（client.aio）"""
+        key = make_prompt_key(kind, model, prompt, style)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached, True
+
+        with time_stage('gemini', kind):
+            response = await client.aio.models.generate_content(model=model, contents=contents)
+        text = (response.text or '').strip()
+        if text:
+            await asyncio.to_thread(self.cache.set, key, text)
+        return text, False
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        stats = self.cache.stats()
+        with self._lock:
+            stats['precompute'] = dict(self.precompute)
+        return stats
+
+    def _update_precompute(self, **changes):
+        with self._lock:
+            self.precompute.update(changes)
+
+    def _count_precompute(self, name):
+        with self._lock:
+            self.precompute[name] += 1
+
+
+# 进程级单例，首次使用时按应用配置创建
+_prompt_cache = None
+_prompt_cache_lock = threading.Lock()
+
+
+def get_prompt_cache():
+    """获取进程级共享的提示词改写缓存"""
+    global _prompt_cache
+    with _prompt_cache_lock:
+        if _prompt_cache is None:
+            config = current_app.config
+            backends = [MemoryCacheBackend(config.get('PROMPT_CACHE_MAX_ENTRIES', 1024))]
+            if config.get('PROMPT_CACHE_DISK_ENABLED', True):
+                try:
+                    backends.append(SQLiteCacheBackend(
+                        config['PROMPT_CACHE_DISK_PATH'],
+                        config.get('PROMPT_CACHE_DISK_MAX_BYTES', 0)
+                    ))
+                except Exception as e:
+                    print(f"提示词磁盘缓存初始化失败，仅使用内存缓存: {str(e)}")
+            _prompt_cache = PromptRewriteCache(ResultCache(
+                backends,
+                ttl=config.get('PROMPT_CACHE_TTL', 30 * 86400),
+                enabled=config.get('PROMPT_CACHE_ENABLED', True)
+            ))
+        return _prompt_cache
+
+
+def load_prompt_templates(path):
+    """
+    读取预先改写的模板提示词列表
+
+    文件为JSON数组，每项包含 type（image / video / translate）、prompt，
+    image 类型可用 styles 指定需要预先改写的风格列表（默认 realistic）
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        templates = json.load(f)
+    if not isinstance(templates, list):
+        raise ValueError('模板提示词文件应为JSON数组')
+    return [t for t in templates if isinstance(t, dict) and t.get('prompt') and t.get('type')]
+
+
+def precompute_prompts(app):
+    """在应用上下文中预先改写配置的模板提示词（未命中缓存时才会调用Gemini）"""
+    with app.app_context():
+        from .image_generation_service import ImageGenerationService
+        from .video_generation_service import VideoGenerationService
+        from ..utils.helpers import init_gemini_client, translation_contents
+
+        cache = get_prompt_cache()
+        try:
+            templates = load_prompt_templates(app.config['PROMPT_CACHE_PRECOMPUTE_FILE'])
+        except Exception as e:
+            print(f"读取模板提示词失败: {str(e)}")
+            cache._update_precompute(status='failed')
+            return
+
+        # 预先改写在后台执行，优先级低于用户请求
+        client = prioritized(init_gemini_client(), PRIORITY_BATCH)
+        # 直接调用缓存的改写（与各服务使用相同的缓存键和请求内容），
+        # 服务中的 optimize_prompt 等失败时回退为原文而不抛出异常，无法统计失败
+        tasks = []
+        for template in templates:
+            prompt = template['prompt']
+            if template['type'] == 'image':
+                for style in template.get('styles') or [template.get('style', 'realistic')]:
+                    tasks.append((KIND_IMAGE_PROMPT, 'gemini-2.0-flash', prompt, style,
+                                  ImageGenerationService.optimization_prompt(prompt, style)))
+            elif template['type'] == 'video':
+                tasks.append((KIND_VIDEO_PROMPT, 'gemini-2.0-flash', prompt, '',
+                              VideoGenerationService.optimization_prompt(prompt)))
+            elif template['type'] == 'translate':
+                tasks.append((KIND_TRANSLATE, app.config['DEFAULT_VISION_MODEL'], prompt, '',
+                              translation_contents(prompt)))
+
+        cache._update_precompute(status='running', total=len(tasks), completed=0, failed=0)
+        started = time.time()
+        failed = 0
+        for kind, model, prompt, style, contents in tasks:
+            try:
+                text, _ = cache.rewrite(client, kind, model, prompt, contents, style)
+                if not text:
+                    raise ValueError('改写结果为空')
+                cache._count_precompute('completed')
+            except Exception as e:
+                print(f"模板提示词预先改写失败 ({kind}): {str(e)}")
+                cache._count_precompute('failed')
+                failed += 1
+
+        status = 'completed' if not failed else ('failed' if failed == len(tasks) else 'partial')
+        cache._update_precompute(status=status, duration_ms=round((time.time() - started) * 1000, 2))
+        print(f"✅ 模板提示词预先改写结束（{len(tasks)} 项，失败 {failed} 项）", flush=True)
+
+
+def start_prompt_precompute(app):
+    """配置了模板提示词文件时，在后台线程中预先改写"""
+    if not app.config.get('PROMPT_CACHE_ENABLED', True) or not app.config.get('PROMPT_CACHE_PRECOMPUTE_FILE'):
+        return None
+    thread = threading.Thread(target=precompute_prompts, args=(app,), name='prompt-precompute', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,310 @@
+"""
+Gemini 结果缓存
+按 (图像内容哈希, 模型, 调用类型, 归一化查询) 缓存视觉调用的响应文本，
+同一张图片重复查询或对比接口重复调用时直接复用，节省延迟和API配额。
+
+缓存分层：进程内LRU（内存）+ 本地SQLite（磁盘，多进程共享），均支持TTL和容量上限
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from ..utils.metrics import time_stage
+
+
+def normalize_query(text):
+    """归一化查询文本：去除首尾空白、合并连续空白、统一小写"""
+    return re.sub(r'\s+', ' ', (text or '').strip()).lower()
+
+
+def image_digest(image_bytes):
+    """图像内容哈希"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def make_cache_key(image_hash, model, kind, query):
+    """
+    构建缓存键
+
+    Args:
+        image_hash (str): 图像内容的sha256
+        model (str): 模型名称
+        kind (str): 调用类型（如 detection.validate），提示词模板变更时应同时修改类型版本
+        query (str): 用户查询（对象名称或问题），会被归一化
+    """
+    raw = '\x1f'.join([image_hash, model, kind, normalize_query(query)])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryCacheBackend:
+    """进程内LRU缓存"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while self.max_entries and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.name,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self.evictions
+            }
+
+
+class SQLiteCacheBackend:
+    """本地SQLite缓存，按最近访问时间淘汰，总大小受字节上限约束"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path, max_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_access ON cache (last_access)')
+            self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at and expires_at < now:
+                self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute('UPDATE cache SET last_access = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key, value, expires_at):
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)',
+                (key, value, size, expires_at, time.time())
+            )
+            self._evict_if_needed()
+            self._conn.commit()
+
+    def _evict_if_needed(self):
+        """先清理过期条目，再按LRU淘汰到字节上限以内（调用方需持有锁）"""
+        self._conn.execute('DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?', (time.time(),))
+        if not self.max_bytes:
+            return
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute('SELECT key, size FROM cache ORDER BY last_access').fetchall()
+        victims = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM cache WHERE key = ?', victims)
+        self.evictions += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM cache')
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        return {
+            'backend': self.name,
+            'path': self.db_path,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions
+        }
+
+
+class ResultCache:
+    """分层结果缓存：按顺序查询各层，命中下层时回填上层"""
+
+    def __init__(self, backends, ttl=86400, enabled=True):
+        self.backends = backends
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'errors': 0}
+        self._tier_hits = {backend.name: 0 for backend in backends}
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        for index, backend in enumerate(self.backends):
+            try:
+                value = backend.get(key)
+            except Exception as e:
+                print(f"结果缓存读取失败 ({backend.name}): {str(e)}")
+                self._count('errors')
+                continue
+            if value is not None:
+                expires_at = time.time() + self.ttl if self.ttl else None
+                for upper in self.backends[:index]:
+                    upper.set(key, value, expires_at)
+                with self._lock:
+                    self._stats['hits'] += 1
+                    self._tier_hits[backend.name] += 1
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        if not self.enabled or value is None:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else None
+        for backend in self.backends:
+            try:
+                backend.set(key, value, expires_at)
+            except Exception as e:
+                print(f"结果缓存写入失败 ({backend.name}): {str(e)}")
+                self._count('errors')
+        self._count('sets')
+
+    def generate_text(self, client, model, kind, query, image_bytes, contents, image_hash=None):
+        """
+        带缓存的 generate_content 调用，返回响应文本
+
+        Args:
+            client: Gemini客户端
+            model (str): 模型名称
+            kind (str): 调用类型
+            query (str): 决定提示词内容的用户查询（对象名称或问题）
+            image_bytes (bytes): 图像内容，用于计算缓存键
+            contents (list): 传给 generate_content 的内容
+            image_hash (str): 已计算好的图像哈希（可选，省去重复计算）
+
+        Returns:
+            tuple: (响应文本, 是否命中缓存)
+        """
+        key = make_cache_key(image_hash or image_digest(image_bytes), model, kind, query)
+        cached = self.get(key)
+        if cached is not None:
+            return cached, True
+
+        with time_stage('gemini', kind):
+            response = client.models.generate_content(model=model, contents=contents)
+        text = response.text
+        if text:
+            self.set(key, text)
+        return text, False
+
+    async def agenerate_text(self, client, model, kind, query, image_bytes, contents, image_hash=None):
+        """generate_text 的协程版本，使用异步客户端（client.aio）"""
+        key = make_cache_key(image_hash or image_digest(image_bytes), model, kind, query)
+        # 磁盘层的读写会提交SQLite事务，放到线程中执行，避免阻塞事件循环
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            return cached, True
+
+        with time_stage('gemini', kind):
+            response = await client.aio.models.generate_content(model=model, contents=contents)
+        text = response.text
+        if text:
+            await asyncio.to_thread(self.set, key, text)
+        return text, False
+
+    def clear(self):
+        for backend in self.backends:
+            backend.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tier_hits'] = dict(self._tier_hits)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['enabled'] = self.enabled
+        stats['ttl'] = self.ttl
+        stats['backends'] = [backend.stats() for backend in self.backends]
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+# 进程级单例，首次使用时按应用配置创建
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """获取进程级共享的Gemini结果缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = current_app.config
+            backends = [MemoryCacheBackend(config.get('GEMINI_CACHE_MAX_ENTRIES', 512))]
+            if config.get('GEMINI_CACHE_DISK_ENABLED', True):
+                try:
+                    backends.append(SQLiteCacheBackend(
+                        config['GEMINI_CACHE_DISK_PATH'],
+                        config.get('GEMINI_CACHE_DISK_MAX_BYTES', 0)
+                    ))
+                except Exception as e:
+                    print(f"磁盘结果缓存初始化失败，仅使用内存缓存: {str(e)}")
+            _cache = ResultCache(
+                backends,
+                ttl=config.get('GEMINI_CACHE_TTL', 86400),
+                enabled=config.get('GEMINI_CACHE_ENABLED', True)
+            )
+        return _cache
@@ -0,0 +1,376 @@
+"""
+存储生命周期管理
+记录服务写入上传目录、生成目录和结果图像目录的每个文件（大小、最近访问时间），
+按目录执行字节数/文件数配额和TTL，超出时按最近访问时间（LRU）淘汰。
+
+请求线程只把新文件和访问记录放入内存缓冲区，由进程内唯一的后台线程批量写入索引并分批清理，
+清理过程中不会长时间持有锁，不阻塞请求
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class StorageArea:
+    """一个受管理的存储目录及其配额（0表示不限制）"""
+
+    def __init__(self, name, folder, max_bytes=0, max_files=0, ttl=0):
+        self.name = name
+        self.folder = os.path.abspath(folder)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.ttl = ttl
+
+    def contains(self, path):
+        return path == self.folder or path.startswith(self.folder + os.sep)
+
+
+class StorageIndex:
+    """线程安全的SQLite文件索引"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS storage_files (
+                    path TEXT PRIMARY KEY,
+                    area TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_storage_access ON storage_files (area, last_access)')
+            self._conn.commit()
+
+    def upsert(self, rows):
+        """写入或更新文件记录，rows 为 (路径, 区域, 大小, 创建时间, 最近访问时间)"""
+        with self._lock:
+            self._conn.executemany('''
+                INSERT INTO storage_files (path, area, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET size = excluded.size, last_access = excluded.last_access
+            ''', rows)
+            self._conn.commit()
+
+    def insert_missing(self, rows):
+        """只登记索引中还没有的文件（目录扫描时使用，不覆盖已有的访问时间）"""
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO storage_files (path, area, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.commit()
+
+    def touch(self, items):
+        """更新最近访问时间，items 为 (访问时间, 路径)"""
+        with self._lock:
+            self._conn.executemany(
+                'UPDATE storage_files SET last_access = MAX(last_access, ?) WHERE path = ?', items)
+            self._conn.commit()
+
+    def remove(self, paths):
+        with self._lock:
+            self._conn.executemany('DELETE FROM storage_files WHERE path = ?', [(path,) for path in paths])
+            self._conn.commit()
+
+    def paths(self, area):
+        with self._lock:
+            rows = self._conn.execute('SELECT path FROM storage_files WHERE area = ?', (area,)).fetchall()
+        return {row[0] for row in rows}
+
+    def usage(self, area):
+        """返回 (文件数, 总字节数)"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM storage_files WHERE area = ?', (area,)).fetchone()
+
+    def least_recent(self, area, before, limit):
+        """最近访问时间早于 before 的文件，按最久未访问排序，返回 [(路径, 大小)]"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT path, size FROM storage_files WHERE area = ? AND last_access < ? ORDER BY last_access LIMIT ?',
+                (area, before, limit)
+            ).fetchall()
+
+
+class StorageManager:
+    """存储配额、TTL和后台分批清理"""
+
+    def __init__(self):
+        self.app = None
+        self.index = None
+        self.areas = []
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._pending_tracks = {}
+        self._pending_touches = {}
+        self._listeners = []
+        self._thread = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._last_scan = 0.0
+        self._stats = {'gc_runs': 0, 'last_gc_at': None, 'last_gc_ms': 0.0, 'last_scan_at': None, 'errors': 0}
+        self._area_stats = {}
+
+    def init_app(self, app):
+        """按应用配置创建存储区域和文件索引，启用时启动后台清理线程"""
+        config = app.config
+        self.app = app
+        self.enabled = config.get('STORAGE_GC_ENABLED', True)
+        # 结果图像目录位于生成目录内，更具体的目录优先匹配
+        self.areas = sorted([
+            StorageArea('uploads', config['UPLOAD_FOLDER'], config.get('STORAGE_UPLOADS_MAX_BYTES', 0),
+                        config.get('STORAGE_UPLOADS_MAX_FILES', 0), config.get('STORAGE_UPLOADS_TTL', 0)),
+            StorageArea('generated', config['GENERATED_FOLDER'], config.get('STORAGE_GENERATED_MAX_BYTES', 0),
+                        config.get('STORAGE_GENERATED_MAX_FILES', 0), config.get('STORAGE_GENERATED_TTL', 0)),
+            StorageArea('artifacts', config['ARTIFACT_FOLDER'], config.get('STORAGE_ARTIFACTS_MAX_BYTES', 0),
+                        config.get('STORAGE_ARTIFACTS_MAX_FILES', 0), config.get('STORAGE_ARTIFACTS_TTL', 0)),
+        ], key=lambda area: len(area.folder), reverse=True)
+        self._area_stats = {area.name: {'evicted_files': 0, 'evicted_bytes': 0, 'delete_errors': 0}
+                            for area in self.areas}
+        try:
+            self.index = StorageIndex(config['STORAGE_INDEX_PATH'])
+        except Exception as e:
+            print(f"存储索引初始化失败，不执行存储清理: {str(e)}")
+            self.enabled = False
+            return
+        if self.enabled:
+            self.start()
+
+    def start(self):
+        """启动后台清理线程（每个进程只有一个）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='storage-gc', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def add_eviction_listener(self, listener):
+        """注册文件被清理后的回调 listener(区域名称, 路径列表)"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def track(self, path):
+        """记录服务新写入的文件（不在受管理目录中的路径会被忽略），返回原路径便于直接在 return 中使用"""
+        if self.enabled and path:
+            with self._lock:
+                self._pending_tracks[os.path.abspath(path)] = time.time()
+        return path
+
+    def touch(self, path):
+        """记录文件被访问（下载、复用），推迟其LRU淘汰"""
+        if self.enabled and path:
+            with self._lock:
+                self._pending_touches[os.path.abspath(path)] = time.time()
+
+    def request_gc(self):
+        """立即唤醒后台线程执行一次清理"""
+        self._wake.set()
+
+    def area_for(self, path):
+        for area in self.areas:
+            if area.contains(path):
+                return area
+        return None
+
+    def _run(self):
+        config = self.app.config
+        interval = config.get('STORAGE_GC_INTERVAL', 60)
+        rescan_interval = config.get('STORAGE_RESCAN_INTERVAL', 3600)
+        while not self._stopped.is_set():
+            try:
+                if time.time() - self._last_scan >= rescan_interval:
+                    self.scan()
+                self.collect()
+            except Exception as e:
+                print(f"存储清理出错: {str(e)}")
+                self._count('errors')
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def flush(self):
+        """把缓冲的新文件和访问记录写入索引"""
+        with self._lock:
+            tracks, self._pending_tracks = self._pending_tracks, {}
+            touches, self._pending_touches = self._pending_touches, {}
+
+        rows = []
+        for path, created_at in tracks.items():
+            area = self.area_for(path)
+            if area is None:
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            rows.append((path, area.name, size, created_at, max(created_at, touches.pop(path, created_at))))
+        if rows:
+            self.index.upsert(rows)
+        if touches:
+            self.index.touch([(accessed_at, path) for path, accessed_at in touches.items()])
+
+    def scan(self):
+        """
+        扫描受管理目录：登记不是通过 track 写入的文件（如升级前已有的文件），
+        移除磁盘上已不存在的文件记录
+        """
+        batch_size = self.app.config.get('STORAGE_GC_BATCH', 200)
+        for area in self.areas:
+            known = self.index.paths(area.name)
+            seen = set()
+            rows = []
+            for path, size, mtime in self._walk(area):
+                seen.add(path)
+                if path not in known:
+                    rows.append((path, area.name, size, mtime, mtime))
+                if len(rows) >= batch_size:
+                    self.index.insert_missing(rows)
+                    rows = []
+            if rows:
+                self.index.insert_missing(rows)
+            # 刚写入还未登记到磁盘的文件不在 known 中，不会被误删记录
+            missing = list(known - seen)
+            for start in range(0, len(missing), batch_size):
+                self.index.remove(missing[start:start + batch_size])
+        self._last_scan = time.time()
+        with self._lock:
+            self._stats['last_scan_at'] = self._last_scan
+
+    def _walk(self, area):
+        """遍历区域目录中的文件（跳过嵌套的其他区域和渲染中的临时文件）"""
+        stack = [area.folder]
+        while stack:
+            folder = stack.pop()
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.area_for(entry.path) is area:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and '.tmp' not in entry.name:
+                        stat = entry.stat()
+                        yield entry.path, stat.st_size, stat.st_mtime
+                except OSError:
+                    continue
+
+    def collect(self):
+        """执行一次清理：先淘汰超过TTL的文件，再按LRU淘汰到配额以内，每批之间释放锁让出CPU"""
+        started_at = time.perf_counter()
+        self.flush()
+        config = self.app.config
+        batch_size = config.get('STORAGE_GC_BATCH', 200)
+        # 最近访问过的文件不会因配额被淘汰，避免刚返回给客户端的文件在下载前被删除
+        protected_since = time.time() - config.get('STORAGE_MIN_AGE', 300)
+
+        for area in self.areas:
+            if area.ttl:
+                while not self._stopped.is_set():
+                    victims = self.index.least_recent(area.name, time.time() - area.ttl, batch_size)
+                    if not victims or not self._evict(area, victims):
+                        break
+
+            while not self._stopped.is_set() and (area.max_bytes or area.max_files):
+                files, total = self.index.usage(area.name)
+                over_files = max(0, files - area.max_files) if area.max_files else 0
+                over_bytes = max(0, total - area.max_bytes) if area.max_bytes else 0
+                if not over_files and not over_bytes:
+                    break
+                candidates = self.index.least_recent(area.name, protected_since, batch_size)
+                victims = []
+                for path, size in candidates:
+                    if over_files <= 0 and over_bytes <= 0:
+                        break
+                    victims.append((path, size))
+                    over_files -= 1
+                    over_bytes -= size
+                if not victims or not self._evict(area, victims):
+                    break
+
+        with self._lock:
+            self._stats['gc_runs'] += 1
+            self._stats['last_gc_at'] = time.time()
+            self._stats['last_gc_ms'] = round((time.perf_counter() - started_at) * 1000, 2)
+
+    def _evict(self, area, victims):
+        """
+        删除一批文件及其索引记录，并通知监听者
+
+        删除失败（权限、只读挂载等）的文件保留索引记录，但把最近访问时间推迟到当前时间，
+        本轮清理不会反复选中它们，之后再按TTL或配额重试
+
+        Returns:
+            int: 移除的记录数
+        """
+        removed = []
+        failed = []
+        freed = 0
+        now = time.time()
+        for path, size in victims:
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"删除存储文件失败 {path}: {str(e)}")
+                failed.append((now, path))
+                continue
+            removed.append(path)
+        self.index.remove(removed)
+        if failed:
+            self.index.touch(failed)
+
+        with self._lock:
+            self._area_stats[area.name]['evicted_files'] += len(removed)
+            self._area_stats[area.name]['evicted_bytes'] += freed
+            self._area_stats[area.name]['delete_errors'] += len(failed)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(area.name, removed)
+            except Exception as e:
+                print(f"存储清理回调失败: {str(e)}")
+        time.sleep(0)
+        return len(removed)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            area_stats = {name: dict(values) for name, values in self._area_stats.items()}
+            stats['pending'] = len(self._pending_tracks) + len(self._pending_touches)
+        stats['enabled'] = self.enabled
+        stats['areas'] = {}
+        for area in self.areas:
+            files, total = self.index.usage(area.name) if self.index is not None else (0, 0)
+            stats['areas'][area.name] = dict(
+                area_stats.get(area.name, {}),
+                folder=area.folder,
+                files=files,
+                bytes=total,
+                max_files=area.max_files,
+                max_bytes=area.max_bytes,
+                ttl=area.ttl
+            )
+        return stats
+
+
+storage_manager = StorageManager()
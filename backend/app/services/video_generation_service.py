@@ -5,18 +5,23 @@
 import os
 import time
 import base64
-from google import genai
 from google.genai import types
 from ..utils.helpers import save_generated_image
+from .storage_manager import storage_manager
+from .gemini_clients import get_gemini_client
+from .prompt_cache import get_prompt_cache, KIND_VIDEO_PROMPT
+from .gemini_scheduler import GeminiQuotaError, quota_exhausted_result
 from flask import current_app
 
 
 class VideoGenerationService:
+    VEO_MODEL = "veo-2.0-generate-001"
+
     def __init__(self, client=None):
         """初始化视频生成服务"""
         if client is None:
-            # 如果没有提供client，创建一个新的
-            self.client = genai.Client(api_key=current_app.config['GEMINI_API_KEY'])
+            # 如果没有提供client，使用进程内共享的客户端
+            self.client = get_gemini_client()
         else:
             self.client = client
 
@@ -25,7 +30,36 @@ class VideoGenerationService:
         使用 Gemini 优化用户的视频生成提示词
         """
         try:
-            optimization_prompt = f"""
+            # 相同的提示词直接复用之前的改写结果
+            optimized_prompt, cached = get_prompt_cache().rewrite(
+                self.client, KIND_VIDEO_PROMPT, "gemini-2.0-flash", user_prompt, self.optimization_prompt(user_prompt))
+            return self._optimization_result(user_prompt, optimized_prompt, cached)
+
+        except Exception as e:
+            print(f"提示词优化失败: {str(e)}")
+            # 如果优化失败，返回原始提示词
+            return {
+                'original_prompt': user_prompt,
+                'optimized_prompt': user_prompt
+            }
+
+    async def aoptimize_prompt(self, user_prompt):
+        """optimize_prompt 的协程版本（ASGI模式）"""
+        try:
+            optimized_prompt, cached = await get_prompt_cache().arewrite(
+                self.client, KIND_VIDEO_PROMPT, "gemini-2.0-flash", user_prompt, self.optimization_prompt(user_prompt))
+            return self._optimization_result(user_prompt, optimized_prompt, cached)
+
+        except Exception as e:
+            print(f"提示词优化失败: {str(e)}")
+            return {
+                'original_prompt': user_prompt,
+                'optimized_prompt': user_prompt
+            }
+
+    @staticmethod
+    def optimization_prompt(user_prompt):
+        return f"""
 请优化以下视频生成提示词，使其更适合Veo 2.0视频生成模型。
 优化要求：
 1. 添加具体的视觉细节描述
@@ -41,58 +75,241 @@ class VideoGenerationService:
 请返回优化后的英文提示词：
 """
 
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=optimization_prompt
-            )
+    @staticmethod
+    def _optimization_result(user_prompt, optimized_prompt, cached):
+        if not optimized_prompt:
+            raise ValueError('优化结果为空')
 
-            optimized_prompt = response.text.strip()
+        # 如果返回的内容包含引号或其他格式，清理一下
+        if optimized_prompt.startswith('"') and optimized_prompt.endswith('"'):
+            optimized_prompt = optimized_prompt[1:-1]
 
-            # 如果返回的内容包含引号或其他格式，清理一下
-            if optimized_prompt.startswith('"') and optimized_prompt.endswith('"'):
-                optimized_prompt = optimized_prompt[1:-1]
+        return {
+            'original_prompt': user_prompt,
+            'optimized_prompt': optimized_prompt,
+            'cached': cached
+        }
+
+    def start_video_generation(self, prompt, duration=8, aspect_ratio="16:9"):
+        """
+        提交文本到视频的生成操作，不等待完成
+
+        Returns:
+            tuple: (operation, optimized_prompt)
+        """
+        # 首先优化提示词
+        prompt_optimization = self.optimize_prompt(prompt)
+        optimized_prompt = prompt_optimization['optimized_prompt']
+
+        print(f"正在调用Veo 2.0视频生成API...")
+        print(f"优化后的提示词: {optimized_prompt}")
+
+        # 根据最新官方文档使用正确的API调用方式
+        operation = self.client.models.generate_videos(
+            model=self.VEO_MODEL,
+            prompt=optimized_prompt,
+            config=self._video_config(duration, aspect_ratio),
+        )
+        print(f"视频生成操作已启动: {operation.name}")
+        return operation, optimized_prompt
+
+    async def astart_video_generation(self, prompt, duration=8, aspect_ratio="16:9"):
+        """start_video_generation 的协程版本（ASGI模式）"""
+        prompt_optimization = await self.aoptimize_prompt(prompt)
+        optimized_prompt = prompt_optimization['optimized_prompt']
+
+        print(f"正在调用Veo 2.0视频生成API...")
+        print(f"优化后的提示词: {optimized_prompt}")
+
+        operation = await self.client.aio.models.generate_videos(
+            model=self.VEO_MODEL,
+            prompt=optimized_prompt,
+            config=self._video_config(duration, aspect_ratio),
+        )
+        print(f"视频生成操作已启动: {operation.name}")
+        return operation, optimized_prompt
+
+    @staticmethod
+    def _video_config(duration, aspect_ratio):
+        return types.GenerateVideosConfig(
+            person_generation="dont_allow",  # 安全设置
+            aspect_ratio=aspect_ratio,  # "16:9" 或 "9:16"
+            duration_seconds=duration,  # 5-8秒
+            number_of_videos=1,
+            enhance_prompt=True,  # 启用提示词增强
+        )
+
+    def start_video_from_image(self, image_path, prompt="", duration=8, aspect_ratio="16:9"):
+        """
+        提交图像到视频的生成操作，不等待完成
+
+        Returns:
+            tuple: (operation, optimized_prompt)
+        """
+        # 优化提示词
+        if prompt:
+            prompt_optimization = self.optimize_prompt(prompt)
+            optimized_prompt = prompt_optimization['optimized_prompt']
+        else:
+            optimized_prompt = "Animate this image with natural motion and cinematic quality"
+
+        print(f"正在从图像生成视频...")
+        print(f"提示词: {optimized_prompt}")
+
+        # 读取图像
+        from PIL import Image
+        image = Image.open(image_path)
+
+        # 使用图像到视频API
+        operation = self.client.models.generate_videos(
+            model=self.VEO_MODEL,
+            prompt=optimized_prompt,
+            image=image,
+            config=self._video_config(duration, aspect_ratio),
+        )
+        print(f"视频生成操作已启动: {operation.name}")
+        return operation, optimized_prompt
+
+    def get_operation(self, operation):
+        """
+        刷新操作状态
+
+        Args:
+            operation: 操作对象或操作名称（进程重启后从任务存储中按名称重建）
+        """
+        if isinstance(operation, str):
+            operation = types.GenerateVideosOperation(name=operation)
+        return self.client.operations.get(operation)
+
+    def finalize_video(self, operation, params):
+        """
+        处理已完成的视频生成操作：下载视频并组装结果
+
+        Args:
+            operation: 已完成的操作
+            params (dict): 提交时的参数（kind、prompt、optimized_prompt、duration、style、aspect_ratio、source_image）
 
+        Returns:
+            tuple: (结果字典, 状态码)
+        """
+        from_image = params.get('kind') == 'image_to_video'
+        prompt = params.get('prompt', '')
+        optimized_prompt = params.get('optimized_prompt', prompt)
+        duration = params.get('duration', 8)
+        style = params.get('style', 'image-to-video' if from_image else 'realistic')
+        aspect_ratio = params.get('aspect_ratio', '16:9')
+
+        if not (hasattr(operation, 'response') and operation.response):
+            error = getattr(operation, 'error', None)
+            raise Exception(f"操作完成但无结果数据{f': {error}' if error else ''}")
+
+        generated_videos = operation.response.generated_videos
+        if not generated_videos:
+            raise Exception("未找到生成的视频")
+
+        # 获取第一个生成的视频
+        video = generated_videos[0].video
+
+        # 下载视频文件
+        timestamp = int(time.time())
+        prefix = 'veo2_image_to_video' if from_image else 'veo2_generated_video'
+        video_filename = f"{prefix}_{timestamp}.mp4"
+        video_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], video_filename)
+
+        try:
+            # 根据官方示例下载和保存视频
+            self.client.files.download(file=video)
+            video.save(video_filepath)
+            storage_manager.track(video_filepath)
+        except Exception as download_error:
+            print(f"视频保存失败: {str(download_error)}")
+            if from_image:
+                return {
+                    'success': False,
+                    'error': f'视频保存失败: {str(download_error)}'
+                }, 500
+            # 即使保存失败，也返回成功状态和视频信息
             return {
-                'original_prompt': user_prompt,
-                'optimized_prompt': optimized_prompt
-            }
+                'success': True,
+                'status': 'video_generated',
+                'message': '视频生成成功，但保存失败',
+                'video_info': str(video),
+                'original_prompt': prompt,
+                'optimized_prompt': optimized_prompt,
+                'duration': duration,
+                'style': style,
+                'aspect_ratio': aspect_ratio,
+                'model': 'Veo 2.0',
+                'note': f'视频已生成但保存失败: {str(download_error)}'
+            }, 200
 
-        except Exception as e:
-            print(f"提示词优化失败: {str(e)}")
-            # 如果优化失败，返回原始提示词
+        if from_image:
             return {
-                'original_prompt': user_prompt,
-                'optimized_prompt': user_prompt
-            }
+                'success': True,
+                'status': 'video_generated',
+                'message': '从图像生成视频成功！',
+                'video_path': video_filepath,
+                'source_image': params.get('source_image'),
+                'original_prompt': prompt,
+                'optimized_prompt': optimized_prompt,
+                'duration': duration,
+                'aspect_ratio': aspect_ratio,
+                'model': 'Veo 2.0 Image-to-Video',
+            }, 200
+
+        # 生成预览图
+        preview_image_path = self._generate_preview_image(prompt, style)
+
+        return {
+            'success': True,
+            'status': 'video_generated',
+            'message': '视频生成成功！',
+            'video_path': video_filepath,
+            'preview_image': preview_image_path,
+            'original_prompt': prompt,
+            'optimized_prompt': optimized_prompt,
+            'duration': duration,
+            'style': style,
+            'aspect_ratio': aspect_ratio,
+            'model': 'Veo 2.0',
+            'note': 'Veo 2.0 视频生成完成'
+        }, 200
+
+    def fallback_plan(self, params):
+        """视频生成不可用或超时时，生成详细的制作方案"""
+        style = params.get('style', 'image-to-video' if params.get('kind') == 'image_to_video' else 'realistic')
+        return self._generate_enhanced_video_plan(
+            params.get('optimized_prompt') or params.get('prompt', ''),
+            params.get('duration', 8),
+            style,
+            params.get('aspect_ratio', '16:9')
+        )
 
     def generate_video(self, prompt, duration=8, style="realistic", aspect_ratio="16:9"):
         """
-        生成视频 - 使用 Veo 2.0 视频生成模型
+        生成视频 - 使用 Veo 2.0 视频生成模型（阻塞等待完成）
+
+        API路由通过任务接口异步提交（见 video_jobs），此方法保留给需要同步结果的调用方
         """
-        try:
-            # 首先优化提示词
-            prompt_optimization = self.optimize_prompt(prompt)
-            optimized_prompt = prompt_optimization['optimized_prompt']
+        params = {'kind': 'text_to_video', 'prompt': prompt, 'duration': duration,
+                  'style': style, 'aspect_ratio': aspect_ratio}
+        return self._generate_blocking(
+            lambda: self.start_video_generation(prompt, duration, aspect_ratio), params, '视频生成失败')
 
-            print(f"正在调用Veo 2.0视频生成API...")
-            print(f"优化后的提示词: {optimized_prompt}")
+    def generate_video_from_image(self, image_path, prompt="", duration=8, aspect_ratio="16:9"):
+        """
+        从图像生成视频 - 图像到视频功能（阻塞等待完成）
+        """
+        params = {'kind': 'image_to_video', 'prompt': prompt, 'duration': duration,
+                  'aspect_ratio': aspect_ratio, 'source_image': image_path}
+        return self._generate_blocking(
+            lambda: self.start_video_from_image(image_path, prompt, duration, aspect_ratio), params, '图像到视频生成失败')
 
-            # 使用最新的Veo 2.0 API调用方式
+    def _generate_blocking(self, start, params, error_prefix):
+        """提交操作并在当前线程轮询至完成"""
+        try:
             try:
-                # 根据最新官方文档使用正确的API调用方式
-                operation = self.client.models.generate_videos(
-                    model="veo-2.0-generate-001",
-                    prompt=optimized_prompt,
-                    config=types.GenerateVideosConfig(
-                        person_generation="dont_allow",  # 安全设置
-                        aspect_ratio=aspect_ratio,  # "16:9" 或 "9:16"
-                        duration_seconds=duration,  # 5-8秒
-                        number_of_videos=1,
-                        enhance_prompt=True,  # 启用提示词增强
-                    ),
-                )
-
-                print(f"视频生成操作已启动: {operation.name}")
+                operation, params['optimized_prompt'] = start()
 
                 # 轮询操作状态
                 max_wait_time = 600  # 最大等待10分钟
@@ -103,163 +320,26 @@ class VideoGenerationService:
                     print(f"等待视频生成中... ({wait_time}/{max_wait_time}秒)")
                     time.sleep(poll_interval)
                     wait_time += poll_interval
-                    operation = self.client.operations.get(operation)
+                    operation = self.get_operation(operation)
 
-                # 检查生成结果
                 if operation.done:
-                    if hasattr(operation, 'response') and operation.response:
-                        generated_videos = operation.response.generated_videos
-                        if generated_videos and len(generated_videos) > 0:
-                            # 获取第一个生成的视频
-                            video = generated_videos[0].video
-
-                            # 下载视频文件
-                            timestamp = int(time.time())
-                            video_filename = f"veo2_generated_video_{timestamp}.mp4"
-                            video_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], video_filename)
-
-                            try:
-                                # 根据官方示例下载和保存视频
-                                self.client.files.download(file=video)
-                                video.save(video_filepath)
-
-                                # 生成预览图
-                                preview_image_path = self._generate_preview_image(prompt, style)
-
-                                return {
-                                    'success': True,
-                                    'status': 'video_generated',
-                                    'message': '视频生成成功！',
-                                    'video_path': video_filepath,
-                                    'preview_image': preview_image_path,
-                                    'original_prompt': prompt,
-                                    'optimized_prompt': optimized_prompt,
-                                    'duration': duration,
-                                    'style': style,
-                                    'aspect_ratio': aspect_ratio,
-                                    'model': 'Veo 2.0',
-                                    'note': 'Veo 2.0 视频生成完成'
-                                }, 200
-
-                            except Exception as download_error:
-                                print(f"视频保存失败: {str(download_error)}")
-                                # 即使保存失败，也返回成功状态和视频信息
-                                return {
-                                    'success': True,
-                                    'status': 'video_generated',
-                                    'message': '视频生成成功，但保存失败',
-                                    'video_info': str(video),
-                                    'original_prompt': prompt,
-                                    'optimized_prompt': optimized_prompt,
-                                    'duration': duration,
-                                    'style': style,
-                                    'aspect_ratio': aspect_ratio,
-                                    'model': 'Veo 2.0',
-                                    'note': f'视频已生成但保存失败: {str(download_error)}'
-                                }, 200
-                        else:
-                            raise Exception("未找到生成的视频")
-                    else:
-                        raise Exception("操作完成但无结果数据")
-                else:
-                    # 超时情况
-                    print("视频生成超时，生成详细制作方案")
-                    return self._generate_enhanced_video_plan(optimized_prompt, duration, style, aspect_ratio)
+                    return self.finalize_video(operation, params)
+
+                # 超时情况
+                print("视频生成超时，生成详细制作方案")
+                return self.fallback_plan(params)
 
             except Exception as video_api_error:
+                if isinstance(video_api_error, GeminiQuotaError):
+                    return quota_exhausted_result(video_api_error)
+                if params['kind'] == 'image_to_video':
+                    raise
                 print(f"Veo 2.0 API调用失败: {str(video_api_error)}")
                 # 如果Veo 2.0不可用，生成详细的制作方案
-                return self._generate_enhanced_video_plan(optimized_prompt, duration, style, aspect_ratio)
-
-        except Exception as e:
-            error_msg = f"视频生成失败: {str(e)}"
-            print(error_msg)
-            return {
-                'success': False,
-                'error': error_msg
-            }, 500
-
-    def generate_video_from_image(self, image_path, prompt="", duration=8, aspect_ratio="16:9"):
-        """
-        从图像生成视频 - 图像到视频功能
-        """
-        try:
-            # 优化提示词
-            if prompt:
-                prompt_optimization = self.optimize_prompt(prompt)
-                optimized_prompt = prompt_optimization['optimized_prompt']
-            else:
-                optimized_prompt = "Animate this image with natural motion and cinematic quality"
-
-            print(f"正在从图像生成视频...")
-            print(f"提示词: {optimized_prompt}")
-
-            # 读取图像
-            from PIL import Image
-            image = Image.open(image_path)
-
-            # 使用图像到视频API
-            operation = self.client.models.generate_videos(
-                model="veo-2.0-generate-001",
-                prompt=optimized_prompt,
-                image=image,
-                config=types.GenerateVideosConfig(
-                    person_generation="dont_allow",
-                    aspect_ratio=aspect_ratio,
-                    duration_seconds=duration,
-                    number_of_videos=1,
-                    enhance_prompt=True,
-                ),
-            )
-
-            # 等待完成（与上面相同的逻辑）
-            max_wait_time = 600
-            wait_time = 0
-            poll_interval = 20
-
-            while not operation.done and wait_time < max_wait_time:
-                print(f"等待视频生成中... ({wait_time}/{max_wait_time}秒)")
-                time.sleep(poll_interval)
-                wait_time += poll_interval
-                operation = self.client.operations.get(operation)
-
-            if operation.done and hasattr(operation, 'response') and operation.response:
-                generated_videos = operation.response.generated_videos
-                if generated_videos and len(generated_videos) > 0:
-                    video = generated_videos[0].video
-                    
-                    timestamp = int(time.time())
-                    video_filename = f"veo2_image_to_video_{timestamp}.mp4"
-                    video_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], video_filename)
-
-                    try:
-                        self.client.files.download(file=video)
-                        video.save(video_filepath)
-
-                        return {
-                            'success': True,
-                            'status': 'video_generated',
-                            'message': '从图像生成视频成功！',
-                            'video_path': video_filepath,
-                            'source_image': image_path,
-                            'original_prompt': prompt,
-                            'optimized_prompt': optimized_prompt,
-                            'duration': duration,
-                            'aspect_ratio': aspect_ratio,
-                            'model': 'Veo 2.0 Image-to-Video',
-                        }, 200
-
-                    except Exception as download_error:
-                        return {
-                            'success': False,
-                            'error': f'视频保存失败: {str(download_error)}'
-                        }, 500
-
-            # 如果失败，返回制作方案
-            return self._generate_enhanced_video_plan(optimized_prompt, duration, "image-to-video", aspect_ratio)
+                return self.fallback_plan(params)
 
         except Exception as e:
-            error_msg = f"图像到视频生成失败: {str(e)}"
+            error_msg = f"{error_prefix}: {str(e)}"
             print(error_msg)
             return {
                 'success': False,
@@ -0,0 +1,296 @@
+"""
+视频生成任务管理
+API请求只负责提交Veo操作并立即返回任务ID，由进程内唯一的后台轮询线程统一推进所有操作，
+任务状态持久化到本地任务库，进程重启后按操作名称继续轮询
+"""
+import ipaddress
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from .job_store import JobStore, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED, job_to_response
+from .gemini_scheduler import GeminiQuotaError, quota_exhausted_result, prioritized, PRIORITY_BATCH
+from ..utils.aio import run_blocking
+
+
+def validate_callback_url(callback_url, allowed_hosts=()):
+    """
+    校验回调地址：仅允许http/https，且主机不能解析到本机、内网、链路本地（含云元数据）等非公网地址，
+    allowed_hosts 中的主机名不受地址限制
+
+    Raises:
+        ValueError: 地址不可用
+    """
+    parsed = urlparse(callback_url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('回调地址必须是有效的http或https URL')
+    host = parsed.hostname.lower()
+    if host in allowed_hosts:
+        return callback_url
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parsed.port or None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, ValueError):
+        raise ValueError(f'无法解析回调地址的主机: {host}')
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f'回调地址不能指向内网或本机地址: {host}')
+    return callback_url
+
+
+class VideoJobManager:
+    """视频生成任务的提交、轮询与回调"""
+
+    KIND_TEXT_TO_VIDEO = 'text_to_video'
+    KIND_IMAGE_TO_VIDEO = 'image_to_video'
+
+    def __init__(self):
+        self.app = None
+        self.store = None
+        self._thread = None
+        self._callback_executor = None
+        self._finish_executor = None
+        self._finishing = set()  # 正在后台生成结果的任务ID
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def init_app(self, app):
+        """绑定应用并打开任务库，配置启用时启动轮询线程"""
+        self.app = app
+        self.store = JobStore(app.config['JOB_STORE_PATH'])
+        if app.config.get('VIDEO_JOB_POLLER_ENABLED', True):
+            self.start()
+
+    def start(self):
+        """启动后台轮询线程（每个进程只有一个）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='video-job-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def submit(self, service, kind, params, callback_url=None):
+        """
+        提交视频生成操作并创建任务（需在请求上下文中调用）
+
+        提交失败时与原同步接口一致：文本到视频直接生成制作方案，图像到视频记录错误，任务立即结束
+
+        Returns:
+            dict: 任务信息
+        """
+        try:
+            if kind == self.KIND_IMAGE_TO_VIDEO:
+                operation, optimized_prompt = service.start_video_from_image(
+                    params['source_image'], params.get('prompt', ''), params['duration'], params['aspect_ratio'])
+            else:
+                operation, optimized_prompt = service.start_video_generation(
+                    params['prompt'], params['duration'], params['aspect_ratio'])
+        except Exception as video_api_error:
+            return self._submit_failed(service, kind, params, callback_url, video_api_error)
+        return self._submit_started(kind, params, operation, optimized_prompt, callback_url)
+
+    async def asubmit(self, service, params, callback_url=None):
+        """
+        submit 的协程版本（ASGI模式，文本到视频）：提交操作时使用异步客户端，
+        任务库读写和提交失败后的制作方案在线程池中执行
+        """
+        try:
+            operation, optimized_prompt = await service.astart_video_generation(
+                params['prompt'], params['duration'], params['aspect_ratio'])
+        except Exception as video_api_error:
+            return await run_blocking(
+                self._submit_failed, service, self.KIND_TEXT_TO_VIDEO, params, callback_url, video_api_error)
+        return await run_blocking(
+            self._submit_started, self.KIND_TEXT_TO_VIDEO, params, operation, optimized_prompt, callback_url)
+
+    def _submit_failed(self, service, kind, params, callback_url, video_api_error):
+        """提交失败：记录已结束的任务（文本到视频附带制作方案）"""
+        print(f"Veo 2.0 API调用失败: {str(video_api_error)}")
+        result, status_code = self._failure_result(service, kind, params, video_api_error)
+        job = self.store.create(kind, params=params, callback_url=callback_url,
+                                status=self._final_status(result, status_code))
+        self._complete(job, result, status_code)
+        return self.store.get(job['id'])
+
+    def _failure_result(self, service, kind, params, error):
+        """视频未能生成时的结果：文本到视频返回制作方案，图像到视频返回错误"""
+        if isinstance(error, GeminiQuotaError):
+            # 配额不足时不再调用Gemini生成制作方案
+            return quota_exhausted_result(error)
+        if kind == self.KIND_IMAGE_TO_VIDEO:
+            return {'success': False, 'error': f'图像到视频生成失败: {str(error)}'}, 500
+        # 如果Veo 2.0不可用，生成详细的制作方案
+        return service.fallback_plan(params)
+
+    def _submit_started(self, kind, params, operation, optimized_prompt, callback_url):
+        """提交成功：创建轮询中的任务并唤醒轮询线程"""
+        config = self.app.config
+        params['optimized_prompt'] = optimized_prompt
+        now = time.time()
+        job = self.store.create(
+            kind,
+            params=params,
+            operation_name=operation.name,
+            callback_url=callback_url,
+            status=JOB_RUNNING,
+            next_poll_at=now + config['VIDEO_JOB_POLL_INTERVAL'],
+            deadline=now + config['VIDEO_JOB_MAX_WAIT']
+        )
+        print(f"视频生成任务已创建: {job['id']} (操作: {operation.name})")
+        self.start()
+        self._wake.set()
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id) if self.store else None
+
+    def _run(self):
+        """轮询主循环：一次处理所有到期任务，然后休眠到下一个任务的轮询时间"""
+        poll_interval = self.app.config['VIDEO_JOB_POLL_INTERVAL']
+        while not self._stopped.is_set():
+            delay = poll_interval
+            try:
+                for job in self.store.due_jobs():
+                    self._poll_job(job)
+                next_at = self.store.next_poll_time()
+                if next_at is not None:
+                    delay = max(0.5, min(poll_interval, next_at - time.time()))
+            except Exception as e:
+                # 任务库的临时错误（如 database is locked）不能结束轮询线程，按轮询间隔重试
+                print(f"视频任务轮询出错: {str(e)}")
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def _poll_job(self, job):
+        """推进单个任务：刷新操作状态，完成或超时后交给结果线程池生成结果"""
+        config = self.app.config
+        now = time.time()
+        if not self.store.claim(job['id'], job['next_poll_at'], now + config['VIDEO_JOB_POLL_INTERVAL']):
+            return
+        with self._lock:
+            if job['id'] in self._finishing:
+                return
+
+        with self.app.app_context():
+            from .video_generation_service import VideoGenerationService
+            from ..utils.helpers import init_gemini_client
+            params = dict(job['params'] or {}, kind=job['kind'])
+
+            try:
+                # 后台轮询的优先级低于用户请求
+                service = VideoGenerationService(prioritized(init_gemini_client(), PRIORITY_BATCH))
+                operation = service.get_operation(job['operation_name'])
+            except Exception as e:
+                # 查询操作状态的临时错误：到截止时间前继续轮询
+                print(f"视频任务 {job['id']} 轮询失败: {str(e)}")
+                if job['deadline'] and now >= job['deadline']:
+                    self._complete(job, {'success': False, 'error': f'视频生成失败: {str(e)}'}, 500)
+                return
+
+            if operation.done:
+                self._finish_in_background(job, service, params, operation)
+            elif job['deadline'] and now >= job['deadline']:
+                print(f"视频生成任务超时，生成详细制作方案: {job['id']}")
+                self._finish_in_background(job, service, params)
+
+    def _finish_in_background(self, job, service, params, operation=None):
+        """
+        在结果线程池中下载视频或生成制作方案（可能排队等待Gemini调度），轮询线程不等待，
+        生成期间该任务的后续轮询直接跳过
+        """
+        with self._lock:
+            self._finishing.add(job['id'])
+            if self._finish_executor is None:
+                self._finish_executor = ThreadPoolExecutor(
+                    max_workers=self.app.config.get('VIDEO_JOB_FINISH_WORKERS', 2),
+                    thread_name_prefix='video-job-finish')
+            executor = self._finish_executor
+        try:
+            executor.submit(self._finish_job, job, service, params, operation)
+        except Exception:
+            with self._lock:
+                self._finishing.discard(job['id'])
+            raise
+
+    def _finish_job(self, job, service, params, operation):
+        """生成任务结果：操作已结束时取回视频，超时（operation 为None）时生成制作方案"""
+        try:
+            with self.app.app_context():
+                try:
+                    if operation is None:
+                        result, status_code = service.fallback_plan(params)
+                    else:
+                        try:
+                            result, status_code = service.finalize_video(operation, params)
+                        except Exception as e:
+                            # 操作已结束但没有结果（生成失败或被过滤），重新轮询也不会变化，立即结束任务
+                            print(f"视频生成操作已结束但没有可用结果 {job['id']}: {str(e)}")
+                            result, status_code = self._failure_result(service, job['kind'], params, e)
+                except Exception as e:
+                    print(f"视频任务 {job['id']} 处理失败: {str(e)}")
+                    result, status_code = {'success': False, 'error': f'视频生成失败: {str(e)}'}, 500
+                self._complete(job, result, status_code)
+        except Exception as e:
+            # 写入结果失败时任务仍为运行中，之后的轮询会重新生成结果
+            print(f"视频任务 {job['id']} 结果写入失败: {str(e)}")
+        finally:
+            with self._lock:
+                self._finishing.discard(job['id'])
+
+    def _complete(self, job, result, status_code):
+        """记录任务结果并触发回调"""
+        status = self._final_status(result, status_code)
+        succeeded = status == JOB_SUCCEEDED
+        self.store.update(
+            job['id'],
+            status=status,
+            result=result,
+            error=None if succeeded else result.get('error'),
+            next_poll_at=None
+        )
+        print(f"视频生成任务结束: {job['id']} ({'成功' if succeeded else '失败'})")
+        if job.get('callback_url'):
+            self._deliver_callback(self.store.get(job['id']))
+
+    @staticmethod
+    def _final_status(result, status_code):
+        return JOB_SUCCEEDED if status_code < 400 and result.get('success', False) else JOB_FAILED
+
+    def _deliver_callback(self, job):
+        """在回调线程池中发送回调，轮询线程不等待回调地址响应"""
+        with self._lock:
+            if self._callback_executor is None:
+                self._callback_executor = ThreadPoolExecutor(
+                    max_workers=self.app.config.get('VIDEO_JOB_CALLBACK_WORKERS', 4),
+                    thread_name_prefix='video-job-callback')
+            executor = self._callback_executor
+        executor.submit(self._send_callback, job)
+
+    def _send_callback(self, job):
+        """向回调地址POST任务最终状态，失败只记录不重试"""
+        try:
+            # 发送前重新校验（提交后主机的解析结果可能已经变化），不跟随重定向
+            validate_callback_url(job['callback_url'], self.app.config.get('VIDEO_JOB_CALLBACK_ALLOWED_HOSTS', ()))
+            response = requests.post(
+                job['callback_url'],
+                json=job_to_response(job),
+                timeout=self.app.config['VIDEO_JOB_CALLBACK_TIMEOUT'],
+                allow_redirects=False
+            )
+            callback_status = f'delivered:{response.status_code}'
+        except Exception as e:
+            print(f"任务回调失败 {job['id']}: {str(e)}")
+            callback_status = f'failed:{str(e)}'
+        self.store.update(job['id'], callback_status=callback_status)
+
+
+# 进程级单例
+video_job_manager = VideoJobManager()
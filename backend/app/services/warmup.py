@@ -0,0 +1,127 @@
+"""
+模型预热服务
+应用启动时预加载YOLO检测/分割模型、执行一次占位推理并加载Haar级联分类器（可选预先建立Gemini连接），
+预热完成前应用处于未就绪状态
+"""
+import threading
+import time
+import numpy as np
+from .model_registry import get_model_registry
+from .gemini_clients import get_gemini_client_pool
+
+
+class WarmupState:
+    """预热状态（进程级）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ready = False
+        self.status = 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self.steps = []
+
+    def start(self):
+        with self._lock:
+            self.ready = False
+            self.status = 'running'
+            self.started_at = time.time()
+            self.finished_at = None
+            self.steps = []
+
+    def record_step(self, name, success, duration, error=None):
+        with self._lock:
+            step = {
+                'name': name,
+                'success': success,
+                'duration_ms': round(duration * 1000, 2)
+            }
+            if error:
+                step['error'] = error
+            self.steps.append(step)
+
+    def finish(self, status='completed'):
+        with self._lock:
+            self.ready = True
+            self.status = status
+            self.finished_at = time.time()
+
+    def to_dict(self):
+        with self._lock:
+            result = {
+                'ready': self.ready,
+                'status': self.status,
+                'steps': list(self.steps)
+            }
+            if self.started_at and self.finished_at:
+                result['duration_ms'] = round((self.finished_at - self.started_at) * 1000, 2)
+            return result
+
+
+warmup_state = WarmupState()
+
+
+def _run_step(name, func):
+    """执行单个预热步骤并记录耗时，失败不会中断后续步骤"""
+    start = time.perf_counter()
+    try:
+        func()
+        warmup_state.record_step(name, True, time.perf_counter() - start)
+        return True
+    except Exception as e:
+        print(f"预热步骤失败 {name}: {str(e)}")
+        warmup_state.record_step(name, False, time.perf_counter() - start, str(e))
+        return False
+
+
+def _warm_model(model_name, image_size):
+    """加载模型并用占位图像执行一次推理，触发torch的首次初始化开销"""
+    model = get_model_registry().get(model_name)
+    if model is None:
+        raise RuntimeError(f'无法加载模型: {model_name}')
+    dummy = np.zeros((image_size, image_size, 3), dtype=np.uint8)
+    with get_model_registry().inference_lock(model_name):
+        model(dummy, conf=0.5, verbose=False)
+
+
+def warm_up(app):
+    """在应用上下文中执行完整的预热流程"""
+    with app.app_context():
+        warmup_state.start()
+        print("🔥 开始模型预热...", flush=True)
+
+        config = app.config
+        image_size = int(config.get('MODEL_WARMUP_IMAGE_SIZE', 640))
+        registry = get_model_registry()
+        all_ok = True
+
+        for model_name in config.get('MODEL_WARMUP_DETECTION_MODELS', []):
+            all_ok &= _run_step(f'yolo:{model_name}', lambda m=model_name: _warm_model(m, image_size))
+
+        for model_name in config.get('MODEL_WARMUP_SEGMENTATION_MODELS', []):
+            all_ok &= _run_step(f'yolo:{model_name}', lambda m=model_name: _warm_model(m, image_size))
+
+        for cascade_file in ('haarcascade_frontalface_default.xml', 'haarcascade_eye.xml'):
+            all_ok &= _run_step(f'haar:{cascade_file}', lambda c=cascade_file: registry.get_cascade(c))
+
+        if config.get('GEMINI_CLIENT_WARMUP', False) and config.get('GEMINI_API_KEY'):
+            all_ok &= _run_step('gemini:client', lambda: get_gemini_client_pool().warm(
+                config['GEMINI_API_KEY'], config['DEFAULT_VISION_MODEL']))
+
+        warmup_state.finish('completed' if all_ok else 'degraded')
+        print(f"✅ 模型预热结束（{warmup_state.status}）", flush=True)
+
+
+def start_warmup(app):
+    """根据配置启动预热：关闭时直接就绪，否则在后台线程（或阻塞）执行"""
+    if not app.config.get('MODEL_WARMUP_ENABLED', False):
+        warmup_state.finish('skipped')
+        return None
+
+    if app.config.get('MODEL_WARMUP_BLOCKING', False):
+        warm_up(app)
+        return None
+
+    thread = threading.Thread(target=warm_up, args=(app,), name='model-warmup', daemon=True)
+    thread.start()
+    return thread
@@ -1,215 +1,304 @@
 import os
-import cv2
 import numpy as np
-from ultralytics import YOLO
 from PIL import Image, ImageDraw, ImageFont
 import time
 from flask import current_app
-from ..utils.helpers import allowed_file, save_uploaded_file
+from ..utils.image_input import ImageInput, ImageInputError, load_image_input
+from .model_registry import get_model_registry
+from .inference_scheduler import get_inference_scheduler
+from ..utils.rendering import RenderItem, MODE_CROP
+from ..utils.label_index import label_index
+from .artifact_store import render_detection_artifacts, ARTIFACTS_ALL
+from ..utils.metrics import time_stage
 
 class YOLODetectionService:
     """YOLO目标检测服务"""
 
+    # 内容验证使用的较低置信度阈值
+    VALIDATION_CONFIDENCE = 0.25
+
     def __init__(self):
-        self.models = {
-            'yolo11n': None,  # YOLOv11 nano
-            'yolo11s': None,  # YOLOv11 small
-            'yolo11m': None,  # YOLOv11 medium
-            'yolo11l': None,  # YOLOv11 large
-            'yolo11x': None,  # YOLOv11 extra large
-        }
-        self.current_model = None
-        self.current_model_name = None
+        self.supported_models = ['yolo11n', 'yolo11s', 'yolo11m', 'yolo11l', 'yolo11x']
+
+    def resolve_model_name(self, model_name):
+        """实际使用的模型名称：不支持的模型回退到nano版本"""
+        return model_name if model_name in self.supported_models else 'yolo11n'
 
     def load_model(self, model_name='yolo11n'):
-        """加载YOLO模型"""
+        """
+        从进程级注册表获取YOLO模型
+
+        模型句柄不保存在服务实例上，并发请求之间互不影响
+
+        Returns:
+            tuple: (模型句柄, 实际使用的模型名称)，加载失败时模型句柄为None
+        """
         try:
-            if model_name not in self.models:
-                model_name = 'yolo11n'  # 默认使用nano版本
-
-            if self.models[model_name] is None:
-                # 使用配置中定义的模型目录
-                models_folder = current_app.config.get('MODELS_FOLDER')
-                if models_folder:
-                    model_path = os.path.join(models_folder, f'{model_name}.pt')
-                else:
-                    # 回退到当前目录
-                    model_path = f'{model_name}.pt'
-
-                if os.path.exists(model_path):
-                    print(f"找到本地模型文件: {model_path}")
-                    print(f"正在加载 {model_name} 模型...")
-                    self.models[model_name] = YOLO(model_path)
-                    print(f"{model_name} 模型加载完成")
-                else:
-                    print(f"本地未找到模型文件: {model_path}")
-                    print(f"正在下载并加载 {model_name} 模型...")
-                    # 如果本地没有，先尝试下载到模型目录
-                    if models_folder and os.path.exists(models_folder):
-                        # 下载到指定的模型目录
-                        self.models[model_name] = YOLO(f'{model_name}.pt')  # 先下载
-                        # 然后移动到正确位置（如果需要）
-                        downloaded_path = f'{model_name}.pt'
-                        if os.path.exists(downloaded_path) and downloaded_path != model_path:
-                            import shutil
-                            shutil.move(downloaded_path, model_path)
-                            print(f"模型文件已移动到: {model_path}")
-                        self.models[model_name] = YOLO(model_path)
-                    else:
-                        self.models[model_name] = YOLO(f'{model_name}.pt')  # 这会自动下载
-                    print(f"{model_name} 模型下载并加载完成")
-
-            self.current_model = self.models[model_name]
-            self.current_model_name = model_name
-            return True
+            model_name = self.resolve_model_name(model_name)
+            return get_model_registry().get(model_name), model_name
 
         except Exception as e:
             print(f"加载YOLO模型失败: {str(e)}")
-            return False
+            return None, model_name
+
+    def detect_objects(self, image_path=None, model_name='yolo11n', confidence=0.5, user_query=None, image=None,
+                       artifacts=ARTIFACTS_ALL):
+        """
+        使用YOLO检测图像中的对象（image_path 为文件路径，或直接传入已解码的 ImageInput）
 
-    def detect_objects(self, image_path, model_name='yolo11n', confidence=0.5, user_query=None):
-        """使用YOLO检测图像中的对象"""
+        artifacts 控制立即生成的结果图像：all（全部）、summary（仅汇总图）、none（不生成，按需渲染）
+        """
         try:
+            source = image if image is not None else ImageInput.from_path(image_path)
+
             # 加载模型
-            if not self.load_model(model_name):
+            model, model_name = self.load_model(model_name)
+            if model is None:
                 return {
                     'success': False,
                     'error': f'无法加载YOLO模型: {model_name}'
                 }
 
-            # 读取图像
-            image = cv2.imread(image_path)
-            if image is None:
+            # 读取图像（共享的解码结果，只读使用）
+            try:
+                image = source.bgr
+            except ImageInputError:
                 return {
                     'success': False,
                     'error': '无法读取图像文件'
                 }
 
-            # 如果提供了用户查询，验证内容匹配性
-            if user_query:
-                content_match_result = self._validate_content_match(image_path, user_query)
-                if not content_match_result['is_match']:
-                    return {
-                        'success': False,
-                        'error': f'未检测到目标：{user_query}',
-                        'message': f'图像中检测到的对象与您查询的"{user_query}"不匹配。{content_match_result["message"]}',
-                        'suggestion': content_match_result.get('suggestion', '请检查图像内容或修改查询词汇。'),
-                        'detected_objects': content_match_result.get('detected_objects', []),
-                        'alternative_queries': content_match_result.get('alternative_queries', [])
-                    }
-
-            # 进行检测
-            results = self.current_model(image, conf=confidence)
-
-            # 处理检测结果
-            detected_objects = []
-            bbox_images = []
-
-            # 创建汇总图像
-            summary_image = image.copy()
-
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for i, box in enumerate(boxes):
-                        # 获取边界框坐标
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-
-                        # 获取类别和置信度
-                        class_id = int(box.cls[0])
-                        confidence_score = float(box.conf[0])
-                        class_name = self.current_model.names[class_id]
-
-                        # 添加到检测结果
-                        detected_objects.append({
-                            'label': class_name,
-                            'confidence': confidence_score,
-                            'bbox': [int(x1), int(y1), int(x2), int(y2)]
-                        })
-
-                        # 在汇总图像上绘制边界框
-                        cv2.rectangle(summary_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-                        # 添加标签
-                        label_text = f"{class_name}: {confidence_score:.2f}"
-                        cv2.putText(summary_image, label_text, (x1, y1-10),
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-                        # 创建单个对象的边界框图像
-                        bbox_image = image[y1:y2, x1:x2].copy()
-
-                        # 保存边界框图像
-                        timestamp = int(time.time() * 1000)
-                        bbox_filename = f"yolo_bbox_{timestamp}_{i}_{os.path.basename(image_path)}"
-                        bbox_path = os.path.join(current_app.config['GENERATED_FOLDER'], bbox_filename)
-                        cv2.imwrite(bbox_path, bbox_image)
-                        bbox_images.append(bbox_path)
-
-            # 保存汇总图像
-            if detected_objects:
-                timestamp = int(time.time() * 1000)
-                summary_filename = f"yolo_summary_{timestamp}_{os.path.basename(image_path)}"
-                summary_path = os.path.join(current_app.config['GENERATED_FOLDER'], summary_filename)
-                cv2.imwrite(summary_path, summary_image)
+            # 单次推理：有用户查询时按较低阈值推理，内容验证与返回结果共用同一次前向计算
+            inference_confidence = min(confidence, self.VALIDATION_CONFIDENCE) if user_query else confidence
+            results = get_inference_scheduler().predict(model_name, model, image, inference_confidence)
+            detections = self._collect_detections(results, model.names)
+            return self._build_detection_result(source, detections, model_name, confidence, user_query,
+                                                artifacts=artifacts)
 
-                return {
-                    'success': True,
-                    'detected_objects': detected_objects,
-                    'bbox_images': bbox_images,
-                    'summary_image': summary_path,
-                    'method': f'YOLO {model_name}',
-                    'model_name': model_name,
-                    'total_objects': len(detected_objects)
-                }
-            else:
+        except Exception as e:
+            print(f"YOLO检测错误: {str(e)}")
+            return {
+                'success': False,
+                'error': f'YOLO检测失败: {str(e)}'
+            }
+
+    def detect_objects_batch(self, images, model_name='yolo11n', confidence=0.5, user_query=None, batch_size=None,
+                             artifacts=ARTIFACTS_ALL):
+        """
+        批量检测多张图像：每批图像只调用一次 model(...)，结果按输入顺序逐张返回
+
+        Args:
+            images (list[ImageInput]): 输入图像（逐批解码，每批处理完后释放解码结果）
+            model_name (str): 模型名称
+            confidence (float): 置信度阈值
+            user_query (str): 用户查询（可选，对每张图像分别做内容验证）
+            batch_size (int): 每次推理的图像数，默认使用配置 YOLO_BATCH_SIZE
+            artifacts (str): 立即生成的结果图像，见 detect_objects
+
+        Returns:
+            list[dict]: 与 detect_objects 相同格式的逐张结果，附带输入序号 index
+        """
+        if batch_size is None:
+            batch_size = current_app.config.get('YOLO_BATCH_SIZE', 8)
+        batch_size = max(1, int(batch_size))
+
+        model, model_name = self.load_model(model_name)
+        if model is None:
+            return [{'index': index, 'success': False, 'error': f'无法加载YOLO模型: {model_name}'}
+                    for index in range(len(images))]
+
+        results = [None] * len(images)
+        inference_confidence = min(confidence, self.VALIDATION_CONFIDENCE) if user_query else confidence
+        registry = get_model_registry()
+        for start in range(0, len(images), batch_size):
+            sources = images[start:start + batch_size]
+            try:
+                # 逐批解码，峰值内存只有一批图像；无法读取的图像单独报告错误，不影响同批其他图像
+                chunk = []
+                for index, source in enumerate(sources, start):
+                    try:
+                        chunk.append((index, source, source.bgr))
+                    except ImageInputError as e:
+                        results[index] = {'index': index, 'success': False, 'error': str(e)}
+                if not chunk:
+                    continue
+
+                try:
+                    with registry.inference_lock(model_name), time_stage('yolo', model_name):
+                        batch_results = model([item[2] for item in chunk], conf=inference_confidence)
+                except Exception as e:
+                    print(f"YOLO批量检测错误: {str(e)}")
+                    for index, _, _ in chunk:
+                        results[index] = {'index': index, 'success': False, 'error': f'YOLO检测失败: {str(e)}'}
+                    continue
+
+                for (index, source, _), result in zip(chunk, batch_results):
+                    try:
+                        detections = self._collect_detections([result], model.names)
+                        item = self._build_detection_result(source, detections, model_name, confidence,
+                                                            user_query, name_prefix=f'{index}_', artifacts=artifacts)
+                    except Exception as e:
+                        print(f"YOLO批量检测结果处理错误: {str(e)}")
+                        item = {'success': False, 'error': f'YOLO检测失败: {str(e)}'}
+                    item['index'] = index
+                    results[index] = item
+            finally:
+                # 本批结果已生成，释放解码的像素数据（延迟渲染只需要原始字节）
+                chunk = batch_results = None
+                for source in sources:
+                    source.release()
+
+        return results
+
+    def _build_detection_result(self, source, detections, model_name, confidence, user_query=None, name_prefix='',
+                                artifacts=ARTIFACTS_ALL):
+        """将一张图像的推理结果整理为接口返回格式（内容验证、裁剪图与汇总图）"""
+        primary_detections = [d for d in detections if d['confidence'] >= confidence]
+
+        # 如果提供了用户查询，基于同一次推理结果验证内容匹配性
+        validation_pass = None
+        if user_query:
+            content_match_result, validation_pass = self._validate_detections(
+                detections, primary_detections, user_query)
+            if not content_match_result['is_match']:
                 return {
                     'success': False,
-                    'error': '未检测到任何对象',
-                    'method': f'YOLO {model_name}',
-                    'detected_objects': [],
-                    'total_objects': 0
+                    'error': f'未检测到目标：{user_query}',
+                    'message': f'图像中检测到的对象与您查询的"{user_query}"不匹配。{content_match_result["message"]}',
+                    'suggestion': content_match_result.get('suggestion', '请检查图像内容或修改查询词汇。'),
+                    'detected_objects': content_match_result.get('detected_objects', []),
+                    'alternative_queries': content_match_result.get('alternative_queries', []),
+                    'validation_pass': validation_pass
                 }
 
-        except Exception as e:
-            print(f"YOLO检测错误: {str(e)}")
+        # 处理检测结果
+        detected_objects = []
+        render_items = []
+
+        for i, detection in enumerate(primary_detections):
+            x1, y1, x2, y2 = detection['box']
+            class_name = detection['class_name']
+            confidence_score = detection['confidence']
+
+            # 添加到检测结果
+            detected_objects.append({
+                'label': class_name,
+                'confidence': confidence_score,
+                'bbox': [x1, y1, x2, y2]
+            })
+
+            # 单个对象的边界框裁剪图，汇总图上绘制边界框和标签
+            timestamp = int(time.time() * 1000)
+            bbox_filename = f"yolo_bbox_{timestamp}_{name_prefix}{i}_{source.name}"
+            render_items.append(RenderItem(
+                (x1, y1, x2, y2),
+                os.path.join(current_app.config['GENERATED_FOLDER'], bbox_filename),
+                label=f"{class_name}: {confidence_score:.2f}",
+                color=(0, 255, 0),
+                width=2
+            ))
+
+        # 一次遍历保存裁剪图和汇总图像
+        if detected_objects:
+            timestamp = int(time.time() * 1000)
+            summary_filename = f"yolo_summary_{timestamp}_{name_prefix}{source.name}"
+            summary_path = os.path.join(current_app.config['GENERATED_FOLDER'], summary_filename)
+            rendered = render_detection_artifacts(source, render_items, summary_path, artifacts, mode=MODE_CROP)
+
+            return {
+                'success': True,
+                'detected_objects': detected_objects,
+                **rendered,
+                'method': f'YOLO {model_name}',
+                'model_name': model_name,
+                'total_objects': len(detected_objects),
+                'validation_pass': validation_pass
+            }
+        else:
             return {
                 'success': False,
-                'error': f'YOLO检测失败: {str(e)}'
+                'error': '未检测到任何对象',
+                'method': f'YOLO {model_name}',
+                'detected_objects': [],
+                'total_objects': 0,
+                'validation_pass': validation_pass
             }
 
+    def _collect_detections(self, results, names):
+        """将一次推理的结果整理为检测列表（像素坐标）"""
+        detections = []
+        for result in results:
+            if result.boxes is None:
+                continue
+            boxes = result.boxes.xyxy.cpu().numpy().astype(int)
+            classes = result.boxes.cls.cpu().numpy()
+            confidences = result.boxes.conf.cpu().numpy()
+            for box, cls, conf in zip(boxes, classes, confidences):
+                detections.append({
+                    'class_id': int(cls),
+                    'class_name': names[int(cls)],
+                    'confidence': float(conf),
+                    'box': [int(v) for v in box]
+                })
+        return detections
+
+    def _validate_detections(self, detections, primary_detections, user_query):
+        """
+        基于同一次推理的结果做两级阈值的内容验证
+
+        先用返回结果所用的置信度阈值匹配（primary），不匹配时再用较低的验证阈值匹配（low_confidence）
+
+        Returns:
+            tuple: (验证结果, 产生判定结果的阈值档位)
+        """
+        primary_result = self._match_detections(primary_detections, user_query)
+        if primary_result['is_match']:
+            return primary_result, 'primary'
+
+        low_detections = [d for d in detections if d['confidence'] >= self.VALIDATION_CONFIDENCE]
+        return self._match_detections(low_detections, user_query), 'low_confidence'
+
     def _validate_content_match(self, image_path, user_query):
-        """验证用户查询内容与图像内容的匹配性"""
+        """验证用户查询内容与图像内容的匹配性（image_path 也可以是 ImageInput）"""
         try:
             # 首先进行快速检测，获取图像中的对象
-            if not self.load_model('yolo11n'):  # 使用最快的模型进行检测
+            model, model_name = self.load_model('yolo11n')  # 使用最快的模型进行检测
+            if model is None:
                 return {
                     'is_match': True,  # 如果无法加载模型，允许继续
                     'message': '无法验证内容匹配性，将继续处理'
                 }
 
             # 读取图像
-            image = cv2.imread(image_path)
-            if image is None:
+            try:
+                source = image_path if isinstance(image_path, ImageInput) else ImageInput.from_path(image_path)
+                image = source.bgr
+            except ImageInputError:
                 return {
                     'is_match': True,
                     'message': '无法读取图像，将继续处理'
                 }
 
             # 进行快速检测
-            results = self.current_model(image, conf=0.25)  # 使用较低的置信度进行检测
+            # 使用较低的置信度进行检测
+            results = get_inference_scheduler().predict(model_name, model, image, self.VALIDATION_CONFIDENCE)
+            return self._match_detections(self._collect_detections(results, model.names), user_query)
 
-            detected_objects = []
-            for result in results:
-                if result.boxes is not None:
-                    classes = result.boxes.cls.cpu().numpy()
-                    confidences = result.boxes.conf.cpu().numpy()
+        except Exception as e:
+            print(f"YOLO内容匹配验证错误: {str(e)}")
+            # 如果验证过程出错，允许继续处理
+            return {
+                'is_match': True,
+                'message': f'内容匹配验证出错，将继续处理: {str(e)}'
+            }
 
-                    for cls, conf in zip(classes, confidences):
-                        class_name = self.current_model.names[int(cls)]
-                        detected_objects.append({
-                            'class_name': class_name,
-                            'confidence': float(conf)
-                        })
+    def _match_detections(self, detections, user_query):
+        """检查检测结果是否与用户查询匹配"""
+        try:
+            detected_objects = [{
+                'class_name': d['class_name'],
+                'confidence': d['confidence']
+            } for d in detections]
 
             if not detected_objects:
                 return {
@@ -219,26 +308,8 @@ class YOLODetectionService:
                     'detected_objects': []
                 }
 
-            # 检查用户查询是否与检测到的对象匹配
-            user_query_lower = user_query.lower().strip()
-            detected_names = [obj['class_name'].lower() for obj in detected_objects]
-
-            # 严格的关键词匹配，包括同义词
-            matched_objects = []
-
-            # 创建同义词映射
-            synonym_map = self._get_synonym_map()
-
-            # 获取用户查询的所有可能匹配词汇
-            query_words = self._expand_query_words(user_query_lower, synonym_map)
-
-            # 更严格的匹配逻辑
-            for obj in detected_objects:
-                class_name = obj['class_name'].lower()
-
-                # 检查精确匹配和同义词匹配
-                if self._is_strict_match(query_words, class_name, synonym_map):
-                    matched_objects.append(obj['class_name'])
+            # 通过共享的标签索引匹配（中英文同义词、上位词）
+            matched_objects = label_index.select(user_query, [obj['class_name'] for obj in detected_objects])
 
             is_match = len(matched_objects) > 0
 
@@ -252,7 +323,7 @@ class YOLODetectionService:
                 }
             else:
                 detected_names = [obj['class_name'] for obj in detected_objects[:5]]  # 只显示前5个
-                suggestions = self._generate_suggestions(user_query_lower, detected_names, synonym_map)
+                suggestions = self._generate_suggestions(user_query, detected_names)
 
                 return {
                     'is_match': False,
@@ -270,142 +341,7 @@ class YOLODetectionService:
                 'message': f'内容匹配验证出错，将继续处理: {str(e)}'
             }
 
-    def _get_synonym_map(self):
-        """获取更完善的同义词映射表"""
-        return {
-            # 动物类 - 更详细的映射
-            'cat': ['kitten', 'feline', '猫', '小猫', 'kitty', '猫咪', '喵', '猫猫'],
-            'dog': ['puppy', 'canine', '狗', '小狗', 'doggy', '狗狗', '犬', '汪'],
-            'bird': ['飞鸟', '鸟类', 'avian', '鸟儿', '小鸟'],
-            'horse': ['马', 'equine', 'pony', '马匹', '小马'],
-            'cow': ['cattle', '牛', 'bull', '奶牛', '母牛'],
-            'sheep': ['羊', 'lamb', '绵羊', '小羊'],
-            'elephant': ['大象', '象'],
-            'bear': ['熊', '狗熊', '黑熊', '棕熊'],
-            'zebra': ['斑马'],
-            'giraffe': ['长颈鹿'],
-            'lion': ['狮子', '雄狮', '母狮'],
-            'tiger': ['老虎', '虎'],
-            'monkey': ['猴子', '猴'],
-            'rabbit': ['兔子', '小兔', '兔'],
-
-            # 交通工具
-            'car': ['automobile', 'vehicle', '汽车', '车辆', '轿车', '小车'],
-            'truck': ['lorry', '卡车', '货车', '大车'],
-            'bus': ['coach', '公交车', '巴士', '客车'],
-            'motorcycle': ['motorbike', '摩托车', '机车', '摩托'],
-            'bicycle': ['bike', '自行车', '单车', '脚踏车'],
-            'train': ['火车', 'locomotive', '列车'],
-            'airplane': ['plane', '飞机', 'aircraft', '客机'],
-            'boat': ['ship', '船', '轮船', '小船'],
-
-            # 人物
-            'person': ['people', 'human', '人', '人类', 'man', 'woman', 'individual', '人物'],
-            'child': ['kid', '孩子', '儿童', '小孩'],
-            'baby': ['infant', '婴儿', '宝宝', '小宝宝'],
-
-            # 物品
-            'phone': ['mobile', 'cellphone', '手机', '电话', 'smartphone', '移动电话'],
-            'laptop': ['computer', '笔记本', '电脑', 'notebook', '笔记本电脑'],
-            'book': ['书', '书籍', '图书'],
-            'bottle': ['瓶子', 'container', '水瓶'],
-            'cup': ['mug', '杯子', '茶杯', '水杯'],
-            'clock': ['时钟', '钟表', 'watch', '手表'],
-            'tv': ['television', '电视', 'monitor', '电视机'],
-            'remote': ['遥控器', 'controller', '遥控'],
-
-            # 食物
-            'apple': ['苹果'],
-            'banana': ['香蕉'],
-            'orange': ['橙子', '橘子', '桔子'],
-            'pizza': ['比萨', '披萨'],
-            'cake': ['蛋糕'],
-            'sandwich': ['三明治'],
-            'donut': ['甜甜圈', '油炸圈饼'],
-
-            # 家具
-            'chair': ['椅子', '座椅'],
-            'couch': ['sofa', '沙发'],
-            'bed': ['床', '床铺'],
-            'dining table': ['table', '桌子', '餐桌', '饭桌'],
-            'toilet': ['厕所', '马桶', '卫生间'],
-
-            # 运动用品
-            'sports ball': ['ball', '球', '运动球'],
-            'tennis racket': ['tennis', '网球拍', '球拍'],
-            'baseball bat': ['棒球棒', '球棒'],
-            'baseball glove': ['棒球手套', '手套'],
-            'skateboard': ['滑板'],
-            'surfboard': ['冲浪板'],
-            'ski': ['滑雪板'],
-
-            # 厨房用品
-            'knife': ['刀', '小刀', '菜刀'],
-            'spoon': ['勺子', '汤匙', '勺'],
-            'fork': ['叉子', '餐叉'],
-            'bowl': ['碗', '饭碗'],
-            'wine glass': ['酒杯', '红酒杯', '玻璃杯'],
-            'refrigerator': ['冰箱', 'fridge'],
-            'microwave': ['微波炉'],
-            'oven': ['烤箱'],
-            'toaster': ['烤面包机'],
-
-            # 电子设备
-            'keyboard': ['键盘'],
-            'mouse': ['鼠标'],
-            'cell phone': ['phone', '手机', 'mobile', '移动电话'],
-
-            # 植物和自然
-            'flower': ['花', '花朵', '鲜花'],
-            'tree': ['树', '树木', '大树'],
-            'grass': ['草', '草地', '草坪'],
-
-            # 建筑和结构
-            'building': ['建筑', '房子', '楼房', '大楼'],
-            'house': ['房子', '住宅', '房屋'],
-            'bridge': ['桥', '大桥', '桥梁'],
-        }
-
-    def _expand_query_words(self, query, synonym_map):
-        """扩展查询词汇，包括同义词"""
-        words = [query] + query.split()
-        expanded_words = set(words)
-
-        for word in words:
-            for key, synonyms in synonym_map.items():
-                if word in synonyms or word == key:
-                    expanded_words.add(key)
-                    expanded_words.update(synonyms)
-
-        return list(expanded_words)
-
-    def _is_strict_match(self, query_words, class_name, synonym_map):
-        """检查是否为严格匹配（包括同义词）"""
-        # 1. 直接精确匹配
-        for query_word in query_words:
-            if query_word == class_name:
-                return True
-
-        # 2. 同义词精确匹配
-        for query_word in query_words:
-            # 检查查询词是否是检测类别的同义词
-            for key, synonyms in synonym_map.items():
-                if key == class_name and query_word in synonyms:
-                    return True
-                if query_word == key and class_name in synonyms:
-                    return True
-
-        # 3. 严格的部分匹配（仅限于特定情况）
-        for query_word in query_words:
-            if len(query_word) > 4:  # 只对较长的词进行部分匹配
-                # 检查是否为复合词的一部分
-                if (query_word in class_name and len(query_word) / len(class_name) > 0.6) or \
-                   (class_name in query_word and len(class_name) / len(query_word) > 0.6):
-                    return True
-
-        return False
-
-    def _generate_suggestions(self, user_query, detected_names, synonym_map):
+    def _generate_suggestions(self, user_query, detected_names):
         """生成建议"""
         suggestions = []
 
@@ -414,11 +350,10 @@ class YOLODetectionService:
             suggestions.append(f"图像中包含: {', '.join(detected_names)}")
             suggestions.append(f"您可以尝试搜索: {', '.join(detected_names[:3])}")
 
-        # 基于同义词生成建议
-        for key, synonyms in synonym_map.items():
-            if user_query in synonyms:
-                suggestions.append(f"您搜索的是'{user_query}'，请尝试使用'{key}'")
-                break
+        # 查询是同义词时建议对应的类别名
+        candidates = label_index.suggest(user_query)
+        if candidates:
+            suggestions.append(f"您搜索的是'{user_query.strip()}'，请尝试使用'{', '.join(candidates[:3])}'")
 
         return '; '.join(suggestions) if suggestions else "请检查图像内容或修改查询词汇"
 
@@ -491,50 +426,20 @@ class YOLODetectionService:
     def detect_objects_with_file(self, file, model_name='yolo11n', confidence=0.5, user_query=None):
         """使用文件对象进行YOLO检测"""
         try:
-            if not file or not hasattr(file, 'filename') or file.filename == '':
-                return {'success': False, 'error': '未选择文件'}, 400
-            if not allowed_file(file.filename):
-                return {'success': False, 'error': '无效的文件类型'}, 400
-
-            # 检查是否是已经存在的文件路径（用于测试）
-            if hasattr(file, 'filepath') and os.path.exists(file.filepath):
-                filepath = file.filepath
-            else:
-                # 标准的Flask文件上传对象
-                filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
-
-            # 调用检测方法
-            return self.detect_objects(filepath, model_name, confidence, user_query), 200
-
+            image = load_image_input(file=file)
+        except ImageInputError as e:
+            return {'success': False, 'error': str(e)}, 400
+        try:
+            return self.detect_objects(model_name=model_name, confidence=confidence,
+                                       user_query=user_query, image=image), 200
         except Exception as e:
             return {'success': False, 'error': f'YOLO检测失败: {str(e)}'}, 500
 
     def detect_objects_with_file_data(self, image_data, model_name='yolo11n', confidence=0.5, user_query=None):
         """使用base64图像数据进行YOLO检测"""
         try:
-            import base64
-            import tempfile
-
-            # 处理base64图像数据
-            image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-            image_bytes = base64.b64decode(image_data_clean)
-
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                tmp_file.write(image_bytes)
-                filepath = tmp_file.name
-
-            # 调用检测方法
-            result = self.detect_objects(filepath, model_name, confidence, user_query)
-
-            # 清理临时文件
-            import os
-            try:
-                os.unlink(filepath)
-            except:
-                pass
-
-            return result, 200
-
+            image = load_image_input(image_data=image_data)
+            return self.detect_objects(model_name=model_name, confidence=confidence,
+                                       user_query=user_query, image=image), 200
         except Exception as e:
             return {'success': False, 'error': f'YOLO检测失败: {str(e)}'}, 500
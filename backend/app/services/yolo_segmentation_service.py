@@ -5,141 +5,106 @@ YOLO 图像分割服务
 import os
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from PIL import Image, ImageDraw, ImageFont
 import time
-import base64
-import tempfile
 from flask import current_app
-from ..utils.helpers import allowed_file, save_uploaded_file
+from ..utils.image_input import ImageInput, ImageInputError, load_image_input
+from ..utils.rendering import contour_cutout
+from ..utils.mask_encoding import encode_mask, MASK_FORMAT_NONE
+from ..utils.label_index import label_index
+from .artifact_store import defer_contour_cutouts, ARTIFACTS_ALL
+from .model_registry import get_model_registry
+from .inference_scheduler import get_inference_scheduler
+from .storage_manager import storage_manager
+from ..utils.metrics import time_stage
 
 
 class YOLOSegmentationService:
     """YOLO图像分割服务"""
 
+    # 内容验证使用的较低置信度阈值
+    VALIDATION_CONFIDENCE = 0.3
+
     def __init__(self):
-        self.models = {
-            'yolo11n-seg': None,  # YOLOv11 nano segmentation
-            'yolo11s-seg': None,  # YOLOv11 small segmentation
-            'yolo11m-seg': None,  # YOLOv11 medium segmentation
-            'yolo11l-seg': None,  # YOLOv11 large segmentation
-            'yolo11x-seg': None,  # YOLOv11 extra large segmentation
-        }
-        self.current_model = None
-        self.current_model_name = None
+        self.supported_models = ['yolo11n-seg', 'yolo11s-seg', 'yolo11m-seg', 'yolo11l-seg', 'yolo11x-seg']
 
     def load_model(self, model_name='yolo11n-seg'):
-        """加载YOLO分割模型"""
+        """
+        从进程级注册表获取YOLO分割模型
+
+        模型句柄不保存在服务实例上，并发请求之间互不影响
+
+        Returns:
+            tuple: (模型句柄, 实际使用的模型名称)，加载失败时模型句柄为None
+        """
         try:
-            if model_name not in self.models:
+            if model_name not in self.supported_models:
                 model_name = 'yolo11n-seg'  # 默认使用nano版本
 
-            if self.models[model_name] is None:
-                # 使用配置中定义的模型目录
-                models_folder = current_app.config.get('MODELS_FOLDER')
-                if models_folder:
-                    model_path = os.path.join(models_folder, f'{model_name}.pt')
-                else:
-                    # 回退到当前目录
-                    model_path = f'{model_name}.pt'
-
-                if os.path.exists(model_path):
-                    print(f"找到本地分割模型文件: {model_path}")
-                    print(f"正在加载 {model_name} 分割模型...")
-                    self.models[model_name] = YOLO(model_path)
-                    print(f"{model_name} 分割模型加载完成")
-                else:
-                    print(f"本地未找到分割模型文件: {model_path}")
-                    print(f"正在下载并加载 {model_name} 分割模型...")
-                    # 如果本地没有，先尝试下载到模型目录
-                    if models_folder and os.path.exists(models_folder):
-                        # 下载到指定的模型目录
-                        self.models[model_name] = YOLO(f'{model_name}.pt')  # 先下载
-                        # 然后移动到正确位置（如果需要）
-                        downloaded_path = f'{model_name}.pt'
-                        if os.path.exists(downloaded_path) and downloaded_path != model_path:
-                            import shutil
-                            shutil.move(downloaded_path, model_path)
-                            print(f"分割模型文件已移动到: {model_path}")
-                        self.models[model_name] = YOLO(model_path)
-                    else:
-                        self.models[model_name] = YOLO(f'{model_name}.pt')  # 这会自动下载
-                    print(f"{model_name} 分割模型下载并加载完成")
-
-            self.current_model = self.models[model_name]
-            self.current_model_name = model_name
-            return True
+            return get_model_registry().get(model_name), model_name
 
         except Exception as e:
             print(f"加载YOLO分割模型失败: {str(e)}")
-            return False
+            return None, model_name
+
+    def segment_image_yolo(self, file=None, image_data=None, model_name='yolo11n-seg', confidence=0.5, user_query=None,
+                           image=None, artifacts=ARTIFACTS_ALL, mask_format=MASK_FORMAT_NONE):
+        """
+        使用YOLO进行图像分割（image 为已解码的 ImageInput 时直接使用）
 
-    def segment_image_yolo(self, file=None, image_data=None, model_name='yolo11n-seg', confidence=0.5, user_query=None):
-        """使用YOLO进行图像分割"""
+        mask_format 为 rle / polygon 时每个对象附带内联的掩码（mask 字段）；
+        artifacts 不为 all 时不立即生成分割图像，返回按需渲染地址
+        """
         try:
-            # 处理文件输入
-            if image_data:
-                image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(image_data_clean)
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-                    tmp_file.write(image_bytes)
-                    filepath = tmp_file.name
-            else:
-                if not file or file.filename == '':
-                    return {'success': False, 'error': '未选择文件'}, 400
-                if not allowed_file(file.filename):
-                    return {'success': False, 'error': '无效的文件类型'}, 400
-                filepath = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
+            # 解析图像输入（只解码一次，不落盘）
+            try:
+                source = load_image_input(file, image_data, image)
+            except ImageInputError as e:
+                return {'success': False, 'error': str(e)}, 400
 
             # 加载模型
-            if not self.load_model(model_name):
+            model, model_name = self.load_model(model_name)
+            if model is None:
                 return {
                     'success': False,
                     'error': f'无法加载YOLO分割模型: {model_name}'
-                }
+                }, 500
 
-            # 读取图像
-            image = cv2.imread(filepath)
-            if image is None:
+            # 读取图像（共享的解码结果，只读使用）
+            try:
+                image = source.bgr
+            except ImageInputError:
                 return {
                     'success': False,
                     'error': '无法读取图像文件'
-                }
+                }, 400
 
-            # 如果提供了用户查询，验证内容匹配性
-            if user_query and user_query.strip():
-                content_match_result = self._validate_content_match(filepath, user_query)
-                if not content_match_result['is_match']:
-                    return {
-                        'success': False,
-                        'error': f'未检测到目标：{user_query}',
-                        'message': f'图像中检测到的对象与您查询的"{user_query}"不匹配。{content_match_result["message"]}',
-                        'suggestion': content_match_result.get('suggestion', '请检查图像内容或修改查询词汇。'),
-                        'detected_objects': content_match_result.get('detected_objects', []),
-                        'alternative_queries': content_match_result.get('alternative_queries', [])
-                    }, 200  # 改为200状态码，让前端正确处理内容不匹配
+            # 单次推理：有用户查询时按较低阈值推理，内容验证与分割结果共用同一次前向计算
+            has_query = bool(user_query and user_query.strip())
+            inference_confidence = min(confidence, self.VALIDATION_CONFIDENCE) if has_query else confidence
+            results = get_inference_scheduler().predict(model_name, model, image, inference_confidence)
 
-            # 进行分割
-            # 如果用户指定了查询对象，先进行内容匹配验证
-            if user_query and user_query.strip():
-                content_validation = self._validate_content_match(filepath, user_query.strip())
+            # 如果提供了用户查询，基于同一次推理结果验证内容匹配性
+            validation_pass = None
+            if has_query:
+                content_validation, validation_pass = self._validate_results(results, model.names, confidence, user_query.strip())
                 if not content_validation['is_match']:
                     return {
                         'success': False,
                         'error': f'未检测到目标：{user_query.strip()}',
-                        'message': content_validation['message'],
+                        'message': f'图像中检测到的对象与您查询的"{user_query.strip()}"不匹配。{content_validation["message"]}',
                         'suggestion': content_validation.get('suggestion', '请检查图像内容或修改查询词汇'),
                         'detected_objects': content_validation.get('detected_objects', []),
                         'alternative_queries': content_validation.get('alternative_queries', []),
                         'content_mismatch': True,
-                        'user_query': user_query.strip()
+                        'user_query': user_query.strip(),
+                        'validation_pass': validation_pass
                     }, 200  # 改为200状态码，让前端正确处理内容不匹配
 
-            results = self.current_model(image, conf=confidence)
-
             # 处理分割结果
             segmented_objects = []
             segment_images = []
+            deferred_cutouts = []
+            height, width = image.shape[:2]
 
             for result in results:
                 if result.masks is not None:
@@ -148,43 +113,59 @@ class YOLOSegmentationService:
                     classes = result.boxes.cls.cpu().numpy()
                     confidences = result.boxes.conf.cpu().numpy()
 
-                    height, width = image.shape[:2]
-
                     for i, (mask, box, cls, conf) in enumerate(zip(masks, boxes, classes, confidences)):
+                        # 低于用户置信度的实例仅用于内容验证，不参与分割输出
+                        if conf < confidence:
+                            continue
+
                         # 获取类别名称
-                        class_name = self.current_model.names[int(cls)]
+                        class_name = model.names[int(cls)]
 
                         # 如果有用户查询，只处理匹配的对象
-                        if user_query and user_query.strip():
+                        if has_query:
                             if not self._is_target_object(class_name, user_query):
                                 continue
 
-                        # 调整掩码大小到原图尺寸
-                        mask_resized = cv2.resize(mask, (width, height))
-                        mask_binary = (mask_resized > 0.5).astype(np.uint8) * 255
-
-                        # 使用精确轮廓分割
-                        segmented_image = self._create_precise_segment(image, mask_binary, box)
-
                         # 获取边界框
                         x1, y1, x2, y2 = box.astype(int)
 
                         # 裁剪分割区域（保持完整对象）
                         padding = 10
-                        x1_crop = max(0, x1 - padding)
-                        y1_crop = max(0, y1 - padding)
-                        x2_crop = min(width, x2 + padding)
-                        y2_crop = min(height, y2 + padding)
-
-                        cropped_segment = segmented_image[y1_crop:y2_crop, x1_crop:x2_crop]
-
-                        # 保存分割图像
-                        timestamp = int(time.time())
-                        seg_filename = f"yolo_segment_{class_name}_{i}_{timestamp}.png"
-                        seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
-                        cv2.imwrite(seg_filepath, cropped_segment)
-
-                        segment_images.append(seg_filepath)
+                        crop_box = (max(0, x1 - padding), max(0, y1 - padding),
+                                    min(width, x2 + padding), min(height, y2 + padding))
+                        if crop_box[2] <= crop_box[0] or crop_box[3] <= crop_box[1]:
+                            continue
+
+                        # 只把裁剪区域内的掩码放大到原图分辨率，后续处理都在该区域内进行
+                        mask_roi = self._upsample_mask_roi(mask, (height, width), crop_box)
+                        mask_binary = (mask_roi > 0.5).astype(np.uint8) * 255
+
+                        # 精确轮廓：掩码的最大外轮廓（转换为原图坐标），空掩码不作为分割结果
+                        contour = self._largest_contour(mask_binary)
+                        if contour is None:
+                            continue
+                        contour = contour + np.array(crop_box[:2], dtype=contour.dtype)
+
+                        if artifacts == ARTIFACTS_ALL:
+                            # 只在裁剪区域内合成，轮廓外填充白色背景
+                            cropped_segment = contour_cutout(image, contour, crop_box, feather=False)
+
+                            # 保存分割图像
+                            timestamp = int(time.time())
+                            seg_filename = f"yolo_segment_{class_name}_{i}_{timestamp}.png"
+                            seg_filepath = os.path.join(current_app.config['GENERATED_FOLDER'], seg_filename)
+                            with time_stage('disk_write', 'yolo'):
+                                cv2.imwrite(seg_filepath, cropped_segment)
+                            storage_manager.track(seg_filepath)
+
+                            segment_images.append(seg_filepath)
+                        else:
+                            seg_filepath = None
+                            deferred_cutouts.append({
+                                'contour': contour.reshape(-1, 2).tolist(),
+                                'crop_box': [int(v) for v in crop_box],
+                                'feather': False
+                            })
 
                         # 归一化坐标
                         ymin = y1 / height
@@ -192,7 +173,7 @@ class YOLOSegmentationService:
                         ymax = y2 / height
                         xmax = x2 / width
 
-                        segmented_objects.append({
+                        segment = {
                             'label': f'{class_name}_{i+1}',
                             'description': f'YOLO分割的{class_name}对象',
                             'confidence': float(conf),
@@ -201,16 +182,28 @@ class YOLOSegmentationService:
                             'method': f'YOLO {model_name}',
                             'class_id': int(cls),
                             'class_name': class_name
-                        })
+                        }
+                        if mask_format != MASK_FORMAT_NONE:
+                            segment['mask'] = encode_mask(mask_binary, mask_format, (height, width), crop_box[:2])
+                        segmented_objects.append(segment)
+
+            if deferred_cutouts:
+                result_id, urls = defer_contour_cutouts(source, deferred_cutouts)
+                for segment, url in zip(segmented_objects, urls):
+                    segment['result_id'] = result_id
+                    segment['segment_image_url'] = url
 
             if segmented_objects:
                 return {
                     'success': True,
-                    'original_image': filepath,
+                    'original_image': source.reference_path(),
                     'segmented_objects': segmented_objects,
                     'segment_images': segment_images,
                     'method': f'YOLO {model_name}',
-                    'total_objects': len(segmented_objects)
+                    'total_objects': len(segmented_objects),
+                    'validation_pass': validation_pass,
+                    'artifacts': artifacts,
+                    'mask_format': mask_format
                 }, 200
             else:
                 if user_query and user_query.strip():
@@ -232,152 +225,55 @@ class YOLOSegmentationService:
             print(f"YOLO 分割错误: {e}")
             return {'success': False, 'error': error_msg}, 500
 
-    def _create_precise_segment(self, image, mask_binary, box):
-        """创建精确的轮廓分割图像"""
-        # 找到掩码的轮廓
+    def _upsample_mask_roi(self, mask, image_shape, crop_box):
+        """
+        把模型输出的实例掩码只在裁剪区域内放大到原图分辨率
+
+        掩码与推理输入同尺寸（letterbox 缩放并补边），原图坐标先按缩放比例和补边映射到掩码坐标，
+        再对裁剪区域做双线性采样，结果与整幅掩码去补边后 resize 到原图再裁剪一致，
+        计算量只与裁剪区域大小有关
+
+        Args:
+            mask (numpy.ndarray): 模型输出的单个实例掩码
+            image_shape (tuple): 原图尺寸 (高, 宽)
+            crop_box (tuple): 原图坐标系下的裁剪区域 (x1, y1, x2, y2)
+
+        Returns:
+            numpy.ndarray: 裁剪区域大小的掩码概率图
+        """
+        mask_height, mask_width = mask.shape[:2]
+        height, width = image_shape
+        x1, y1, x2, y2 = crop_box
+
+        # letterbox 参数：等比缩放后居中，两侧补边（与 ultralytics scale_image 的取整方式一致）
+        gain = min(mask_height / height, mask_width / width)
+        pad_x = (mask_width - width * gain) / 2
+        pad_y = (mask_height - height * gain) / 2
+        left, top = int(round(pad_x - 0.1)), int(round(pad_y - 0.1))
+        right, bottom = mask_width - int(round(pad_x + 0.1)), mask_height - int(round(pad_y + 0.1))
+        scale_x = (right - left) / width
+        scale_y = (bottom - top) / height
+
+        # 输出像素 -> 掩码坐标（像素中心对齐，与 cv2.resize 的双线性插值一致）
+        transform = np.float32([
+            [scale_x, 0, left + (x1 + 0.5) * scale_x - 0.5],
+            [0, scale_y, top + (y1 + 0.5) * scale_y - 0.5]
+        ])
+        return cv2.warpAffine(
+            np.asarray(mask, dtype=np.float32), transform, (x2 - x1, y2 - y1),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE
+        )
+
+    def _largest_contour(self, mask_binary):
+        """掩码的最大外轮廓，掩码为空时返回None"""
         contours, _ = cv2.findContours(mask_binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
         if not contours:
-            # 如果没有找到轮廓，使用原始掩码
-            result = image.copy()
-            result[mask_binary == 0] = [255, 255, 255]
-            return result
-
-        # 找到最大的轮廓
-        largest_contour = max(contours, key=cv2.contourArea)
-
-        # 创建精确的轮廓掩码
-        precise_mask = np.zeros(mask_binary.shape, dtype=np.uint8)
-        cv2.fillPoly(precise_mask, [largest_contour], 255)
-
-        # 应用精确掩码到原图像
-        result = image.copy()
-        result[precise_mask == 0] = [255, 255, 255]  # 白色背景
-
-        return result
+            return None
+        return max(contours, key=cv2.contourArea)
 
     def _is_target_object(self, class_name, user_query):
-        """检查检测到的对象是否与用户查询匹配"""
-        # 使用与检测服务相同的同义词映射
-        synonym_map = self._get_synonym_map()
-
-        user_query_lower = user_query.lower().strip()
-        class_name_lower = class_name.lower()
-
-        # 直接匹配
-        if user_query_lower == class_name_lower:
-            return True
-
-        # 同义词匹配
-        for key, synonyms in synonym_map.items():
-            if key == class_name_lower and user_query_lower in synonyms:
-                return True
-            if user_query_lower == key and class_name_lower in synonyms:
-                return True
-
-        # 部分匹配（严格条件）
-        if len(user_query_lower) > 3:
-            if (user_query_lower in class_name_lower and len(user_query_lower) / len(class_name_lower) > 0.6) or \
-               (class_name_lower in user_query_lower and len(class_name_lower) / len(user_query_lower) > 0.6):
-                return True
-
-        return False
-
-    def _get_synonym_map(self):
-        """获取同义词映射表（与检测服务保持一致）"""
-        return {
-            # 动物类
-            'cat': ['kitten', 'feline', '猫', '小猫', 'kitty', '猫咪', '喵', '猫猫'],
-            'dog': ['puppy', 'canine', '狗', '小狗', 'doggy', '狗狗', '犬', '汪'],
-            'bird': ['飞鸟', '鸟类', 'avian', '鸟儿', '小鸟'],
-            'horse': ['马', 'equine', 'pony', '马匹', '小马'],
-            'cow': ['cattle', '牛', 'bull', '奶牛', '母牛'],
-            'sheep': ['羊', 'lamb', '绵羊', '小羊'],
-            'elephant': ['大象', '象'],
-            'bear': ['熊', '狗熊', '黑熊', '棕熊'],
-            'zebra': ['斑马'],
-            'giraffe': ['长颈鹿'],
-            'lion': ['狮子', '雄狮', '母狮'],
-            'tiger': ['老虎', '虎'],
-            'monkey': ['猴子', '猴'],
-            'rabbit': ['兔子', '小兔', '兔'],
-
-            # 交通工具
-            'car': ['automobile', 'vehicle', '汽车', '车辆', '轿车', '小车'],
-            'truck': ['lorry', '卡车', '货车', '大车'],
-            'bus': ['coach', '公交车', '巴士', '客车'],
-            'motorcycle': ['motorbike', '摩托车', '机车', '摩托'],
-            'bicycle': ['bike', '自行车', '单车', '脚踏车'],
-            'train': ['火车', 'locomotive', '列车'],
-            'airplane': ['plane', '飞机', 'aircraft', '客机'],
-            'boat': ['ship', '船', '轮船', '小船'],
-
-            # 人物
-            'person': ['people', 'human', '人', '人类', 'man', 'woman', 'individual', '人物'],
-            'child': ['kid', '孩子', '儿童', '小孩'],
-            'baby': ['infant', '婴儿', '宝宝', '小宝宝'],
-
-            # 物品
-            'phone': ['mobile', 'cellphone', '手机', '电话', 'smartphone', '移动电话'],
-            'laptop': ['computer', '笔记本', '电脑', 'notebook', '笔记本电脑'],
-            'book': ['书', '书籍', '图书'],
-            'bottle': ['瓶子', 'container', '水瓶'],
-            'cup': ['mug', '杯子', '茶杯', '水杯'],
-            'clock': ['时钟', '钟表', 'watch', '手表'],
-            'tv': ['television', '电视', 'monitor', '电视机'],
-            'remote': ['遥控器', 'controller', '遥控'],
-
-            # 食物
-            'apple': ['苹果'],
-            'banana': ['香蕉'],
-            'orange': ['橙子', '橘子', '桔子'],
-            'pizza': ['比萨', '披萨'],
-            'cake': ['蛋糕'],
-            'sandwich': ['三明治'],
-            'donut': ['甜甜圈', '油炸圈饼'],
-
-            # 家具
-            'chair': ['椅子', '座椅'],
-            'couch': ['sofa', '沙发'],
-            'bed': ['床', '床铺'],
-            'dining table': ['table', '桌子', '餐桌', '饭桌'],
-            'toilet': ['厕所', '马桶', '卫生间'],
-
-            # 运动用品
-            'sports ball': ['ball', '球', '运动球'],
-            'tennis racket': ['tennis', '网球拍', '球拍'],
-            'baseball bat': ['棒球棒', '球棒'],
-            'baseball glove': ['棒球手套', '手套'],
-            'skateboard': ['滑板'],
-            'surfboard': ['冲浪板'],
-            'ski': ['滑雪板'],
-
-            # 厨房用品
-            'knife': ['刀', '小刀', '菜刀'],
-            'spoon': ['勺子', '汤匙', '勺'],
-            'fork': ['叉子', '餐叉'],
-            'bowl': ['碗', '饭碗'],
-            'wine glass': ['酒杯', '红酒杯', '玻璃杯'],
-            'refrigerator': ['冰箱', 'fridge'],
-            'microwave': ['微波炉'],
-            'oven': ['烤箱'],
-            'toaster': ['烤面包机'],
-
-            # 电子设备
-            'keyboard': ['键盘'],
-            'mouse': ['鼠标'],
-            'cell phone': ['phone', '手机', 'mobile', '移动电话'],
-
-            # 植物和自然
-            'flower': ['花', '花朵', '鲜花'],
-            'tree': ['树', '树木', '大树'],
-            'grass': ['草', '草地', '草坪'],
-
-            # 建筑和结构
-            'building': ['建筑', '房子', '楼房', '大楼'],
-            'house': ['房子', '住宅', '房屋'],
-            'bridge': ['桥', '大桥', '桥梁'],
-        }
+        """检查检测到的对象是否与用户查询匹配（与检测服务共用标签索引）"""
+        return label_index.matches(user_query, class_name)
 
     def get_available_models(self):
         """获取可用的YOLO分割模型列表"""
@@ -414,28 +310,9 @@ class YOLOSegmentationService:
         try:
             # 获取YOLO分割结果
             yolo_result = self.segment_image_yolo(
-                file=None,
-                image_data=None,
                 model_name=yolo_model,
-                confidence=confidence
-            )
-
-            # 需要传入图像路径，所以创建一个临时文件对象
-            class TempFile:
-                def __init__(self, path):
-                    self.filename = os.path.basename(path)
-                    self._path = path
-
-                def save(self, path):
-                    import shutil
-                    shutil.copy2(self._path, path)
-                    return path
-
-            temp_file = TempFile(image_path)
-            yolo_result = self.segment_image_yolo(
-                file=temp_file,
-                model_name=yolo_model,
-                confidence=confidence
+                confidence=confidence,
+                image=ImageInput.from_path(image_path)
             )
 
             # 构建对比结果
@@ -460,40 +337,38 @@ class YOLOSegmentationService:
                 'error': f'YOLO分割对比失败: {str(e)}'
             }
 
-    def _validate_content_match(self, image_path, user_query):
-        """验证用户查询内容与图像内容的匹配性"""
+    def _validate_results(self, results, names, confidence, user_query):
+        """
+        基于同一次推理的结果做两级阈值的内容验证
+
+        先用分割输出所用的置信度阈值匹配（primary），不匹配时再用较低的验证阈值匹配（low_confidence）
+
+        Returns:
+            tuple: (验证结果, 产生判定结果的阈值档位)
+        """
+        detected_objects = []
+        for result in results:
+            if result.boxes is not None:
+                classes = result.boxes.cls.cpu().numpy()
+                confidences = result.boxes.conf.cpu().numpy()
+
+                for cls, conf in zip(classes, confidences):
+                    detected_objects.append({
+                        'class_name': names[int(cls)],
+                        'confidence': float(conf)
+                    })
+
+        primary_objects = [obj for obj in detected_objects if obj['confidence'] >= confidence]
+        primary_result = self._match_detections(primary_objects, user_query)
+        if primary_result['is_match']:
+            return primary_result, 'primary'
+
+        low_objects = [obj for obj in detected_objects if obj['confidence'] >= self.VALIDATION_CONFIDENCE]
+        return self._match_detections(low_objects, user_query), 'low_confidence'
+
+    def _match_detections(self, detected_objects, user_query):
+        """检查检测结果是否与用户查询匹配"""
         try:
-            # 首先进行快速检测，获取图像中的对象
-            if not self.load_model('yolo11n-seg'):  # 使用最快的模型进行检测
-                return {
-                    'is_match': True,  # 如果无法加载模型，允许继续
-                    'message': '无法验证内容匹配性，将继续处理'
-                }
-
-            # 读取图像
-            image = cv2.imread(image_path)
-            if image is None:
-                return {
-                    'is_match': True,
-                    'message': '无法读取图像，将继续处理'
-                }
-
-            # 进行快速检测
-            results = self.current_model(image, conf=0.3)  # 使用较低的置信度进行检测
-
-            detected_objects = []
-            for result in results:
-                if result.boxes is not None:
-                    classes = result.boxes.cls.cpu().numpy()
-                    confidences = result.boxes.conf.cpu().numpy()
-
-                    for cls, conf in zip(classes, confidences):
-                        class_name = self.current_model.names[int(cls)]
-                        detected_objects.append({
-                            'class_name': class_name,
-                            'confidence': float(conf)
-                        })
-
             if not detected_objects:
                 return {
                     'is_match': False,
@@ -502,61 +377,10 @@ class YOLOSegmentationService:
                     'detected_objects': []
                 }
 
-            # 分析用户查询与检测到的对象的匹配性
-            user_query_lower = user_query.lower()
-            detected_classes = [obj['class_name'].lower() for obj in detected_objects]
-
-            # 创建类别映射（英文到中文，以及常见的同义词）
-            class_mapping = {
-                'person': ['人', '人物', '人类', '男人', '女人', '小孩', '儿童'],
-                'dog': ['狗', '小狗', '犬', '宠物狗'],
-                'cat': ['猫', '小猫', '猫咪', '宠物猫'],
-                'car': ['汽车', '车', '轿车', '小车'],
-                'truck': ['卡车', '货车', '大车'],
-                'bird': ['鸟', '小鸟', '鸟类'],
-                'horse': ['马', '马匹'],
-                'cow': ['牛', '奶牛', '母牛'],
-                'sheep': ['羊', '绵羊'],
-                'bicycle': ['自行车', '单车', '脚踏车'],
-                'motorcycle': ['摩托车', '机车'],
-                'airplane': ['飞机', '客机'],
-                'boat': ['船', '小船', '船只'],
-                'bottle': ['瓶子', '水瓶'],
-                'chair': ['椅子', '座椅'],
-                'table': ['桌子', '餐桌'],
-                'laptop': ['笔记本电脑', '电脑'],
-                'phone': ['手机', '电话'],
-                'book': ['书', '书本'],
-                'clock': ['时钟', '钟表'],
-                'flower': ['花', '花朵'],
-                'tree': ['树', '树木'],
-                'building': ['建筑', '房子', '楼房']
-            }
-
-            # 检查是否匹配
-            is_match = False
-            matched_objects = []
-
-            # 直接匹配检测到的类别
-            for detected_class in detected_classes:
-                if detected_class in user_query_lower or user_query_lower in detected_class:
-                    is_match = True
-                    matched_objects.append(detected_class)
-
-            # 通过映射检查匹配
-            if not is_match:
-                for english_class, chinese_variants in class_mapping.items():
-                    if english_class in detected_classes:
-                        for chinese_variant in chinese_variants:
-                            if chinese_variant in user_query_lower:
-                                is_match = True
-                                matched_objects.append(english_class)
-                                break
-
-                    # 反向检查：用户输入英文，图像中有对应对象
-                    if english_class in user_query_lower and english_class in detected_classes:
-                        is_match = True
-                        matched_objects.append(english_class)
+            # 通过共享的标签索引匹配（中英文同义词、上位词），同一类别只列出一次
+            matched_objects = list(dict.fromkeys(
+                label_index.select(user_query, [obj['class_name'] for obj in detected_objects])))
+            is_match = len(matched_objects) > 0
 
             if is_match:
                 return {
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+异步（ASGI模式）工具
+- run_blocking：在进程内共享的有界线程池中执行阻塞的CPU密集型工作（渲染、OpenCV/YOLO），
+  保留当前的应用和请求上下文，事件循环在等待期间继续处理其他请求
+- AsyncRouter：异步视图的路由表，ASGI模式下匹配的请求直接在事件循环中处理
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_blocking_executor():
+    """获取进程内共享的有界线程池，首次使用时按配置创建"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = current_app.config.get('ASGI_EXECUTOR_WORKERS', 8)
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asgi-blocking')
+        return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """在线程池中执行阻塞调用并等待结果（线程中可以继续使用 current_app 和 request）"""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_blocking_executor(), call)
+
+
+class AsyncRouter:
+    """异步视图的路由表，用法与蓝图的 route 装饰器相同"""
+
+    def __init__(self, url_prefix=''):
+        self.url_prefix = url_prefix
+        self._map = Map()
+        self._views = {}
+
+    def route(self, rule, methods=('GET',)):
+        def decorator(view):
+            endpoint = f'{view.__module__}.{view.__name__}'
+            self._map.add(Rule(self.url_prefix + rule, endpoint=endpoint, methods=list(methods)))
+            self._views[endpoint] = view
+            return view
+        return decorator
+
+    def match(self, path, method):
+        """
+        Returns:
+            tuple: (异步视图, URL参数)，未匹配（或方法不匹配）时为 (None, None)
+        """
+        try:
+            endpoint, values = self._map.bind('').match(path, method=method)
+        except HTTPException:
+            return None, None
+        return self._views[endpoint], values
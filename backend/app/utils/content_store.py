@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+内容寻址文件存储
+文件按内容的sha256命名并分片存放（<目录>/ab/cd/<sha256>.<扩展名>），
+相同内容只写一次；写入先落到同目录的临时文件再原子重命名，并发写入同一内容时读者不会看到半个文件
+"""
+
+import hashlib
+import os
+import tempfile
+from .metrics import time_stage
+
+
+def content_path(folder, digest, extension):
+    """内容哈希对应的分片存储路径"""
+    return os.path.join(folder, digest[:2], digest[2:4], f'{digest}.{extension}')
+
+
+def store_content(folder, data, extension, digest=None):
+    """
+    按内容哈希保存字节
+
+    Args:
+        folder (str): 存储根目录
+        data (bytes): 文件内容
+        extension (str): 扩展名（不含点）
+        digest (str): 已计算好的sha256（可选）
+
+    Returns:
+        tuple: (文件路径, 是否新写入)，内容已存在时不再写入
+    """
+    digest = digest or hashlib.sha256(data).hexdigest()
+    path = content_path(folder, digest, extension)
+    if os.path.exists(path):
+        return path, False
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{digest[:16]}.', suffix='.tmp')
+    try:
+        with time_stage('disk_write', 'content'), os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return path, True
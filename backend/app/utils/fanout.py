@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+并行扇出工具
+对比类接口把多个后端（Gemini / OpenCV / YOLO）提交到进程内共享的有界线程池并行执行，
+每一路独立超时（从开始执行时计时），并返回每一路的排队时间、耗时与状态
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+
+
+LEG_OK = 'ok'
+LEG_TIMEOUT = 'timeout'
+LEG_ERROR = 'error'
+LEG_BUSY = 'busy'  # 线程池繁忙，排队超时未开始执行
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+class _SlotPool:
+    """
+    线程池名额：一个请求的各路调用一次性全部获得名额后才提交，
+    提交后立即开始执行，不会排在其他请求的调用后面而被计入超时
+    """
+
+    def __init__(self, size):
+        self.size = max(1, size)
+        self.available = self.size
+        self._condition = threading.Condition()
+
+    def acquire(self, count, timeout=None):
+        """
+        获取 count 个名额（超过总数时按总数），超时返回0
+
+        Returns:
+            int: 获得的名额数
+        """
+        count = min(count, self.size)
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        with self._condition:
+            while self.available < count:
+                remaining = deadline - time.perf_counter() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return 0
+                self._condition.wait(remaining)
+            self.available -= count
+        return count
+
+    def release(self, count=1):
+        with self._condition:
+            self.available = min(self.size, self.available + count)
+            self._condition.notify_all()
+
+
+def get_fanout_executor():
+    """获取进程内共享的有界线程池，首次使用时按配置创建"""
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            max_workers = current_app.config.get('FANOUT_MAX_WORKERS', 8)
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fanout')
+            _slots = _SlotPool(max_workers)
+        return _executor
+
+
+class Leg:
+    """扇出的一路调用"""
+
+    def __init__(self, name, func, timeout, *args, **kwargs):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.args = args
+        self.kwargs = kwargs
+        self.started = threading.Event()
+        self.started_at = None
+        self.duration = None
+
+
+def run_legs(legs):
+    """
+    并行执行多路调用
+
+    各路调用的超时从开始执行时计时；等待线程池名额的时间单独报告（queue_wait_ms），
+    超过 FANOUT_QUEUE_TIMEOUT 仍未获得名额时不执行，状态为 busy（已提交但仍在排队的调用会被取消）。
+    已开始执行的调用超时后无法被强制中断，会在后台继续运行直到结束并一直占用名额，但其结果会被丢弃
+
+    Args:
+        legs (list[Leg]): 要执行的调用
+
+    Returns:
+        tuple: (各路返回值 {name: value}, 各路执行报告 {name: {...}})
+               超时、出错或未执行的调用返回值为None
+    """
+    app = current_app._get_current_object()
+    executor = get_fanout_executor()
+    slots = _slots
+
+    def run_in_context(leg):
+        leg.started_at = time.perf_counter()
+        leg.started.set()
+        try:
+            # 线程池中没有应用上下文，各服务依赖 current_app 读取配置
+            with app.app_context():
+                return leg.func(*leg.args, **leg.kwargs)
+        finally:
+            leg.duration = time.perf_counter() - leg.started_at
+            slots.release()
+
+    queue_timeout = app.config.get('FANOUT_QUEUE_TIMEOUT', 30)
+    queued_at = time.perf_counter()
+    acquired = slots.acquire(len(legs), queue_timeout)
+    queue_wait = time.perf_counter() - queued_at
+    if not acquired:
+        values = {leg.name: None for leg in legs}
+        report = {leg.name: {
+            'status': LEG_BUSY,
+            'duration_ms': 0.0,
+            'queue_wait_ms': round(queue_wait * 1000, 2),
+            'timeout': leg.timeout,
+            'error': f'等待空闲线程超过 {queue_timeout} 秒，未执行'
+        } for leg in legs}
+        return values, report
+
+    # 调用数超过线程池大小时，多出的调用各自等待名额，排队超时的不再提交
+    futures = [(leg, executor.submit(run_in_context, leg)) for leg in legs[:acquired]]
+    for leg in legs[acquired:]:
+        remaining = max(0.0, queue_timeout - (time.perf_counter() - queued_at))
+        futures.append((leg, executor.submit(run_in_context, leg) if slots.acquire(1, remaining) else None))
+
+    values = {}
+    report = {}
+    for leg, future in futures:
+        values[leg.name] = None
+        status, error = LEG_OK, None
+        # 已获得名额的调用通常立即开始执行；仍在排队的调用超时后取消，不再占用线程池
+        if future is None or (not leg.started.wait(queue_timeout) and future.cancel()):
+            if future is not None:
+                slots.release()
+            status, error = LEG_BUSY, f'等待空闲线程超过 {queue_timeout} 秒，未执行'
+        else:
+            leg.started.wait()
+            remaining = max(0.0, leg.timeout - (time.perf_counter() - leg.started_at)) if leg.timeout else None
+            try:
+                values[leg.name] = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                status, error = LEG_TIMEOUT, f'超过 {leg.timeout} 秒未完成'
+            except Exception as e:
+                status, error = LEG_ERROR, str(e)
+
+        # 已完成的调用记录自身执行耗时，超时的调用记录开始执行后的等待时长
+        duration = leg.duration if future is not None and future.done() else None
+        if duration is None:
+            duration = time.perf_counter() - leg.started_at if leg.started_at is not None else 0.0
+        entry = {
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'queue_wait_ms': round(((leg.started_at or queued_at) - queued_at) * 1000, 2),
+            'timeout': leg.timeout
+        }
+        if error:
+            entry['error'] = error
+        report[leg.name] = entry
+
+    return values, report
+
+
+def failed_leg_result(label, leg_report):
+    """超时或出错的一路调用在响应中对应的结果"""
+    if leg_report['status'] == LEG_TIMEOUT:
+        return {
+            'success': False,
+            'error': f'{label} 处理超时（{leg_report["timeout"]}秒）',
+            'timed_out': True
+        }
+    if leg_report['status'] == LEG_BUSY:
+        return {
+            'success': False,
+            'error': f'{label} 未执行：服务繁忙，请稍后重试',
+            'busy': True
+        }
+    return {
+        'success': False,
+        'error': f'{label} 处理失败: {leg_report.get("error", "未知错误")}'
+    }
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+图像输入模块
+请求中的图像（base64 或上传文件）只解码一次，得到内存中的 ImageInput 对象，
+各服务按需使用其惰性计算的视图（原始字节、BGR数组、PIL图像、内容哈希、MIME类型），
+只有需要持久化时才写入磁盘
+"""
+
+import base64
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .content_store import store_content
+
+
+# 按文件头识别的图像格式
+_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png', 'png'),
+    (b'\xff\xd8\xff', 'image/jpeg', 'jpg'),
+    (b'GIF87a', 'image/gif', 'gif'),
+    (b'GIF89a', 'image/gif', 'gif'),
+    (b'BM', 'image/bmp', 'bmp'),
+]
+
+
+class ImageInputError(ValueError):
+    """图像输入无效（未选择文件、类型不允许、内容为空等）"""
+
+
+class ImageInput:
+    """内存中的请求图像，所有视图首次访问时计算并缓存，可在多个线程间共享"""
+
+    def __init__(self, data=None, path=None, filename=None):
+        if data is None and path is None:
+            raise ImageInputError('未提供图像数据')
+        self._data = data
+        self.path = path
+        self.filename = filename or (os.path.basename(path) if path else None)
+        # 可重入：解码视图时会在持锁状态下惰性读取原始字节
+        self._lock = threading.RLock()
+        self._bgr = None
+        self._pil = None
+        self._rgb = None
+        self._sha256 = None
+
+    @classmethod
+    def from_base64(cls, image_data, filename=None):
+        """从base64字符串（可带 data:image/...;base64, 前缀）创建"""
+        image_data_clean = image_data.split(',')[1] if ',' in image_data else image_data
+        data = base64.b64decode(image_data_clean)
+        if not data:
+            raise ImageInputError('图像数据为空')
+        return cls(data=data, filename=filename)
+
+    @classmethod
+    def from_upload(cls, file):
+        """从上传的文件对象创建，只读取到内存不落盘"""
+        data = file.read()
+        if not data:
+            raise ImageInputError('上传的文件为空')
+        return cls(data=data, filename=file.filename)
+
+    @classmethod
+    def from_path(cls, path):
+        """从已存在的文件创建，字节在首次使用时读取"""
+        if not os.path.exists(path):
+            raise ImageInputError(f'图像文件不存在: {path}')
+        return cls(path=path)
+
+    @property
+    def data(self):
+        """原始字节"""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    with open(self.path, 'rb') as f:
+                        self._data = f.read()
+        return self._data
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def dimensions(self):
+        """图像尺寸 (宽, 高)：已解码时直接读取，否则只解析文件头，不解码像素"""
+        if self._bgr is not None:
+            return self._bgr.shape[1], self._bgr.shape[0]
+        if self._pil is not None:
+            return self._pil.size
+        with Image.open(BytesIO(self.data)) as image:
+            return image.size
+
+    @property
+    def sha256(self):
+        """内容哈希"""
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    @property
+    def mime_type(self):
+        """按文件头识别的MIME类型，无法识别时按文件扩展名，最后回退为jpeg"""
+        head = self.data[:12]
+        for signature, mime_type, _ in _SIGNATURES:
+            if head.startswith(signature):
+                return mime_type
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'image/webp'
+        if self.filename and '.' in self.filename:
+            ext = self.filename.rsplit('.', 1)[1].lower()
+            return f"image/{'jpeg' if ext == 'jpg' else ext}"
+        return 'image/jpeg'
+
+    @property
+    def extension(self):
+        return self.mime_type.split('/')[1].replace('jpeg', 'jpg')
+
+    @property
+    def name(self):
+        """用于派生输出文件名的稳定名称：原文件名，没有时使用内容哈希"""
+        if self.filename:
+            return os.path.basename(self.filename)
+        return f'{self.sha256[:16]}.{self.extension}'
+
+    @property
+    def bgr(self):
+        """OpenCV BGR数组（只读共享，需要修改时请使用 read_bgr_image 获取副本）"""
+        if self._bgr is None:
+            with self._lock:
+                if self._bgr is None:
+                    self._bgr = self._decode_bgr()
+        return self._bgr
+
+    @property
+    def pil(self):
+        """PIL图像（只读共享，需要修改时请使用 open_pil_image 获取副本）"""
+        if self._pil is None:
+            with self._lock:
+                if self._pil is None:
+                    image = Image.open(BytesIO(self.data))
+                    image.load()
+                    self._pil = image
+        return self._pil
+
+    @property
+    def rgb(self):
+        """
+        用于绘制的RGB模式PIL图像（只读共享）
+
+        优先复用已解码的BGR数组，避免为绘制再解码一次；否则由PIL图像转换，透明通道合成到白色背景
+        """
+        if self._rgb is None:
+            if self._bgr is not None and self._pil is None:
+                rgb = Image.fromarray(cv2.cvtColor(self._bgr, cv2.COLOR_BGR2RGB))
+            else:
+                rgb = flatten_to_rgb(self.pil)
+            with self._lock:
+                if self._rgb is None:
+                    self._rgb = rgb
+        return self._rgb
+
+    def release(self):
+        """释放已解码的视图（保留原始字节），批量处理时处理完一批即可释放该批的像素数据"""
+        with self._lock:
+            self._bgr = None
+            self._pil = None
+            self._rgb = None
+
+    def ensure_saved(self, folder=None):
+        """
+        确保图像存在于磁盘上并返回路径
+
+        已有路径时直接返回；否则按内容哈希分片存入目标目录（默认上传目录），相同内容只写一次
+        """
+        from ..services.storage_manager import storage_manager
+
+        if self.path and os.path.exists(self.path):
+            storage_manager.touch(self.path)
+            return self.path
+        if folder is None:
+            from flask import current_app
+            folder = current_app.config['UPLOAD_FOLDER']
+        path, created = store_content(folder, self.data, self.extension, self.sha256)
+        if created:
+            storage_manager.track(path)
+        else:
+            storage_manager.touch(path)
+        self.path = path
+        return path
+
+    def reference_path(self):
+        """响应中引用的原图路径：配置保留上传图像时落盘，否则只返回已有的路径（可能为None）"""
+        from flask import current_app
+        if current_app.config.get('PERSIST_UPLOADS', False):
+            return self.ensure_saved()
+        return self.path
+
+    def _decode_bgr(self):
+        """解码为BGR数组：优先cv2.imdecode，失败时使用PIL转换"""
+        data = self.data
+        if len(data) < 100:  # 小于100字节的图像文件通常是无效的
+            raise ImageInputError(f'图像文件过小，可能已损坏（文件大小: {len(data)} 字节）')
+
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None or image.size == 0:
+            try:
+                pil_image = self.pil
+                if pil_image.size[0] == 0 or pil_image.size[1] == 0:
+                    raise ValueError('图像尺寸无效')
+                image = cv2.cvtColor(np.array(pil_image.convert('RGB')), cv2.COLOR_RGB2BGR)
+            except Exception as e:
+                raise ImageInputError(f'无法读取图像。文件可能已损坏或格式不支持。文件大小: {len(data)} 字节（{e}）')
+
+        if image.shape[0] == 0 or image.shape[1] == 0:
+            raise ImageInputError(f'图像尺寸无效: {image.shape}')
+        return image
+
+
+def load_image_input(file=None, image_data=None, image=None):
+    """
+    将服务的输入参数统一为 ImageInput
+
+    Args:
+        file: 上传的文件对象，或带 filepath 属性的共享文件对象
+        image_data (str): base64图像数据
+        image (ImageInput): 已解码的图像（对比接口在多个服务之间共享）
+
+    Returns:
+        ImageInput
+
+    Raises:
+        ImageInputError: 输入无效
+    """
+    from .helpers import allowed_file
+
+    if image is not None:
+        return image
+    if image_data:
+        return ImageInput.from_base64(image_data)
+    if not file or file.filename == '':
+        raise ImageInputError('未选择文件')
+    if not allowed_file(file.filename):
+        raise ImageInputError('无效的文件类型')
+    if hasattr(file, 'filepath') and os.path.exists(file.filepath):
+        return ImageInput.from_path(file.filepath)
+    return ImageInput.from_upload(file)
+
+
+def flatten_to_rgb(image):
+    """转换为RGB模式：带透明通道的图像合成到白色背景上"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def open_pil_image(source):
+    """获取可修改的PIL图像：source 可以是文件路径、ImageInput 或 PIL图像"""
+    if isinstance(source, ImageInput):
+        return source.pil.copy()
+    if isinstance(source, Image.Image):
+        return source.copy()
+    return Image.open(source)
+
+
+def read_bgr_image(source):
+    """获取可修改的BGR数组：source 可以是文件路径、ImageInput 或数组，读取失败返回None"""
+    if isinstance(source, ImageInput):
+        try:
+            return source.bgr.copy()
+        except ImageInputError:
+            return None
+    if isinstance(source, np.ndarray):
+        return source.copy()
+    return cv2.imread(source)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+标签匹配索引
+用户查询（中文/英文、同义词、上位词如“动物”“交通工具”）到 COCO 类别ID的映射，
+导入时从 app/data/coco_labels.json 构建一次，所有内容验证共用：
+- 完整词条通过字典 O(1) 查找
+- 查询中包含的词条通过字典树一次扫描找出（最长匹配优先，英文词条要求单词边界）
+"""
+
+import functools
+import json
+import os
+import re
+
+
+LABELS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'coco_labels.json')
+
+# 字典树中标记词条结束的键
+_END = ''
+
+# 英文词条后允许出现的复数后缀
+_PLURAL_SUFFIXES = ('es', 's')
+
+# 部分匹配：较长的词互相包含且长度占比超过该值时视为匹配（如 teddy bear / teddy bears）
+PARTIAL_MIN_LENGTH = 4
+PARTIAL_MIN_RATIO = 0.6
+
+
+def _is_word_char(char):
+    return char.isascii() and char.isalnum()
+
+
+def normalize(text):
+    """统一大小写和空白"""
+    return re.sub(r'\s+', ' ', (text or '').strip().lower())
+
+
+class LabelIndex:
+    """只读的标签匹配索引，构建后可在多个线程间共享"""
+
+    def __init__(self, classes, groups=()):
+        """
+        Args:
+            classes (list[dict]): 每个类别的 id、name（模型输出的类别名）和 terms（同义词）
+            groups (list[dict]): 上位词分组，每组的 name、terms 和包含的类别ID列表 classes
+        """
+        self.names = {int(item['id']): item['name'] for item in classes}
+        self._ids_by_name = {normalize(name): class_id for class_id, name in self.names.items()}
+
+        terms = {}
+        for item in classes:
+            for term in [item['name']] + list(item.get('terms', [])):
+                terms.setdefault(normalize(term), set()).add(int(item['id']))
+        for group in groups:
+            for term in group.get('terms', []):
+                terms.setdefault(normalize(term), set()).update(int(i) for i in group['classes'])
+        self._terms = {term: frozenset(ids) for term, ids in terms.items() if term}
+
+        self._trie = {}
+        for term in self._terms:
+            node = self._trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[_END] = term
+
+        # 同一查询通常会与多个检测结果逐一比较，解析结果按查询缓存
+        self.resolve = functools.lru_cache(maxsize=1024)(self._resolve)
+
+    @classmethod
+    def from_file(cls, path=LABELS_PATH):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['classes'], data.get('groups', []))
+
+    def lookup(self, term):
+        """完整词条对应的类别ID集合，未知词条返回空集合"""
+        return self._terms.get(normalize(term), frozenset())
+
+    def class_id(self, class_name):
+        """模型输出的类别名对应的类别ID，不在索引中时返回None"""
+        return self._ids_by_name.get(normalize(class_name))
+
+    def scan(self, text):
+        """
+        找出文本中包含的所有词条
+
+        从左到右取最长匹配，匹配到的部分不再参与后续匹配（如“热狗”不会再匹配出“狗”）；
+        英文词条必须是完整单词（允许复数后缀），避免 cat 匹配到 category
+
+        Returns:
+            list[str]: 按出现顺序排列的词条
+        """
+        text = normalize(text)
+        found = []
+        position = 0
+        while position < len(text):
+            match = self._longest_match(text, position)
+            if match is None:
+                position += 1
+                continue
+            term, end = match
+            found.append(term)
+            position = end
+        return found
+
+    def _longest_match(self, text, start):
+        """从 start 开始的最长词条，返回 (词条, 结束位置)"""
+        if start > 0 and _is_word_char(text[start]) and _is_word_char(text[start - 1]):
+            return None
+
+        best = None
+        node = self._trie
+        for position in range(start, len(text)):
+            node = node.get(text[position])
+            if node is None:
+                break
+            term = node.get(_END)
+            if term is None:
+                continue
+            end = self._word_end(text, position + 1) if _is_word_char(term[-1]) else position + 1
+            if end is not None:
+                best = (term, end)
+        return best
+
+    def _word_end(self, text, end):
+        """英文词条在 end 处结束时的单词结束位置（含复数后缀），不在单词边界上时返回None"""
+        if end >= len(text) or not _is_word_char(text[end]):
+            return end
+        for suffix in _PLURAL_SUFFIXES:
+            tail = end + len(suffix)
+            if text.startswith(suffix, end) and (tail >= len(text) or not _is_word_char(text[tail])):
+                return tail
+        return None
+
+    def _resolve(self, query):
+        query = normalize(query)
+        ids = set(self.lookup(query))
+        for term in self.scan(query):
+            ids.update(self._terms[term])
+        return frozenset(ids)
+
+    def matches(self, query, class_name):
+        """检测到的类别是否与查询匹配：查询中的词条指向该类别，或较长的词互相包含"""
+        class_id = self.class_id(class_name)
+        if class_id is not None and class_id in self.resolve(normalize(query)):
+            return True
+        return self._partial_match(normalize(query), normalize(class_name))
+
+    def select(self, query, class_names):
+        """按原顺序返回与查询匹配的类别名（重复的检测结果会重复出现）"""
+        return [name for name in class_names if self.matches(query, name)]
+
+    def suggest(self, query):
+        """查询是同义词而非类别名时，返回建议使用的类别名列表"""
+        query = normalize(query)
+        if query in self._ids_by_name:
+            return []
+        return [self.names[class_id] for class_id in sorted(self.resolve(query))]
+
+    @staticmethod
+    def _partial_match(query, class_name):
+        for word in {query, *query.split()}:
+            if len(word) < PARTIAL_MIN_LENGTH:
+                continue
+            if word in class_name and len(word) / len(class_name) > PARTIAL_MIN_RATIO:
+                return True
+            if class_name in word and len(class_name) / len(word) > PARTIAL_MIN_RATIO:
+                return True
+        return False
+
+
+# 进程级共享索引，导入时构建
+label_index = LabelIndex.from_file()
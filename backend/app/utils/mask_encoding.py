@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+掩码编码模块
+将二值掩码编码为可直接放入JSON响应的紧凑格式：
+- rle: COCO 格式的游程编码（按列优先展开，counts 为 COCO 压缩字符串），可直接用 pycocotools 解码
+- polygon: 简化后的外轮廓多边形，每个多边形为 [x1, y1, x2, y2, ...] 像素坐标
+"""
+
+import cv2
+import numpy as np
+
+
+MASK_FORMAT_NONE = 'none'
+MASK_FORMAT_RLE = 'rle'
+MASK_FORMAT_POLYGON = 'polygon'
+MASK_FORMATS = (MASK_FORMAT_NONE, MASK_FORMAT_RLE, MASK_FORMAT_POLYGON)
+
+
+def parse_mask_format(value):
+    """解析请求中的 mask_format 参数，未提供或无效时返回 none（不返回掩码）"""
+    value = (value or '').strip().lower()
+    return value if value in MASK_FORMATS else MASK_FORMAT_NONE
+
+
+def rle_counts_to_string(counts):
+    """游程计数编码为 COCO 压缩字符串（与 pycocotools rleToString 一致）"""
+    chars = []
+    for i, count in enumerate(counts):
+        x = count - counts[i - 2] if i > 2 else count
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return ''.join(chars)
+
+
+def encode_rle(mask, size=None, offset=(0, 0)):
+    """
+    COCO 游程编码
+
+    局部掩码不会放回完整尺寸的画布：只在局部区域内查找前景/背景的变化位置，再换算为完整图像中的位置，
+    计算量与局部区域大小成正比
+
+    Args:
+        mask (numpy.ndarray): 二值掩码（非零为前景），可以只是图像的局部区域
+        size (tuple): 完整图像尺寸 (高, 宽)，默认与掩码相同
+        offset (tuple): 局部掩码在完整图像中的左上角 (x, y)
+
+    Returns:
+        dict: {'size': [高, 宽], 'counts': 压缩字符串}
+    """
+    mask = np.asarray(mask) > 0
+    height, width = size if size is not None else mask.shape
+    x, y = offset
+    mask = mask[:max(0, height - y), :max(0, width - x)]
+    rows = mask.shape[0]
+
+    # 每列上下各补一行背景，列与列之间的变化与完整图像中一致
+    padded = np.zeros((rows + 2, mask.shape[1]), dtype=bool)
+    padded[1:-1] = mask
+    flat = padded.ravel(order='F')
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    column, row = np.divmod(changes, rows + 2)
+    positions = (x + column) * height + y + row - 1
+
+    # 局部区域贴着图像上下边缘时，相邻两列的补行会在同一位置产生一对相互抵消的变化
+    positions, repeats = np.unique(positions, return_counts=True)
+    positions = positions[(repeats % 2 == 1) & (positions < height * width)]
+
+    counts = np.diff(np.concatenate(([0], positions, [height * width]))).tolist()
+    return {'size': [int(height), int(width)], 'counts': rle_counts_to_string(counts)}
+
+
+def mask_to_polygons(mask, offset=(0, 0), tolerance=1.0, min_area=4.0):
+    """
+    提取掩码的外轮廓并简化为多边形
+
+    Args:
+        mask (numpy.ndarray): 二值掩码（非零为前景），可以只是图像的局部区域
+        offset (tuple): 局部掩码在完整图像中的左上角 (x, y)，结果为完整图像坐标
+        tolerance (float): 多边形简化的最大偏差（像素）
+        min_area (float): 忽略面积小于该值的碎片
+
+    Returns:
+        list[list[int]]: 多边形列表，按面积从大到小排列
+    """
+    mask = (np.asarray(mask) > 0).astype(np.uint8)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)
+    return [contour_to_polygon(contour, offset, tolerance)
+            for contour in contours if cv2.contourArea(contour) >= min_area]
+
+
+def contour_to_polygon(contour, offset=(0, 0), tolerance=1.0):
+    """OpenCV 轮廓简化为 [x1, y1, x2, y2, ...] 形式的多边形"""
+    if tolerance:
+        contour = cv2.approxPolyDP(contour, tolerance, True)
+    points = np.asarray(contour, dtype=np.int32).reshape(-1, 2) + np.asarray(offset, dtype=np.int32)
+    return points.ravel().tolist()
+
+
+def encode_contour(contour, mask_format, size):
+    """
+    按 mask_format 编码单个轮廓（已简化的轮廓直接作为多边形，RLE 只在轮廓外接矩形内填充）
+
+    Args:
+        contour (numpy.ndarray): 完整图像坐标系下的轮廓点
+        mask_format (str): rle / polygon / none
+        size (tuple): 完整图像尺寸 (高, 宽)
+    """
+    if mask_format == MASK_FORMAT_POLYGON:
+        return [contour_to_polygon(contour, tolerance=0)]
+    if mask_format == MASK_FORMAT_RLE:
+        x, y, w, h = cv2.boundingRect(contour)
+        roi = np.zeros((h, w), np.uint8)
+        cv2.fillPoly(roi, [np.asarray(contour, dtype=np.int32).reshape(-1, 2) - [x, y]], 1)
+        return encode_rle(roi, size, (x, y))
+    return None
+
+
+def encode_mask(mask, mask_format, size=None, offset=(0, 0)):
+    """按 mask_format 编码掩码，none 时返回None"""
+    if mask_format == MASK_FORMAT_RLE:
+        return encode_rle(mask, size, offset)
+    if mask_format == MASK_FORMAT_POLYGON:
+        return mask_to_polygons(mask, offset)
+    return None
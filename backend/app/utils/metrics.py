@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+"""
+进程内指标，以 Prometheus 文本格式在 /metrics 导出
+- 请求：各路由的请求数、延迟直方图、5xx错误数和处理中的请求数
+- 后端阶段：Gemini调用（按调用类型）、YOLO推理、OpenCV方法、结果渲染、写盘的耗时和失败次数
+- 模型加载、Gemini/YOLO排队等待；缓存命中率、队列深度等在抓取时从各服务的 stats() 读取
+
+记录路径不加锁：每个线程写自己预先分配的计数数组，抓取时再汇总各线程的数组
+（已结束线程的计数在抓取或新线程注册时合并，不会丢失）
+"""
+
+import bisect
+import functools
+import math
+import threading
+import time
+from flask import current_app, g, request
+
+
+# 默认的延迟直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 模型加载耗时分桶（秒）
+LOAD_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 批次大小分桶
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _ThreadCells:
+    """按线程分片的计数数组：每个线程只写自己的数组，读取时汇总"""
+
+    __slots__ = ('_size', '_local', '_lock', '_shards', '_retired', '_fold_at')
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (线程, 数组)
+        self._retired = [0] * size
+        self._fold_at = 64
+
+    def values(self):
+        """当前线程的数组（首次使用时注册）"""
+        try:
+            return self._local.values
+        except AttributeError:
+            return self._register()
+
+    def _register(self):
+        values = [0] * self._size
+        with self._lock:
+            if len(self._shards) >= self._fold_at:
+                self._fold_dead_locked()
+                self._fold_at = max(64, len(self._shards) * 2)
+            self._shards.append((threading.current_thread(), values))
+        self._local.values = values
+        return values
+
+    def _fold_dead_locked(self):
+        """把已结束线程的数组合并到 _retired（这些线程不会再写入）"""
+        alive = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                alive.append((thread, values))
+            else:
+                for i, value in enumerate(values):
+                    self._retired[i] += value
+        self._shards = alive
+
+    def snapshot(self):
+        with self._lock:
+            self._fold_dead_locked()
+            total = list(self._retired)
+            for _, values in self._shards:
+                for i, value in enumerate(values):
+                    total[i] += value
+        return total
+
+
+class _CounterChild:
+    __slots__ = ('_cells',)
+
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount=1):
+        self._cells.values()[0] += amount
+
+    def samples(self):
+        return self._cells.snapshot()[0]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        self._cells.values()[0] -= amount
+
+
+class _HistogramChild:
+    __slots__ = ('_cells', '_bounds')
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        # 各分桶计数（最后一个为 +Inf），末尾为观测值总和
+        self._cells = _ThreadCells(len(bounds) + 2)
+
+    def observe(self, value):
+        values = self._cells.values()
+        values[bisect.bisect_left(self._bounds, value)] += 1
+        values[-1] += value
+
+    def samples(self):
+        return self._cells.snapshot()
+
+
+class _Metric:
+    """按标签值区分的一组指标，标签值组合首次出现时创建（加锁），之后直接读取字典"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """按 labelnames 的顺序传入标签值（字符串）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} 需要标签 {self.labelnames}')
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def collect(self):
+        return [(f'{self.name}_total', dict(zip(self.labelnames, values)), child.samples())
+                for values, child in self._items()]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def collect(self):
+        return [(self.name, dict(zip(self.labelnames, values)), child.samples())
+                for values, child in self._items()]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def collect(self):
+        samples = []
+        for values, child in self._items():
+            labels = dict(zip(self.labelnames, values))
+            counts = child.samples()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', dict(labels, le=_format_value(bound)), cumulative))
+            samples.append((f'{self.name}_sum', labels, counts[-1]))
+            samples.append((f'{self.name}_count', labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """指标注册表：直接记录的指标，加上抓取时调用的采集函数"""
+
+    def __init__(self, prefix='gemini_app'):
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(f'{self.prefix}_{name}', documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(f'{self.prefix}_{name}', documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(f'{self.prefix}_{name}', documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        """
+        注册采集函数，抓取时调用
+
+        采集函数返回 [(名称, 类型, 说明, [(标签字典, 值), ...]), ...]，名称不含前缀，
+        counter 类型的名称不含 _total 后缀
+        """
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        """导出 Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            _render_family(lines, metric.name, metric.kind, metric.documentation, metric.collect())
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"指标采集失败 ({getattr(collector, '__name__', collector)}): {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                name = f'{self.prefix}_{name}'
+                sample_name = f'{name}_total' if kind == 'counter' else name
+                _render_family(lines, name, kind, documentation,
+                               [(sample_name, labels, value) for labels, value in samples])
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+
+def _render_family(lines, name, kind, documentation, samples):
+    # 文本格式 0.0.4 中 counter 的元数据名称需与样本名称一致（带 _total 后缀）
+    if kind == 'counter':
+        name = f'{name}_total'
+    lines.append(f'# HELP {name} {_escape(documentation, quote=False)}')
+    lines.append(f'# TYPE {name} {kind}')
+    for sample_name, labels, value in samples:
+        if labels:
+            label_text = ','.join(f'{key}="{_escape(str(value_))}"' for key, value_ in labels.items())
+            lines.append(f'{sample_name}{{{label_text}}} {_format_value(value)}')
+        else:
+            lines.append(f'{sample_name} {_format_value(value)}')
+
+
+def _escape(text, quote=True):
+    text = text.replace('\\', '\\\\').replace('\n', '\\n')
+    return text.replace('"', '\\"') if quote else text
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+# 进程级注册表和直接记录的指标（各服务的状态由文件末尾的采集函数在抓取时读取）
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    'http_requests', '按路由和状态码统计的请求数', ('method', 'route', 'status'))
+HTTP_ERRORS = registry.counter(
+    'http_request_errors', '返回5xx的请求数', ('method', 'route'))
+HTTP_LATENCY = registry.histogram(
+    'http_request_duration_seconds', '请求处理耗时（流式响应为返回响应头之前的耗时）', ('method', 'route'))
+HTTP_IN_FLIGHT = registry.gauge(
+    'http_requests_in_flight', '正在处理的请求数')
+
+STAGE_LATENCY = registry.histogram(
+    'stage_duration_seconds', '后端各阶段耗时：gemini（按调用类型）、yolo（按模型）、opencv（按方法）、render、disk_write',
+    ('stage', 'target'))
+STAGE_ERRORS = registry.counter(
+    'stage_errors', '后端各阶段抛出异常的次数', ('stage', 'target'))
+
+MODEL_LOADS = registry.counter(
+    'model_loads', 'YOLO模型加载次数', ('model', 'result'))
+MODEL_LOAD_LATENCY = registry.histogram(
+    'model_load_duration_seconds', 'YOLO模型加载耗时', ('model',), LOAD_BUCKETS)
+
+GEMINI_QUEUE_WAIT = registry.histogram(
+    'gemini_queue_wait_seconds', 'Gemini调用排队等待配额的耗时', ('model',))
+YOLO_QUEUE_WAIT = registry.histogram(
+    'yolo_queue_wait_seconds', 'YOLO推理请求在微批处理队列中的等待耗时', ('model',))
+YOLO_BATCH_SIZE = registry.histogram(
+    'yolo_batch_size', '每次合并推理的图像数', ('model',), BATCH_BUCKETS)
+
+
+class _StageTimer:
+    __slots__ = ('stage', 'target', 'started')
+
+    def __init__(self, stage, target):
+        self.stage = stage
+        self.target = target
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_LATENCY.labels(self.stage, self.target).observe(time.perf_counter() - self.started)
+        if exc_type is not None:
+            STAGE_ERRORS.labels(self.stage, self.target).inc()
+        return False
+
+
+def time_stage(stage, target=''):
+    """
+    记录一个后端阶段的耗时（with 语句，可包含 await）
+
+    Args:
+        stage (str): 阶段，如 gemini、yolo、opencv、render、disk_write
+        target (str): 阶段内的细分，如调用类型、模型名称、OpenCV方法（取值应为有限集合）
+    """
+    return _StageTimer(stage, target)
+
+
+def timed(stage, target=''):
+    """time_stage 的装饰器形式"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _StageTimer(stage, target):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    HTTP_IN_FLIGHT.dec()
+    # 以路由规则（而不是实际路径）作为标签，未匹配的路径统一记为 unmatched
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    method = request.method
+    HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+    HTTP_REQUESTS.labels(method, route, str(response.status_code)).inc()
+    if response.status_code >= 500:
+        HTTP_ERRORS.labels(method, route).inc()
+    return response
+
+
+def init_app(app):
+    """注册请求计时钩子（ASGI模式下的异步视图同样经过这些钩子）"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+def render_metrics():
+    """当前应用上下文中导出全部指标"""
+    return registry.render()
+
+
+@registry.register_collector
+def _collect_gemini_scheduler():
+    from ..services.gemini_scheduler import get_gemini_scheduler
+    if not current_app.config.get('GEMINI_SCHEDULER_ENABLED', True):
+        return []
+    models = get_gemini_scheduler().stats()['models']
+
+    def family(name, kind, documentation, field):
+        return (name, kind, documentation,
+                [({'key': m['key'], 'model': m['model']}, m[field]) for m in models])
+
+    return [
+        family('gemini_queue_depth', 'gauge', '等待Gemini调用配额的请求数', 'queue_depth'),
+        family('gemini_tokens', 'gauge', '令牌桶中剩余的令牌数', 'tokens'),
+        family('gemini_blocked_seconds', 'gauge', '被限流后暂停发放令牌的剩余秒数', 'blocked_for'),
+        family('gemini_calls', 'counter', '经过调度的Gemini调用数', 'calls'),
+        family('gemini_retries', 'counter', 'Gemini调用重试次数', 'retries'),
+        family('gemini_rate_limited', 'counter', 'Gemini返回429的次数', 'rate_limited'),
+        family('gemini_queue_timeouts', 'counter', '排队等待配额超时的次数', 'timeouts'),
+        family('gemini_failures', 'counter', '重试用尽或不可重试的失败次数', 'failures')
+    ]
+
+
+@registry.register_collector
+def _collect_gemini_clients():
+    from ..services.gemini_clients import get_gemini_client_pool
+    stats = get_gemini_client_pool().stats()
+    return [
+        ('gemini_clients', 'gauge', '客户端池中的Gemini客户端数', [({}, stats['clients'])]),
+        ('gemini_clients_created', 'counter', '创建的Gemini客户端数', [({}, stats['created'])]),
+        ('gemini_clients_reused', 'counter', '复用客户端的次数', [({}, stats['reused'])])
+    ]
+
+
+@registry.register_collector
+def _collect_caches():
+    from ..services.result_cache import get_result_cache
+    from ..services.prompt_cache import get_prompt_cache
+    caches = {'result': get_result_cache().stats(), 'prompt': get_prompt_cache().stats()}
+    lookups, hit_ratio, entries = [], [], []
+    for name, stats in caches.items():
+        lookups.append(({'cache': name, 'result': 'hit'}, stats['hits']))
+        lookups.append(({'cache': name, 'result': 'miss'}, stats['misses']))
+        hit_ratio.append(({'cache': name}, stats['hit_rate']))
+        for backend in stats['backends']:
+            entries.append(({'cache': name, 'backend': backend['backend']}, backend['entries']))
+    return [
+        ('cache_lookups', 'counter', '缓存查询次数（按是否命中）', lookups),
+        ('cache_hit_ratio', 'gauge', '缓存命中率', hit_ratio),
+        ('cache_entries', 'gauge', '各缓存层的条目数', entries)
+    ]
+
+
+@registry.register_collector
+def _collect_yolo():
+    from ..services.model_registry import get_model_registry
+    from ..services.inference_scheduler import get_inference_scheduler
+    registry_stats = get_model_registry().stats()
+    queues = get_inference_scheduler().stats()['models']
+    return [
+        ('yolo_models_loaded', 'gauge', '注册表中已加载的YOLO模型数', [({}, registry_stats['loaded_count'])]),
+        ('yolo_resident_bytes', 'gauge', '已加载模型的常驻内存估算（字节）', [({}, registry_stats['resident_bytes'])]),
+        ('yolo_model_evictions', 'counter', '从注册表淘汰的模型数', [({}, registry_stats['evictions'])]),
+        ('yolo_queue_depth', 'gauge', '微批处理队列中等待推理的请求数',
+         [({'model': name}, stats['pending']) for name, stats in queues.items()]),
+        ('yolo_batches', 'counter', '执行的推理批次数',
+         [({'model': name}, stats['batches']) for name, stats in queues.items()])
+    ]
+
+
+@registry.register_collector
+def _collect_storage():
+    from ..services.storage_manager import storage_manager
+    stats = storage_manager.stats()
+    areas = stats.get('areas', {})
+    return [
+        ('storage_pending', 'gauge', '等待写入存储索引的登记数', [({}, stats['pending'])]),
+        ('storage_files', 'gauge', '各存储目录的文件数', [({'area': name}, area['files']) for name, area in areas.items()]),
+        ('storage_bytes', 'gauge', '各存储目录的用量（字节）', [({'area': name}, area['bytes']) for name, area in areas.items()])
+    ]
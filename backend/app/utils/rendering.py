@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+检测结果渲染模块
+源图像只解码一次（复用 ImageInput 已有的解码结果），字体进程级缓存，
+逐对象图像（高亮框或裁剪图）与汇总图在一次遍历中基于同一个只读底图生成
+"""
+
+import functools
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from .image_input import ImageInput, flatten_to_rgb
+from .metrics import time_stage, timed
+
+
+# 按顺序尝试的字体文件，都不可用时使用PIL内置字体
+FONT_CANDIDATES = [
+    '/System/Library/Fonts/Arial.ttf',
+    'arial.ttf',
+    'DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+]
+
+# 汇总图中区分不同对象的颜色
+PALETTE = ['red', 'blue', 'green', 'yellow', 'purple', 'orange', 'cyan', 'magenta']
+
+# 逐对象图像的生成方式
+MODE_HIGHLIGHT = 'highlight'  # 在完整图像上只绘制该对象的边界框
+MODE_CROP = 'crop'            # 按边界框裁剪
+
+
+@functools.lru_cache(maxsize=16)
+def get_font(size=16):
+    """获取指定字号的字体（进程级缓存，只在首次使用时查找字体文件）"""
+    for path in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(path, size)
+        except (OSError, IOError):
+            continue
+    return ImageFont.load_default()
+
+
+def save_image(image, output_path):
+    """保存图像：jpg/jpeg使用高质量JPEG编码，其他格式按扩展名保存，并登记到存储管理"""
+    from ..services.storage_manager import storage_manager
+
+    with time_stage('disk_write', 'image'):
+        if output_path.lower().endswith(('.jpg', '.jpeg')):
+            image.save(output_path, 'JPEG', quality=95)
+        else:
+            image.save(output_path)
+    return storage_manager.track(output_path)
+
+
+def to_pixels(bbox, dimensions):
+    """归一化坐标 [ymin, xmin, ymax, xmax] 按图像尺寸 (宽, 高) 转换为像素坐标 (x1, y1, x2, y2)"""
+    ymin, xmin, ymax, xmax = bbox
+    width, height = dimensions
+    return int(xmin * width), int(ymin * height), int(xmax * width), int(ymax * height)
+
+
+class RenderItem:
+    """一个待渲染的对象"""
+
+    def __init__(self, box, output_path=None, label=None, color='red', width=4,
+                 summary_label=None, summary_color=None, summary_width=None, number=None):
+        """
+        Args:
+            box (tuple): 像素坐标 (x1, y1, x2, y2)
+            output_path (str): 逐对象图像的保存路径，为None时只绘制到汇总图
+            label (str): 逐对象图像上的标签
+            color: 逐对象图像的边界框颜色
+            width (int): 逐对象图像的边界框线宽
+            summary_label (str): 汇总图上的标签，默认与 label 相同
+            summary_color: 汇总图上的颜色，默认与 color 相同
+            summary_width (int): 汇总图上的线宽，默认与 width 相同
+            number (int): 汇总图中显示在边界框右上角的编号（可选）
+        """
+        self.box = box
+        self.output_path = output_path
+        self.label = label
+        self.color = color
+        self.width = width
+        self.summary_label = summary_label if summary_label is not None else label
+        self.summary_color = summary_color or color
+        self.summary_width = summary_width or width
+        self.number = number
+
+    def to_dict(self):
+        """序列化为可保存的字典（不含输出路径），用于延迟渲染"""
+        return {
+            'box': [int(v) for v in self.box],
+            'label': self.label,
+            'color': self.color,
+            'width': self.width,
+            'summary_label': self.summary_label,
+            'summary_color': self.summary_color,
+            'summary_width': self.summary_width,
+            'number': self.number
+        }
+
+    @classmethod
+    def from_dict(cls, data, output_path=None):
+        def color(value):
+            # JSON中的颜色元组会变为列表，PIL需要元组
+            return tuple(value) if isinstance(value, list) else value
+
+        return cls(
+            tuple(data['box']),
+            output_path,
+            label=data.get('label'),
+            color=color(data.get('color', 'red')),
+            width=data.get('width', 4),
+            summary_label=data.get('summary_label'),
+            summary_color=color(data.get('summary_color')),
+            summary_width=data.get('summary_width'),
+            number=data.get('number')
+        )
+
+
+class DetectionRenderer:
+    """基于同一张底图渲染逐对象图像和汇总图"""
+
+    def __init__(self, source, font_size=16):
+        """
+        Args:
+            source: ImageInput、文件路径或PIL图像
+            font_size (int): 标签字号
+        """
+        if isinstance(source, ImageInput):
+            self.base = source.rgb
+        elif isinstance(source, Image.Image):
+            self.base = flatten_to_rgb(source)
+        else:
+            image = Image.open(source)
+            image.load()
+            self.base = flatten_to_rgb(image)
+        self.font = get_font(font_size)
+
+    @property
+    def size(self):
+        return self.base.size
+
+    def to_pixels(self, bbox):
+        """归一化坐标 [ymin, xmin, ymax, xmax] 转换为像素坐标 (x1, y1, x2, y2)"""
+        return to_pixels(bbox, self.base.size)
+
+    @timed('render', 'boxes')
+    def render(self, items, summary_path=None, mode=MODE_HIGHLIGHT, expand_ratio=0.0, min_crop_size=0):
+        """
+        一次遍历生成所有逐对象图像和汇总图
+
+        Args:
+            items (list[RenderItem]): 待渲染的对象
+            summary_path (str): 汇总图保存路径，为None时不生成汇总图
+            mode (str): 逐对象图像的生成方式（高亮框或裁剪）
+            expand_ratio (float): 裁剪时边界框向外扩展的比例
+            min_crop_size (int): 裁剪图的最小边长，过小时按比例放大
+
+        Returns:
+            tuple: (逐对象图像路径列表（与items一一对应，未生成时为None）, 汇总图路径)
+        """
+        summary = self.base.copy() if summary_path else None
+        summary_draw = ImageDraw.Draw(summary) if summary is not None else None
+
+        paths = []
+        for item in items:
+            if item.output_path:
+                if mode == MODE_CROP:
+                    image = self.crop(item.box, expand_ratio, min_crop_size)
+                else:
+                    image = self.base.copy()
+                    self._draw_box(ImageDraw.Draw(image), item.box, item.color, item.width, item.label)
+                paths.append(save_image(image, item.output_path))
+            else:
+                paths.append(None)
+
+            if summary_draw is not None:
+                self._draw_box(summary_draw, item.box, item.summary_color, item.summary_width, item.summary_label)
+                if item.number is not None:
+                    x2, y1 = item.box[2], item.box[1]
+                    summary_draw.text((x2 - 30, y1 + 5), f'#{item.number}', fill=item.summary_color, font=self.font)
+
+        if summary is not None:
+            save_image(summary, summary_path)
+        return paths, summary_path
+
+    def crop(self, box, expand_ratio=0.0, min_size=0):
+        """裁剪边界框区域，可按比例向外扩展，过小时保持宽高比放大到最小边长"""
+        width, height = self.base.size
+        x1, y1, x2, y2 = box
+        expand_x = int((x2 - x1) * expand_ratio)
+        expand_y = int((y2 - y1) * expand_ratio)
+        x1, y1 = max(0, x1 - expand_x), max(0, y1 - expand_y)
+        x2, y2 = min(width, x2 + expand_x), min(height, y2 + expand_y)
+
+        # 确保裁剪区域有效
+        if x2 <= x1:
+            x2 = min(width, x1 + 50)
+        if y2 <= y1:
+            y2 = min(height, y1 + 50)
+
+        cropped = self.base.crop((x1, y1, x2, y2))
+        if min_size and (cropped.size[0] < min_size or cropped.size[1] < min_size):
+            scale = max(min_size / cropped.size[0], min_size / cropped.size[1])
+            new_size = (int(cropped.size[0] * scale), int(cropped.size[1] * scale))
+            cropped = cropped.resize(new_size, Image.Resampling.LANCZOS)
+        return cropped
+
+    def _draw_box(self, draw, box, color, width, label=None):
+        """绘制边界框和带背景色的白色标签"""
+        x1, y1, x2, y2 = box
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=width)
+        if label:
+            text_bbox = draw.textbbox((x1, y1 - 25), label, font=self.font)
+            draw.rectangle(text_bbox, fill=color)
+            draw.text((x1, y1 - 25), label, fill='white', font=self.font)
+
+
+@timed('render', 'contour')
+def contour_cutout(image, contour, crop_box, feather=True):
+    """
+    按轮廓抠出对象：只在裁剪区域内生成掩码，背景填充为白色
+
+    Args:
+        image (numpy.ndarray): BGR原图（只读）
+        contour (numpy.ndarray): 原图坐标系下的轮廓点
+        crop_box (tuple): 裁剪区域 (x1, y1, x2, y2)
+        feather (bool): 是否对掩码边缘做轻微模糊（柔和边缘）
+
+    Returns:
+        numpy.ndarray: 裁剪区域大小的BGR图像
+    """
+    x1, y1, x2, y2 = crop_box
+    region = image[y1:y2, x1:x2]
+    mask = np.zeros(region.shape[:2], np.uint8)
+    cv2.fillPoly(mask, [np.asarray(contour, dtype=np.int32).reshape(-1, 2) - [x1, y1]], 255)
+
+    if not feather:
+        result = region.copy()
+        result[mask == 0] = 255
+        return result
+
+    # 对掩码进行轻微的高斯模糊，创建柔和边缘
+    alpha = cv2.GaussianBlur(mask, (3, 3), 0)[:, :, np.newaxis] / 255.0
+    return (region * alpha + 255 * (1 - alpha)).astype(np.uint8)
+
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+服务器推送事件（SSE）工具
+"""
+
+import json
+
+from flask import Response, stream_with_context
+
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # 关闭反向代理（如nginx）的响应缓冲，保证事件立即送达
+    'X-Accel-Buffering': 'no'
+}
+
+
+def format_sse(event, data):
+    """编码为一条SSE消息，data 序列化为单行JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events):
+    """
+    将 (事件名, 数据) 生成器包装为流式响应
+
+    客户端断开连接时服务器会关闭响应迭代器，生成器在当前 yield 处收到 GeneratorExit，
+    可在 finally 中取消上游调用
+    """
+    def generate():
+        try:
+            for event, data in events:
+                yield format_sse(event, data)
+        finally:
+            events.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+def async_sse_response(events):
+    """
+    将 (事件名, 数据) 异步生成器包装为流式响应（ASGI模式）
+
+    响应体为 async_body 异步迭代器，由ASGI应用逐条发送；客户端断开连接时发送任务被取消，
+    生成器在当前 await 处收到 CancelledError，同样在 finally 中关闭
+    """
+    async def generate():
+        try:
+            async for event, data in events:
+                yield format_sse(event, data).encode('utf-8')
+        finally:
+            await events.aclose()
+
+    response = Response(mimetype='text/event-stream', headers=SSE_HEADERS)
+    response.async_body = generate()
+    return response
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+OpenCV / YOLO 离线基准测试
+不经过HTTP和Gemini，直接调用 OpenCVService 的各检测/分割方法和各YOLO检测/分割模型，
+在不同分辨率（0.3 / 2 / 12 / 48 MP）的合成图像和样例图像上测量吞吐量、p50/p95/p99延迟和峰值内存（RSS），
+结果输出为JSON，并可与保存的基线比较，超出阈值时以非0状态退出
+
+在 backend 目录下运行：
+    python -m benchmarks                              # 全部OpenCV方法和本地已有权重的YOLO模型
+    python -m benchmarks --suite opencv --resolutions 0.3,2 --iterations 10
+    python -m benchmarks --samples ../img             # 额外使用样例图像（按各分辨率缩放）
+    python -m benchmarks --output results.json --save-baseline   # 保存为基线
+    python -m benchmarks --baseline benchmarks/baseline.json     # 与基线比较
+
+每个用例默认在独立的子进程中运行，峰值RSS只包含该用例；基线与机器相关，应在同一台机器上生成和比较
+"""
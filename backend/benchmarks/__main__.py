@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试命令行入口（在 backend 目录下运行 python -m benchmarks --help）
+"""
+
+import argparse
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .cases import SUITES, list_cases, run_case
+from .corpus import RESOLUTIONS, build_corpus
+from .report import compare, format_comparison, format_table, load_results, save_results
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='OpenCV / YOLO 离线基准测试')
+    parser.add_argument('--suite', default=','.join(SUITES), help='逗号分隔：opencv,yolo')
+    parser.add_argument('--methods', default='', help='只测试这些OpenCV方法（逗号分隔，默认全部）')
+    parser.add_argument('--models', default='', help='只测试这些YOLO模型（逗号分隔，默认全部检测和分割模型）')
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS), help='逗号分隔的百万像素档位：0.3,2,12,48')
+    parser.add_argument('--samples', default=None, help='样例图像目录（按各分辨率缩放后作为第二个图像集）')
+    parser.add_argument('--corpus-dir', default=None, help='编码后图像的缓存目录（默认使用临时目录）')
+    parser.add_argument('--seed', type=int, default=0, help='合成图像的随机种子')
+    parser.add_argument('--iterations', type=int, default=5, help='每个用例处理图像集的轮数')
+    parser.add_argument('--warmup', type=int, default=1, help='不计时的预热轮数')
+    parser.add_argument('--max-seconds', type=float, default=120, help='单个用例的计时上限，超过后不再处理新的图像（结果标记为截断）')
+    parser.add_argument('--artifacts', default='all', choices=('all', 'summary', 'none'), help='结果图像的生成方式')
+    parser.add_argument('--allow-download', action='store_true', help='本地没有YOLO权重时允许下载')
+    parser.add_argument('--no-isolate', action='store_true', help='所有用例在同一进程中运行（峰值RSS为累计值）')
+    parser.add_argument('--output', default=None, help='结果JSON的输出路径')
+    parser.add_argument('--baseline', default=None, help=f'比较的基线JSON（默认 {DEFAULT_BASELINE}，存在时比较）')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--threshold', type=float, default=0.15, help='延迟/吞吐量允许的相对变化')
+    parser.add_argument('--rss-threshold', type=float, default=0.2, help='峰值内存允许的相对变化')
+    parser.add_argument('--no-fail', action='store_true', help='有回退时仍以0状态退出')
+    return parser.parse_args(argv)
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _versions():
+    versions = {'python': platform.python_version()}
+    for module in ('cv2', 'numpy', 'PIL', 'ultralytics', 'torch'):
+        try:
+            versions[module] = getattr(__import__(module), '__version__', 'unknown')
+        except ImportError:
+            continue
+    return versions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def collect_meta(args):
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_revision': _git_revision(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'versions': _versions(),
+        'options': {
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'max_seconds': args.max_seconds,
+            'artifacts': args.artifacts,
+            'seed': args.seed,
+            'isolated': not args.no_isolate
+        }
+    }
+
+
+def run_isolated(spec):
+    """在新的子进程中运行用例，峰值RSS只反映该用例"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_case, spec).result()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    resolutions = _split(args.resolutions)
+    unknown = [r for r in resolutions if r not in RESOLUTIONS]
+    if unknown:
+        print(f"未知的分辨率: {', '.join(unknown)}（可选 {', '.join(RESOLUTIONS)}）")
+        return 2
+
+    with tempfile.TemporaryDirectory(prefix='gemini-bench-corpus-') as tmp_dir:
+        corpus_dir = args.corpus_dir or tmp_dir
+        print(f"准备图像集（{', '.join(r + 'MP' for r in resolutions)}）...", flush=True)
+        corpus = build_corpus(corpus_dir, resolutions, args.samples, args.seed)
+        cases = list_cases(
+            _split(args.suite), corpus,
+            models=_split(args.models) or None,
+            methods=_split(args.methods) or None,
+            iterations=max(1, args.iterations),
+            warmup=max(0, args.warmup),
+            max_seconds=args.max_seconds,
+            artifacts=args.artifacts,
+            allow_download=args.allow_download
+        )
+
+        results = []
+        for index, spec in enumerate(cases, 1):
+            print(f"[{index}/{len(cases)}] {spec['id']}", flush=True)
+            result = run_case(spec) if args.no_isolate else run_isolated(spec)
+            if result['status'] == 'ok':
+                print(f"    p50 {result['latency_ms']['p50']:.1f}ms  p95 {result['latency_ms']['p95']:.1f}ms  "
+                      f"峰值RSS {result['peak_rss_mb']}MB" + ('  （超过计时上限，已截断）' if result['truncated'] else ''),
+                      flush=True)
+            else:
+                print(f"    {result['status']}: {result.get('reason') or result.get('error')}", flush=True)
+            results.append(result)
+
+    report = {'meta': collect_meta(args), 'results': results}
+    print()
+    print(format_table(results))
+
+    exit_code = 0
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) else None)
+    if baseline_path and not args.save_baseline:
+        comparison = compare(results, load_results(baseline_path), args.threshold, args.rss_threshold)
+        comparison['baseline'] = baseline_path
+        report['comparison'] = comparison
+        print()
+        print(f"与基线比较（{baseline_path}）：")
+        print(format_comparison(comparison))
+        if comparison['regressions'] and not args.no_fail:
+            exit_code = 1
+
+    if args.output:
+        save_results(args.output, report)
+        print(f"结果已保存: {args.output}")
+    if args.save_baseline:
+        path = args.baseline or DEFAULT_BASELINE
+        save_results(path, report)
+        print(f"基线已保存: {path}")
+    if any(r['status'] == 'error' for r in results) and not exit_code:
+        exit_code = 3
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试用例
+每个用例 = 流水线（OpenCV检测/分割、YOLO检测/分割）× 方法或模型 × 图像集 × 分辨率。
+用例在最小的Flask应用上下文中直接调用服务方法，输出文件写入临时目录，
+计时范围与接口处理一致：解码上传字节、检测/分割、渲染并保存结果图像
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+from .report import summarize_latencies
+
+
+OPENCV_DETECTION_METHODS = ('contour', 'color', 'edge', 'haar')
+OPENCV_SEGMENTATION_METHODS = ('contour_mask', 'grabcut', 'watershed', 'kmeans')
+YOLO_DETECTION_MODELS = ('yolo11n', 'yolo11s', 'yolo11m', 'yolo11l', 'yolo11x')
+YOLO_SEGMENTATION_MODELS = ('yolo11n-seg', 'yolo11s-seg', 'yolo11m-seg', 'yolo11l-seg', 'yolo11x-seg')
+
+SUITES = ('opencv', 'yolo')
+
+
+class CaseSkipped(Exception):
+    """当前环境无法运行该用例（缺少依赖或模型权重）"""
+
+
+def list_cases(suites, corpus, models=None, methods=None, **options):
+    """
+    展开用例列表
+
+    Args:
+        suites (list[str]): opencv / yolo
+        corpus (list[dict]): build_corpus 返回的图像集
+        models (list[str]): 要测试的YOLO模型，为None时测试全部检测和分割模型
+        methods (list[str]): 要测试的OpenCV方法，为None时测试全部方法
+        options: 写入每个用例的运行参数（iterations、warmup、max_seconds、artifacts、allow_download）
+    """
+    pipelines = []
+    if 'opencv' in suites:
+        pipelines += [('opencv.detect', m) for m in OPENCV_DETECTION_METHODS if not methods or m in methods]
+        pipelines += [('opencv.segment', m) for m in OPENCV_SEGMENTATION_METHODS if not methods or m in methods]
+    if 'yolo' in suites:
+        pipelines += [('yolo.detect', m) for m in YOLO_DETECTION_MODELS if not models or m in models]
+        pipelines += [('yolo.segment', m) for m in YOLO_SEGMENTATION_MODELS if not models or m in models]
+
+    cases = []
+    for pipeline, method in pipelines:
+        for entry in corpus:
+            cases.append(dict(
+                options,
+                id=f"{pipeline}.{method}/{entry['corpus']}/{entry['resolution']}mp",
+                pipeline=pipeline,
+                method=method,
+                corpus=entry['corpus'],
+                resolution=entry['resolution'],
+                paths=entry['paths']
+            ))
+    return cases
+
+
+def create_benchmark_app(workdir):
+    """只加载配置的最小Flask应用（不启动预热、任务轮询和存储清理），上传和生成目录指向临时目录"""
+    from flask import Flask
+    from app.config import TestingConfig
+
+    app = Flask('benchmarks')
+    app.config.from_object(TestingConfig)
+    generated = os.path.join(workdir, 'generated')
+    app.config.update(
+        UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+        GENERATED_FOLDER=generated,
+        ARTIFACT_FOLDER=os.path.join(generated, 'artifacts'),
+        ARTIFACT_STORE_PATH=os.path.join(workdir, 'artifacts.db'),
+        # 用例顺序执行，微批处理的等待窗口只会给每次推理增加固定延迟
+        YOLO_MICROBATCH_ENABLED=False
+    )
+    _reset_outputs(app)
+    return app
+
+
+def _reset_outputs(app):
+    """清空上一轮写入的文件，每轮都按新上传的图像处理（包括保存上传文件）"""
+    for key in ('UPLOAD_FOLDER', 'GENERATED_FOLDER'):
+        shutil.rmtree(app.config[key], ignore_errors=True)
+        os.makedirs(app.config[key], exist_ok=True)
+    os.makedirs(app.config['ARTIFACT_FOLDER'], exist_ok=True)
+
+
+def _accept_content(source, object_name):
+    """跳过内容验证（验证会调用YOLO或Gemini，不属于被测的OpenCV方法）"""
+    return {'is_match': True, 'validation_method': 'benchmark'}
+
+
+def _make_runner(spec):
+    """返回处理单张图像的函数 runner(ImageInput) -> 服务返回值"""
+    pipeline, method, artifacts = spec['pipeline'], spec['method'], spec['artifacts']
+
+    if pipeline.startswith('opencv.'):
+        from app.services.opencv_service import OpenCVService
+        service = OpenCVService()
+        service._validate_image_content = _accept_content
+        if pipeline == 'opencv.detect':
+            object_name = '人脸' if method == 'haar' else '对象'
+            return lambda image: service.detect_objects_opencv(
+                image=image, method=method, object_name=object_name, artifacts=artifacts)
+        return lambda image: service.segment_image_opencv(
+            image=image, method=method, object_name='对象', artifacts=artifacts)
+
+    try:
+        import ultralytics  # noqa: F401
+    except ImportError:
+        raise CaseSkipped('未安装 ultralytics')
+    from app.services.model_registry import get_model_registry
+    if get_model_registry().get(method, allow_download=spec['allow_download']) is None:
+        raise CaseSkipped(f'没有可用的 {method} 权重（本地不存在且未允许下载）')
+
+    if pipeline == 'yolo.detect':
+        from app.services.yolo_detection_service import YOLODetectionService
+        service = YOLODetectionService()
+        return lambda image: service.detect_objects(model_name=method, image=image, artifacts=artifacts)
+    from app.services.yolo_segmentation_service import YOLOSegmentationService
+    service = YOLOSegmentationService()
+    return lambda image: service.segment_image_yolo(model_name=method, image=image, artifacts=artifacts)
+
+
+def _outcome(result):
+    """
+    Returns:
+        tuple: (是否得到结果, 错误信息)；服务返回5xx时抛出异常
+    """
+    status = 200
+    if isinstance(result, tuple):
+        result, status = result
+    if status >= 500:
+        raise RuntimeError(result.get('error', f'状态码 {status}'))
+    if result.get('success'):
+        return True, None
+    return False, result.get('error')
+
+
+def _downscale(data, megapixels=0.3):
+    """把编码后的图像缩小到指定像素数（已不大于时原样返回）"""
+    import cv2
+    import numpy as np
+    from .corpus import encode_jpeg, resize_to_megapixels
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None or image.shape[0] * image.shape[1] <= megapixels * 1_000_000:
+        return data
+    return encode_jpeg(resize_to_megapixels(image, megapixels))
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），平台不支持时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以KB为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_case(spec):
+    """
+    在当前进程中运行一个用例
+
+    先用缩小的图像预热（加载模型、Haar级联、字体等，不计时），再按轮次处理图像集中的每张图像，
+    达到 iterations 轮时停止；每张图像开始前检查计时上限，累计耗时超过 max_seconds 时立即停止，
+    结果标记为 truncated（至少处理一张图像，单张图像的处理无法中断）
+
+    Returns:
+        dict: 用例结果，status 为 ok / skipped / error
+    """
+    result = {key: spec[key] for key in ('id', 'pipeline', 'method', 'corpus', 'resolution')}
+    workdir = tempfile.mkdtemp(prefix='gemini-bench-')
+    try:
+        from app.utils.image_input import ImageInput
+
+        app = create_benchmark_app(workdir)
+        with app.app_context():
+            images = []
+            for path in spec['paths']:
+                with open(path, 'rb') as f:
+                    images.append((os.path.basename(path), f.read()))
+            if not images:
+                raise CaseSkipped('图像集为空')
+
+            load_started = time.perf_counter()
+            runner = _make_runner(spec)
+            setup_seconds = time.perf_counter() - load_started
+
+            # 预热使用缩小的图像：只需触发模型、级联分类器和字体等的首次加载，
+            # 不让大分辨率下的慢方法（如GrabCut）多跑一轮，也不提前抬高峰值内存
+            warmup_name, warmup_data = images[0][0], _downscale(images[0][1])
+            for _ in range(spec['warmup']):
+                _outcome(runner(ImageInput(data=warmup_data, filename=warmup_name)))
+                _reset_outputs(app)
+            setup_rss = peak_rss_mb()
+
+            latencies, megapixels, succeeded, last_error = [], [], 0, None
+            rounds, truncated = 0, False
+            started = time.perf_counter()
+            while rounds < spec['iterations'] and not truncated:
+                for name, data in images:
+                    # 每张图像开始前检查计时上限（至少处理一张）
+                    if latencies and time.perf_counter() - started > spec['max_seconds']:
+                        truncated = True
+                        break
+                    image = ImageInput(data=data, filename=name)
+                    begin = time.perf_counter()
+                    ok, error = _outcome(runner(image))
+                    latencies.append(time.perf_counter() - begin)
+                    width, height = image.dimensions
+                    megapixels.append(width * height / 1_000_000)
+                    if ok:
+                        succeeded += 1
+                    else:
+                        last_error = error
+                    _reset_outputs(app)
+                else:
+                    rounds += 1
+
+        busy = sum(latencies)
+        result.update({
+            'status': 'ok',
+            'iterations': rounds,
+            'truncated': truncated,
+            'images': len(latencies),
+            'megapixels': round(sum(megapixels) / len(megapixels), 2),
+            'success_rate': round(succeeded / len(latencies), 3),
+            'latency_ms': summarize_latencies(latencies),
+            'throughput': {
+                'images_per_s': round(len(latencies) / busy, 3) if busy else None,
+                'megapixels_per_s': round(sum(megapixels) / busy, 2) if busy else None
+            },
+            'setup_ms': round(setup_seconds * 1000, 1),
+            'setup_rss_mb': setup_rss,
+            'peak_rss_mb': peak_rss_mb()
+        })
+        if last_error:
+            result['last_error'] = last_error
+    except CaseSkipped as e:
+        result.update({'status': 'skipped', 'reason': str(e)})
+    except Exception as e:
+        result.update({
+            'status': 'error',
+            'error': f'{type(e).__name__}: {e}',
+            'traceback': traceback.format_exc(limit=5)
+        })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试图像集
+- synthetic：按固定随机种子生成的场景（低频背景、纹理和多个纯色几何对象），同一种子在任何机器上结果相同
+- samples：指定目录中的样例图像，按目标像素数等比缩放
+图像编码为JPEG后写入缓存目录，子进程只读取编码后的字节（与接口收到的上传一致），不把生成过程计入用例的内存峰值
+"""
+
+import math
+import os
+import cv2
+import numpy as np
+
+
+# 分辨率名称 -> 合成图像尺寸（宽, 高），约为 0.3 / 2 / 12 / 48 百万像素
+RESOLUTIONS = {
+    '0.3': (640, 480),
+    '2': (1920, 1080),
+    '12': (4000, 3000),
+    '48': (8000, 6000),
+}
+
+SAMPLE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+JPEG_QUALITY = 90
+
+# 合成对象的颜色（BGR，饱和度高，便于颜色/轮廓方法检出）
+SHAPE_COLORS = [(40, 40, 220), (40, 180, 40), (220, 60, 40), (30, 210, 230), (200, 40, 200), (20, 20, 20)]
+
+
+def synthetic_image(width, height, seed=0, shapes=12):
+    """生成合成场景（BGR）：对象的数量和相对位置与分辨率无关"""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(150, 235, (6, 8, 3), dtype=np.uint8)
+    image = cv2.resize(background, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    # 平铺的细纹理，模拟真实照片的高频成分
+    texture = rng.integers(0, 14, (256, 256, 3), dtype=np.uint8)
+    reps = (math.ceil(height / 256), math.ceil(width / 256), 1)
+    image = cv2.add(image, np.tile(texture, reps)[:height, :width])
+
+    unit = min(width, height)
+    for i in range(shapes):
+        color = SHAPE_COLORS[i % len(SHAPE_COLORS)]
+        cx, cy = int(rng.uniform(0.1, 0.9) * width), int(rng.uniform(0.1, 0.9) * height)
+        size = max(4, int(rng.uniform(0.04, 0.12) * unit))
+        kind = i % 3
+        if kind == 0:
+            cv2.circle(image, (cx, cy), size, color, -1, lineType=cv2.LINE_AA)
+        elif kind == 1:
+            cv2.rectangle(image, (cx - size, cy - size // 2), (cx + size, cy + size // 2), color, -1)
+        else:
+            angles = np.sort(rng.uniform(0, 2 * np.pi, 6))
+            points = np.stack([cx + size * np.cos(angles), cy + size * np.sin(angles)], axis=1).astype(np.int32)
+            cv2.fillPoly(image, [points], color, lineType=cv2.LINE_AA)
+    return image
+
+
+def resize_to_megapixels(image, megapixels):
+    """等比缩放到目标像素数"""
+    height, width = image.shape[:2]
+    scale = math.sqrt(megapixels * 1_000_000 / (width * height))
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(image, size, interpolation=interpolation)
+
+
+def encode_jpeg(image):
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise ValueError('JPEG编码失败')
+    return buffer.tobytes()
+
+
+def list_samples(folder):
+    """样例目录中的图像文件（按文件名排序）"""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(SAMPLE_EXTENSIONS)
+    )
+
+
+def build_corpus(cache_dir, resolutions, samples_dir=None, seed=0):
+    """
+    生成各图像集在各分辨率下的编码文件
+
+    Args:
+        cache_dir (str): 编码文件的写入目录（已存在的文件直接复用）
+        resolutions (list[str]): RESOLUTIONS 中的分辨率名称
+        samples_dir (str): 样例图像目录，为None时只使用合成图像
+        seed (int): 合成图像的随机种子
+
+    Returns:
+        list[dict]: 每项包含 corpus、resolution、paths（该分辨率下的图像文件列表）
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entries = []
+    for resolution in resolutions:
+        width, height = RESOLUTIONS[resolution]
+        path = os.path.join(cache_dir, f'synthetic_{seed}_{resolution}mp.jpg')
+        if not os.path.exists(path):
+            _write(path, encode_jpeg(synthetic_image(width, height, seed)))
+        entries.append({'corpus': 'synthetic', 'resolution': resolution, 'paths': [path]})
+
+    if samples_dir:
+        sources = list_samples(samples_dir)
+        if not sources:
+            raise ValueError(f'样例目录中没有图像: {samples_dir}')
+        for resolution in resolutions:
+            paths = []
+            for source in sources:
+                stem = os.path.splitext(os.path.basename(source))[0]
+                path = os.path.join(cache_dir, f'sample_{stem}_{resolution}mp.jpg')
+                if not os.path.exists(path):
+                    image = cv2.imread(source, cv2.IMREAD_COLOR)
+                    if image is None:
+                        print(f"跳过无法读取的样例图像: {source}")
+                        continue
+                    _write(path, encode_jpeg(resize_to_megapixels(image, float(resolution))))
+                paths.append(path)
+            entries.append({'corpus': 'samples', 'resolution': resolution, 'paths': paths})
+    return entries
+
+
+def _write(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试结果统计、基线比较和表格输出
+"""
+
+import json
+import math
+
+
+# 与基线比较的指标：(结果中的路径, 名称, 数值越大越差)
+COMPARED_METRICS = (
+    (('latency_ms', 'p50'), 'p50_ms', True),
+    (('latency_ms', 'p95'), 'p95_ms', True),
+    (('throughput', 'images_per_s'), 'images_per_s', False),
+    (('peak_rss_mb',), 'peak_rss_mb', True),
+)
+
+
+def percentile(sorted_values, q):
+    """线性插值的分位数（sorted_values 已升序排列，q 取 0~100）"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize_latencies(latencies):
+    """延迟统计（毫秒）"""
+    values = sorted(latencies)
+    stats = {
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'min': values[0],
+        'max': values[-1]
+    }
+    return {name: round(value * 1000, 3) for name, value in stats.items()}
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(path, report):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def _metric(result, path):
+    value = result
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(results, baseline, threshold=0.15, rss_threshold=0.2):
+    """
+    与基线逐用例比较
+
+    Args:
+        results (list[dict]): 本次的用例结果
+        baseline (dict): 基线报告（与本次输出格式相同）
+        threshold (float): 延迟和吞吐量允许的相对变化，超过时视为回退
+        rss_threshold (float): 峰值内存允许的相对变化
+
+    Returns:
+        dict: regressions、improvements（每项包含用例、指标、基线值、本次值和相对变化）、
+              missing（基线中成功、本次运行但未成功的用例）
+    """
+    baseline_results = {r['id']: r for r in baseline.get('results', []) if r.get('status') == 'ok'}
+    current = {r['id']: r for r in results if r.get('status') == 'ok'}
+    attempted = {r['id'] for r in results}
+    regressions, improvements = [], []
+
+    for case_id, result in current.items():
+        base = baseline_results.get(case_id)
+        if base is None:
+            continue
+        for path, name, higher_is_worse in COMPARED_METRICS:
+            before, after = _metric(base, path), _metric(result, path)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            limit = rss_threshold if name == 'peak_rss_mb' else threshold
+            worse = change if higher_is_worse else -change
+            item = {'id': case_id, 'metric': name, 'baseline': before, 'current': after,
+                    'change': round(change, 4)}
+            if worse > limit:
+                regressions.append(item)
+            elif worse < -limit:
+                improvements.append(item)
+
+    return {
+        'threshold': threshold,
+        'rss_threshold': rss_threshold,
+        'baseline_meta': baseline.get('meta', {}),
+        'regressions': regressions,
+        'improvements': improvements,
+        'missing': sorted((set(baseline_results) & attempted) - set(current))
+    }
+
+
+def format_table(results):
+    """用例结果的文本表格"""
+    header = f"{'用例':<48} {'状态':<8} {'p50(ms)':>10} {'p95(ms)':>10} {'p99(ms)':>10} {'图像/秒':>9} {'峰值RSS(MB)':>12}"
+    lines = [header, '-' * len(header)]
+    for r in results:
+        if r['status'] != 'ok':
+            detail = r.get('reason') or r.get('error', '')
+            lines.append(f"{r['id']:<48} {r['status']:<8} {detail}")
+            continue
+        latency = r['latency_ms']
+        lines.append(
+            f"{r['id']:<48} {r['status']:<8} {latency['p50']:>10.1f} {latency['p95']:>10.1f} {latency['p99']:>10.1f} "
+            f"{r['throughput']['images_per_s'] or 0:>9.2f} {r['peak_rss_mb'] if r['peak_rss_mb'] is not None else '-':>12}"
+        )
+    return '\n'.join(lines)
+
+
+def format_comparison(comparison):
+    lines = []
+    for title, items in (('回退', comparison['regressions']), ('提升', comparison['improvements'])):
+        for item in items:
+            lines.append(f"{title}: {item['id']} {item['metric']} {item['baseline']} -> {item['current']} "
+                         f"({item['change']:+.1%})")
+    for case_id in comparison['missing']:
+        lines.append(f"缺少: {case_id}（基线中成功，本次未成功运行）")
+    if not lines:
+        lines.append('与基线相比没有超出阈值的变化')
+    return '\n'.join(lines)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Gemini / Imagen / Veo API 本地替身服务
+在不消耗配额、没有网络抖动的情况下对整个Flask应用做端到端压测。
+在 backend 目录下运行：
+    python -m gemini_standin                                   # 合成响应，默认延迟接近真实API
+    python -m gemini_standin --no-latency                      # 不模拟延迟，只测应用自身开销
+    python -m gemini_standin --mode record --recordings rec/   # 转发到真实API并录制
+    python -m gemini_standin --mode replay --recordings rec/   # 回放录制的响应（按录制时的耗时）
+    python -m gemini_standin --latency generate_content=lognormal:800,0.5 --error '*=0.05:429,503'
+然后在应用的 .env 中设置 GEMINI_BASE_URL=http://127.0.0.1:8090（API Key 可以是任意非空值，record 模式除外）
+"""
+
+from .server import StandinOptions, create_app
+
+__all__ = ['StandinOptions', 'create_app']
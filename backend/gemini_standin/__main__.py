@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+替身服务命令行入口（在 backend 目录下运行 python -m gemini_standin --help）
+"""
+
+import argparse
+import sys
+
+from .faults import ErrorRule, FaultInjector, LatencyModel, parse_assignments
+from .server import DEFAULT_UPSTREAM, MODES, StandinOptions, create_app
+
+
+# 合成模式的默认延迟（毫秒），接近真实API的量级
+SYNTHETIC_LATENCIES = {
+    'generate_content': 'lognormal:900,0.4',
+    'stream_first_chunk': 'lognormal:450,0.3',
+    'stream_chunk': 'fixed:40',
+    'generate_images': 'lognormal:6000,0.3',
+    'generate_videos': 'lognormal:400,0.2',
+    'video_duration': 'uniform:30000,60000',
+    'operations_get': 'fixed:80',
+    'download': 'fixed:300',
+    'models_get': 'fixed:60',
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m gemini_standin', description='Gemini / Imagen / Veo API 本地替身服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--mode', default='synthetic', choices=MODES, help='synthetic / replay / record')
+    parser.add_argument('--recordings', default=None, help='录制文件目录（replay 和 record 模式必需）')
+    parser.add_argument('--strict', action='store_true', help='replay 模式下没有录制时返回404，而不是合成响应')
+    parser.add_argument('--upstream', default=DEFAULT_UPSTREAM, help='record 模式转发的目标地址')
+    parser.add_argument('--latency', action='append', default=[], metavar='KIND=SPEC',
+                        help='调用类型的延迟分布，可重复，如 generate_content=lognormal:800,0.5 或 *=fixed:0')
+    parser.add_argument('--error', action='append', default=[], metavar='KIND=RATE[:CODES]',
+                        help='按比例注入错误，可重复，如 generate_content=0.05:429,503 或 *=0.01:503')
+    parser.add_argument('--no-latency', action='store_true', help='不模拟延迟（只压测应用自身的开销）')
+    parser.add_argument('--seed', type=int, default=None, help='延迟采样和错误注入的随机种子')
+    parser.add_argument('--text-words', type=int, default=60, help='合成文本的单词数')
+    parser.add_argument('--chunk-words', type=int, default=8, help='流式响应每块的单词数')
+    parser.add_argument('--image-edge', type=int, default=1024, help='合成图像的长边像素数')
+    return parser.parse_args(argv)
+
+
+def build_options(args):
+    """
+    命令行参数 -> StandinOptions
+    合成模式默认使用 SYNTHETIC_LATENCIES，回放模式默认按录制时的耗时延迟（回退到合成响应时不延迟）
+    """
+    if args.no_latency:
+        defaults = {'*': 'fixed:0'}
+    elif args.mode == 'replay':
+        # 合成的视频操作没有录制耗时，完成时间仍按合成默认值
+        defaults = {kind: 'recorded' for kind in SYNTHETIC_LATENCIES if kind != 'video_duration'}
+        defaults['video_duration'] = SYNTHETIC_LATENCIES['video_duration']
+    elif args.mode == 'record':
+        # 录制时的耗时就是真实API的耗时，不再额外延迟
+        defaults = {}
+    else:
+        defaults = dict(SYNTHETIC_LATENCIES)
+
+    latencies = parse_assignments(args.latency, LatencyModel, {k: LatencyModel(v) for k, v in defaults.items()})
+    errors = parse_assignments(args.error, ErrorRule)
+    return StandinOptions(
+        mode=args.mode,
+        recordings=args.recordings,
+        strict=args.strict,
+        upstream=args.upstream,
+        injector=FaultInjector(latencies, errors, args.seed),
+        text_words=args.text_words,
+        chunk_words=args.chunk_words,
+        image_edge=args.image_edge
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        options = build_options(args)
+    except ValueError as e:
+        print(f"参数错误: {e}")
+        return 2
+
+    from werkzeug.serving import run_simple
+
+    app = create_app(options)
+    print(f"Gemini替身服务（{options.mode}）: http://{args.host}:{args.port}", flush=True)
+    print(f"应用中设置 GEMINI_BASE_URL=http://{args.host}:{args.port} 即可把所有Gemini调用发到这里", flush=True)
+    for kind, model in sorted(options.injector.latencies.items()):
+        print(f"  延迟 {kind}: {model.spec}")
+    for kind, rule in sorted(options.injector.errors.items()):
+        print(f"  错误 {kind}: {rule.spec}")
+    # 每个请求一个线程，模拟的延迟只占用线程而不占用CPU
+    run_simple(args.host, args.port, app, threaded=True, use_reloader=False, use_debugger=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
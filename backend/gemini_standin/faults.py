@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+延迟分布和错误注入
+延迟格式（毫秒）：
+    fixed:800              固定延迟
+    uniform:200,1500       均匀分布
+    normal:800,200         正态分布（均值, 标准差），小于0时取0
+    lognormal:800,0.5      对数正态分布（中位数, sigma），贴近真实API的长尾
+    recorded               回放录制时的实际耗时（没有录制耗时时不延迟）
+错误格式：比例[:状态码,...]，如 0.05:429,503；未指定状态码时注入429
+"""
+
+import math
+import random
+import threading
+
+
+# 调用类型：generate_content、stream_first_chunk（流式首块）、stream_chunk（流式后续块的间隔）、
+# generate_images、generate_videos、video_duration（视频操作从提交到完成的时间）、operations_get、download、models_get
+KINDS = ('generate_content', 'stream_first_chunk', 'stream_chunk', 'generate_images', 'generate_videos',
+         'video_duration', 'operations_get', 'download', 'models_get')
+
+# 与Google API一致的错误状态
+ERROR_STATUSES = {
+    400: 'INVALID_ARGUMENT',
+    403: 'PERMISSION_DENIED',
+    404: 'NOT_FOUND',
+    429: 'RESOURCE_EXHAUSTED',
+    500: 'INTERNAL',
+    503: 'UNAVAILABLE',
+    504: 'DEADLINE_EXCEEDED',
+}
+
+
+class LatencyModel:
+    """单个调用类型的延迟分布"""
+
+    def __init__(self, spec='fixed:0'):
+        self.spec = spec
+        name, _, params = spec.partition(':')
+        self.name = name.strip().lower()
+        self.params = [float(p) for p in params.split(',') if p.strip()]
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2, 'recorded': 0}
+        if self.name not in expected:
+            raise ValueError(f'未知的延迟分布: {spec}')
+        if len(self.params) != expected[self.name]:
+            raise ValueError(f'延迟分布 {self.name} 需要 {expected[self.name]} 个参数: {spec}')
+
+    def sample(self, rng, recorded_ms=None):
+        """
+        采样一次延迟
+
+        Returns:
+            float: 延迟秒数
+        """
+        if self.name == 'fixed':
+            value = self.params[0]
+        elif self.name == 'uniform':
+            value = rng.uniform(*self.params)
+        elif self.name == 'normal':
+            value = rng.gauss(*self.params)
+        elif self.name == 'lognormal':
+            median, sigma = self.params
+            value = median * math.exp(rng.gauss(0, sigma)) if median > 0 else 0
+        else:
+            value = recorded_ms or 0
+        return max(0.0, value) / 1000
+
+
+class ErrorRule:
+    """按比例注入的错误"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        rate, _, codes = spec.partition(':')
+        self.rate = float(rate)
+        if not 0 <= self.rate <= 1:
+            raise ValueError(f'错误比例应在0~1之间: {spec}')
+        self.codes = [int(c) for c in codes.split(',') if c.strip()] or [429]
+
+    def pick(self, rng):
+        """按比例决定是否注入错误，返回状态码或None"""
+        if self.rate and rng.random() < self.rate:
+            return rng.choice(self.codes)
+        return None
+
+
+def parse_assignments(items, parser, defaults=None):
+    """
+    解析 类型=规格 的列表（按顺序应用；类型为 * 时覆盖之前的全部设置，作用于全部调用类型）
+
+    Args:
+        items (list[str]): 如 ['generate_content=lognormal:800,0.5', '*=fixed:50']
+        parser: 把规格字符串转换为对象的函数
+        defaults (dict): 默认值，被列表中的同名类型覆盖
+    """
+    result = dict(defaults or {})
+    for item in items or []:
+        kind, sep, spec = item.partition('=')
+        kind = kind.strip()
+        if not sep or not spec.strip():
+            raise ValueError(f'格式应为 类型=规格: {item}')
+        if kind != '*' and kind not in KINDS:
+            raise ValueError(f"未知的调用类型: {kind}（可选 {', '.join(KINDS)} 或 *）")
+        if kind == '*':
+            result.clear()
+        result[kind] = parser(spec.strip())
+    return result
+
+
+class FaultInjector:
+    """按调用类型采样延迟并注入错误（线程安全，固定种子时结果可复现）"""
+
+    def __init__(self, latencies=None, errors=None, seed=None):
+        """
+        Args:
+            latencies (dict): 调用类型 -> LatencyModel，* 为默认值
+            errors (dict): 调用类型 -> ErrorRule，* 为默认值
+            seed (int): 随机种子，为None时每次运行不同
+        """
+        self.latencies = latencies or {}
+        self.errors = errors or {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.injected = {}
+
+    def delay(self, kind, recorded_ms=None):
+        """调用类型的延迟秒数"""
+        model = self.latencies.get(kind) or self.latencies.get('*')
+        if model is None:
+            return 0.0
+        with self._lock:
+            return model.sample(self._rng, recorded_ms)
+
+    def error(self, kind):
+        """需要注入错误时返回状态码，否则返回None"""
+        rule = self.errors.get(kind) or self.errors.get('*')
+        if rule is None:
+            return None
+        with self._lock:
+            code = rule.pick(self._rng)
+            if code is not None:
+                self.injected[code] = self.injected.get(code, 0) + 1
+        return code
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.injected)
+
+    def reset(self):
+        with self._lock:
+            self.injected.clear()
+
+
+def error_body(code, message=None):
+    """Google API格式的错误响应体"""
+    status = ERROR_STATUSES.get(code, 'UNKNOWN')
+    return {
+        'error': {
+            'code': code,
+            'message': message or f'Injected {status} error from the Gemini stand-in server',
+            'status': status
+        }
+    }
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+录制和回放
+请求按 方法 + 路径 + 归一化请求体 计算键，每个键一个JSON文件，保存该请求依次收到的响应
+（同一视频操作的多次轮询会得到不同的状态，回放时按顺序返回，用完后重复最后一个）。
+归一化时把请求体中的大段base64数据（上传的图像）替换为其哈希，录制文件不包含图像内容和API Key
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode
+
+
+# 超过此长度的字符串视为二进制数据，只保留哈希
+INLINE_DATA_THRESHOLD = 512
+
+# 参与请求键计算的查询参数（key 为API Key，不参与也不录制）
+KEY_QUERY_PARAMS = ('alt',)
+
+
+def normalize_body(value):
+    """把请求体中的大段数据替换为哈希"""
+    if isinstance(value, dict):
+        return {k: normalize_body(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [normalize_body(v) for v in value]
+    if isinstance(value, str) and len(value) > INLINE_DATA_THRESHOLD:
+        return f"sha256:{hashlib.sha256(value.encode('utf-8')).hexdigest()}"
+    return value
+
+
+def normalize_path(path, query_string=''):
+    """路径加上参与键计算的查询参数"""
+    params = [(k, v) for k, v in parse_qsl(query_string) if k in KEY_QUERY_PARAMS]
+    return f'{path}?{urlencode(sorted(params))}' if params else path
+
+
+def request_key(method, path, body):
+    """
+    Returns:
+        tuple: (请求键, 归一化的请求描述)
+    """
+    normalized = {'method': method.upper(), 'path': path, 'body': normalize_body(body) if body is not None else None}
+    canonical = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32], normalized
+
+
+def encode_body(data, content_type):
+    """响应体的存储形式：JSON按对象保存，其余（视频、流式响应）按base64或文本保存"""
+    if content_type.startswith('application/json'):
+        try:
+            return {'json': json.loads(data)}
+        except ValueError:
+            pass
+    if content_type.startswith('text/'):
+        return {'text': data.decode('utf-8', errors='replace')}
+    return {'base64': base64.b64encode(data).decode('ascii')}
+
+
+def decode_body(response):
+    if 'json' in response:
+        return json.dumps(response['json'], ensure_ascii=False).encode('utf-8')
+    if 'text' in response:
+        return response['text'].encode('utf-8')
+    return base64.b64decode(response.get('base64', ''))
+
+
+class RecordingStore:
+    """录制文件目录（线程安全）"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries = {}  # 键 -> 录制内容（首次访问时从文件加载）
+        self._cursors = {}  # 键 -> 下一个回放的响应序号
+
+    def _path(self, key):
+        return os.path.join(self.folder, f'{key}.json')
+
+    def _load_locked(self, key):
+        if key not in self._entries:
+            entry = None
+            path = self._path(key)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            self._entries[key] = entry
+        return self._entries[key]
+
+    def next_response(self, key):
+        """按录制顺序返回下一个响应，没有录制时返回None"""
+        with self._lock:
+            entry = self._load_locked(key)
+            if not entry or not entry.get('responses'):
+                return None
+            responses = entry['responses']
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            return responses[min(index, len(responses) - 1)]
+
+    def append(self, key, request_info, response):
+        """追加一个录制的响应并写入文件"""
+        with self._lock:
+            entry = self._load_locked(key) or {'request': request_info, 'responses': []}
+            entry['responses'].append(response)
+            self._entries[key] = entry
+            tmp_path = f'{self._path(key)}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self._path(key))
+
+    def reset_cursors(self):
+        """从头开始回放（每轮压测开始前调用）"""
+        with self._lock:
+            self._cursors.clear()
+
+    def count(self):
+        return sum(1 for name in os.listdir(self.folder) if name.endswith('.json'))
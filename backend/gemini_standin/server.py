@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Gemini API替身服务
+实现SDK用到的REST接口（路径与 generativelanguage.googleapis.com 相同）：
+    POST /{version}/models/{model}:generateContent        generate_content
+    POST /{version}/models/{model}:streamGenerateContent  generate_content_stream（SSE）
+    POST /{version}/models/{model}:predict                generate_images
+    POST /{version}/models/{model}:predictLongRunning     generate_videos
+    GET  /{version}/{operation_name}                      operations.get
+    GET  /{version}/files/{file_id}:download              files.download（生成的视频）
+    GET  /{version}/models/{model}                        models.get（客户端预热）
+    GET  /_standin/stats                                  请求计数、回放命中和注入的错误
+    POST /_standin/reset                                  回放从头开始，清空计数
+三种模式：
+    synthetic  全部返回合成响应
+    replay     返回录制的响应，没有录制时返回合成响应（strict 时返回404）
+    record     转发到真实API并录制响应（使用调用方的API Key，不写入录制文件）
+"""
+
+import json
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+from . import synthetic
+from .faults import FaultInjector, error_body
+from .recordings import RecordingStore, decode_body, encode_body, normalize_path, request_key
+
+
+MODES = ('synthetic', 'replay', 'record')
+DEFAULT_UPSTREAM = 'https://generativelanguage.googleapis.com'
+
+# 转发到真实API的请求头
+FORWARDED_HEADERS = ('x-goog-api-key', 'x-goog-api-client', 'user-agent', 'content-type')
+
+
+class StandinOptions:
+    """替身服务配置"""
+
+    def __init__(self, mode='synthetic', recordings=None, strict=False, upstream=DEFAULT_UPSTREAM,
+                 injector=None, text_words=60, chunk_words=8, image_edge=1024, upstream_timeout=600):
+        """
+        Args:
+            mode (str): synthetic / replay / record
+            recordings (str): 录制文件目录（replay 和 record 模式必需）
+            strict (bool): replay 模式下没有录制时返回404而不是合成响应
+            upstream (str): record 模式转发的目标地址
+            injector (FaultInjector): 延迟和错误注入
+            text_words (int): 合成文本的单词数
+            chunk_words (int): 流式响应每块的单词数
+            image_edge (int): 合成图像的长边像素数
+            upstream_timeout (float): 转发请求的超时（秒）
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的模式: {mode}（可选 {', '.join(MODES)}）")
+        if mode != 'synthetic' and not recordings:
+            raise ValueError(f'{mode} 模式需要指定录制文件目录')
+        self.mode = mode
+        self.recordings = recordings
+        self.strict = strict
+        self.upstream = upstream.rstrip('/')
+        self.injector = injector or FaultInjector()
+        self.text_words = text_words
+        self.chunk_words = chunk_words
+        self.image_edge = image_edge
+        self.upstream_timeout = upstream_timeout
+
+
+def classify(method, target):
+    """
+    按请求路径判断调用类型
+
+    Returns:
+        tuple: (调用类型, 模型名称)，无法识别时调用类型为None
+    """
+    resource, _, action = target.partition(':')
+    model = resource[len('models/'):] if resource.startswith('models/') else None
+    if method == 'POST' and model:
+        kind = {
+            'generateContent': 'generate_content',
+            'streamGenerateContent': 'stream',
+            'predict': 'generate_images',
+            'predictLongRunning': 'generate_videos'
+        }.get(action)
+        return kind, model
+    if method == 'GET':
+        if '/operations/' in resource or resource.startswith('operations/'):
+            return 'operations_get', None
+        if resource.startswith('files/') and action == 'download':
+            return 'download', None
+        if model and not action and '/' not in model:
+            return 'models_get', model
+    return None, model
+
+
+class StandinState:
+    """进程内状态：计数、合成的视频操作"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests = {}
+        self.replay_hits = 0
+        self.replay_misses = 0
+        self.recorded = 0
+        self.operations = {}  # 操作名称 -> {done_at, video_id, model}
+
+    def count(self, kind):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def replay(self, hit):
+        with self._lock:
+            if hit:
+                self.replay_hits += 1
+            else:
+                self.replay_misses += 1
+
+    def add_recorded(self):
+        with self._lock:
+            self.recorded += 1
+
+    def add_operation(self, name, done_at, model):
+        with self._lock:
+            self.operations[name] = {'done_at': done_at, 'video_id': uuid.uuid4().hex[:16], 'model': model}
+
+    def get_operation(self, name):
+        with self._lock:
+            return self.operations.get(name)
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.replay_hits = self.replay_misses = self.recorded = 0
+
+    def snapshot(self):
+        with self._lock:
+            now = time.time()
+            return {
+                'uptime_seconds': round(now - self.started_at, 1),
+                'requests': dict(self.requests),
+                'replay_hits': self.replay_hits,
+                'replay_misses': self.replay_misses,
+                'recorded': self.recorded,
+                'operations': len(self.operations),
+                'operations_pending': sum(1 for op in self.operations.values() if op['done_at'] > now)
+            }
+
+
+def _json_response(payload, status=200):
+    return Response(json.dumps(payload, ensure_ascii=False), status=status, mimetype='application/json')
+
+
+def _sse(payload):
+    return f'data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n'
+
+
+def create_app(options=None):
+    """创建替身服务的Flask应用"""
+    options = options or StandinOptions()
+    app = Flask('gemini_standin')
+    state = StandinState()
+    store = RecordingStore(options.recordings) if options.mode != 'synthetic' else None
+    injector = options.injector
+    upstream = None
+    if options.mode == 'record':
+        import httpx
+        upstream = httpx.Client(base_url=options.upstream, timeout=options.upstream_timeout,
+                                follow_redirects=True)
+
+    app.extensions['gemini_standin'] = {'options': options, 'state': state, 'store': store}
+
+    @app.route('/_standin/stats', methods=['GET'])
+    def standin_stats():
+        stats = state.snapshot()
+        stats.update({
+            'mode': options.mode,
+            'strict': options.strict,
+            'injected_errors': injector.snapshot(),
+            'recordings': store.count() if store else 0
+        })
+        return jsonify(stats)
+
+    @app.route('/_standin/reset', methods=['POST'])
+    def standin_reset():
+        state.reset()
+        injector.reset()
+        if store:
+            store.reset_cursors()
+        return jsonify({'success': True})
+
+    @app.route('/<version>/<path:target>', methods=['GET', 'POST'])
+    def api(version, target):
+        kind, model = classify(request.method, target)
+        if kind is None:
+            return _json_response(error_body(404, f'Method not found: {request.method} {target}'), 404)
+        state.count(kind)
+
+        # 注入的错误立即返回（与真实API的限流和过载响应一样不产生生成耗时），流式调用使用 generate_content 的规则
+        injected = injector.error('generate_content' if kind == 'stream' else kind)
+        if injected:
+            return _json_response(error_body(injected), injected)
+
+        body = request.get_json(silent=True) if request.method == 'POST' else None
+        path = normalize_path(f'/{version}/{target}', request.query_string.decode('ascii', errors='ignore'))
+        key, request_info = request_key(request.method, path, body)
+
+        if options.mode == 'record':
+            return _record(key, request_info, kind)
+
+        if options.mode == 'replay':
+            recorded = store.next_response(key)
+            state.replay(recorded is not None)
+            if recorded is not None:
+                return _replay(recorded, kind)
+            if options.strict:
+                return _json_response(error_body(404, f'No recording for {request.method} {path}'), 404)
+
+        return _synthetic(kind, model, target, body or {})
+
+    def _synthetic(kind, model, target, body):
+        seed = synthetic.request_seed(body)
+        if kind == 'stream':
+            chunks = synthetic.stream_chunks(model, body, seed, options.text_words, options.chunk_words)
+            return _stream([(None, chunk) for chunk in chunks])
+
+        time.sleep(injector.delay(kind))
+        if kind == 'generate_content':
+            return _json_response(synthetic.content_response(
+                model, body, seed, options.text_words, options.image_edge))
+        if kind == 'generate_images':
+            return _json_response(synthetic.images_response(body, seed, options.image_edge))
+        if kind == 'generate_videos':
+            name = f'models/{model}/operations/{uuid.uuid4().hex[:12]}'
+            state.add_operation(name, time.time() + injector.delay('video_duration'), model)
+            return _json_response({'name': name})
+        if kind == 'operations_get':
+            return _operation(target.partition(':')[0])
+        if kind == 'download':
+            return Response(synthetic.video_bytes(), mimetype='video/mp4')
+        return _json_response({
+            'name': f'models/{model}',
+            'displayName': model,
+            'inputTokenLimit': 1048576,
+            'outputTokenLimit': 8192,
+            'supportedGenerationMethods': ['generateContent', 'countTokens']
+        })
+
+    def _operation(name):
+        operation = state.get_operation(name)
+        if operation is None:
+            return _json_response(error_body(404, f'Operation not found: {name}'), 404)
+        if time.time() < operation['done_at']:
+            return _json_response({'name': name})
+        return _json_response({
+            'name': name,
+            'done': True,
+            'response': {
+                '@type': 'type.googleapis.com/google.ai.generativelanguage.v1beta.PredictLongRunningResponse',
+                'generateVideoResponse': {
+                    # SDK 从 files/ 之后取文件ID，下载请求同样发到替身服务
+                    'generatedSamples': [{'video': {'uri': f"files/{operation['video_id']}"}}]
+                }
+            }
+        })
+
+    def _stream(chunks):
+        """
+        流式响应
+
+        Args:
+            chunks (list): (录制时的偏移毫秒或None, 响应对象)
+        """
+        def generate():
+            previous = 0
+            for index, (offset, chunk) in enumerate(chunks):
+                recorded_gap = None
+                if offset is not None:
+                    recorded_gap, previous = offset - previous, offset
+                time.sleep(injector.delay('stream_first_chunk' if index == 0 else 'stream_chunk', recorded_gap))
+                yield _sse(chunk)
+
+        return Response(generate(), mimetype='text/event-stream')
+
+    def _replay(recorded, kind):
+        if recorded.get('chunks') is not None:
+            return _stream([(chunk['offset_ms'], chunk['data']) for chunk in recorded['chunks']])
+        time.sleep(injector.delay(kind, recorded.get('elapsed_ms')))
+        return Response(decode_body(recorded), status=recorded['status'],
+                        content_type=recorded.get('content_type', 'application/json'))
+
+    def _record(key, request_info, kind):
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        query = [(k, v) for k, v in request.args.items(multi=True) if k != 'key']
+        upstream_request = upstream.build_request(
+            request.method, request.path, params=query, headers=headers,
+            content=request.get_data() if request.method == 'POST' else None)
+        started = time.perf_counter()
+        response = upstream.send(upstream_request, stream=True)
+        content_type = response.headers.get('content-type', 'application/json')
+
+        if kind == 'stream' and response.status_code == 200:
+            def generate():
+                chunks = []
+                try:
+                    for line in response.iter_lines():
+                        if not line.startswith('data:'):
+                            continue
+                        data = json.loads(line[len('data:'):].strip())
+                        chunks.append({'offset_ms': round((time.perf_counter() - started) * 1000, 1),
+                                       'data': data})
+                        yield _sse(data)
+                finally:
+                    response.close()
+                store.append(key, request_info, {'status': 200, 'content_type': 'text/event-stream',
+                                                 'chunks': chunks})
+                state.add_recorded()
+            return Response(generate(), mimetype='text/event-stream')
+
+        try:
+            data = response.read()
+        finally:
+            response.close()
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        # 失败的响应（如限流）也录制，回放时得到相同的错误
+        store.append(key, request_info, dict(
+            encode_body(data, content_type), status=response.status_code,
+            content_type=content_type, elapsed_ms=elapsed_ms))
+        state.add_recorded()
+        return Response(data, status=response.status_code, content_type=content_type)
+
+    return app
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+合成响应
+按请求内容的哈希确定性地生成响应，同一请求每次得到相同的结果：
+- generate_content：提示词要求JSON时返回同时满足内容验证、检测和分割解析的JSON；
+  responseModalities 包含 IMAGE 时附带PNG图像；其余返回纯文本
+- generate_images：按 sampleCount 和 aspectRatio 返回PNG图像
+- generate_videos：返回长时间运行操作，视频为短小的MP4
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+
+WORDS = ('a', 'bright', 'detailed', 'scene', 'with', 'soft', 'light', 'the', 'subject', 'is', 'centered',
+         'and', 'surrounded', 'by', 'natural', 'colors', 'in', 'high', 'resolution', 'cinematic', 'style',
+         'sharp', 'focus', 'on', 'texture', 'background', 'shows', 'gentle', 'depth', 'of', 'field')
+
+ASPECT_RATIOS = {'1:1': (1, 1), '16:9': (16, 9), '9:16': (9, 16), '4:3': (4, 3), '3:4': (3, 4)}
+
+# 生成的图像按（尺寸, 变体）缓存，避免高并发压测时替身服务自身的编码开销成为瓶颈
+IMAGE_VARIANTS = 4
+
+_image_cache = {}
+_video_cache = {}
+_cache_lock = threading.Lock()
+
+
+def request_seed(body):
+    """请求内容的稳定哈希（作为合成结果的种子）"""
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def prompt_text(body):
+    """请求中所有文本部分（generate_content 的 contents 或 predict 的 instances）"""
+    texts = []
+    for content in body.get('contents') or []:
+        for part in content.get('parts') or []:
+            if part.get('text'):
+                texts.append(part['text'])
+    for instance in body.get('instances') or []:
+        if instance.get('prompt'):
+            texts.append(instance['prompt'])
+    return '\n'.join(texts)
+
+
+def _subject(text):
+    """提示词中第一个引号内的对象名称（如内容验证提示词中的 "猫"），跳过JSON模板中的键和值"""
+    for match in re.finditer(r'["“]([^"”\n]{1,30})["”]', text):
+        before = text[:match.start()].rstrip()[-1:]
+        after = text[match.end():].lstrip()[:1]
+        if before != ':' and after != ':':
+            return match.group(1).strip()
+    return 'object'
+
+
+def _sentence(rng, words):
+    chosen = [WORDS[i] for i in rng.integers(0, len(WORDS), words)]
+    return ' '.join(chosen).capitalize() + '.'
+
+
+def structured_text(text, seed, max_objects=3):
+    """
+    同时满足各服务解析逻辑的JSON文本：
+    contains_object / match_type / confidence（内容验证）、objects（检测）、segments（分割）
+    """
+    rng = np.random.default_rng(seed)
+    label = _subject(text)
+    objects = []
+    for i in range(int(rng.integers(1, max_objects + 1))):
+        ymin, xmin = rng.uniform(0.05, 0.55, 2)
+        height, width = rng.uniform(0.15, 0.4, 2)
+        bbox = [round(float(v), 3) for v in (ymin, xmin, min(ymin + height, 0.98), min(xmin + width, 0.98))]
+        objects.append({'label': f'{label}{i + 1}' if i else label,
+                        'confidence': round(float(rng.uniform(0.75, 0.98)), 2), 'bbox': bbox})
+    return json.dumps({
+        'contains_object': True,
+        'match_type': 'direct',
+        'confidence': 0.95,
+        'detected_objects': [label],
+        'matching_objects': [label],
+        'explanation': f'The image contains {label}.',
+        'objects': objects,
+        'segments': [dict(obj, description=f'{obj["label"]} region') for obj in objects]
+    }, ensure_ascii=False)
+
+
+def content_text(body, seed, words=60):
+    """generate_content 的响应文本"""
+    text = prompt_text(body)
+    config = body.get('generationConfig') or {}
+    if 'json' in text.lower() or config.get('responseMimeType') == 'application/json':
+        return structured_text(text, seed)
+    rng = np.random.default_rng(seed)
+    sentences, total = [], 0
+    while total < words:
+        count = int(rng.integers(6, 14))
+        sentences.append(_sentence(rng, count))
+        total += count
+    return ' '.join(sentences)
+
+
+def wants_image(body):
+    modalities = (body.get('generationConfig') or {}).get('responseModalities') or []
+    return any(str(m).upper() == 'IMAGE' for m in modalities)
+
+
+def png_image(width, height, seed):
+    """合成PNG图像（渐变背景和几个色块）"""
+    key = (width, height, seed % IMAGE_VARIANTS)
+    with _cache_lock:
+        cached = _image_cache.get(key)
+    if cached is not None:
+        return cached
+
+    rng = np.random.default_rng(key[2])
+    ys, xs = np.mgrid[0:height, 0:width]
+    image = np.zeros((height, width, 3), np.uint8)
+    base = rng.integers(60, 200, 3)
+    image[..., 0] = (base[0] + 50 * xs / width) % 256
+    image[..., 1] = (base[1] + 50 * ys / height) % 256
+    image[..., 2] = base[2]
+    for _ in range(5):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(min(width, height) // 12, min(width, height) // 4))
+        cv2.circle(image, center, radius, [int(c) for c in rng.integers(0, 256, 3)], -1)
+    ok, buffer = cv2.imencode('.png', image)
+    if not ok:
+        raise ValueError('PNG编码失败')
+    data = buffer.tobytes()
+    with _cache_lock:
+        _image_cache[key] = data
+    return data
+
+
+def image_size(aspect_ratio, long_edge):
+    ratio = ASPECT_RATIOS.get(aspect_ratio or '1:1', (1, 1))
+    scale = long_edge / max(ratio)
+    return int(ratio[0] * scale), int(ratio[1] * scale)
+
+
+def content_response(model, body, seed, words=60, image_edge=1024):
+    """generateContent 的完整响应"""
+    text = content_text(body, seed, words)
+    parts = [{'text': text}]
+    if wants_image(body):
+        data = png_image(image_edge, image_edge, seed)
+        parts.append({'inlineData': {'mimeType': 'image/png', 'data': base64.b64encode(data).decode('ascii')}})
+    return _content_envelope(model, parts, body, text, seed, finished=True)
+
+
+def stream_chunks(model, body, seed, words=60, chunk_words=8):
+    """streamGenerateContent 的分块响应（每块为一个完整的响应对象，最后一块带结束原因和用量）"""
+    tokens = content_text(body, seed, words).split(' ')
+    pieces = [' '.join(tokens[i:i + chunk_words]) for i in range(0, len(tokens), chunk_words)]
+    chunks = []
+    for index, piece in enumerate(pieces):
+        last = index == len(pieces) - 1
+        text = piece if index == 0 else ' ' + piece
+        chunks.append(_content_envelope(model, [{'text': text}], body, ' '.join(tokens), seed, finished=last))
+    return chunks
+
+
+def _content_envelope(model, parts, body, full_text, seed, finished):
+    candidate = {'content': {'parts': parts, 'role': 'model'}, 'index': 0}
+    response = {'candidates': [candidate], 'modelVersion': model, 'responseId': f'{seed:016x}'}
+    if finished:
+        candidate['finishReason'] = 'STOP'
+        prompt_tokens = max(1, len(prompt_text(body)) // 4)
+        output_tokens = max(1, len(full_text) // 4)
+        response['usageMetadata'] = {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': output_tokens,
+            'totalTokenCount': prompt_tokens + output_tokens
+        }
+    return response
+
+
+def images_response(body, seed, image_edge=1024):
+    """predict（Imagen）的响应"""
+    parameters = body.get('parameters') or {}
+    width, height = image_size(parameters.get('aspectRatio'), image_edge)
+    count = max(1, min(int(parameters.get('sampleCount') or 1), 4))
+    return {'predictions': [{
+        'bytesBase64Encoded': base64.b64encode(png_image(width, height, seed + i)).decode('ascii'),
+        'mimeType': 'image/png'
+    } for i in range(count)]}
+
+
+def video_bytes(width=320, height=180, seconds=1, fps=8):
+    """合成的短MP4视频（进程内只编码一次）"""
+    key = (width, height, seconds, fps)
+    with _cache_lock:
+        cached = _video_cache.get(key)
+    if cached is not None:
+        return cached
+
+    fd, path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    try:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+        for frame_index in range(seconds * fps):
+            frame = np.full((height, width, 3), 40, np.uint8)
+            x = int((width - 40) * frame_index / max(1, seconds * fps - 1))
+            cv2.rectangle(frame, (x, height // 2 - 20), (x + 40, height // 2 + 20), (60, 180, 240), -1)
+            writer.write(frame)
+        writer.release()
+        with open(path, 'rb') as f:
+            data = f.read()
+    finally:
+        os.remove(path)
+    with _cache_lock:
+        _video_cache[key] = data
+    return data
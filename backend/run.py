@@ -52,6 +52,22 @@ if __name__ == '__main__':
         debug_mode = app.config.get('DEBUG', True)
 
         print(f"📊 调试模式: {'开启' if debug_mode else '关闭'}", flush=True)
+
+        if app.config.get('SERVER_MODE') == 'asgi':
+            # ASGI模式：网络密集型接口在事件循环中异步处理，其余接口在线程池中执行
+            import uvicorn
+            from app.asgi import create_asgi_app
+
+            print(f"🔧 开始启动ASGI服务器（uvicorn）...", flush=True)
+            uvicorn.run(
+                create_asgi_app(flask_app=app),
+                host=host,
+                port=port,
+                limit_concurrency=app.config.get('ASGI_LIMIT_CONCURRENCY') or None,
+                log_level='debug' if debug_mode else 'info'
+            )
+            sys.exit(0)
+
         print(f"🔧 开始启动服务器...", flush=True)
 
         # 启动服务器
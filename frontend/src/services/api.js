@@ -162,6 +162,29 @@ class ApiService {
     return this.get('/video-options')
   }
 
+  // 异步任务API
+  async getJob(jobId) {
+    return this.get(`/jobs/${jobId}`)
+  }
+
+  /**
+   * 轮询任务直到结束，返回任务的最终结果
+   */
+  async waitForJob(jobId, { interval = 5000, onProgress } = {}) {
+    for (;;) {
+      const response = await this.getJob(jobId)
+      const job = response.data
+      if (onProgress) onProgress(job)
+      if (!job.success) {
+        throw new Error(job.error || '获取任务状态失败')
+      }
+      if (job.done) {
+        return job
+      }
+      await new Promise(resolve => setTimeout(resolve, interval))
+    }
+  }
+
   // 工具API
   async testApiKey(apiKey) {
     return this.post('/test-api-key', { api_key: apiKey })